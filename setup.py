@@ -26,6 +26,10 @@ setup(
         "pathlib>=1.0.1",
         "gitpython>=3.1.0",
     ],
+    extras_require={
+        "terminals": ["flask-sock>=0.7.0"],
+        "zstd": ["zstandard>=0.21.0"],
+    },
     entry_points={
         "console_scripts": [
             "shellama=shellama.cli:main",
@@ -10,7 +10,13 @@ functionality as a REST API for use by the APILama gateway.
 
 import os
 import sys
+import gzip
+import json
+import queue
+import shlex
 import argparse
+import mimetypes
+import threading
 from pathlib import Path
 
 # Import LogLama components first to ensure environment variables are loaded
@@ -22,14 +28,51 @@ init_logging()
 # Get a logger for this module
 logger = get_logger('app')
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 
+# zstd compression of responses is optional
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# WebSocket terminals are optional
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
 # Import SheLLama modules
-from shellama import file_ops, dir_ops, shell, git_ops
+from shellama import file_ops, dir_ops, dir_size, reaper, tree_copy, shell, git_ops, uploads, workspace
+from shellama.executor import command_executor
+from shellama.scheduler import PRIORITY_CLASSES, SchedulerFull
+from shellama.fs_cache import metadata_cache
+from shellama.limits import ResourceLimits
+from shellama.result_cache import CachePolicy, result_cache
+from shellama.output_capture import overflow_store
+from shellama.process_registry import process_registry, process_summary
+from shellama.sessions import session_manager
+from shellama.terminals import TerminalBusy, bridge, terminal_manager
+from shellama.conditional import (
+    conditional,
+    file_etag,
+    file_validator,
+    files_validator,
+    directory_validator,
+    git_status_validator,
+    set_validators
+)
 from shellama.logger import logger as shellama_logger
 
 
+# Longest a terminal output request waits for new output, in seconds
+TERMINAL_MAX_WAIT = 30
+
+# Command responses smaller than this many bytes are never compressed
+COMPRESS_MIN_SIZE = int(os.environ.get('SHELLAMA_COMPRESS_MIN_SIZE', 1024))
+
+
 def init_app(app):
     """
     Initialize the Flask application with additional configurations.
@@ -44,6 +87,233 @@ def init_app(app):
         pass
 
 
+def _is_true(value):
+    """Interpret a query-string or environment flag as a boolean."""
+    return str(value).lower() in ('true', '1', 't', 'yes')
+
+
+def _scheduling_options(data, default_priority):
+    """
+    Read the scheduling options of a command request.
+    
+    The tenant is taken from the ``X-Tenant`` header, then the ``tenant`` field,
+    then the client address. Neither the priority nor the tenant is
+    authenticated: any client may claim them, so they order cooperating
+    clients and are no protection against hostile ones.
+    
+    Args:
+        data (dict): The JSON body.
+        default_priority (str): Priority class used when the body has none.
+        
+    Returns:
+        dict: ``priority``, ``tenant`` and ``deadline`` keyword arguments.
+        
+    Raises:
+        ValueError: If the priority or deadline is not valid.
+    """
+    priority = data.get('priority') or default_priority
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"priority must be one of {', '.join(PRIORITY_CLASSES)}")
+    deadline = data.get('deadline')
+    if deadline is not None:
+        deadline = float(deadline)
+        if deadline < 0:
+            raise ValueError("deadline must not be negative")
+    tenant = request.headers.get('X-Tenant') or data.get('tenant') or request.remote_addr
+    return {'priority': priority, 'tenant': tenant, 'deadline': deadline}
+
+
+def _scheduler_full_response(error):
+    """Build a 429 response telling the client when to retry."""
+    response = jsonify({
+        'status': 'error',
+        'message': str(error),
+        'retry_after': error.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def _stream_file_response(filename):
+    """
+    Build a streaming response with the raw bytes of a file.
+    
+    Honours a single ``Range`` request header with a ``206`` response, unless an
+    ``If-Range`` header shows the client's copy is outdated. When the
+    WSGI server provides ``wsgi.file_wrapper`` and the response runs to the end
+    of the file, the open handle is passed to it so servers that implement it
+    with ``sendfile`` can send the file without copying it through Python.
+    
+    Args:
+        filename (str): Path of the file to stream.
+        
+    Returns:
+        Response: The streaming Flask response.
+    """
+    handle, stats = file_ops.open_file_stream(filename)
+    size = stats.st_size
+    etag = file_etag(stats)
+    
+    # A Range is only honoured if the client's copy is still the current one
+    range_header = request.headers.get('Range')
+    if range_header and 'If-Range' in request.headers:
+        if_range = request.if_range
+        if if_range.etag is not None:
+            range_current = if_range.etag == etag
+        else:
+            range_current = if_range.date is not None and int(stats.st_mtime) <= if_range.date.timestamp()
+        if not range_current:
+            range_header = None
+    
+    try:
+        byte_range = file_ops.parse_range_header(range_header, size)
+    except ValueError:
+        handle.close()
+        response = Response(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+    
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status = 206
+    length = end - start + 1
+    
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None and end == size - 1:
+        handle.seek(start)
+        body = file_wrapper(handle, file_ops.STREAM_CHUNK_SIZE)
+    else:
+        body = file_ops.iter_file_chunks(handle, start, length)
+    
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = Response(body, status=status, mimetype=mimetype, direct_passthrough=True)
+    response.headers['Content-Length'] = str(length)
+    response.headers['Accept-Ranges'] = 'bytes'
+    set_validators(response, etag, False, stats.st_mtime)
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def _ndjson_response(events):
+    """
+    Build a streaming response with one JSON document per line.
+    
+    Args:
+        events (Iterable[dict]): Events to send.
+        
+    Returns:
+        Response: The streaming Flask response.
+    """
+    def generate():
+        try:
+            for event in events:
+                yield json.dumps(event, default=str) + '\n'
+        finally:
+            # Stop the producer as soon as the client goes away
+            close = getattr(events, 'close', None)
+            if close is not None:
+                close()
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+def _sse_response(events):
+    """
+    Build a Server-Sent Events response.
+    
+    Each event is sent with its ``event`` key as the SSE event name and the
+    whole event as JSON data.
+    
+    Args:
+        events (Iterable[dict]): Events to send.
+        
+    Returns:
+        Response: The streaming Flask response.
+    """
+    def generate():
+        try:
+            for event in events:
+                yield f"event: {event.get('event', 'message')}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            close = getattr(events, 'close', None)
+            if close is not None:
+                close()
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Ask reverse proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _compress_response(response):
+    """
+    Compress a buffered response with zstd or gzip if the client accepts it.
+    
+    zstd is used when the ``zstandard`` package is installed and preferred by
+    the client. Small responses are sent as they are.
+    
+    Args:
+        response (Response): The response to compress.
+        
+    Returns:
+        Response: The same response, possibly compressed.
+    """
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    accepted = request.accept_encodings
+    if zstandard is not None and accepted['zstd'] and accepted['zstd'] >= accepted['gzip']:
+        response.set_data(zstandard.ZstdCompressor(level=3).compress(data))
+        response.headers['Content-Encoding'] = 'zstd'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def _iter_progress(task):
+    """
+    Run a long task in a background thread and yield its progress events.
+    
+    The task is called with a progress callback. Progress events are yielded as
+    ``{'event': 'progress', ...}``, followed by ``{'event': 'result', ...}`` with
+    the task's return value or ``{'event': 'error', 'message': ...}``.
+    
+    Args:
+        task (Callable[[Callable[[dict], None]], dict]): Task to run.
+        
+    Yields:
+        dict: Progress events followed by the result event.
+    """
+    events = queue.Queue()
+    
+    def run():
+        try:
+            result = task(lambda update: events.put(dict(update, event='progress')))
+            events.put(dict(result, event='result'))
+        except Exception as e:
+            logger.error(f"Error in background task: {str(e)}")
+            events.put({'event': 'error', 'message': str(e)})
+        finally:
+            events.put(None)
+    
+    threading.Thread(target=run, daemon=True).start()
+    while True:
+        event = events.get()
+        if event is None:
+            break
+        yield event
+
+
 def create_app(test_config=None):
     """
     Create and configure the Flask application.
@@ -73,6 +343,12 @@ def create_app(test_config=None):
     # Initialize the logger
     init_app(app)
     
+    # Overflow output of an earlier server that crashed is never fetched
+    overflow_store.sweep()
+    
+    # Finish deleting trees an earlier server moved to the trash
+    reaper.sweep_leftovers()
+    
     # Health check endpoint
     @app.route('/health', methods=['GET'])
     def health_check():
@@ -80,15 +356,41 @@ def create_app(test_config=None):
     
     # File operations endpoints
     @app.route('/files', methods=['GET'])
+    @conditional(files_validator)
     def get_files():
         directory = request.args.get('directory', '.')
         pattern = request.args.get('pattern', '*')
         try:
+            if 'limit' in request.args or 'cursor' in request.args:
+                page = file_ops.list_files_page(
+                    directory,
+                    pattern,
+                    limit=request.args.get('limit', 50, type=int),
+                    cursor=request.args.get('cursor'),
+                    sort=request.args.get('sort', 'mtime'),
+                    order=request.args.get('order'),
+                    min_size=request.args.get('min_size', type=int),
+                    max_size=request.args.get('max_size', type=int),
+                    modified_after=request.args.get('modified_after', type=float),
+                    modified_before=request.args.get('modified_before', type=float)
+                )
+                return jsonify({
+                    'status': 'success',
+                    'files': page['files'],
+                    'total': page['total'],
+                    'next_cursor': page['next_cursor']
+                })
+            
             files = file_ops.list_files(directory, pattern)
             return jsonify({
                 'status': 'success',
                 'files': files
             })
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
         except Exception as e:
             logger.error(f"Error listing files: {str(e)}")
             return jsonify({
@@ -96,7 +398,15 @@ def create_app(test_config=None):
                 'message': str(e)
             }), 500
     
+    @app.route('/files/cache', methods=['GET'])
+    def get_files_cache_stats():
+        return jsonify({
+            'status': 'success',
+            'cache': metadata_cache.stats()
+        })
+    
     @app.route('/file', methods=['GET'])
+    @conditional(file_validator)
     def get_file():
         filename = request.args.get('filename')
         if not filename:
@@ -106,6 +416,9 @@ def create_app(test_config=None):
             }), 400
         
         try:
+            if _is_true(request.args.get('stream', 'false')):
+                return _stream_file_response(filename)
+            
             content = file_ops.read_file(filename)
             return jsonify({
                 'status': 'success',
@@ -143,6 +456,131 @@ def create_app(test_config=None):
                 'message': str(e)
             }), 500
     
+    # Chunked upload endpoints
+    @app.route('/file/upload', methods=['POST'])
+    def start_upload():
+        data = request.get_json()
+        filename = data.get('filename')
+        total_size = data.get('size')
+        
+        if not filename:
+            return jsonify({
+                'status': 'error',
+                'message': 'Filename is required'
+            }), 400
+        
+        try:
+            session = uploads.create_upload(filename, total_size)
+            return jsonify({
+                'status': 'success',
+                'upload': session.to_dict()
+            })
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        except Exception as e:
+            logger.error(f"Error starting upload: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+    
+    @app.route('/file/upload/<upload_id>', methods=['GET'])
+    def get_upload(upload_id):
+        try:
+            session = uploads.get_upload(upload_id)
+            return jsonify({
+                'status': 'success',
+                'upload': session.to_dict()
+            })
+        except KeyError as e:
+            return jsonify({
+                'status': 'error',
+                'message': e.args[0]
+            }), 404
+    
+    @app.route('/file/upload/<upload_id>', methods=['PUT'])
+    def upload_chunk(upload_id):
+        offset = request.args.get('offset')
+        if offset is not None:
+            # An offset that does not parse must not turn into an append
+            if not (offset.isascii() and offset.isdigit()):
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Invalid offset: {offset}'
+                }), 400
+            offset = int(offset)
+        
+        try:
+            session = uploads.get_upload(upload_id)
+            new_offset = session.write_chunk(request.stream, offset)
+            return jsonify({
+                'status': 'success',
+                'upload_id': upload_id,
+                'offset': new_offset
+            })
+        except KeyError as e:
+            return jsonify({
+                'status': 'error',
+                'message': e.args[0]
+            }), 404
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e),
+                'offset': session.offset
+            }), 409
+        except Exception as e:
+            logger.error(f"Error writing upload chunk: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+    
+    @app.route('/file/upload/<upload_id>/commit', methods=['POST'])
+    def commit_upload(upload_id):
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            info = uploads.commit_upload(upload_id, data.get('checksum'))
+            return jsonify({
+                'status': 'success',
+                'message': f"File {info['filename']} saved successfully",
+                'upload': info
+            })
+        except KeyError as e:
+            return jsonify({
+                'status': 'error',
+                'message': e.args[0]
+            }), 404
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 409
+        except Exception as e:
+            logger.error(f"Error committing upload: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+    
+    @app.route('/file/upload/<upload_id>', methods=['DELETE'])
+    def abort_upload(upload_id):
+        try:
+            uploads.abort_upload(upload_id)
+            return jsonify({
+                'status': 'success',
+                'message': f'Upload {upload_id} cancelled'
+            })
+        except KeyError as e:
+            return jsonify({
+                'status': 'error',
+                'message': e.args[0]
+            }), 404
+    
     @app.route('/file', methods=['DELETE'])
     def delete_file():
         filename = request.args.get('filename')
@@ -167,6 +605,7 @@ def create_app(test_config=None):
     
     # Directory operations endpoints
     @app.route('/directory', methods=['GET'])
+    @conditional(directory_validator)
     def get_directory():
         path = request.args.get('path', '.')
         try:
@@ -182,6 +621,35 @@ def create_app(test_config=None):
                 'message': str(e)
             }), 500
     
+    @app.route('/directory/size', methods=['GET'])
+    def get_directory_size():
+        path = request.args.get('path', '.')
+        workers = request.args.get('workers', type=int)
+        use_cache = _is_true(request.args.get('cache', 'true'))
+        
+        if _is_true(request.args.get('stream', 'false')):
+            return _ndjson_response(_iter_progress(
+                lambda progress: dir_size.compute_directory_size(path, workers, use_cache, progress)
+            ))
+        
+        try:
+            result = dir_size.compute_directory_size(path, workers, use_cache)
+            return jsonify({
+                'status': 'success',
+                'size': result
+            })
+        except FileNotFoundError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 404
+        except Exception as e:
+            logger.error(f"Error getting directory size: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+    
     @app.route('/directory', methods=['POST'])
     def create_directory():
         data = request.get_json()
@@ -206,9 +674,43 @@ def create_app(test_config=None):
                 'message': str(e)
             }), 500
     
+    @app.route('/directory/copy', methods=['POST'])
+    def copy_directory():
+        data = request.get_json()
+        source = data.get('source')
+        destination = data.get('destination')
+        workers = data.get('workers')
+        dry_run = bool(data.get('dry_run', False))
+        
+        if not source or not destination:
+            return jsonify({
+                'status': 'error',
+                'message': 'Source and destination are required'
+            }), 400
+        
+        if data.get('stream'):
+            return _ndjson_response(_iter_progress(
+                lambda progress: tree_copy.copy_tree(source, destination, workers, dry_run, progress)
+            ))
+        
+        try:
+            result = tree_copy.copy_tree(source, destination, workers, dry_run)
+            return jsonify({
+                'status': 'success',
+                'copy': result
+            })
+        except Exception as e:
+            logger.error(f"Error copying directory: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+    
     @app.route('/directory', methods=['DELETE'])
     def delete_directory():
         path = request.args.get('path')
+        recursive = _is_true(request.args.get('recursive', 'false'))
+        background = _is_true(request.args.get('background', 'true'))
         if not path:
             return jsonify({
                 'status': 'error',
@@ -216,11 +718,24 @@ def create_app(test_config=None):
             }), 400
         
         try:
-            dir_ops.delete_directory(path)
+            if recursive and background:
+                job = reaper.schedule_delete(path)
+                return jsonify({
+                    'status': 'success',
+                    'message': f'Directory {path} scheduled for deletion',
+                    'job': job.to_dict()
+                }), 202
+            
+            dir_ops.delete_directory(path, recursive=recursive)
             return jsonify({
                 'status': 'success',
                 'message': f'Directory {path} deleted successfully'
             })
+        except FileNotFoundError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 404
         except Exception as e:
             logger.error(f"Error deleting directory: {str(e)}")
             return jsonify({
@@ -228,12 +743,34 @@ def create_app(test_config=None):
                 'message': str(e)
             }), 500
     
+    @app.route('/directory/delete', methods=['GET'])
+    def list_delete_jobs():
+        return jsonify({
+            'status': 'success',
+            'jobs': [job.to_dict() for job in reaper.list_jobs()]
+        })
+    
+    @app.route('/directory/delete/<job_id>', methods=['GET'])
+    def get_delete_job(job_id):
+        try:
+            job = reaper.get_job(job_id)
+            return jsonify({
+                'status': 'success',
+                'job': job.to_dict()
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Deletion job {job_id} not found'
+            }), 404
+    
     # Shell command endpoint
     @app.route('/shell', methods=['POST'])
     def execute_shell_command():
         data = request.get_json()
         command = data.get('command')
         cwd = data.get('cwd')
+        use_shell = bool(data.get('shell', False))
         
         if not command:
             return jsonify({
@@ -242,30 +779,593 @@ def create_app(test_config=None):
             }), 400
         
         try:
-            result = shell.execute_command(command, cwd=cwd)
+            timeout = shell.check_timeout(data.get('timeout'))
+            limits = ResourceLimits.from_dict(data.get('limits'))
+            cache = CachePolicy.from_request(data.get('cache'))
+            output_limit = int(data['output_limit']) if data.get('output_limit') is not None else None
+            if output_limit is not None and output_limit <= 0:
+                raise ValueError("output_limit must be greater than 0")
+            scheduling = _scheduling_options(data, 'normal')
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        try:
+            result = shell.execute_command(command, cwd=cwd, timeout=timeout, shell=use_shell, limits=limits,
+                                           cache=cache, output_limit=output_limit, **scheduling)
+            response = {
+                'status': 'success' if result['success'] else 'error',
+                'output': result['stdout'],
+                'error': result['stderr'],
+                'exit_code': result['exit_code'],
+                'execution_time': result['execution_time']
+            }
+            for key in ('truncated', 'output_size', 'output_id', 'resources', 'cached'):
+                if key in result:
+                    response[key] = result[key]
+            if not result['success']:
+                response['message'] = result['error']
+            return _compress_response(jsonify(response))
+        except SchedulerFull as e:
+            return _scheduler_full_response(e)
+        except Exception as e:
+            logger.error(f"Error executing command: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+    
+    @app.route('/shell/scheduler', methods=['GET'])
+    def get_scheduler_stats():
+        return jsonify({
+            'status': 'success',
+            'executor': command_executor.stats()
+        })
+    
+    @app.route('/shell/cache', methods=['GET'])
+    def get_shell_cache_stats():
+        return jsonify({
+            'status': 'success',
+            'cache': result_cache.stats()
+        })
+    
+    @app.route('/shell/cache', methods=['DELETE'])
+    def clear_shell_cache():
+        result_cache.clear()
+        return jsonify({
+            'status': 'success',
+            'message': 'Result cache cleared'
+        })
+    
+    @app.route('/shell/output/<output_id>/<stream>', methods=['GET'])
+    def get_shell_output(output_id, stream):
+        try:
+            overflow = overflow_store.get(output_id, stream)
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'No {stream} output {output_id}'
+            }), 404
+        try:
+            response = _stream_file_response(overflow['path'])
+        except FileNotFoundError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Output {output_id} has expired'
+            }), 404
+        response.mimetype = 'text/plain'
+        response.headers['X-Output-Size'] = str(overflow['size'])
+        response.headers['X-Output-Complete'] = 'true' if overflow['complete'] else 'false'
+        return response
+    
+    @app.route('/shell/output/<output_id>', methods=['DELETE'])
+    def delete_shell_output(output_id):
+        try:
+            overflow_store.remove(output_id)
             return jsonify({
                 'status': 'success',
-                'output': result.stdout,
-                'error': result.stderr,
-                'exit_code': result.returncode
+                'message': f'Output {output_id} deleted'
             })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Output {output_id} not found'
+            }), 404
+    
+    @app.route('/shell/batch', methods=['POST'])
+    def execute_shell_batch():
+        data = request.get_json()
+        commands = data.get('commands')
+        mode = data.get('mode', 'sequential')
+        
+        if not commands or not isinstance(commands, list):
+            return jsonify({
+                'status': 'error',
+                'message': 'A list of commands is required'
+            }), 400
+        if len(commands) > shell.BATCH_MAX_COMMANDS:
+            return jsonify({
+                'status': 'error',
+                'message': f'At most {shell.BATCH_MAX_COMMANDS} commands are allowed in a batch'
+            }), 400
+        if mode not in shell.BATCH_MODES:
+            return jsonify({
+                'status': 'error',
+                'message': f"mode must be one of {', '.join(shell.BATCH_MODES)}"
+            }), 400
+        
+        try:
+            timeout = shell.check_timeout(data.get('timeout'))
+            shell.check_batch(commands, mode, data.get('max_parallel'), timeout)
+            limits = ResourceLimits.from_dict(data.get('limits'))
+            scheduling = _scheduling_options(data, 'batch')
+            # Reject the whole batch while its queue is full instead of failing each command
+            command_executor.check_admission(scheduling['priority'], scheduling['tenant'])
+        except SchedulerFull as e:
+            return _scheduler_full_response(e)
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        options = dict(mode=mode, max_parallel=data.get('max_parallel'), cwd=data.get('cwd'),
+                       timeout=timeout, shell=bool(data.get('shell', False)), limits=limits,
+                       priority=scheduling['priority'], tenant=scheduling['tenant'])
+        
+        if data.get('stream'):
+            def events():
+                results = shell.iter_batch(commands, **options)
+                success = True
+                try:
+                    for result in results:
+                        success = success and result['success']
+                        yield dict(result, event='result')
+                finally:
+                    results.close()
+                yield {'event': 'summary', 'success': success, 'commands': len(commands)}
+            return _ndjson_response(events())
+        
+        try:
+            result = shell.execute_batch(commands, **options)
+            return _compress_response(jsonify({
+                'status': 'success' if result['success'] else 'error',
+                'results': result['results'],
+                'execution_time': result['execution_time']
+            }))
         except Exception as e:
-            logger.error(f"Error executing command: {str(e)}")
+            logger.error(f"Error executing batch: {str(e)}")
             return jsonify({
                 'status': 'error',
                 'message': str(e)
             }), 500
     
+    @app.route('/shell/stream', methods=['POST'])
+    def stream_shell_command():
+        data = request.get_json()
+        command = data.get('command')
+        use_shell = bool(data.get('shell', False))
+        mode = data.get('mode', 'lines')
+        output_format = data.get('format')
+        if output_format is None:
+            output_format = 'sse' if request.accept_mimetypes.best == 'text/event-stream' else 'ndjson'
+        
+        if not command:
+            return jsonify({
+                'status': 'error',
+                'message': 'Command is required'
+            }), 400
+        if mode not in ('lines', 'chunks') or output_format not in ('sse', 'ndjson'):
+            return jsonify({
+                'status': 'error',
+                'message': "mode must be 'lines' or 'chunks' and format 'sse' or 'ndjson'"
+            }), 400
+        
+        try:
+            args = command if use_shell else shlex.split(command)
+            timeout = shell.check_timeout(data.get('timeout'))
+            limits = ResourceLimits.from_dict(data.get('limits'))
+            scheduling = _scheduling_options(data, 'normal')
+            # Once the stream has started its status can no longer be 429
+            command_executor.check_admission(scheduling['priority'], scheduling['tenant'])
+        except SchedulerFull as e:
+            return _scheduler_full_response(e)
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        logger.info(f"Streaming command: {command}")
+        events = command_executor.stream(args, mode=mode, shell=use_shell, cwd=data.get('cwd'),
+                                         timeout=timeout, limits=limits, **scheduling)
+        return _sse_response(events) if output_format == 'sse' else _ndjson_response(events)
+    
+    # Shell session endpoints
+    @app.route('/sessions', methods=['POST'])
+    def create_session():
+        data = request.get_json(silent=True) or {}
+        try:
+            session = session_manager.create(cwd=data.get('cwd'), env=data.get('env'))
+            return jsonify({
+                'status': 'success',
+                'session': session.to_dict()
+            }), 201
+        except RuntimeError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 429
+        except Exception as e:
+            logger.error(f"Error creating shell session: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+    
+    @app.route('/sessions', methods=['GET'])
+    def list_sessions():
+        return jsonify({
+            'status': 'success',
+            'sessions': [session.to_dict() for session in session_manager.list()]
+        })
+    
+    @app.route('/sessions/<session_id>', methods=['GET'])
+    def get_session(session_id):
+        try:
+            return jsonify({
+                'status': 'success',
+                'session': session_manager.get(session_id).to_dict()
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Session {session_id} not found'
+            }), 404
+    
+    @app.route('/sessions/<session_id>/exec', methods=['POST'])
+    def run_in_session(session_id):
+        data = request.get_json()
+        command = data.get('command')
+        
+        if not command:
+            return jsonify({
+                'status': 'error',
+                'message': 'Command is required'
+            }), 400
+        
+        try:
+            timeout = shell.check_timeout(data.get('timeout'))
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        try:
+            result = session_manager.run(session_id, command, timeout=timeout)
+            response = {
+                'status': 'success' if result['success'] else 'error',
+                'output': result['stdout'],
+                'error': result['stderr'],
+                'exit_code': result['exit_code'],
+                'cwd': result['cwd'],
+                'session_alive': result['alive'],
+                'execution_time': result['execution_time']
+            }
+            if not result['success']:
+                response['message'] = result['error']
+            return jsonify(response)
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Session {session_id} not found'
+            }), 404
+    
+    @app.route('/sessions/<session_id>', methods=['DELETE'])
+    def close_session(session_id):
+        try:
+            session_manager.close(session_id)
+            return jsonify({
+                'status': 'success',
+                'message': f'Session {session_id} closed'
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Session {session_id} not found'
+            }), 404
+    
+    # Terminal endpoints
+    @app.route('/terminals', methods=['POST'])
+    def open_terminal():
+        data = request.get_json(silent=True) or {}
+        try:
+            terminal = terminal_manager.create(data.get('command'), cwd=data.get('cwd'),
+                                               shell=bool(data.get('shell', False)), env=data.get('env'),
+                                               rows=int(data.get('rows', 24)), cols=int(data.get('cols', 80)))
+            return jsonify({
+                'status': 'success',
+                'terminal': terminal.to_dict(),
+                'websocket': Sock is not None
+            }), 201
+        except RuntimeError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 429
+        except Exception as e:
+            logger.error(f"Error opening terminal: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+    
+    @app.route('/terminals', methods=['GET'])
+    def list_terminals():
+        return jsonify({
+            'status': 'success',
+            'terminals': [terminal.to_dict() for terminal in terminal_manager.list()]
+        })
+    
+    @app.route('/terminals/<terminal_id>', methods=['GET'])
+    def get_terminal(terminal_id):
+        try:
+            return jsonify({
+                'status': 'success',
+                'terminal': terminal_manager.get(terminal_id).to_dict()
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Terminal {terminal_id} not found'
+            }), 404
+    
+    @app.route('/terminals/<terminal_id>/output', methods=['GET'])
+    def read_terminal(terminal_id):
+        try:
+            terminal = terminal_manager.get(terminal_id)
+            offset = int(request.args.get('offset', 0))
+            max_bytes = int(request.args['max_bytes']) if 'max_bytes' in request.args else None
+            wait = min(float(request.args.get('wait', 0)), TERMINAL_MAX_WAIT)
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Terminal {terminal_id} not found'
+            }), 404
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        data, start, next_offset = terminal.read(offset, max_bytes, timeout=wait)
+        response = Response(data, mimetype='application/octet-stream')
+        response.headers['X-Output-Start'] = str(start)
+        response.headers['X-Output-Next'] = str(next_offset)
+        response.headers['X-Terminal-Running'] = 'false' if terminal.finished else 'true'
+        return response
+    
+    @app.route('/terminals/<terminal_id>/input', methods=['POST'])
+    def write_terminal(terminal_id):
+        try:
+            terminal_manager.get(terminal_id).write(request.get_data())
+            return jsonify({
+                'status': 'success'
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Terminal {terminal_id} not found'
+            }), 404
+        except TerminalBusy as e:
+            # The client resends the input from ``written`` on
+            return jsonify({
+                'status': 'error',
+                'message': str(e),
+                'written': e.written
+            }), 409
+        except OSError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 409
+    
+    @app.route('/terminals/<terminal_id>/resize', methods=['POST'])
+    def resize_terminal(terminal_id):
+        data = request.get_json(silent=True) or {}
+        try:
+            terminal = terminal_manager.get(terminal_id)
+            terminal.resize(int(data.get('rows', 0)), int(data.get('cols', 0)))
+            return jsonify({
+                'status': 'success',
+                'terminal': terminal.to_dict()
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Terminal {terminal_id} not found'
+            }), 404
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        except OSError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 409
+    
+    @app.route('/terminals/<terminal_id>', methods=['DELETE'])
+    def close_terminal(terminal_id):
+        try:
+            terminal_manager.close(terminal_id)
+            return jsonify({
+                'status': 'success',
+                'message': f'Terminal {terminal_id} closed'
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Terminal {terminal_id} not found'
+            }), 404
+    
+    if Sock is not None:
+        sock = Sock(app)
+        
+        @sock.route('/terminals/<terminal_id>/ws')
+        def terminal_websocket(ws, terminal_id):
+            try:
+                terminal = terminal_manager.get(terminal_id)
+            except KeyError:
+                ws.close(reason=1008, message=f'Terminal {terminal_id} not found')
+                return
+            bridge(terminal, ws, offset=request.args.get('offset', 0, type=int))
+    
+    # Background process endpoints
+    @app.route('/processes', methods=['POST'])
+    def start_process():
+        data = request.get_json()
+        command = data.get('command')
+        
+        if not command:
+            return jsonify({
+                'status': 'error',
+                'message': 'Command is required'
+            }), 400
+        
+        try:
+            limits = ResourceLimits.from_dict(data.get('limits'))
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        try:
+            process = process_registry.start(command, cwd=data.get('cwd'), shell=bool(data.get('shell', False)),
+                                             env=data.get('env'), limits=limits)
+            return jsonify({
+                'status': 'success',
+                'process': process_summary(process)
+            }), 201
+        except RuntimeError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 429
+        except Exception as e:
+            logger.error(f"Error starting background process: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+    
+    @app.route('/processes', methods=['GET'])
+    def list_processes():
+        return jsonify({
+            'status': 'success',
+            'processes': [process_summary(process) for process in process_registry.list()],
+            'stats': process_registry.stats()
+        })
+    
+    @app.route('/processes/<process_id>', methods=['GET'])
+    def get_process(process_id):
+        try:
+            process = process_registry.get(process_id)
+            max_bytes = request.args.get('max_bytes')
+            status = process.get_status(
+                stdout_offset=int(request.args.get('stdout_offset', 0)),
+                stderr_offset=int(request.args.get('stderr_offset', 0)),
+                max_bytes=int(max_bytes) if max_bytes else None
+            )
+            return jsonify({
+                'status': 'success',
+                'process': dict(process_summary(process), **status)
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Process {process_id} not found'
+            }), 404
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+    
+    @app.route('/processes/<process_id>/signal', methods=['POST'])
+    def signal_process(process_id):
+        data = request.get_json(silent=True) or {}
+        try:
+            sig = process_registry.signal(process_id, data.get('signal', 'TERM'))
+            return jsonify({
+                'status': 'success',
+                'signal': sig.name
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Process {process_id} not found'
+            }), 404
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        except ProcessLookupError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 409
+    
+    @app.route('/processes/<process_id>/stop', methods=['POST'])
+    def stop_process(process_id):
+        try:
+            process = process_registry.stop(process_id)
+            return jsonify({
+                'status': 'success',
+                'process': process_summary(process)
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Process {process_id} not found'
+            }), 404
+    
+    @app.route('/processes/<process_id>', methods=['DELETE'])
+    def remove_process(process_id):
+        try:
+            process_registry.remove(process_id)
+            return jsonify({
+                'status': 'success',
+                'message': f'Process {process_id} removed'
+            })
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Process {process_id} not found'
+            }), 404
+    
     # Git operations endpoints
     @app.route('/git/status', methods=['GET'])
+    @conditional(git_status_validator)
     def git_status():
         repo_path = request.args.get('path', '.')
         try:
-            status = git_ops.get_status(repo_path)
+            status = git_ops.get_status(repo_path, request.args.get('untracked', 'all'), use_cache=True)
             return jsonify({
                 'status': 'success',
                 'git_status': status
             })
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
         except Exception as e:
             logger.error(f"Error getting git status: {str(e)}")
             return jsonify({
@@ -313,12 +1413,42 @@ def create_app(test_config=None):
     @app.route('/git/log', methods=['GET'])
     def git_log():
         repo_path = request.args.get('path', '.')
+        options = {
+            'limit': request.args.get('limit', 50, type=int),
+            'cursor': request.args.get('cursor'),
+            'rev': request.args.get('rev', 'HEAD'),
+            'paths': request.args.getlist('file'),
+            'since': request.args.get('since'),
+            'until': request.args.get('until'),
+            'author': request.args.get('author'),
+            'numstat': _is_true(request.args.get('numstat', 'false'))
+        }
         try:
-            logs = git_ops.get_log(repo_path)
+            if _is_true(request.args.get('stream', 'false')):
+                events = git_ops.iter_log(repo_path, **options)
+                
+                def generate():
+                    try:
+                        yield from events
+                    except Exception as e:
+                        logger.error(f"Error streaming git log: {str(e)}")
+                        yield {'event': 'error', 'message': str(e)}
+                    finally:
+                        events.close()
+                
+                return _ndjson_response(generate())
+            
+            page = git_ops.get_log(repo_path, **options)
             return jsonify({
                 'status': 'success',
-                'logs': logs
+                'logs': page['commits'],
+                'next_cursor': page['next_cursor']
             })
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
         except Exception as e:
             logger.error(f"Error getting git log: {str(e)}")
             return jsonify({
@@ -326,6 +1456,37 @@ def create_app(test_config=None):
                 'message': str(e)
             }), 500
     
+    @app.route('/git/workspace', methods=['GET'])
+    def git_workspace():
+        root = request.args.get('root', '.')
+        try:
+            events = workspace.iter_workspace_status(
+                root,
+                depth=request.args.get('depth', workspace.WORKSPACE_DEPTH, type=int),
+                untracked=request.args.get('untracked', 'normal'),
+                ahead_behind=_is_true(request.args.get('ahead_behind', 'true')),
+                fetch=_is_true(request.args.get('fetch', 'false')),
+                workers=request.args.get('workers', type=int),
+                refresh=_is_true(request.args.get('refresh', 'false'))
+            )
+            return _ndjson_response(events)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        except FileNotFoundError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 404
+        except Exception as e:
+            logger.error(f"Error getting workspace status: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+    
     # Log the initialization
     logger.info(f"SheLLama API initialized")
     
@@ -351,6 +1512,10 @@ def main():
     host = args.host or os.environ.get('HOST', '127.0.0.1')
     debug = args.debug or os.environ.get('DEBUG', 'True').lower() in ('true', '1', 't')
     
+    # Start the command launcher while this process is still small
+    if command_executor.launcher is not None and command_executor.launcher.supported:
+        command_executor.launcher.start()
+
     # Create and run the app
     app = create_app()
     
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SheLLama Conditional Request Module
+
+This module provides ETag and Last-Modified validators for the read endpoints
+and a decorator that answers conditional GET requests with ``304 Not Modified``
+before the view reads any file contents or serialises any JSON.
+"""
+
+import os
+import hashlib
+import functools
+from typing import Callable, Optional, Tuple
+
+from flask import Response, make_response, request
+
+from shellama import file_ops, git_ops
+from shellama.logger import logger
+
+
+# A validator returns (etag, weak, last_modified timestamp) or None when it cannot be computed
+Validator = Tuple[str, bool, Optional[float]]
+
+
+def file_etag(stats: os.stat_result) -> str:
+    """
+    Build a strong ETag for a file from its stats.
+
+    Args:
+        stats (os.stat_result): Stats of the file
+
+    Returns:
+        str: ETag value without quotes
+    """
+    return f"{stats.st_ino:x}-{stats.st_size:x}-{stats.st_mtime_ns:x}"
+
+
+def _digest(*parts: object) -> str:
+    """Hash the given parts into a short ETag value."""
+    return hashlib.sha1('\0'.join(str(part) for part in parts).encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def file_validator() -> Optional[Validator]:
+    """Validator for ``GET /file``, built from the inode, size and mtime of the file."""
+    filename = request.args.get('filename')
+    if not filename:
+        return None
+
+    stats = os.stat(filename)
+    etag = file_etag(stats)
+    if request.args.get('stream', 'false').lower() not in ('true', '1', 't', 'yes'):
+        # The JSON representation must not share an ETag with the raw bytes
+        etag = f"{etag}-json"
+    return etag, False, stats.st_mtime
+
+
+def files_validator() -> Optional[Validator]:
+    """Validator for ``GET /files``, built from the digest of the cached listing and the query."""
+    directory = request.args.get('directory', '.')
+    pattern = request.args.get('pattern', '*')
+    if not os.path.isdir(directory):
+        # Let the view create the directory as it always has
+        return None
+
+    digest = file_ops.get_listing_digest(directory, pattern)
+    query = sorted(request.args.items(multi=True))
+    return _digest(digest, query), True, None
+
+
+def directory_validator() -> Optional[Validator]:
+    """Validator for ``GET /directory``, built from the directory stats and the digest of its listing."""
+    path = request.args.get('path', '.')
+    stats = os.stat(path)
+    digest = file_ops.get_listing_digest(path, '*')
+    return _digest(stats.st_ino, stats.st_mtime_ns, stats.st_ctime_ns, digest), True, stats.st_mtime
+
+
+def git_status_validator() -> Optional[Validator]:
+    """Validator for ``GET /git/status``, built from the digest of the cached status and the query."""
+    repo_path = request.args.get('path', '.')
+    digest = git_ops.get_status_digest(repo_path, request.args.get('untracked', 'all'))
+    return _digest(os.path.realpath(repo_path), digest), True, None
+
+
+def not_modified(etag: str, weak: bool, last_modified: Optional[float]) -> bool:
+    """
+    Check whether the client's cached copy is still current.
+
+    ``If-None-Match`` takes precedence over ``If-Modified-Since`` as required
+    by RFC 9110.
+
+    Args:
+        etag (str): Current ETag value
+        weak (bool): Whether the ETag is weak
+        last_modified (float, optional): Current modification timestamp
+
+    Returns:
+        bool: True if a ``304 Not Modified`` response should be sent
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since is not None and last_modified is not None:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+
+def set_validators(response: Response, etag: str, weak: bool, last_modified: Optional[float]) -> None:
+    """
+    Add the validator headers to a response.
+
+    Args:
+        response (Response): Response to update
+        etag (str): ETag value
+        weak (bool): Whether the ETag is weak
+        last_modified (float, optional): Modification timestamp
+    """
+    response.set_etag(etag, weak=weak)
+    if last_modified is not None:
+        response.last_modified = int(last_modified)
+    # Clients may keep the response but must revalidate it before reuse
+    response.headers.setdefault('Cache-Control', 'no-cache')
+
+
+def conditional(validator: Callable[[], Optional[Validator]]) -> Callable:
+    """
+    Decorator that answers conditional GET requests for a view.
+
+    The validator runs before the view. If the client's copy is current a
+    ``304`` is returned without calling the view; otherwise the view's
+    successful response is tagged with the validators. Validator errors, for
+    example a missing file, are left for the view to report.
+
+    Args:
+        validator (Callable[[], Optional[Validator]]): Function computing the validators of the current request
+
+    Returns:
+        Callable: The decorator
+    """
+    def decorator(view: Callable) -> Callable:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            try:
+                validators = validator()
+            except Exception as e:
+                logger.debug(f"Could not compute validators for {request.path}: {str(e)}")
+                validators = None
+
+            if validators is None:
+                return view(*args, **kwargs)
+
+            etag, weak, last_modified = validators
+            if not_modified(etag, weak, last_modified):
+                response = Response(status=304)
+                set_validators(response, etag, weak, last_modified)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code in (200, 206) and 'ETag' not in response.headers:
+                set_validators(response, etag, weak, last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -12,6 +12,7 @@ import shutil
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
+from shellama import dir_size, reaper, tree_copy
 from shellama.logger import logger
 
 
@@ -38,13 +39,18 @@ def create_directory(directory_path: str) -> bool:
         raise
 
 
-def delete_directory(directory_path: str, recursive: bool = False) -> bool:
+def delete_directory(directory_path: str, recursive: bool = False, background: bool = False) -> bool:
     """
     Delete a directory.
     
+    With ``background=True`` a recursive deletion moves the directory into the
+    trash and returns immediately; the contents are removed by reaper.schedule_delete.
+    
     Args:
         directory_path (str): Path to the directory to delete
         recursive (bool, optional): Whether to delete the directory recursively. Defaults to False.
+        background (bool, optional): Whether to remove the contents of a recursive deletion
+            in the background. Defaults to False.
         
     Returns:
         bool: True if the directory was deleted successfully, False otherwise
@@ -53,10 +59,12 @@ def delete_directory(directory_path: str, recursive: bool = False) -> bool:
         FileNotFoundError: If the directory does not exist
         IOError: If there is an error deleting the directory
     """
-    logger.info(f"Deleting directory: {directory_path} (recursive={recursive})")
+    logger.info(f"Deleting directory: {directory_path} (recursive={recursive}, background={background})")
     
     try:
-        if recursive:
+        if recursive and background:
+            reaper.schedule_delete(directory_path)
+        elif recursive:
             shutil.rmtree(directory_path)
         else:
             os.rmdir(directory_path)
@@ -88,7 +96,7 @@ def list_directories(parent_directory: str) -> List[Dict[str, Any]]:
         # Get all directories
         directories = []
         for item in Path(parent_directory).iterdir():
-            if item.is_dir():
+            if item.is_dir() and not reaper.is_trash_name(item.name):
                 # Get directory stats
                 stats = item.stat()
                 
@@ -109,6 +117,70 @@ def list_directories(parent_directory: str) -> List[Dict[str, Any]]:
         raise
 
 
+def get_directory_info(directory_path: str) -> Dict[str, Any]:
+    """
+    Get information about a directory and its contents.
+    
+    Args:
+        directory_path (str): Path to the directory
+        
+    Returns:
+        Dict[str, Any]: Dictionary with the directory information and its subdirectories and files
+        
+    Raises:
+        FileNotFoundError: If the directory does not exist
+        NotADirectoryError: If the path is not a directory
+    """
+    logger.info(f"Getting directory info: {directory_path}")
+    
+    try:
+        stats = os.stat(directory_path)
+        base = str(Path(directory_path))
+        
+        directories = []
+        files = []
+        with os.scandir(directory_path) as entries:
+            for entry in entries:
+                if reaper.is_trash_name(entry.name):
+                    continue
+                try:
+                    entry_stats = entry.stat()
+                except FileNotFoundError:
+                    # Broken symlink or entry removed during the scan
+                    continue
+                
+                info = {
+                    'name': entry.name,
+                    'path': os.path.join(base, entry.name),
+                    'modified': entry_stats.st_mtime
+                }
+                if entry.is_dir():
+                    info['created'] = entry_stats.st_ctime
+                    directories.append(info)
+                else:
+                    info['size'] = entry_stats.st_size
+                    files.append(info)
+        
+        # Sort entries by name
+        directories.sort(key=lambda x: x['name'])
+        files.sort(key=lambda x: x['name'])
+        
+        return {
+            'name': os.path.basename(os.path.abspath(directory_path)),
+            'path': base,
+            'modified': stats.st_mtime,
+            'created': stats.st_ctime,
+            'directories': directories,
+            'files': files
+        }
+    except FileNotFoundError:
+        logger.error(f"Directory not found: {directory_path}")
+        raise
+    except NotADirectoryError:
+        logger.error(f"Not a directory: {directory_path}")
+        raise
+
+
 def directory_exists(directory_path: str) -> bool:
     """
     Check if a directory exists.
@@ -122,12 +194,17 @@ def directory_exists(directory_path: str) -> bool:
     return os.path.isdir(directory_path)
 
 
-def get_directory_size(directory_path: str) -> int:
+def get_directory_size(directory_path: str, use_cache: bool = False) -> int:
     """
     Get the total size of a directory in bytes.
     
+    The tree is scanned in parallel and unreadable entries are skipped; use
+    dir_size.compute_directory_size for counts, errors and progress reports.
+    
     Args:
         directory_path (str): Path to the directory
+        use_cache (bool, optional): Whether to reuse cached per-directory subtotals, which miss
+            files that grew in place. Defaults to False.
         
     Returns:
         int: Total size of the directory in bytes
@@ -137,30 +214,26 @@ def get_directory_size(directory_path: str) -> int:
     """
     logger.info(f"Getting directory size: {directory_path}")
     
-    # Check if the directory exists first
-    if not os.path.isdir(directory_path):
-        logger.error(f"Directory not found: {directory_path}")
-        raise FileNotFoundError(f"Directory not found: {directory_path}")
-    
     try:
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(directory_path):
-            for filename in filenames:
-                file_path = os.path.join(dirpath, filename)
-                total_size += os.path.getsize(file_path)
-        return total_size
+        return dir_size.compute_directory_size(directory_path, use_cache=use_cache)['size']
+    except FileNotFoundError:
+        raise
     except Exception as e:
         logger.error(f"Error getting directory size for {directory_path}: {str(e)}")
         raise
 
 
-def copy_directory(source_path: str, destination_path: str) -> bool:
+def copy_directory(source_path: str, destination_path: str, workers: Optional[int] = None) -> bool:
     """
     Copy a directory and its contents to a new location.
     
+    Files are copied in parallel, using reflinks or in-kernel copies where the
+    filesystem supports them; see tree_copy.copy_tree for dry runs and progress reports.
+    
     Args:
         source_path (str): Path to the source directory
         destination_path (str): Path to the destination directory
+        workers (int, optional): Number of copying threads. Defaults to tree_copy.COPY_WORKERS.
         
     Returns:
         bool: True if the directory was copied successfully, False otherwise
@@ -172,7 +245,7 @@ def copy_directory(source_path: str, destination_path: str) -> bool:
     logger.info(f"Copying directory from {source_path} to {destination_path}")
     
     try:
-        shutil.copytree(source_path, destination_path)
+        tree_copy.copy_tree(source_path, destination_path, workers=workers)
         return True
     except FileNotFoundError:
         logger.error(f"Source directory not found: {source_path}")
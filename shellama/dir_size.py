@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Directory Size Module
+
+This module computes the disk usage of directory trees. Subtrees are scanned
+in parallel with ``os.scandir``, files with several hard links are counted
+once, and per-directory subtotals are cached by directory mtime so a repeated
+query only rescans the directories that changed.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from shellama.logger import logger
+
+
+# Number of threads scanning directories in parallel
+DIR_SIZE_WORKERS = int(os.environ.get('SHELLAMA_DIR_SIZE_WORKERS', min(32, (os.cpu_count() or 1) * 4)))
+
+# Maximum number of per-directory subtotals kept in the cache
+DIR_SIZE_CACHE_SIZE = int(os.environ.get('SHELLAMA_DIR_SIZE_CACHE_SIZE', 200000))
+
+# Maximum number of errors included in a result
+MAX_REPORTED_ERRORS = 100
+
+# Minimum number of seconds between two progress reports
+PROGRESS_INTERVAL = 0.25
+
+
+class _DirSummary:
+    """Sizes of the entries directly inside one directory."""
+
+    __slots__ = ('mtime_ns', 'size', 'files', 'linked', 'subdirs')
+
+    def __init__(self, mtime_ns: int):
+        self.mtime_ns = mtime_ns
+        self.size = 0
+        self.files = 0
+        self.linked: List[Tuple[int, int, int]] = []
+        self.subdirs: List[str] = []
+
+
+_summaries: 'OrderedDict[str, _DirSummary]' = OrderedDict()
+_summaries_lock = threading.Lock()
+
+
+def _scan_directory(path: str, use_cache: bool) -> Tuple[Optional[_DirSummary], bool, Optional[str]]:
+    """
+    Summarise the entries directly inside a directory.
+
+    Args:
+        path (str): Absolute path of the directory
+        use_cache (bool): Whether a cached summary may be reused
+
+    Returns:
+        Tuple[Optional[_DirSummary], bool, Optional[str]]: The summary (None on error),
+            whether it came from the cache, and the error message
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        if use_cache:
+            with _summaries_lock:
+                cached = _summaries.get(path)
+                if cached is not None and cached.mtime_ns == mtime_ns:
+                    _summaries.move_to_end(path)
+                    return cached, True, None
+
+        summary = _DirSummary(mtime_ns)
+        errors = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        summary.subdirs.append(entry.name)
+                        continue
+                    stats = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    errors.append(f"{entry.path}: {e.strerror}")
+                    continue
+
+                summary.files += 1
+                if stats.st_nlink > 1:
+                    summary.linked.append((stats.st_dev, stats.st_ino, stats.st_size))
+                else:
+                    summary.size += stats.st_size
+    except OSError as e:
+        return None, False, f"{path}: {e.strerror}"
+
+    if errors:
+        # Do not cache partial results, the errors may be transient
+        return summary, False, '; '.join(errors)
+
+    with _summaries_lock:
+        _summaries[path] = summary
+        _summaries.move_to_end(path)
+        while len(_summaries) > DIR_SIZE_CACHE_SIZE:
+            _summaries.popitem(last=False)
+    return summary, False, None
+
+
+def compute_directory_size(directory_path: str, workers: Optional[int] = None, use_cache: bool = False,
+                           progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Compute the total size of a directory tree.
+
+    Symbolic links are counted as links and not followed, and files with
+    several hard links inside the tree are counted once. Unreadable entries
+    are reported in the result instead of failing the whole computation.
+
+    Cached subtotals are reused while a directory's mtime is unchanged. Files
+    that grow in place do not change their directory's mtime, so the cache is
+    only used when asked for, by callers that can accept such stale totals.
+
+    Args:
+        directory_path (str): Path to the directory
+        workers (int, optional): Number of scanning threads. Defaults to DIR_SIZE_WORKERS.
+        use_cache (bool, optional): Whether to reuse cached subtotals. Defaults to False.
+        progress (Callable[[Dict[str, Any]], None], optional): Function called periodically
+            with the running totals. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: Dictionary with the total size, file and directory counts,
+            the number of rescanned and cached directories, and any errors
+
+    Raises:
+        FileNotFoundError: If the directory does not exist
+    """
+    logger.info(f"Computing directory size: {directory_path} (workers={workers}, use_cache={use_cache})")
+
+    if not os.path.isdir(directory_path):
+        logger.error(f"Directory not found: {directory_path}")
+        raise FileNotFoundError(f"Directory not found: {directory_path}")
+
+    start_time = time.time()
+    root = os.path.abspath(directory_path)
+    totals = {'size': 0, 'files': 0, 'directories': 0, 'rescanned': 0, 'cached': 0}
+    seen_links: Set[Tuple[int, int]] = set()
+    errors: List[str] = []
+    error_count = 0
+    last_report = 0.0
+
+    with ThreadPoolExecutor(max_workers=workers or DIR_SIZE_WORKERS) as executor:
+        pending = {executor.submit(_scan_directory, root, use_cache): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                summary, cached, error = future.result()
+
+                if error:
+                    error_count += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append(error)
+                if summary is None:
+                    continue
+
+                totals['directories'] += 1
+                totals['cached' if cached else 'rescanned'] += 1
+                totals['files'] += summary.files
+                totals['size'] += summary.size
+                for dev, ino, size in summary.linked:
+                    if (dev, ino) not in seen_links:
+                        seen_links.add((dev, ino))
+                        totals['size'] += size
+
+                for name in summary.subdirs:
+                    subdir = os.path.join(path, name)
+                    pending[executor.submit(_scan_directory, subdir, use_cache)] = subdir
+
+            if progress is not None and time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                progress(dict(totals, path=root))
+
+    return dict(
+        totals,
+        path=root,
+        errors=errors,
+        error_count=error_count,
+        execution_time=time.time() - start_time
+    )
+
+
+def clear_cache() -> None:
+    """Drop all cached directory subtotals."""
+    with _summaries_lock:
+        _summaries.clear()
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Command Executor Module
+
+This module runs shell commands on a single asyncio event loop in a background
+thread. Commands are started with ``asyncio.create_subprocess_exec`` and
+supervised without a thread per command, a scheduler decides which waiting
+command runs next when all slots are busy (see shellama.scheduler), and each
+command has its own timeout after which its whole process group is killed. Synchronous callers use ``CommandExecutor.execute``.
+The output kept for each stream is capped (see shellama.output_capture).
+Commands can also be started from a separate launcher process (see shellama.launcher).
+"""
+
+import io
+import os
+import sys
+import time
+import codecs
+import signal
+import asyncio
+import locale
+import inspect
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from shellama.logger import logger
+from shellama.launcher import (LAUNCHER_ENABLED, Launcher, LaunchedProcess, LauncherUnavailable,
+                               launcher as process_launcher)
+from shellama.limits import CommandSandbox, ResourceLimits
+from shellama.output_capture import OUTPUT_LIMIT, CappedOutput, overflow_store
+from shellama.scheduler import PRIORITY_CLASSES, DeadlineExceeded, Scheduler
+
+
+# Maximum number of commands running at the same time; further commands wait for a slot
+MAX_CONCURRENT_COMMANDS = int(os.environ.get('SHELLAMA_MAX_CONCURRENT_COMMANDS', 64))
+
+# Timeout in seconds applied to commands that do not set their own (0 means no timeout)
+DEFAULT_COMMAND_TIMEOUT = float(os.environ.get('SHELLAMA_COMMAND_TIMEOUT', 0))
+
+# Seconds to wait for the output pipes to close after a command has exited
+_DRAIN_TIMEOUT = 1.0
+
+_READ_SIZE = 64 * 1024
+
+# Maximum number of output pieces buffered for a streaming client before the command is paused
+STREAM_QUEUE_SIZE = int(os.environ.get('SHELLAMA_STREAM_QUEUE_SIZE', 64))
+
+# Called with the stream name ('stdout' or 'stderr') and each decoded piece of output
+OutputCallback = Callable[[str, str], None]
+
+
+def _install_child_watcher() -> None:
+    """
+    Use pidfd to wait for child processes where the interpreter does not already.
+
+    Before Python 3.12 the default child watcher starts one thread per child
+    process, which defeats supervising many commands from one loop.
+    """
+    if sys.version_info >= (3, 12) or not hasattr(os, 'pidfd_open'):
+        return
+    policy = asyncio.get_event_loop_policy()
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+        if not isinstance(policy._watcher, _PidfdChildWatcher):
+            policy.set_child_watcher(_PidfdChildWatcher())
+    except (AttributeError, OSError, NotImplementedError) as e:
+        logger.debug(f"pidfd child watcher unavailable: {str(e)}")
+
+
+class _PidfdChildWatcher(asyncio.AbstractChildWatcher if sys.version_info < (3, 12) else object):
+    """
+    Child watcher waiting on a pidfd on whichever loop started the process.
+
+    Unlike the standard library's PidfdChildWatcher before Python 3.12, it is
+    not bound to one loop, so other loops (such as ``asyncio.run`` in the main
+    thread re-attaching the policy's watcher) cannot take it away from the
+    executor loop.
+    """
+
+    def add_child_handler(self, pid, callback, *args):
+        loop = asyncio.get_running_loop()
+        pidfd = os.pidfd_open(pid)
+
+        def on_exit():
+            loop.remove_reader(pidfd)
+            try:
+                _, status = os.waitpid(pid, 0)
+                returncode = os.waitstatus_to_exitcode(status)
+            except ChildProcessError:
+                # Reaped by someone else; the exit status is lost
+                returncode = 255
+            finally:
+                os.close(pidfd)
+            callback(pid, returncode, *args)
+
+        loop.add_reader(pidfd, on_exit)
+
+    def remove_child_handler(self, pid):
+        return False
+
+    def attach_loop(self, loop):
+        pass
+
+    def is_active(self):
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _CommandProtocol(asyncio.subprocess.SubprocessStreamProtocol):
+    """Stream protocol that also reports when the process exits, even if its pipes are still open."""
+
+    def __init__(self, limit: int, loop: asyncio.AbstractEventLoop):
+        super().__init__(limit=limit, loop=loop)
+        self.exited = loop.create_future()
+
+    def process_exited(self) -> None:
+        super().process_exited()
+        if not self.exited.done():
+            self.exited.set_result(None)
+
+
+class CommandExecutor:
+    """Class running commands concurrently on a background event loop."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_COMMANDS, launcher: Optional[Launcher] = None):
+        """
+        Initialize the executor. The event loop is started on first use.
+
+        Args:
+            max_concurrent (int, optional): Maximum number of commands running at the same time.
+                Defaults to MAX_CONCURRENT_COMMANDS.
+            launcher (Launcher, optional): Launcher process starting the commands without
+                resource limits. Defaults to None (commands are started from this process).
+        """
+        self.max_concurrent = max_concurrent
+        self.launcher = launcher
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self.scheduler = Scheduler(max_concurrent)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop running the commands, started if needed."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                _install_child_watcher()
+                ready = threading.Event()
+
+                def run_loop():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run_loop, name='shellama-executor', daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    async def run(self, args: Union[str, List[str]], shell: bool = False, cwd: Optional[str] = None,
+                  env: Optional[Dict[str, str]] = None, timeout: Optional[float] = None,
+                  on_output: Optional[OutputCallback] = None, capture: bool = True,
+                  limits: Optional[ResourceLimits] = None, output_limit: Optional[int] = None,
+                  priority: str = 'normal', tenant: Optional[str] = None,
+                  deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run a command on the executor's event loop.
+
+        Args:
+            args (Union[str, List[str]]): Command line for the shell, or the argument list
+            shell (bool, optional): Whether to run the command with the shell. Defaults to False.
+            cwd (str, optional): The working directory to run the command in. Defaults to None.
+            env (Dict[str, str], optional): Environment variables to set. Defaults to None.
+            timeout (float, optional): Timeout in seconds, counted from when the command
+                starts. Defaults to DEFAULT_COMMAND_TIMEOUT.
+            on_output (OutputCallback, optional): Function called on the event loop with
+                each piece of output as it arrives. If it returns an awaitable, reading
+                pauses until it completes. Defaults to None.
+            capture (bool, optional): Whether to collect the output in the result.
+                Defaults to True.
+            limits (ResourceLimits, optional): Resource limits for the command; the result then
+                includes a ``resources`` entry with the usage. Defaults to None.
+            output_limit (int, optional): Bytes of each stream kept in the result, at most
+                SHELLAMA_OUTPUT_LIMIT. Defaults to SHELLAMA_OUTPUT_LIMIT.
+            priority (str, optional): Priority class: 'interactive', 'normal' or 'batch'.
+                Defaults to 'normal'.
+            tenant (str, optional): Tenant whose commands share their class fairly with
+                other tenants' commands. Defaults to None.
+            deadline (float, optional): Seconds within which the command must start; if it
+                is still waiting then, it is not run. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: Dictionary with command execution results
+
+        Raises:
+            ValueError: If the priority class or output limit is invalid
+            SchedulerFull: If too many commands are waiting
+        """
+        if output_limit is not None and output_limit <= 0:
+            raise ValueError("output_limit must be greater than 0")
+        timeout = timeout or DEFAULT_COMMAND_TIMEOUT or None
+
+        queued_at = time.time()
+        loop = asyncio.get_running_loop()
+        self.waiting += 1
+        try:
+            await self.scheduler.acquire(priority, tenant, None if deadline is None else loop.time() + deadline)
+        except DeadlineExceeded as e:
+            logger.warning(f"Command not started: {str(e)}: {args}")
+            return {'success': False, 'exit_code': None, 'pid': None, 'stdout': '', 'stderr': '',
+                    'error': str(e), 'execution_time': 0.0, 'queue_time': time.time() - queued_at}
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        start_time = time.time()
+        try:
+            return await self._run(args, shell, cwd, env, timeout, on_output, capture, limits,
+                                   min(output_limit or OUTPUT_LIMIT, OUTPUT_LIMIT), start_time,
+                                   start_time - queued_at)
+        finally:
+            self.running -= 1
+            self.scheduler.release(priority, time.time() - start_time)
+
+    async def _run(self, args, shell, cwd, env, timeout, on_output, capture, limits, output_limit, start_time,
+                   queue_time) -> Dict[str, Any]:
+        """Start a command, collect its output and wait for it, killing it on timeout."""
+        output: Dict[str, Optional[CappedOutput]] = {'stdout': CappedOutput(output_limit) if capture else None,
+                                                     'stderr': CappedOutput(output_limit) if capture else None}
+        result: Dict[str, Any] = {'success': False, 'exit_code': None, 'pid': None}
+
+        loop = asyncio.get_running_loop()
+        protocol_factory = lambda: _CommandProtocol(_READ_SIZE, loop)
+        options = dict(stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                       stderr=asyncio.subprocess.PIPE, cwd=cwd, env=env, start_new_session=True)
+        sandbox = None
+        launched = False
+        command, use_shell = args, shell
+        try:
+            if limits is not None:
+                sandbox = CommandSandbox(limits)
+                command = sandbox.command(['/bin/sh', '-c', args] if shell else list(args))
+                use_shell = False
+            if self.launcher is not None and self.launcher.supported:
+                try:
+                    process = await self.launcher.launch(command, shell=use_shell, cwd=cwd, env=env,
+                                                         limit=_READ_SIZE)
+                    exited, close, returncode = process.exited, process.close, lambda: process.returncode
+                    launched = True
+                except LauncherUnavailable as e:
+                    logger.warning(f"Starting command directly: {str(e)}")
+            if not launched:
+                if use_shell:
+                    transport, protocol = await loop.subprocess_shell(protocol_factory, command, **options)
+                else:
+                    transport, protocol = await loop.subprocess_exec(protocol_factory, *command, **options)
+                process = asyncio.subprocess.Process(transport, protocol, loop)
+                exited, close, returncode = protocol.exited, transport.close, transport.get_returncode
+        except Exception as e:
+            logger.error(f"Error executing command {args}: {str(e)}")
+            result.update(stdout='', stderr='', error=str(e))
+            if sandbox is not None:
+                result['resources'] = sandbox.finish()
+            return self._finish(result, start_time, queue_time)
+
+        result['pid'] = process.pid
+        readers = [
+            asyncio.ensure_future(self._read_stream(process.stdout, 'stdout', output['stdout'], on_output)),
+            asyncio.ensure_future(self._read_stream(process.stderr, 'stderr', output['stderr'], on_output))
+        ]
+
+        try:
+            await asyncio.wait_for(asyncio.shield(exited), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Command timed out after {timeout} seconds: {args}")
+            self._kill(process)
+            if sandbox is not None:
+                sandbox.kill()
+            await exited
+            result['error'] = f"Command timed out after {timeout} seconds"
+        except asyncio.CancelledError:
+            self._kill(process)
+            if sandbox is not None:
+                sandbox.finish()
+            for capture in output.values():
+                if capture is not None:
+                    capture.discard()
+            raise
+        finally:
+            # Background children may keep the pipes open after the command has exited
+            _done, pending = await asyncio.wait(readers, timeout=_DRAIN_TIMEOUT)
+            for reader in pending:
+                reader.cancel()
+            if pending or launched:
+                close()
+
+        if sandbox is not None:
+            # Removing the cgroup may have to wait for leftover processes to die
+            result['resources'] = await loop.run_in_executor(None, sandbox.finish)
+
+        if capture:
+            result['stdout'] = output['stdout'].text()
+            result['stderr'] = output['stderr'].text()
+            result['output_size'] = {name: output[name].total for name in output}
+            result['truncated'] = {name: output[name].truncated for name in output}
+            output_id = overflow_store.register(output)
+            if output_id is not None:
+                result['output_id'] = output_id
+        else:
+            result['stdout'] = result['stderr'] = ''
+        if 'error' not in result:
+            result['exit_code'] = returncode()
+            if result['exit_code'] is None:
+                result['error'] = "The command launcher exited before the command finished"
+            elif result['exit_code'] == 0:
+                result['success'] = True
+            else:
+                logger.error(f"Command failed with exit code {result['exit_code']}: {args}")
+                result['error'] = f"Command failed with exit code {result['exit_code']}"
+        return self._finish(result, start_time, queue_time)
+
+    @staticmethod
+    def _finish(result: Dict[str, Any], start_time: float, queue_time: float) -> Dict[str, Any]:
+        result['execution_time'] = time.time() - start_time
+        result['queue_time'] = queue_time
+        return result
+
+    @staticmethod
+    async def _read_stream(stream: asyncio.StreamReader, name: str, capture: Optional[CappedOutput],
+                           on_output: Optional[OutputCallback]) -> None:
+        """Collect a pipe into a capture and, decoded like text mode subprocesses do, pass it to the callback."""
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace'), translate=True)
+        while True:
+            data = await stream.read(_READ_SIZE)
+            if capture is not None:
+                capture.write(data)
+            text = decoder.decode(data, final=not data) if on_output is not None else ''
+            if text:
+                if on_output is not None:
+                    try:
+                        pending = on_output(name, text)
+                        if inspect.isawaitable(pending):
+                            await pending
+                    except Exception as e:
+                        logger.warning(f"Output callback failed: {str(e)}")
+            if not data:
+                break
+
+    @staticmethod
+    def _kill(process: Union[asyncio.subprocess.Process, LaunchedProcess]) -> None:
+        """Kill a command together with the processes it started."""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+    def submit(self, args: Union[str, List[str]], **kwargs: Any) -> concurrent.futures.Future:
+        """
+        Start a command from any thread.
+
+        Args:
+            args (Union[str, List[str]]): Command line for the shell, or the argument list
+            **kwargs: Options accepted by run()
+
+        Returns:
+            concurrent.futures.Future: Future resolving to the command execution results
+        """
+        return asyncio.run_coroutine_threadsafe(self.run(args, **kwargs), self.loop)
+
+    def check_admission(self, priority: str = 'normal', tenant: Optional[str] = None) -> None:
+        """
+        Check from any thread that a command of a class and tenant would not be rejected now.
+
+        Args:
+            priority (str, optional): Priority class. Defaults to 'normal'.
+            tenant (str, optional): Tenant of the command. Defaults to None.
+
+        Raises:
+            ValueError: If the priority class is unknown
+            SchedulerFull: If the class or the tenant has too many commands waiting
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITY_CLASSES)}")
+
+        async def check():
+            # The scheduler's queues belong to the executor loop
+            self.scheduler.check(priority, tenant)
+
+        asyncio.run_coroutine_threadsafe(check(), self.loop).result()
+
+    def execute(self, args: Union[str, List[str]], **kwargs: Any) -> Dict[str, Any]:
+        """
+        Run a command and wait for its results.
+
+        Args:
+            args (Union[str, List[str]]): Command line for the shell, or the argument list
+            **kwargs: Options accepted by run()
+
+        Returns:
+            Dict[str, Any]: Dictionary with command execution results
+
+        Raises:
+            RuntimeError: If called from the executor's own event loop
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("execute() cannot be called from the executor loop, await run() instead")
+        return self.submit(args, **kwargs).result()
+
+    def stream(self, args: Union[str, List[str]], mode: str = 'lines', max_buffered: int = STREAM_QUEUE_SIZE,
+               **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Run a command and yield its output as it is produced.
+
+        The output is not collected. At most ``max_buffered`` pieces wait for the
+        consumer; beyond that the pipes are not read, so a fast command is paused
+        by the kernel until the consumer catches up. Closing the iterator early
+        kills the command.
+
+        Args:
+            args (Union[str, List[str]]): Command line for the shell, or the argument list
+            mode (str, optional): 'lines' to yield complete lines, 'chunks' to yield output
+                as it is read. Defaults to 'lines'.
+            max_buffered (int, optional): Maximum number of buffered output pieces.
+                Defaults to STREAM_QUEUE_SIZE.
+            **kwargs: Options accepted by run()
+
+        Yields:
+            Dict[str, Any]: ``{'event': 'stdout'|'stderr', 'data': ...}`` events followed by an
+                ``{'event': 'exit', ...}`` event with the exit code and timing
+
+        Raises:
+            ValueError: If the mode is unknown
+        """
+        if mode not in ('lines', 'chunks'):
+            raise ValueError(f"Unknown stream mode: {mode}")
+
+        loop = self.loop
+
+        async def create_queue():
+            # Before Python 3.10 a queue binds to the current loop when it is created,
+            # so it must be created on the executor's loop, not in the calling thread
+            return asyncio.Queue(maxsize=max_buffered)
+
+        events: asyncio.Queue = asyncio.run_coroutine_threadsafe(create_queue(), loop).result()
+
+        async def produce():
+            try:
+                result = await self.run(args, on_output=lambda name, text: events.put((name, text)),
+                                        capture=False, **kwargs)
+                del result['stdout'], result['stderr']
+                await events.put(('exit', result))
+            except Exception as e:
+                logger.error(f"Error streaming command {args}: {str(e)}")
+                await events.put(('exit', {'success': False, 'exit_code': None, 'error': str(e)}))
+
+        task = asyncio.run_coroutine_threadsafe(produce(), loop)
+        partial = {'stdout': '', 'stderr': ''}
+        try:
+            while True:
+                name, payload = asyncio.run_coroutine_threadsafe(events.get(), loop).result()
+                if name == 'exit':
+                    for stream_name, rest in partial.items():
+                        if rest:
+                            yield {'event': stream_name, 'data': rest}
+                    yield dict(payload, event='exit')
+                    break
+
+                if mode == 'chunks':
+                    yield {'event': name, 'data': payload}
+                    continue
+
+                lines = (partial[name] + payload).split('\n')
+                partial[name] = lines.pop()
+                for line in lines:
+                    yield {'event': name, 'data': line + '\n'}
+                if len(partial[name]) >= _READ_SIZE:
+                    # Do not hold an unbounded line in memory
+                    yield {'event': name, 'data': partial[name]}
+                    partial[name] = ''
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get executor statistics.
+
+        Returns:
+            Dict[str, Any]: Dictionary with the number of running and waiting commands
+        """
+        return {
+            'running': self.running,
+            'waiting': self.waiting,
+            'max_concurrent': self.max_concurrent,
+            'launcher': self.launcher is not None and self.launcher.supported,
+            'scheduler': self.scheduler.stats()
+        }
+
+
+# Create a global instance
+command_executor = CommandExecutor(launcher=process_launcher if LAUNCHER_ENABLED else None)
@@ -9,46 +9,245 @@ This module provides functions for file operations such as reading, writing, and
 
 import os
 import json
+import uuid
+import base64
+import heapq
+import fnmatch
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, BinaryIO, Iterator, Tuple
 from datetime import datetime
 
 from shellama.logger import logger
+from shellama.fs_cache import metadata_cache
+from shellama.reaper import is_trash_name
 
 
-def list_files(directory: str, pattern: str = "*.md") -> List[Dict[str, Any]]:
+# Size of the chunks sent when streaming raw file contents
+STREAM_CHUNK_SIZE = int(os.environ.get('SHELLAMA_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Sort fields accepted by list_files_page and the file information keys they sort on
+_SORT_FIELDS = {
+    'mtime': 'modified',
+    'name': 'name',
+    'size': 'size'
+}
+
+
+def list_files(directory: str, pattern: str = "*.md", use_cache: bool = True) -> List[Dict[str, Any]]:
     """
     List files in a directory matching a pattern.
     
+    Listings are served from the metadata cache, which is invalidated when the
+    directory changes.
+    
     Args:
         directory (str): Directory path to list files from
         pattern (str, optional): Glob pattern to match files. Defaults to "*.md".
+        use_cache (bool, optional): Whether to use the metadata cache. Defaults to True.
         
     Returns:
-        List[Dict[str, Any]]: List of file information dictionaries
+        List[Dict[str, Any]]: List of file information dictionaries, newest first
     """
     logger.info(f"Listing files in {directory} with pattern {pattern}")
-    
+    return _load_files(directory, pattern, use_cache)
+
+
+def _load_files(directory: str, pattern: str, use_cache: bool) -> List[Dict[str, Any]]:
+    """Get the files matching a pattern newest first, from the metadata cache if allowed."""
     # Create the directory if it doesn't exist
     os.makedirs(directory, exist_ok=True)
     
-    # Get all files matching the pattern
+    if use_cache:
+        return metadata_cache.get(directory, pattern, lambda: _scan_files(directory, pattern))
+    return _scan_files(directory, pattern)
+
+
+def get_listing_digest(directory: str, pattern: str = "*.md") -> str:
+    """
+    Get a digest that changes whenever the listing of a directory changes.
+    
+    The digest is computed once per scan and served from the metadata cache,
+    so it is much cheaper than listing the files again.
+    
+    Args:
+        directory (str): Directory path to list files from
+        pattern (str, optional): Glob pattern to match files. Defaults to "*.md".
+        
+    Returns:
+        str: Hex digest of the listing
+        
+    Raises:
+        FileNotFoundError: If the directory does not exist
+    """
+    return metadata_cache.digest(directory, pattern, lambda: _scan_files(directory, pattern))
+
+
+def list_files_page(directory: str, pattern: str = "*", limit: int = 50, cursor: Optional[str] = None,
+                    sort: str = 'mtime', order: Optional[str] = None,
+                    min_size: Optional[int] = None, max_size: Optional[int] = None,
+                    modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+                    use_cache: bool = True) -> Dict[str, Any]:
+    """
+    List one page of files in a directory matching a pattern.
+    
+    Only the requested page is sorted: the next ``limit`` files after the cursor
+    are selected with a heap while the listing is filtered, which costs
+    O(n log limit) instead of sorting the whole directory.
+    
+    Args:
+        directory (str): Directory path to list files from
+        pattern (str, optional): Glob pattern to match files. Defaults to "*".
+        limit (int, optional): Maximum number of files to return. Defaults to 50.
+        cursor (str, optional): Cursor returned with the previous page. Defaults to None (first page).
+        sort (str, optional): Sort field, one of 'mtime', 'name' or 'size'. Defaults to 'mtime'.
+        order (str, optional): 'asc' or 'desc'. Defaults to newest/largest first for 'mtime'
+            and 'size', and to alphabetical order for 'name'.
+        min_size (int, optional): Minimum file size in bytes. Defaults to None.
+        max_size (int, optional): Maximum file size in bytes. Defaults to None.
+        modified_after (float, optional): Only include files modified after this timestamp. Defaults to None.
+        modified_before (float, optional): Only include files modified before this timestamp. Defaults to None.
+        use_cache (bool, optional): Whether to use the metadata cache. Defaults to True.
+        
+    Returns:
+        Dict[str, Any]: Dictionary with the files of the page, the total number of
+            matching files and the cursor of the next page (None on the last page)
+        
+    Raises:
+        ValueError: If the sort field, order, limit or cursor is invalid
+    """
+    if sort not in _SORT_FIELDS:
+        raise ValueError(f"Invalid sort field: {sort}")
+    if order is None:
+        order = 'asc' if sort == 'name' else 'desc'
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"Invalid sort order: {order}")
+    if limit < 1:
+        raise ValueError(f"Invalid limit: {limit}")
+    
+    logger.info(f"Listing files in {directory} with pattern {pattern} (sort={sort}, order={order}, limit={limit})")
+    field = _SORT_FIELDS[sort]
+    descending = order == 'desc'
+    after = _decode_cursor(cursor, sort, order) if cursor else None
+    
+    def sort_key(info):
+        return info[field], info['path']
+    
+    def matches(info):
+        if min_size is not None and info['size'] < min_size:
+            return False
+        if max_size is not None and info['size'] > max_size:
+            return False
+        if modified_after is not None and info['modified'] <= modified_after:
+            return False
+        if modified_before is not None and info['modified'] >= modified_before:
+            return False
+        return True
+    
+    total = 0
+    
+    def candidates():
+        nonlocal total
+        for info in _load_files(directory, pattern, use_cache):
+            if not matches(info):
+                continue
+            total += 1
+            if after is None or (sort_key(info) < after if descending else sort_key(info) > after):
+                yield info
+    
+    select = heapq.nlargest if descending else heapq.nsmallest
+    page = select(limit + 1, candidates(), key=sort_key)
+    
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = _encode_cursor(sort, order, sort_key(page[-1]))
+    
+    return {
+        'files': page,
+        'total': total,
+        'next_cursor': next_cursor
+    }
+
+
+def _encode_cursor(sort: str, order: str, key: Tuple[Any, str]) -> str:
+    """Encode the sort key of the last file of a page as an opaque cursor."""
+    data = json.dumps([sort, order, key[0], key[1]])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: str, sort: str, order: str) -> Tuple[Any, str]:
+    """Decode a cursor created by _encode_cursor for the same sort field and order."""
+    try:
+        cursor_sort, cursor_order, value, path = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise ValueError(f"Cursor was created for sort={cursor_sort} order={cursor_order}")
+    return value, path
+
+
+def _is_simple_pattern(pattern: str) -> bool:
+    """Check if a glob pattern only matches names directly inside the directory."""
+    return (pattern not in ('', '.', '..') and '**' not in pattern and os.sep not in pattern
+            and (os.altsep is None or os.altsep not in pattern))
+
+
+def _scan_files(directory: str, pattern: str) -> List[Dict[str, Any]]:
+    """
+    Scan a directory for files matching a pattern.
+    
+    Patterns that only match names inside the directory are handled with
+    ``os.scandir``, which reuses the stat data of each directory entry;
+    recursive patterns fall back to ``Path.glob``.
+    
+    Args:
+        directory (str): Directory path to list files from
+        pattern (str): Glob pattern to match files
+        
+    Returns:
+        List[Dict[str, Any]]: List of file information dictionaries, newest first
+    """
     files = []
-    for file_path in Path(directory).glob(pattern):
-        # Get file stats
-        stats = file_path.stat()
-        
-        # Add file info to the list
-        files.append({
-            'name': file_path.name,
-            'path': str(file_path),
-            'size': stats.st_size,
-            'modified': stats.st_mtime
-        })
     
-    # Sort files by modification time (newest first)
-    files.sort(key=lambda x: x['modified'], reverse=True)
+    if _is_simple_pattern(pattern):
+        base = str(Path(directory))
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not fnmatch.fnmatchcase(entry.name, pattern) or is_trash_name(entry.name):
+                    continue
+                try:
+                    stats = entry.stat()
+                except FileNotFoundError:
+                    # Broken symlink or file removed during the scan
+                    continue
+                
+                files.append({
+                    'name': entry.name,
+                    'path': entry.name if base == '.' else os.path.join(base, entry.name),
+                    'size': stats.st_size,
+                    'modified': stats.st_mtime
+                })
+    else:
+        # Get all files matching the pattern
+        for file_path in Path(directory).glob(pattern):
+            # Trees waiting to be deleted are not listed, nor is anything inside them
+            if any(is_trash_name(part) for part in file_path.relative_to(directory).parts):
+                continue
+            
+            # Get file stats
+            stats = file_path.stat()
+            
+            # Add file info to the list
+            files.append({
+                'name': file_path.name,
+                'path': str(file_path),
+                'size': stats.st_size,
+                'modified': stats.st_mtime
+            })
     
+    # Sorted once per scan, so cached listings are served without sorting them again
+    files.sort(key=lambda x: x['modified'], reverse=True)
     return files
 
 
@@ -80,10 +279,190 @@ def read_file(file_path: str) -> str:
         raise
 
 
+def open_file_stream(file_path: str) -> Tuple[BinaryIO, os.stat_result]:
+    """
+    Open a file for streaming its raw bytes.
+    
+    The returned stats are taken from the open descriptor, so they describe
+    exactly the file that will be streamed even if the path is replaced later.
+    
+    Args:
+        file_path (str): Path to the file to open
+        
+    Returns:
+        Tuple[BinaryIO, os.stat_result]: Open binary file handle and its stats
+        
+    Raises:
+        FileNotFoundError: If the file does not exist
+        IOError: If there is an error opening the file
+    """
+    logger.info(f"Opening file for streaming: {file_path}")
+    
+    try:
+        handle = open(file_path, 'rb')
+    except FileNotFoundError:
+        logger.error(f"File not found: {file_path}")
+        raise
+    except IOError as e:
+        logger.error(f"Error opening file {file_path}: {str(e)}")
+        raise
+    
+    return handle, os.fstat(handle.fileno())
+
+
+def parse_range_header(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse an HTTP ``Range`` header into a single inclusive byte range.
+    
+    Only single ``bytes`` ranges are supported. Missing, malformed and
+    multi-range headers return None, in which case the whole file should be
+    sent, as permitted by RFC 9110.
+    
+    Args:
+        range_header (str, optional): Value of the ``Range`` request header
+        file_size (int): Size of the file in bytes
+        
+    Returns:
+        Optional[Tuple[int, int]]: Inclusive (start, end) offsets, or None
+        
+    Raises:
+        ValueError: If the range cannot be satisfied for a file of this size
+    """
+    if not range_header:
+        return None
+    
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    
+    try:
+        first_pos = int(first) if first else None
+        last_pos = int(last) if last else None
+    except ValueError:
+        return None
+    
+    if first_pos is None:
+        # Suffix range: the last N bytes of the file
+        if last_pos is None:
+            return None
+        if last_pos <= 0:
+            raise ValueError(f"Range not satisfiable: {range_header}")
+        start = max(file_size - last_pos, 0)
+        end = file_size - 1
+    else:
+        if first_pos < 0 or (last_pos is not None and last_pos < first_pos):
+            return None
+        start = first_pos
+        end = last_pos if last_pos is not None else file_size - 1
+    
+    if start >= file_size:
+        raise ValueError(f"Range not satisfiable: {range_header}")
+    
+    return start, min(end, file_size - 1)
+
+
+def iter_file_chunks(handle: BinaryIO, start: int = 0, length: Optional[int] = None,
+                     chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yield the bytes of an open file in fixed-size chunks.
+    
+    At most one chunk is held in memory at a time. The handle is closed once
+    the generator is exhausted or closed.
+    
+    Args:
+        handle (BinaryIO): Open binary file handle
+        start (int, optional): Offset to start reading from. Defaults to 0.
+        length (int, optional): Number of bytes to read. Defaults to None (until EOF).
+        chunk_size (int, optional): Maximum chunk size in bytes. Defaults to STREAM_CHUNK_SIZE.
+        
+    Yields:
+        bytes: Consecutive chunks of the file
+    """
+    try:
+        handle.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = handle.read(size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+
+def temp_path_for(file_path: str, tag: Optional[str] = None) -> str:
+    """
+    Get a hidden temporary path next to a file.
+    
+    The temporary file lives in the same directory as the target so that it
+    can later be moved into place with an atomic ``os.replace``.
+    
+    Args:
+        file_path (str): Path of the target file
+        tag (str, optional): Unique tag for the temporary file. Defaults to a random UUID.
+        
+    Returns:
+        str: Path of the temporary file
+    """
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name[:200]}.{tag or uuid.uuid4().hex}.tmp")
+
+
+def replace_file(temp_path: str, file_path: str) -> None:
+    """
+    Atomically move a fully written temporary file over the target path.
+    
+    The temporary file is flushed to disk first and takes over the permissions
+    of an existing target, so readers see either the old or the new content and
+    never a partially written file.
+    
+    Args:
+        temp_path (str): Path of the temporary file, in the same directory as the target
+        file_path (str): Path of the target file
+        
+    Raises:
+        IOError: If there is an error replacing the file
+    """
+    fd = os.open(temp_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    
+    try:
+        os.chmod(temp_path, os.stat(file_path).st_mode & 0o7777)
+    except FileNotFoundError:
+        pass
+    
+    os.replace(temp_path, file_path)
+    
+    # Persist the rename itself
+    try:
+        dir_fd = os.open(os.path.dirname(file_path) or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
 def write_file(file_path: str, content: str) -> bool:
     """
     Write content to a file.
     
+    The content is written to a temporary file that atomically replaces the
+    target, so concurrent readers never see a partially written file.
+    
     Args:
         file_path (str): Path to the file to write
         content (str): Content to write to the file
@@ -96,17 +475,25 @@ def write_file(file_path: str, content: str) -> bool:
     """
     logger.info(f"Writing to file: {file_path}")
     
+    # Write through symlinks instead of replacing the link itself
+    if os.path.islink(file_path):
+        file_path = os.path.realpath(file_path)
+    
     # Create the directory if it doesn't exist
     directory = os.path.dirname(file_path)
     if directory:
         os.makedirs(directory, exist_ok=True)
     
+    temp_path = temp_path_for(file_path)
     try:
-        with open(file_path, 'w', encoding='utf-8') as file:
+        with open(temp_path, 'x', encoding='utf-8') as file:
             file.write(content)
+        replace_file(temp_path, file_path)
         return True
     except IOError as e:
         logger.error(f"Error writing to file {file_path}: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         raise
 
 
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Filesystem Metadata Cache Module
+
+This module provides an in-process cache for directory listings. Entries are
+kept fresh by inotify watches on the listed directories; where a directory
+cannot be watched, entries are revalidated against the directory mtime and
+expire after a short polling interval.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from shellama.logger import logger
+from shellama.watcher import Watcher
+
+
+# Maximum number of (directory, pattern) listings kept in the cache
+FS_CACHE_SIZE = int(os.environ.get('SHELLAMA_FS_CACHE_SIZE', 256))
+
+# Seconds an unwatched listing may be served before it is rescanned
+FS_CACHE_POLL_INTERVAL = float(os.environ.get('SHELLAMA_FS_CACHE_POLL_INTERVAL', 2.0))
+
+
+class _CacheEntry:
+    """A cached directory listing."""
+
+    __slots__ = ('real_path', 'files', 'mtime_ns', 'loaded_at', 'watched', '_digest')
+
+    def __init__(self, real_path: str, files: List[Dict[str, Any]], mtime_ns: int, watched: bool):
+        self.real_path = real_path
+        self.files = files
+        self.mtime_ns = mtime_ns
+        self.loaded_at = time.monotonic()
+        self.watched = watched
+        self._digest: Optional[str] = None
+
+    @property
+    def digest(self) -> str:
+        """Digest of the listing, computed once per scan."""
+        if self._digest is None:
+            self._digest = listing_digest(self.files)
+        return self._digest
+
+
+def listing_digest(files: List[Dict[str, Any]]) -> str:
+    """
+    Compute a digest of a directory listing.
+
+    Args:
+        files (List[Dict[str, Any]]): File information dictionaries with path, size and modified keys
+
+    Returns:
+        str: Hex digest that changes whenever a file is added, removed, resized or touched
+    """
+    digest = hashlib.sha1()
+    for info in files:
+        digest.update(f"{info['path']}\0{info['size']}\0{info['modified']!r}\n".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+class MetadataCache:
+    """Bounded LRU cache of directory listings."""
+
+    def __init__(self, max_entries: int = FS_CACHE_SIZE, poll_interval: float = FS_CACHE_POLL_INTERVAL):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int, optional): Maximum number of cached listings. Defaults to FS_CACHE_SIZE.
+            poll_interval (float, optional): Lifetime of unwatched listings in seconds.
+                Defaults to FS_CACHE_POLL_INTERVAL.
+        """
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self._entries: 'OrderedDict[Tuple[str, str], _CacheEntry]' = OrderedDict()
+        self._keys_by_dir: Dict[str, Set[Tuple[str, str]]] = {}
+        self._loading: Dict[str, List[List[bool]]] = {}
+        self._watcher = Watcher()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, directory: str, pattern: str, loader: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Get a directory listing, loading it on a cache miss.
+
+        Recursive patterns are never cached, because a watch on the top-level
+        directory does not see changes in its subdirectories.
+
+        Args:
+            directory (str): Directory that is listed
+            pattern (str): Glob pattern of the listing
+            loader (Callable[[], List[Dict[str, Any]]]): Function that scans the directory
+
+        Returns:
+            List[Dict[str, Any]]: The listing. The dictionaries are shared with the cache and must not be modified.
+        """
+        files, _entry = self._lookup(directory, pattern, loader)
+        return list(files)
+
+    def digest(self, directory: str, pattern: str, loader: Callable[[], List[Dict[str, Any]]]) -> str:
+        """
+        Get a digest of a directory listing, loading the listing on a cache miss.
+
+        Args:
+            directory (str): Directory that is listed
+            pattern (str): Glob pattern of the listing
+            loader (Callable[[], List[Dict[str, Any]]]): Function that scans the directory
+
+        Returns:
+            str: Hex digest of the listing
+        """
+        files, entry = self._lookup(directory, pattern, loader)
+        return entry.digest if entry is not None else listing_digest(files)
+
+    def _lookup(self, directory: str, pattern: str,
+                loader: Callable[[], List[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], Optional[_CacheEntry]]:
+        """Get a listing and its cache entry, which is None if the listing could not be cached."""
+        if '**' in pattern or os.sep in pattern:
+            with self._lock:
+                self.misses += 1
+            return loader(), None
+
+        key = (directory, pattern)
+        real_path = os.path.realpath(directory)
+
+        with self._lock:
+            self._process_events()
+
+            entry = self._entries.get(key)
+            if entry is not None and entry.real_path == real_path and self._is_fresh(entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.files, entry
+
+            self.misses += 1
+            # Watch before scanning so that changes made during the scan invalidate the result
+            watched = self._watcher.watch(real_path)
+            ticket = [True]
+            self._loading.setdefault(real_path, []).append(ticket)
+
+        try:
+            mtime_ns = os.stat(real_path).st_mtime_ns
+            files = loader()
+        except Exception:
+            with self._lock:
+                self._finish_loading(real_path, ticket)
+                self._release(real_path)
+            raise
+
+        entry = _CacheEntry(real_path, files, mtime_ns, watched)
+        with self._lock:
+            self._process_events()
+            self._finish_loading(real_path, ticket)
+            if ticket[0]:
+                self._store(key, entry)
+            else:
+                self._release(real_path)
+
+        return files, entry
+
+    def invalidate(self, directory: Optional[str] = None) -> None:
+        """
+        Drop cached listings.
+
+        Args:
+            directory (str, optional): Directory whose listings to drop. Defaults to None (all listings).
+        """
+        with self._lock:
+            if directory is None:
+                for real_path in list(self._keys_by_dir):
+                    self._invalidate_dir(real_path)
+            else:
+                self._invalidate_dir(os.path.realpath(directory))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dict[str, Any]: Dictionary with hit/miss counters and cache size
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'inotify': self._watcher.available
+            }
+
+    def _is_fresh(self, entry: _CacheEntry) -> bool:
+        """Check whether a cached listing can still be served."""
+        if entry.watched and self._watcher.is_watching(entry.real_path):
+            return True
+
+        # Polling fallback for directories that could not be watched
+        if time.monotonic() - entry.loaded_at > self.poll_interval:
+            return False
+        try:
+            return os.stat(entry.real_path).st_mtime_ns == entry.mtime_ns
+        except OSError:
+            return False
+
+    def _process_events(self) -> None:
+        """Invalidate the listings of directories that changed since the last call."""
+        for real_path, _name, _mask in self._watcher.read_events():
+            if real_path is None:
+                logger.warning("inotify event queue overflowed, invalidating all listings")
+                for path in set(self._keys_by_dir) | set(self._loading):
+                    self._invalidate_dir(path)
+            else:
+                self._invalidate_dir(real_path)
+
+    def _invalidate_dir(self, real_path: str) -> None:
+        """Drop the listings of one directory. Must be called with the lock held."""
+        for ticket in self._loading.get(real_path, ()):
+            ticket[0] = False
+        for key in self._keys_by_dir.pop(real_path, ()):
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+        self._release(real_path)
+
+    def _finish_loading(self, real_path: str, ticket: List[bool]) -> None:
+        """Forget an in-flight scan. Must be called with the lock held."""
+        tickets = self._loading.get(real_path)
+        if tickets is not None:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._loading[real_path]
+
+    def _release(self, real_path: str) -> None:
+        """Stop watching a directory that has no listings left. Must be called with the lock held."""
+        if real_path not in self._keys_by_dir and real_path not in self._loading:
+            self._watcher.unwatch(real_path)
+
+    def _store(self, key: Tuple[str, str], entry: _CacheEntry) -> None:
+        """Add a listing, evicting the least recently used ones. Must be called with the lock held."""
+        previous = self._entries.get(key)
+        if previous is not None and previous.real_path != entry.real_path:
+            self._forget_key(previous.real_path, key)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._keys_by_dir.setdefault(entry.real_path, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self.evictions += 1
+            self._forget_key(old_entry.real_path, old_key)
+
+    def _forget_key(self, real_path: str, key: Tuple[str, str]) -> None:
+        """Detach a listing from its directory. Must be called with the lock held."""
+        keys = self._keys_by_dir.get(real_path)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_dir[real_path]
+                self._release(real_path)
+
+
+# Create a global instance
+metadata_cache = MetadataCache()
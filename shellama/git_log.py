@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Git Log Module
+
+This module reads commit history from one ``git log -z`` call per page. The
+output is parsed as it arrives, so commits can be sent to a client before the
+page is complete. Pages are addressed by opaque cursors that record the commit
+the first page started from and how many commits were already returned, so
+paging is not affected by new commits on the branch.
+"""
+
+import re
+import json
+import base64
+import hashlib
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+import git
+
+from shellama.git_status import _split_records
+from shellama.repo_pool import repo_pool
+
+
+# Largest page of commits
+MAX_LOG_LIMIT = 1000
+
+# Fields of each commit header, separated by \x1f; the message comes last as it may contain anything
+_FORMAT = '%x1e' + '%x1f'.join(('%H', '%P', '%an', '%ae', '%aI', '%cn', '%ce', '%cI', '%B'))
+_FIELDS = ('hash', 'parents', 'author', 'email', 'author_date', 'committer', 'committer_email', 'date',
+           'message')
+
+# Full SHA-1 or SHA-256 object id
+_OBJECT_ID = re.compile(r'[0-9a-f]{40}|[0-9a-f]{64}')
+
+
+def _numstat_count(value: bytes) -> Optional[int]:
+    # Binary files are reported as '-'
+    return None if value == b'-' else int(value)
+
+
+def parse_log(stream: IO[bytes], numstat: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Parse ``git log -z`` output in this module's format incrementally.
+
+    Args:
+        stream (IO[bytes]): The output of Git
+        numstat (bool, optional): Whether the output includes ``--numstat``. Defaults to False.
+
+    Yields:
+        Dict[str, Any]: One dictionary per commit
+    """
+    commit: Optional[Dict[str, Any]] = None
+    records = _split_records(stream)
+    for record in records:
+        if record.startswith(b'\x1e'):
+            if commit is not None:
+                yield commit
+            values = record[1:].decode('utf-8', 'replace').split('\x1f', len(_FIELDS) - 1)
+            commit = dict(zip(_FIELDS, values))
+            commit['parents'] = commit['parents'].split()
+            commit['message'] = commit['message'].strip()
+            commit['subject'] = commit['message'].split('\n', 1)[0]
+            if numstat:
+                commit['files'] = []
+            continue
+
+        record = record.lstrip(b'\n')
+        if commit is None or not numstat or not record:
+            continue
+        added, deleted, path = record.split(b'\t', 2)
+        change = {'path': path.decode('utf-8', 'replace'), 'added': _numstat_count(added),
+                  'deleted': _numstat_count(deleted)}
+        if not path:
+            # Renames are followed by the old and the new path as separate records
+            change['orig_path'] = next(records, b'').decode('utf-8', 'replace')
+            change['path'] = next(records, b'').decode('utf-8', 'replace')
+        commit['files'].append(change)
+    if commit is not None:
+        yield commit
+
+
+def _query_digest(rev: str, paths: List[str], since: Optional[str], until: Optional[str],
+                  author: Optional[str]) -> str:
+    data = json.dumps([rev, paths, since, until, author])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+def _encode_cursor(tip: str, skip: int, query: str) -> str:
+    """Encode where the next page starts as an opaque cursor."""
+    data = json.dumps([tip, skip, query])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: str, query: str, rev: str) -> Tuple[str, int]:
+    """Decode a cursor created by _encode_cursor for the same query."""
+    try:
+        tip, skip, cursor_query = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    # Cursors come from clients, so nothing in them may reach Git unchecked
+    if not isinstance(tip, str) or not (_OBJECT_ID.fullmatch(tip) or ('..' in rev and tip == rev)):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if type(skip) is not int or skip < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if cursor_query != query:
+        raise ValueError("Cursor was created for a different query")
+    return tip, skip
+
+
+def iter_log(repo_path: str, limit: int = 50, cursor: Optional[str] = None, rev: str = 'HEAD',
+             paths: Optional[List[str]] = None, since: Optional[str] = None, until: Optional[str] = None,
+             author: Optional[str] = None, numstat: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Read one page of commit history.
+
+    The arguments are checked and the starting commit is resolved when this
+    function is called; Git runs while the returned iterator is consumed.
+
+    Args:
+        repo_path (str): Path to the Git repository
+        limit (int, optional): Maximum number of commits in the page. Defaults to 50.
+        cursor (str, optional): Cursor returned with the previous page. Defaults to None (first page).
+        rev (str, optional): Revision or range to list. Defaults to 'HEAD'.
+        paths (List[str], optional): Only list commits touching these paths. Defaults to None.
+        since (str, optional): Only list commits newer than this date. Defaults to None.
+        until (str, optional): Only list commits older than this date. Defaults to None.
+        author (str, optional): Only list commits whose author matches this pattern. Defaults to None.
+        numstat (bool, optional): Include the lines added and deleted per file. Defaults to False.
+
+    Returns:
+        Iterator[Dict[str, Any]]: Events: one ``commit`` event per commit, then a ``page``
+            event with the number of commits and the cursor of the next page (None on the last page)
+
+    Raises:
+        ValueError: If the limit, cursor or revision is invalid
+        git.InvalidGitRepositoryError: If the directory is not a Git repository
+    """
+    if not 1 <= limit <= MAX_LOG_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LOG_LIMIT}")
+    if rev.startswith('-'):
+        raise ValueError(f"Invalid revision: {rev}")
+    paths = list(paths or [])
+    query = _query_digest(rev, paths, since, until, author)
+
+    if cursor:
+        tip, skip = _decode_cursor(cursor, query, rev)
+    else:
+        skip = 0
+        with repo_pool.lease(repo_path) as repo:
+            if rev == 'HEAD' and not repo.head.is_valid():
+                # No commits yet
+                return _empty_log()
+            try:
+                # Ranges such as main..feature are kept as they are
+                tip = rev if '..' in rev else repo.commit(rev).hexsha
+            except (git.BadName, ValueError) as e:
+                raise ValueError(f"Unknown revision: {rev}") from e
+
+    command = ['git', 'log', '-z', f'--format={_FORMAT}', '--no-show-signature', f'--skip={skip}',
+               f'--max-count={limit + 1}']
+    if numstat:
+        command.append('--numstat')
+    if since:
+        command.append(f'--since={since}')
+    if until:
+        command.append(f'--until={until}')
+    if author:
+        command.append(f'--author={author}')
+    command += ['--end-of-options', tip, '--'] + paths
+    return _stream_log(repo_path, command, numstat, limit, tip, skip, query)
+
+
+def _empty_log() -> Iterator[Dict[str, Any]]:
+    """Yield the only event of a repository without commits."""
+    yield {'event': 'page', 'count': 0, 'next_cursor': None}
+
+
+def _stream_log(repo_path: str, command: List[str], numstat: bool, limit: int, tip: str, skip: int,
+                query: str) -> Iterator[Dict[str, Any]]:
+    """Run git log and yield the commits of one page."""
+    count = 0
+    more = False
+    with repo_pool.lease(repo_path) as repo:
+        process = repo.git.execute(command, as_process=True)
+        try:
+            for commit in parse_log(process.proc.stdout, numstat):
+                if count == limit:
+                    more = True
+                    break
+                count += 1
+                yield dict(commit, event='commit')
+        except BaseException:
+            # Stop Git instead of waiting for it to write the rest
+            process.proc.kill()
+            process.proc.wait()
+            raise
+        if more:
+            process.proc.kill()
+            process.proc.wait()
+        else:
+            # Raises GitCommandError with Git's message if the call failed
+            process.wait()
+    yield {'event': 'page', 'count': count,
+           'next_cursor': _encode_cursor(tip, skip + count, query) if more else None}
+
+
+def get_log(repo_path: str, **kwargs: Any) -> Dict[str, Any]:
+    """
+    Get one page of commit history.
+
+    Args:
+        repo_path (str): Path to the Git repository
+        **kwargs: Options accepted by iter_log()
+
+    Returns:
+        Dict[str, Any]: Dictionary with the commits and the cursor of the next page (None on the last page)
+
+    Raises:
+        ValueError: If the limit, cursor or revision is invalid
+        git.InvalidGitRepositoryError: If the directory is not a Git repository
+        git.GitCommandError: If Git fails
+    """
+    commits = []
+    next_cursor = None
+    for event in iter_log(repo_path, **kwargs):
+        if event.pop('event') == 'commit':
+            commits.append(event)
+        else:
+            next_cursor = event['next_cursor']
+    return {'commits': commits, 'next_cursor': next_cursor}
@@ -8,11 +8,14 @@ This module provides functions for Git version control operations.
 """
 
 import os
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import git
 from git import Repo
 
+from shellama import git_log, git_status
 from shellama.logger import logger
+from shellama.repo_pool import repo_pool
+from shellama.status_cache import status_cache
 
 
 def init_repo(directory_path: str) -> bool:
@@ -75,7 +78,10 @@ def clone_repo(repo_url: str, target_directory: str, branch: Optional[str] = Non
 
 def get_repo(directory_path: str) -> Repo:
     """
-    Get a Git repository object for the specified directory.
+    Get a new Git repository object for the specified directory.
+    
+    The caller owns the returned object. The functions in this module instead
+    lease pooled objects from shellama.repo_pool.
     
     Args:
         directory_path (str): Path to the Git repository
@@ -93,6 +99,82 @@ def get_repo(directory_path: str) -> Repo:
         raise
 
 
+def get_git_dir(repo_path: str) -> str:
+    """
+    Get the Git directory of a repository without starting Git.
+    
+    Args:
+        repo_path (str): Path to the Git repository
+        
+    Returns:
+        str: Path to the Git directory (``.git`` for regular repositories)
+        
+    Raises:
+        git.InvalidGitRepositoryError: If the directory is not a Git repository
+    """
+    dot_git = os.path.join(repo_path, '.git')
+    if os.path.isdir(dot_git):
+        return dot_git
+    
+    # Worktrees and submodules use a .git file pointing to the real Git directory
+    if os.path.isfile(dot_git):
+        with open(dot_git, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+        if content.startswith('gitdir:'):
+            return os.path.normpath(os.path.join(repo_path, content[len('gitdir:'):].strip()))
+    
+    # Bare repository
+    if os.path.isfile(os.path.join(repo_path, 'HEAD')) and os.path.isdir(os.path.join(repo_path, 'objects')):
+        return repo_path
+    
+    raise git.InvalidGitRepositoryError(repo_path)
+
+
+def get_head_commit(repo_path: str) -> Optional[str]:
+    """
+    Get the commit SHA that HEAD points to by reading the Git directory directly.
+    
+    Args:
+        repo_path (str): Path to the Git repository
+        
+    Returns:
+        Optional[str]: The commit SHA, or None if the current branch has no commits yet
+        
+    Raises:
+        git.InvalidGitRepositoryError: If the directory is not a Git repository
+    """
+    git_dir = get_git_dir(repo_path)
+    with open(os.path.join(git_dir, 'HEAD'), 'r', encoding='utf-8') as f:
+        head = f.read().strip()
+    
+    if not head.startswith('ref:'):
+        return head
+    ref = head[len('ref:'):].strip()
+    
+    # Linked worktrees keep their refs in the common Git directory
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir_file):
+        with open(commondir_file, 'r', encoding='utf-8') as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    
+    for directory in (git_dir, common_dir):
+        ref_file = os.path.join(directory, ref)
+        if os.path.isfile(ref_file):
+            with open(ref_file, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+    
+    packed_refs = os.path.join(common_dir, 'packed-refs')
+    if os.path.isfile(packed_refs):
+        with open(packed_refs, 'r', encoding='utf-8') as f:
+            for line in f:
+                sha, _, name = line.strip().partition(' ')
+                if name == ref:
+                    return sha
+    
+    return None
+
+
 def add_files(repo_path: str, files: List[str] = None) -> bool:
     """
     Add files to the Git index.
@@ -110,15 +192,14 @@ def add_files(repo_path: str, files: List[str] = None) -> bool:
     logger.info(f"Adding files to Git index in {repo_path}: {files if files else 'all'}")
     
     try:
-        repo = get_repo(repo_path)
-        
-        if files:
-            for file in files:
-                repo.git.add(file)
-        else:
-            repo.git.add(A=True)
-        
-        return True
+        with repo_pool.lease(repo_path) as repo:
+            if files:
+                for file in files:
+                    repo.git.add(file)
+            else:
+                repo.git.add(A=True)
+            
+            return True
     except git.GitCommandError as e:
         logger.error(f"Error adding files to Git index in {repo_path}: {str(e)}")
         raise
@@ -143,17 +224,16 @@ def commit(repo_path: str, message: str, author_name: Optional[str] = None, auth
     logger.info(f"Committing changes to Git repository in {repo_path} with message: {message}")
     
     try:
-        repo = get_repo(repo_path)
-        
-        # Set the author if provided
-        if author_name and author_email:
-            repo.git.config('user.name', author_name)
-            repo.git.config('user.email', author_email)
-        
-        # Commit the changes
-        repo.git.commit(m=message)
-        
-        return True
+        with repo_pool.lease(repo_path) as repo:
+            # Set the author if provided
+            if author_name and author_email:
+                repo.git.config('user.name', author_name)
+                repo.git.config('user.email', author_email)
+            
+            # Commit the changes
+            repo.git.commit(m=message)
+            
+            return True
     except git.GitCommandError as e:
         logger.error(f"Error committing changes to Git repository in {repo_path}: {str(e)}")
         raise
@@ -177,9 +257,9 @@ def push(repo_path: str, remote: str = 'origin', branch: str = 'main') -> bool:
     logger.info(f"Pushing changes to remote {remote}/{branch} from Git repository in {repo_path}")
     
     try:
-        repo = get_repo(repo_path)
-        repo.git.push(remote, branch)
-        return True
+        with repo_pool.lease(repo_path) as repo:
+            repo.git.push(remote, branch)
+            return True
     except git.GitCommandError as e:
         logger.error(f"Error pushing changes to remote {remote}/{branch} from Git repository in {repo_path}: {str(e)}")
         raise
@@ -203,23 +283,28 @@ def pull(repo_path: str, remote: str = 'origin', branch: str = 'main') -> bool:
     logger.info(f"Pulling changes from remote {remote}/{branch} to Git repository in {repo_path}")
     
     try:
-        repo = get_repo(repo_path)
-        repo.git.pull(remote, branch)
-        return True
+        with repo_pool.lease(repo_path) as repo:
+            repo.git.pull(remote, branch)
+            return True
     except git.GitCommandError as e:
         logger.error(f"Error pulling changes from remote {remote}/{branch} to Git repository in {repo_path}: {str(e)}")
         raise
 
 
-def get_status(repo_path: str) -> Dict[str, List[str]]:
+def get_status(repo_path: str, untracked: str = 'all', use_cache: bool = False) -> Dict[str, Any]:
     """
     Get the status of the Git repository.
     
+    With ``use_cache`` the status is served from the status cache, which
+    inotify watches keep fresh, and only changed paths are queried again.
+    
     Args:
         repo_path (str): Path to the Git repository
+        untracked (str, optional): How to list untracked files: 'all', 'normal' or 'no'. Defaults to 'all'.
+        use_cache (bool, optional): Whether to use the status cache. Defaults to False.
         
     Returns:
-        Dict[str, List[str]]: Dictionary with repository status information
+        Dict[str, Any]: Dictionary with repository status information (see shellama.git_status)
         
     Raises:
         git.GitCommandError: If there is an error getting the repository status
@@ -227,34 +312,38 @@ def get_status(repo_path: str) -> Dict[str, List[str]]:
     logger.info(f"Getting status of Git repository in {repo_path}")
     
     try:
-        repo = get_repo(repo_path)
-        
-        # Get the repository status
-        status = {
-            'modified': [],
-            'added': [],
-            'deleted': [],
-            'untracked': []
-        }
-        
-        # Get the repository status
-        for item in repo.index.diff(None):
-            if item.change_type == 'M':
-                status['modified'].append(item.a_path)
-            elif item.change_type == 'A':
-                status['added'].append(item.a_path)
-            elif item.change_type == 'D':
-                status['deleted'].append(item.a_path)
-        
-        # Get untracked files
-        status['untracked'] = repo.untracked_files
-        
+        if use_cache:
+            status = status_cache.get(repo_path, untracked)
+        else:
+            status = git_status.get_status(repo_path, untracked)
+        logger.debug(f"Git status of {repo_path}: {status['timing']['entries']} entries "
+                     f"in {status['timing']['elapsed']:.3f}s")
         return status
     except git.GitCommandError as e:
         logger.error(f"Error getting status of Git repository in {repo_path}: {str(e)}")
         raise
 
 
+def get_status_digest(repo_path: str, untracked: str = 'all') -> str:
+    """
+    Get a digest that changes whenever the status of the Git repository changes.
+    
+    The digest is computed once per change and served from the status cache,
+    so it is much cheaper than getting the status again.
+    
+    Args:
+        repo_path (str): Path to the Git repository
+        untracked (str, optional): How to list untracked files. Defaults to 'all'.
+        
+    Returns:
+        str: Hex digest of the status
+        
+    Raises:
+        git.InvalidGitRepositoryError: If the directory is not a Git repository
+    """
+    return status_cache.digest(repo_path, untracked)
+
+
 def get_commit_history(repo_path: str, max_count: int = 10) -> List[Dict[str, Any]]:
     """
     Get the commit history of the Git repository.
@@ -272,20 +361,67 @@ def get_commit_history(repo_path: str, max_count: int = 10) -> List[Dict[str, An
     logger.info(f"Getting commit history of Git repository in {repo_path} (max_count={max_count})")
     
     try:
-        repo = get_repo(repo_path)
+        with repo_pool.lease(repo_path) as repo:
+            # Get the commit history
+            commits = []
+            for commit in repo.iter_commits(max_count=max_count):
+                commits.append({
+                    'hash': commit.hexsha,
+                    'author': commit.author.name,
+                    'email': commit.author.email,
+                    'date': commit.committed_datetime,
+                    'message': commit.message.strip()
+                })
+            
+            return commits
+    except git.GitCommandError as e:
+        logger.error(f"Error getting commit history of Git repository in {repo_path}: {str(e)}")
+        raise
+
+
+def get_log(repo_path: str, limit: int = 50, cursor: Optional[str] = None, **options: Any) -> Dict[str, Any]:
+    """
+    Get one page of the commit history of the Git repository.
+    
+    The page is read from a single ``git log`` call; see shellama.git_log for the options.
+    
+    Args:
+        repo_path (str): Path to the Git repository
+        limit (int, optional): Maximum number of commits in the page. Defaults to 50.
+        cursor (str, optional): Cursor returned with the previous page. Defaults to None (first page).
+        **options: Revision, path, date, author and numstat options accepted by git_log.iter_log()
         
-        # Get the commit history
-        commits = []
-        for commit in repo.iter_commits(max_count=max_count):
-            commits.append({
-                'hash': commit.hexsha,
-                'author': commit.author.name,
-                'email': commit.author.email,
-                'date': commit.committed_datetime,
-                'message': commit.message.strip()
-            })
+    Returns:
+        Dict[str, Any]: Dictionary with the commits and the cursor of the next page (None on the last page)
         
-        return commits
+    Raises:
+        ValueError: If the limit, cursor or revision is invalid
+        git.GitCommandError: If there is an error getting the commit history
+    """
+    logger.info(f"Getting log of Git repository in {repo_path} (limit={limit})")
+    
+    try:
+        return git_log.get_log(repo_path, limit=limit, cursor=cursor, **options)
     except git.GitCommandError as e:
-        logger.error(f"Error getting commit history of Git repository in {repo_path}: {str(e)}")
+        logger.error(f"Error getting log of Git repository in {repo_path}: {str(e)}")
         raise
+
+
+def iter_log(repo_path: str, limit: int = 50, cursor: Optional[str] = None, **options: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Stream one page of the commit history of the Git repository.
+    
+    Args:
+        repo_path (str): Path to the Git repository
+        limit (int, optional): Maximum number of commits in the page. Defaults to 50.
+        cursor (str, optional): Cursor returned with the previous page. Defaults to None (first page).
+        **options: Revision, path, date, author and numstat options accepted by git_log.iter_log()
+        
+    Returns:
+        Iterator[Dict[str, Any]]: ``commit`` events followed by a ``page`` event with the next cursor
+        
+    Raises:
+        ValueError: If the limit, cursor or revision is invalid
+    """
+    logger.info(f"Streaming log of Git repository in {repo_path} (limit={limit})")
+    return git_log.iter_log(repo_path, limit=limit, cursor=cursor, **options)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Git Status Module
+
+This module gets the status of a working tree from one
+``git status --porcelain=v2 -z`` call. The NUL-delimited output is parsed as
+it arrives, so large working trees are not buffered twice. Git's untracked
+cache and, where Git was built with it, the builtin file system monitor are
+turned on for the call so that repeated calls do not rescan the whole tree.
+"""
+
+import os
+import time
+import subprocess
+from typing import Any, Dict, IO, Iterator, List, Optional
+
+from shellama.logger import logger
+from shellama.repo_pool import repo_pool
+
+
+# Let Git remember untracked directories between calls (core.untrackedCache)
+GIT_UNTRACKED_CACHE = os.environ.get('SHELLAMA_GIT_UNTRACKED_CACHE', 'true').lower() in ('true', '1', 't', 'yes')
+
+# Use Git's builtin file system monitor where available (core.fsmonitor)
+GIT_FSMONITOR = os.environ.get('SHELLAMA_GIT_FSMONITOR', 'true').lower() in ('true', '1', 't', 'yes')
+
+_READ_SIZE = 64 * 1024
+
+# Whether the installed Git has the builtin file system monitor, once checked
+_fsmonitor_available: Optional[bool] = None
+
+
+def fsmonitor_available() -> bool:
+    """
+    Check whether the installed Git was built with the file system monitor daemon.
+
+    Returns:
+        bool: True if ``core.fsmonitor=true`` is supported
+    """
+    global _fsmonitor_available
+    if _fsmonitor_available is None:
+        try:
+            output = subprocess.run(['git', 'version', '--build-options'], capture_output=True,
+                                    text=True, timeout=10).stdout
+            _fsmonitor_available = 'fsmonitor--daemon' in output
+        except (OSError, subprocess.SubprocessError):
+            _fsmonitor_available = False
+    return _fsmonitor_available
+
+
+def _split_records(stream: IO[bytes]) -> Iterator[bytes]:
+    """Yield the NUL-terminated records of a stream as they are read."""
+    pending = b''
+    while True:
+        data = stream.read(_READ_SIZE)
+        if not data:
+            break
+        records = (pending + data).split(b'\0')
+        pending = records.pop()
+        yield from records
+    if pending:
+        yield pending
+
+
+def parse_porcelain_v2(stream: IO[bytes]) -> Iterator[Dict[str, Any]]:
+    """
+    Parse ``git status --porcelain=v2 -z`` output incrementally.
+
+    Args:
+        stream (IO[bytes]): The output of Git
+
+    Yields:
+        Dict[str, Any]: One entry per record, with a ``kind`` of 'header', 'changed',
+            'renamed', 'unmerged', 'untracked' or 'ignored'
+    """
+    records = _split_records(stream)
+    for record in records:
+        if not record:
+            continue
+        kind, _, rest = record.partition(b' ')
+        if kind == b'#':
+            name, _, value = rest.partition(b' ')
+            yield {'kind': 'header', 'name': name.decode(), 'value': value.decode()}
+        elif kind == b'1':
+            fields = rest.split(b' ', 7)
+            yield {'kind': 'changed', 'xy': fields[0].decode(), 'submodule': fields[1].decode(),
+                   'path': os.fsdecode(fields[7])}
+        elif kind == b'2':
+            fields = rest.split(b' ', 8)
+            # The original path follows as its own record
+            orig_path = next(records, b'')
+            yield {'kind': 'renamed', 'xy': fields[0].decode(), 'submodule': fields[1].decode(),
+                   'score': fields[7].decode(), 'path': os.fsdecode(fields[8]),
+                   'orig_path': os.fsdecode(orig_path)}
+        elif kind == b'u':
+            fields = rest.split(b' ', 9)
+            yield {'kind': 'unmerged', 'xy': fields[0].decode(), 'submodule': fields[1].decode(),
+                   'path': os.fsdecode(fields[9])}
+        elif kind == b'?':
+            yield {'kind': 'untracked', 'path': os.fsdecode(rest)}
+        elif kind == b'!':
+            yield {'kind': 'ignored', 'path': os.fsdecode(rest)}
+        else:
+            logger.warning(f"Unknown git status record: {record[:80]!r}")
+
+
+def _empty_status() -> Dict[str, Any]:
+    return {
+        'branch': {'head': None, 'oid': None, 'upstream': None, 'ahead': 0, 'behind': 0},
+        'staged': [],
+        'unstaged': [],
+        'untracked': [],
+        'renamed': [],
+        'conflicted': [],
+        # Path lists kept for older clients
+        'modified': [],
+        'added': [],
+        'deleted': []
+    }
+
+
+def _add_entry(status: Dict[str, Any], entry: Dict[str, Any]) -> None:
+    """Sort one parsed record into the status lists."""
+    kind = entry['kind']
+    if kind == 'header':
+        branch, name, value = status['branch'], entry['name'], entry['value']
+        if name == 'branch.oid':
+            branch['oid'] = None if value == '(initial)' else value
+        elif name == 'branch.head':
+            branch['head'] = None if value == '(detached)' else value
+        elif name == 'branch.upstream':
+            branch['upstream'] = value
+        elif name == 'branch.ab':
+            ahead, _, behind = value.partition(' ')
+            if ahead == '+?':
+                # Not counted with --no-ahead-behind
+                branch['ahead'] = branch['behind'] = None
+            else:
+                branch['ahead'], branch['behind'] = int(ahead), -int(behind)
+        return
+    if kind == 'untracked':
+        status['untracked'].append(entry['path'])
+        return
+    if kind == 'unmerged':
+        status['conflicted'].append({'path': entry['path'], 'status': entry['xy']})
+        return
+    if kind not in ('changed', 'renamed'):
+        return
+
+    path, index_status, worktree_status = entry['path'], entry['xy'][0], entry['xy'][1]
+    if index_status != '.':
+        staged = {'path': path, 'status': index_status}
+        if kind == 'renamed':
+            staged['orig_path'] = entry['orig_path']
+        status['staged'].append(staged)
+    if worktree_status != '.':
+        status['unstaged'].append({'path': path, 'status': worktree_status})
+    if kind == 'renamed':
+        status['renamed'].append({'path': path, 'orig_path': entry['orig_path'], 'score': entry['score'],
+                                  'staged': index_status != '.'})
+
+    if 'M' in (index_status, worktree_status):
+        status['modified'].append(path)
+    if index_status == 'A':
+        status['added'].append(path)
+    if 'D' in (index_status, worktree_status):
+        status['deleted'].append(path)
+
+
+def get_status(repo_path: str, untracked: str = 'all', paths: Optional[List[str]] = None,
+               optional_locks: bool = True, ahead_behind: bool = True) -> Dict[str, Any]:
+    """
+    Get the status of a working tree with a single Git call.
+
+    Args:
+        repo_path (str): Path to the Git repository
+        untracked (str, optional): How to list untracked files: 'all', 'normal' (directories
+            are not descended into) or 'no'. Defaults to 'all'.
+        paths (List[str], optional): Limit the status to these paths, relative to the
+            working tree, and everything below them. Defaults to None (the whole tree).
+        optional_locks (bool, optional): Whether Git may write refreshed index and untracked
+            cache data back to the index. Defaults to True.
+        ahead_behind (bool, optional): Whether to count the commits ahead of and behind the
+            upstream branch; when False both counts are None if the branches differ. Defaults to True.
+
+    Returns:
+        Dict[str, Any]: Dictionary with the branch, staged, unstaged, untracked, renamed
+            and conflicted entries, and the timing of the call
+
+    Raises:
+        ValueError: If the untracked mode is unknown
+        git.InvalidGitRepositoryError: If the directory is not a Git repository
+        git.GitCommandError: If Git fails
+    """
+    if untracked not in ('all', 'normal', 'no'):
+        raise ValueError("untracked must be 'all', 'normal' or 'no'")
+    start_time = time.perf_counter()
+    command = ['git']
+    if not optional_locks:
+        command.append('--no-optional-locks')
+    if GIT_UNTRACKED_CACHE:
+        command += ['-c', 'core.untrackedCache=true']
+        if untracked == 'all':
+            # Git only uses the cache when the untracked mode matches status.showUntrackedFiles
+            command += ['-c', 'status.showUntrackedFiles=all']
+    fsmonitor = GIT_FSMONITOR and fsmonitor_available()
+    if fsmonitor:
+        command += ['-c', 'core.fsmonitor=true']
+    command += ['status', '--porcelain=v2', '-z', '--branch', f'--untracked-files={untracked}']
+    if not ahead_behind:
+        command.append('--no-ahead-behind')
+    if paths is not None:
+        command += ['--'] + [f':(literal){path}' for path in paths]
+
+    status = _empty_status()
+    entries = 0
+    with repo_pool.lease(repo_path) as repo:
+        process = repo.git.execute(command, as_process=True)
+        try:
+            for entry in parse_porcelain_v2(process.proc.stdout):
+                _add_entry(status, entry)
+                entries += 1
+        except BaseException:
+            # Stop Git instead of waiting for it to write the rest
+            process.proc.kill()
+            process.proc.wait()
+            raise
+        # Raises GitCommandError with Git's message if the call failed
+        process.wait()
+
+    status['timing'] = {
+        'elapsed': time.perf_counter() - start_time,
+        'entries': entries,
+        'untracked_cache': GIT_UNTRACKED_CACHE,
+        'fsmonitor': fsmonitor
+    }
+    return status
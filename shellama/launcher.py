@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Command Launcher Module
+
+This module starts commands from a small helper process instead of from the
+server itself. The helper is a fresh interpreter that imports only the
+standard library, so spawning a child costs the same however large the
+server's heap grows. It receives spawn requests over a Unix socket, starts
+each command with ``posix_spawn`` in a new session, and sends the read ends
+of its stdout and stderr pipes back with ``SCM_RIGHTS``. It also reaps the
+children and reports their exit codes.
+
+The helper is shellama/launcher_helper.py, run by path in isolated mode so it
+does not import SheLLama or site packages. It needs ``os.pidfd_open`` and
+``os.waitstatus_to_exitcode`` (Python 3.9 and Linux 5.3); where they are
+missing, and for requests too large for one socket message, commands are
+started directly instead.
+"""
+
+import os
+import sys
+import errno
+import signal
+import socket
+import asyncio
+import itertools
+import threading
+import subprocess
+import concurrent.futures
+from typing import Callable, Dict, List, Optional, Union
+
+from shellama.launcher_helper import receive_message, send_message
+from shellama.logger import logger
+
+
+# Start commands through the launcher process (1) instead of forking the server (0)
+LAUNCHER_ENABLED = os.environ.get('SHELLAMA_LAUNCHER', '0').lower() in ('true', '1', 't', 'yes')
+
+# The launcher process runs this stdlib-only script
+_HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'launcher_helper.py')
+
+
+class LaunchedProcess:
+    """A command started by the launcher, with asyncio readers for its output."""
+
+    def __init__(self, pid: int, stdout: asyncio.StreamReader, stderr: asyncio.StreamReader,
+                 exited: asyncio.Future, transports: List[asyncio.BaseTransport]):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        # Resolves to the exit code, or None if the launcher died first
+        self.exited = exited
+        self._transports = transports
+
+    @property
+    def returncode(self) -> Optional[int]:
+        """Exit code of the command, or None while it runs."""
+        return self.exited.result() if self.exited.done() else None
+
+    def kill(self) -> None:
+        """Kill the command."""
+        os.kill(self.pid, signal.SIGKILL)
+
+    def close(self) -> None:
+        """Stop reading the output pipes."""
+        for transport in self._transports:
+            transport.close()
+
+
+class LauncherUnavailable(OSError):
+    """Raised when a command cannot go through the launcher and has to be started directly."""
+
+
+def _is_supported() -> bool:
+    """Check that the helper can watch its children with pidfds on this Python and kernel."""
+    if not (hasattr(os, 'pidfd_open') and hasattr(os, 'waitstatus_to_exitcode')):
+        return False
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:
+        return False
+    return True
+
+
+def _abandon(spawned: concurrent.futures.Future) -> None:
+    """Kill a command nobody waits for any more and close its pipes."""
+    if spawned.cancelled() or spawned.exception() is not None:
+        return
+    pid, fds = spawned.result()
+    for fd in fds:
+        os.close(fd)
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+class Launcher:
+    """Client of the launcher process, shared by all threads and event loops."""
+
+    def __init__(self):
+        """Initialize the client. The launcher process is started on first use."""
+        self.process: Optional[subprocess.Popen] = None
+        self._sock: Optional[socket.socket] = None
+        self._ids = itertools.count(1)
+        self._replies: Dict[int, concurrent.futures.Future] = {}
+        self._exit_handlers: Dict[int, Callable[[Optional[int]], None]] = {}
+        self._early_exits: Dict[int, Optional[int]] = {}
+        self._lock = threading.Lock()
+        self._supported: Optional[bool] = None
+        self.spawned = 0
+
+    @property
+    def supported(self) -> bool:
+        """Whether the launcher can run on this Python and kernel."""
+        if self._supported is None:
+            self._supported = _is_supported()
+            if not self._supported:
+                logger.warning("The command launcher needs os.pidfd_open and os.waitstatus_to_exitcode "
+                               "(Python 3.9+, Linux 5.3+); starting commands directly")
+        return self._supported
+
+    def start(self) -> None:
+        """
+        Start the launcher process if it is not running.
+
+        Raises:
+            LauncherUnavailable: If the launcher cannot run on this Python or kernel
+            OSError: If the process cannot be started
+        """
+        if not self.supported:
+            raise LauncherUnavailable(errno.ENOSYS, "The command launcher is not supported on this system")
+        with self._lock:
+            if self.process is not None and self.process.poll() is None:
+                return
+            parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            try:
+                self.process = subprocess.Popen([sys.executable, '-I', '-S', _HELPER, str(child.fileno())],
+                                                pass_fds=[child.fileno()], stdin=subprocess.DEVNULL,
+                                                start_new_session=True)
+            except Exception:
+                parent.close()
+                raise
+            finally:
+                child.close()
+            self._sock = parent
+            threading.Thread(target=self._read_messages, args=(parent,), name='shellama-launcher',
+                             daemon=True).start()
+        logger.info(f"Started command launcher (pid {self.process.pid})")
+
+    def _read_messages(self, sock: socket.socket) -> None:
+        """Dispatch spawn replies and exit notices until the launcher goes away."""
+        try:
+            while True:
+                message, fds = receive_message(sock)
+                if message is None:
+                    break
+                if 'exit' in message:
+                    with self._lock:
+                        handler = self._exit_handlers.pop(message['exit'], None)
+                        if handler is None:
+                            self._early_exits[message['exit']] = message['returncode']
+                    if handler is not None:
+                        handler(message['returncode'])
+                    continue
+                with self._lock:
+                    future = self._replies.pop(message['id'], None)
+                if future is None:
+                    for fd in fds:
+                        os.close(fd)
+                elif 'error' in message:
+                    future.set_exception(OSError(message['errno'], message['error'], message.get('filename'))
+                                         if message.get('errno') else OSError(message['error']))
+                else:
+                    future.set_result((message['pid'], fds))
+        except OSError as e:
+            logger.error(f"Lost the command launcher: {str(e)}")
+        finally:
+            logger.warning("Command launcher exited")
+            with self._lock:
+                if self._sock is sock:
+                    self._sock = None
+                replies, self._replies = self._replies, {}
+                handlers, self._exit_handlers = self._exit_handlers, {}
+            sock.close()
+            for future in replies.values():
+                future.set_exception(OSError("The command launcher exited"))
+            for handler in handlers.values():
+                handler(None)
+
+    def spawn(self, args: Union[str, List[str]], shell: bool = False, cwd: Optional[str] = None,
+              env: Optional[Dict[str, str]] = None) -> concurrent.futures.Future:
+        """
+        Ask the launcher to start a command in a new session.
+
+        Args:
+            args (Union[str, List[str]]): Command line for the shell, or the argument list
+            shell (bool, optional): Whether to run the command with /bin/sh. Defaults to False.
+            cwd (str, optional): The working directory. Defaults to None (the server's).
+            env (Dict[str, str], optional): The environment. Defaults to None (the server's).
+
+        Returns:
+            concurrent.futures.Future: Future resolving to the pid and the stdout and stderr descriptors;
+                it fails with LauncherUnavailable if the request does not fit in one message
+        """
+        self.start()
+        request_id = next(self._ids)
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        request = {
+            'id': request_id,
+            'args': ['/bin/sh', '-c', args] if shell else list(args),
+            'cwd': os.path.abspath(cwd) if cwd else os.getcwd(),
+            'env': dict(os.environ if env is None else env)
+        }
+        with self._lock:
+            sock = self._sock
+            if sock is None:
+                future.set_exception(OSError("The command launcher is not running"))
+                return future
+            self._replies[request_id] = future
+            try:
+                send_message(sock, request)
+                self.spawned += 1
+            except OSError as e:
+                del self._replies[request_id]
+                if e.errno == errno.EMSGSIZE:
+                    # Long argument lists or environments do not fit in one SOCK_SEQPACKET message
+                    future.set_exception(LauncherUnavailable(
+                        errno.EMSGSIZE, "Command line and environment are too large for the command launcher"))
+                else:
+                    future.set_exception(e)
+        return future
+
+    def on_exit(self, pid: int, handler: Callable[[Optional[int]], None]) -> None:
+        """
+        Register a function called from the reader thread with the exit code of a command.
+
+        Args:
+            pid (int): Process ID returned by spawn()
+            handler (Callable[[Optional[int]], None]): Called with the exit code, or None if
+                the launcher died first
+        """
+        with self._lock:
+            if pid not in self._early_exits and self._sock is not None:
+                self._exit_handlers[pid] = handler
+                return
+            returncode = self._early_exits.pop(pid, None)
+        handler(returncode)
+
+    async def launch(self, args: Union[str, List[str]], shell: bool = False, cwd: Optional[str] = None,
+                     env: Optional[Dict[str, str]] = None, limit: int = 64 * 1024) -> LaunchedProcess:
+        """
+        Start a command and connect its output to the running event loop.
+
+        Args:
+            args (Union[str, List[str]]): Command line for the shell, or the argument list
+            shell (bool, optional): Whether to run the command with /bin/sh. Defaults to False.
+            cwd (str, optional): The working directory. Defaults to None (the server's).
+            env (Dict[str, str], optional): The environment. Defaults to None (the server's).
+            limit (int, optional): Buffer limit of the stream readers. Defaults to 64 KiB.
+
+        Returns:
+            LaunchedProcess: The running command
+
+        Raises:
+            LauncherUnavailable: If the command has to be started directly
+            OSError: If the command cannot be started
+        """
+        loop = asyncio.get_running_loop()
+        spawned = self.spawn(args, shell, cwd, env)
+        try:
+            pid, fds = await asyncio.wrap_future(spawned)
+        except asyncio.CancelledError:
+            spawned.add_done_callback(_abandon)
+            raise
+        exited = loop.create_future()
+
+        def exit_handler(returncode):
+            def resolve():
+                if not exited.done():
+                    exited.set_result(returncode)
+            loop.call_soon_threadsafe(resolve)
+
+        self.on_exit(pid, exit_handler)
+
+        readers, transports = [], []
+        try:
+            for fd in fds:
+                reader = asyncio.StreamReader(limit=limit, loop=loop)
+                transport, _protocol = await loop.connect_read_pipe(
+                    lambda: asyncio.StreamReaderProtocol(reader, loop=loop), os.fdopen(fd, 'rb', buffering=0))
+                readers.append(reader)
+                transports.append(transport)
+        except Exception:
+            for transport in transports:
+                transport.close()
+            for fd in fds[len(transports):]:
+                os.close(fd)
+            raise
+        return LaunchedProcess(pid, readers[0], readers[1], exited, transports)
+
+    def stop(self) -> None:
+        """Stop the launcher process. Commands it started keep running."""
+        with self._lock:
+            sock, self._sock = self._sock, None
+            process = self.process
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+        if process is not None:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+# Create a global instance
+launcher = Launcher()
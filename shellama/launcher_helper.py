@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Command Launcher Helper
+
+This script is the launcher process started by shellama.launcher. It reads
+spawn requests from a SOCK_SEQPACKET socket, starts each command with
+``posix_spawn`` in a new session, and passes the read ends of the command's
+stdout and stderr pipes back with ``SCM_RIGHTS``. It reaps the commands it
+started and reports their exit codes on the same socket.
+
+It imports only the standard library so that it stays small; it is run as
+``python -I -S launcher_helper.py <fd>``.
+"""
+
+import os
+import sys
+import json
+import errno
+import array
+import signal
+import socket
+import selectors
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Largest spawn request or reply in bytes
+MAX_MESSAGE = 1024 * 1024
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any], fds: Tuple[int, ...] = ()) -> None:
+    """Send one JSON message, passing descriptors along with it."""
+    data = json.dumps(message).encode('utf-8', 'surrogateescape')
+    if len(data) > MAX_MESSAGE:
+        raise OSError(errno.EMSGSIZE, os.strerror(errno.EMSGSIZE))
+    if fds:
+        sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+    else:
+        sock.sendmsg([data])
+
+
+def receive_message(sock: socket.socket) -> Tuple[Optional[Dict[str, Any]], List[int]]:
+    """Receive one message and the descriptors passed with it; None at end of file."""
+    fds = array.array('i')
+    data, ancdata, _flags, _address = sock.recvmsg(MAX_MESSAGE, socket.CMSG_SPACE(16 * fds.itemsize))
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - len(payload) % fds.itemsize])
+    if not data:
+        for fd in fds:
+            os.close(fd)
+        return None, []
+    return json.loads(data.decode('utf-8', 'surrogateescape')), list(fds)
+
+
+def _spawn_child(request: Dict[str, Any]) -> Tuple[int, List[int]]:
+    """Start one command in the launcher process."""
+    pipes = [os.pipe(), os.pipe()]
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    home = os.open('.', os.O_RDONLY)
+    try:
+        # posix_spawn has no working directory argument; the launcher is single-threaded
+        os.chdir(request['cwd'])
+        try:
+            pid = os.posix_spawnp(request['args'][0], request['args'], request['env'], setsid=True,
+                                  file_actions=[(os.POSIX_SPAWN_DUP2, devnull, 0),
+                                                (os.POSIX_SPAWN_DUP2, pipes[0][1], 1),
+                                                (os.POSIX_SPAWN_DUP2, pipes[1][1], 2)])
+        finally:
+            os.fchdir(home)
+    except BaseException:
+        for read_end, _write_end in pipes:
+            os.close(read_end)
+        raise
+    finally:
+        for _read_end, write_end in pipes:
+            os.close(write_end)
+        os.close(devnull)
+        os.close(home)
+    return pid, [pipes[0][0], pipes[1][0]]
+
+
+def serve(fd: int) -> None:
+    """
+    Run the launcher on a connected socket until the server closes it.
+
+    Args:
+        fd (int): Descriptor of the SOCK_SEQPACKET socket connected to the server
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sock = socket.socket(fileno=fd)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    children: Dict[int, int] = {}
+
+    while True:
+        for key, _events in selector.select():
+            if key.fileobj is not sock:
+                pidfd = key.fd
+                pid = children.pop(pidfd)
+                selector.unregister(pidfd)
+                os.close(pidfd)
+                _, status = os.waitpid(pid, 0)
+                send_message(sock, {'exit': pid, 'returncode': os.waitstatus_to_exitcode(status)})
+                continue
+
+            request, fds = receive_message(sock)
+            for extra in fds:
+                os.close(extra)
+            if request is None:
+                return
+            try:
+                pid, pipe_fds = _spawn_child(request)
+            except (OSError, KeyError, IndexError, TypeError) as e:
+                reply = {'id': request.get('id'), 'error': str(e), 'errno': None}
+                if isinstance(e, OSError) and e.errno:
+                    reply.update(error=e.strerror, errno=e.errno, filename=e.filename)
+                send_message(sock, reply)
+                continue
+            try:
+                pidfd = os.pidfd_open(pid)
+                children[pidfd] = pid
+                selector.register(pidfd, selectors.EVENT_READ)
+                send_message(sock, {'id': request['id'], 'pid': pid}, tuple(pipe_fds))
+            finally:
+                for pipe_fd in pipe_fds:
+                    os.close(pipe_fd)
+
+
+if __name__ == '__main__':
+    serve(int(sys.argv[1]))
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Resource Limits Module
+
+This module confines executed commands with CPU, memory and process limits
+and reports what they used. Where a delegated cgroup v2 hierarchy is
+available, each command runs in its own cgroup with ``cpu.max``,
+``memory.max`` and ``pids.max`` set, and its peak memory, CPU time and IO
+bytes are read back when it exits. Elsewhere the limits fall back to
+``setrlimit``, which cannot cap CPU share; usage is then taken from the
+``wait4`` resource usage of the command once it has exited. The limits are
+applied by a small helper that the command line is wrapped in (see
+shellama/sandbox_exec.py), not by ``preexec_fn``, so limited commands can be
+started from any thread and by the command launcher. Without a cgroup the
+helper also waits for the command and writes its ``wait4`` usage to a file.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import tempfile
+import errno
+import signal
+import threading
+from typing import Any, Dict, List, Optional
+
+from shellama.logger import logger
+
+
+# Delegated cgroup v2 directory under which command cgroups are created (defaults to our own cgroup)
+CGROUP_ROOT = os.environ.get('SHELLAMA_CGROUP_ROOT')
+
+# Mount point of the cgroup v2 hierarchy
+CGROUP_MOUNT = '/sys/fs/cgroup'
+
+# Length of a CPU bandwidth period in microseconds
+CPU_PERIOD_USEC = 100000
+
+# The helper applying the limits runs this stdlib-only script
+_EXEC_HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_exec.py')
+
+# Resource usage fields reported by wait4, as written by the helper
+RUSAGE_FIELDS = ('ru_maxrss', 'ru_utime', 'ru_stime', 'ru_inblock', 'ru_oublock')
+
+_CONTROLLERS = ('cpu', 'memory', 'pids', 'io')
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+_cgroup_root: Optional[str] = None
+_cgroup_checked = False
+_cgroup_lock = threading.Lock()
+
+
+def parse_size(value: Any) -> int:
+    """
+    Parse a byte size such as ``268435456``, ``'512M'`` or ``'2G'``.
+
+    Args:
+        value (Any): Size as a number or a string with an optional K, M, G or T suffix
+
+    Returns:
+        int: Size in bytes
+
+    Raises:
+        ValueError: If the size is not valid
+    """
+    match = re.fullmatch(r'\s*(\d+)\s*([KMGT]?)i?B?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    return int(match.group(1)) * _SIZE_UNITS[match.group(2).upper()]
+
+
+class ResourceLimits:
+    """Class describing the resources a command may use."""
+
+    def __init__(self, cpu: Optional[float] = None, memory: Optional[int] = None, pids: Optional[int] = None,
+                 cpu_time: Optional[int] = None):
+        """
+        Initialize the limits.
+
+        Args:
+            cpu (float, optional): Number of CPUs the command may keep busy. Defaults to None.
+            memory (int, optional): Memory in bytes. Defaults to None.
+            pids (int, optional): Number of processes and threads. Defaults to None.
+            cpu_time (int, optional): CPU seconds each process may consume. Defaults to None.
+
+        Raises:
+            ValueError: If a limit is not positive
+        """
+        for name, value in (('cpu', cpu), ('memory', memory), ('pids', pids), ('cpu_time', cpu_time)):
+            if value is not None and value <= 0:
+                raise ValueError(f"Limit {name} must be positive")
+        self.cpu = cpu
+        self.memory = memory
+        self.pids = pids
+        self.cpu_time = cpu_time
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> Optional['ResourceLimits']:
+        """
+        Build limits from a request dictionary.
+
+        Args:
+            data (Dict[str, Any], optional): Dictionary with optional cpu, memory, pids and cpu_time keys
+
+        Returns:
+            Optional[ResourceLimits]: The limits, or None if no limit is set
+
+        Raises:
+            ValueError: If a limit is not valid
+        """
+        if not data:
+            return None
+        unknown = set(data) - {'cpu', 'memory', 'pids', 'cpu_time'}
+        if unknown:
+            raise ValueError(f"Unknown limits: {', '.join(sorted(unknown))}")
+        try:
+            return cls(
+                cpu=float(data['cpu']) if data.get('cpu') is not None else None,
+                memory=parse_size(data['memory']) if data.get('memory') is not None else None,
+                pids=int(data['pids']) if data.get('pids') is not None else None,
+                cpu_time=int(data['cpu_time']) if data.get('cpu_time') is not None else None
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid limits: {str(e)}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the limits to a dictionary"""
+        return {'cpu': self.cpu, 'memory': self.memory, 'pids': self.pids, 'cpu_time': self.cpu_time}
+
+
+def get_cgroup_root() -> Optional[str]:
+    """
+    Find a cgroup v2 directory in which command cgroups can be created.
+
+    The controllers are enabled in its ``cgroup.subtree_control`` if needed.
+    The result is computed once.
+
+    Returns:
+        Optional[str]: Path of the directory, or None if cgroup limits are unavailable
+    """
+    global _cgroup_root, _cgroup_checked
+    with _cgroup_lock:
+        if _cgroup_checked:
+            return _cgroup_root
+        _cgroup_checked = True
+
+        root = CGROUP_ROOT
+        if root is None:
+            try:
+                with open('/proc/self/cgroup', encoding='utf-8') as f:
+                    for line in f:
+                        if line.startswith('0::'):
+                            root = os.path.join(CGROUP_MOUNT, line[3:].strip().lstrip('/'))
+            except OSError:
+                pass
+        if root is None or not os.path.exists(os.path.join(root, 'cgroup.controllers')):
+            logger.info("cgroup v2 is not available, resource limits use setrlimit")
+            return None
+
+        try:
+            with open(os.path.join(root, 'cgroup.controllers'), encoding='utf-8') as f:
+                available = f.read().split()
+            for controller in _CONTROLLERS:
+                if controller in available:
+                    try:
+                        _write(os.path.join(root, 'cgroup.subtree_control'), f'+{controller}')
+                    except OSError as e:
+                        logger.debug(f"Cannot enable the {controller} controller in {root}: {str(e)}")
+            with open(os.path.join(root, 'cgroup.subtree_control'), encoding='utf-8') as f:
+                enabled = f.read().split()
+        except OSError as e:
+            logger.info(f"cgroup v2 root {root} is not usable ({str(e)}), resource limits use setrlimit")
+            return None
+
+        missing = [c for c in ('cpu', 'memory', 'pids') if c not in enabled]
+        if missing:
+            logger.info(f"cgroup controllers {', '.join(missing)} are not delegated to {root}, "
+                        f"resource limits use setrlimit")
+            return None
+
+        _cgroup_root = root
+        return root
+
+
+def _write(path: str, value: str) -> None:
+    with open(path, 'w', encoding='ascii') as f:
+        f.write(value)
+
+
+def _read_keyed(path: str) -> Dict[str, int]:
+    """Read a flat keyed cgroup file such as cpu.stat."""
+    values = {}
+    try:
+        with open(path, encoding='ascii') as f:
+            for line in f:
+                key, _, value = line.partition(' ')
+                if value.strip().isdigit():
+                    values[key] = int(value)
+    except OSError:
+        pass
+    return values
+
+
+class CommandSandbox:
+    """Class applying resource limits to one command and collecting its usage."""
+
+    def __init__(self, limits: ResourceLimits):
+        """
+        Prepare the limits. A cgroup is created if cgroup v2 is available.
+
+        Args:
+            limits (ResourceLimits): Limits to apply
+
+        Raises:
+            OSError: If the cgroup or the usage file cannot be created
+        """
+        self.limits = limits
+        self.cgroup: Optional[str] = None
+        self.start_time = time.time()
+        # Limits that are not enforced, or only approximately
+        self.unenforced: List[str] = []
+        self._rusage_path: Optional[str] = None
+
+        root = get_cgroup_root()
+        if root is not None:
+            self.cgroup = os.path.join(root, f'shellama-{uuid.uuid4().hex}')
+            os.mkdir(self.cgroup)
+            try:
+                if limits.cpu is not None:
+                    _write(os.path.join(self.cgroup, 'cpu.max'),
+                           f'{max(1000, int(limits.cpu * CPU_PERIOD_USEC))} {CPU_PERIOD_USEC}')
+                if limits.memory is not None:
+                    _write(os.path.join(self.cgroup, 'memory.max'), str(limits.memory))
+                    if os.path.exists(os.path.join(self.cgroup, 'memory.swap.max')):
+                        _write(os.path.join(self.cgroup, 'memory.swap.max'), '0')
+                if limits.pids is not None:
+                    _write(os.path.join(self.cgroup, 'pids.max'), str(limits.pids))
+            except OSError:
+                os.rmdir(self.cgroup)
+                raise
+        else:
+            if limits.cpu is not None:
+                self.unenforced.append('cpu')
+            if limits.pids is not None:
+                # RLIMIT_NPROC counts every process of the user, not just this command's
+                self.unenforced.append('pids')
+            fd, self._rusage_path = tempfile.mkstemp(prefix='shellama-rusage-', suffix='.json')
+            os.close(fd)
+
+    @property
+    def mode(self) -> str:
+        """'cgroup' or 'rlimit'."""
+        return 'cgroup' if self.cgroup else 'rlimit'
+
+    def command(self, args: List[str]) -> List[str]:
+        """
+        Wrap a command line so that the command starts with the limits applied.
+
+        Args:
+            args (List[str]): The argument list of the command
+
+        Returns:
+            List[str]: Argument list running the helper, which joins the cgroup and executes the
+                command in its place, or sets the rlimits and runs the command as its child
+        """
+        config: Dict[str, Any] = {'cpu_time': self.limits.cpu_time}
+        if self.cgroup is not None:
+            config['cgroup_procs'] = os.path.join(self.cgroup, 'cgroup.procs')
+        else:
+            config.update(memory=self.limits.memory, pids=self.limits.pids, rusage_path=self._rusage_path)
+        return [sys.executable, '-I', '-S', _EXEC_HELPER, json.dumps(config)] + list(args)
+
+    def kill(self) -> None:
+        """Kill every process left in the command's cgroup."""
+        if self.cgroup is None:
+            return
+        kill_path = os.path.join(self.cgroup, 'cgroup.kill')
+        try:
+            if os.path.exists(kill_path):
+                _write(kill_path, '1')
+                return
+            with open(os.path.join(self.cgroup, 'cgroup.procs'), encoding='ascii') as f:
+                for pid in f.read().split():
+                    try:
+                        os.kill(int(pid), signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+        except OSError as e:
+            logger.warning(f"Cannot kill processes in {self.cgroup}: {str(e)}")
+
+    def usage(self) -> Optional[Dict[str, Any]]:
+        """
+        Read what the command used so far.
+
+        Returns:
+            Optional[Dict[str, Any]]: Peak memory, CPU time, IO bytes, peak process count and OOM kills,
+                or None without a cgroup (see finish() for exited commands)
+        """
+        if self.cgroup is None:
+            return None
+
+        cpu = _read_keyed(os.path.join(self.cgroup, 'cpu.stat'))
+        events = _read_keyed(os.path.join(self.cgroup, 'memory.events'))
+        read_bytes = write_bytes = 0
+        try:
+            with open(os.path.join(self.cgroup, 'io.stat'), encoding='ascii') as f:
+                for line in f:
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition('=')
+                        if key == 'rbytes':
+                            read_bytes += int(value)
+                        elif key == 'wbytes':
+                            write_bytes += int(value)
+        except OSError:
+            pass
+
+        def read_int(name: str) -> Optional[int]:
+            try:
+                with open(os.path.join(self.cgroup, name), encoding='ascii') as f:
+                    return int(f.read())
+            except (OSError, ValueError):
+                return None
+
+        return {
+            'peak_memory': read_int('memory.peak'),
+            'cpu_time': cpu.get('usage_usec', 0) / 1e6,
+            'user_time': cpu.get('user_usec', 0) / 1e6,
+            'system_time': cpu.get('system_usec', 0) / 1e6,
+            'throttled_time': cpu.get('throttled_usec', 0) / 1e6,
+            'io_read_bytes': read_bytes,
+            'io_write_bytes': write_bytes,
+            'peak_pids': read_int('pids.peak'),
+            'oom_kills': events.get('oom_kill', 0)
+        }
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Collect the usage, kill leftover processes and remove the cgroup.
+
+        Without a cgroup the usage is the one the helper wrote when the command
+        exited; it is None if the command was killed together with the helper.
+
+        Returns:
+            Dict[str, Any]: Dictionary with the mode, the limits, unenforced limits and the usage
+        """
+        usage = self.usage()
+        if self._rusage_path is not None:
+            try:
+                with open(self._rusage_path, encoding='ascii') as f:
+                    data = f.read()
+                if data:
+                    usage = rusage_usage(json.loads(data))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Cannot read the usage of a limited command: {str(e)}")
+            try:
+                os.unlink(self._rusage_path)
+            except FileNotFoundError:
+                pass
+            self._rusage_path = None
+        info = {
+            'mode': self.mode,
+            'limits': self.limits.to_dict(),
+            'unenforced': self.unenforced,
+            'usage': usage
+        }
+        if self.cgroup is not None:
+            self.kill()
+            for _ in range(50):
+                try:
+                    os.rmdir(self.cgroup)
+                    break
+                except FileNotFoundError:
+                    break
+                except OSError as e:
+                    if e.errno != errno.EBUSY:
+                        logger.warning(f"Cannot remove {self.cgroup}: {str(e)}")
+                        break
+                    time.sleep(0.01)
+            else:
+                logger.warning(f"Cannot remove {self.cgroup}: processes are still exiting")
+        return info
+
+
+def rusage_usage(rusage: Dict[str, float]) -> Dict[str, Any]:
+    """
+    Convert the ``wait4`` resource usage of a command into the usage reported for cgroups.
+
+    The usage covers the command and the children it waited for; the peak memory
+    is that of its largest process.
+
+    Args:
+        rusage (Dict[str, float]): The RUSAGE_FIELDS values by name
+
+    Returns:
+        Dict[str, Any]: Peak memory, CPU time and IO bytes; the fields only cgroups
+            report are None
+    """
+    return {
+        # Kilobytes on Linux
+        'peak_memory': int(rusage['ru_maxrss']) * 1024,
+        'cpu_time': rusage['ru_utime'] + rusage['ru_stime'],
+        'user_time': rusage['ru_utime'],
+        'system_time': rusage['ru_stime'],
+        'throttled_time': None,
+        # Blocks of 512 bytes
+        'io_read_bytes': int(rusage['ru_inblock']) * 512,
+        'io_write_bytes': int(rusage['ru_oublock']) * 512,
+        'peak_pids': None,
+        'oom_kills': None
+    }
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Output Buffer Module
+
+This module provides a byte-capped ring buffer for the output of long-running
+processes. Every byte written gets an absolute offset, so readers can poll for
+new output incrementally. The newest output is kept in memory; older output is
+spilled to an anonymous temporary file up to a second cap, after which the
+oldest data is dropped and reported as skipped to readers that ask for it.
+"""
+
+import os
+import tempfile
+import threading
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from shellama.logger import logger
+
+
+# Bytes of the most recent output kept in memory for each stream
+OUTPUT_BUFFER_SIZE = int(os.environ.get('SHELLAMA_OUTPUT_BUFFER_SIZE', 1024 * 1024))
+
+# Bytes of older output kept in a temporary file for each stream (0 disables spilling)
+OUTPUT_SPILL_SIZE = int(os.environ.get('SHELLAMA_OUTPUT_SPILL_SIZE', 64 * 1024 * 1024))
+
+# Directory for spill files (defaults to the system temporary directory)
+OUTPUT_SPILL_DIR = os.environ.get('SHELLAMA_OUTPUT_SPILL_DIR') or None
+
+
+class OutputBuffer:
+    """Class buffering a stream of output with absolute offsets in bounded memory."""
+
+    def __init__(self, max_bytes: int = OUTPUT_BUFFER_SIZE, max_spill_bytes: int = OUTPUT_SPILL_SIZE,
+                 spill_dir: Optional[str] = OUTPUT_SPILL_DIR):
+        """
+        Initialize the buffer.
+
+        Args:
+            max_bytes (int, optional): Bytes kept in memory. Defaults to OUTPUT_BUFFER_SIZE.
+            max_spill_bytes (int, optional): Bytes kept on disk once memory is full.
+                Defaults to OUTPUT_SPILL_SIZE.
+            spill_dir (str, optional): Directory for the spill file. Defaults to OUTPUT_SPILL_DIR.
+        """
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self.spill_dir = spill_dir
+        self._chunks: Deque[Tuple[int, bytes]] = deque()
+        self._memory_bytes = 0
+        self._end = 0
+        # The spill file holds the offsets [_spill_start, _spill_start + _spill_size) as a ring
+        self._spill = None
+        self._spill_start = 0
+        self._spill_size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def end(self) -> int:
+        """Offset just past the last byte written."""
+        with self._lock:
+            return self._end
+
+    @property
+    def start(self) -> int:
+        """Offset of the oldest byte still available."""
+        with self._lock:
+            return self._start()
+
+    def _start(self) -> int:
+        if self._spill_size:
+            return self._spill_start
+        return self._chunks[0][0] if self._chunks else self._end
+
+    def write(self, data: bytes) -> None:
+        """
+        Append data to the buffer, evicting the oldest data beyond the caps.
+
+        Args:
+            data (bytes): Data to append
+        """
+        if not data:
+            return
+
+        with self._lock:
+            self._chunks.append((self._end, data))
+            self._memory_bytes += len(data)
+            self._end += len(data)
+
+            while self._memory_bytes > self.max_bytes and len(self._chunks) > 1:
+                offset, chunk = self._chunks.popleft()
+                self._memory_bytes -= len(chunk)
+                self._spill_chunk(offset, chunk)
+
+            if self._memory_bytes > self.max_bytes:
+                # A single chunk larger than the buffer: keep only its tail in memory
+                offset, chunk = self._chunks.popleft()
+                cut = len(chunk) - self.max_bytes
+                self._spill_chunk(offset, chunk[:cut])
+                self._chunks.append((offset + cut, chunk[cut:]))
+                self._memory_bytes = self.max_bytes
+
+    def _spill_chunk(self, offset: int, chunk: bytes) -> None:
+        """Move evicted data to the spill file. Must be called with the lock held."""
+        if self.max_spill_bytes <= 0:
+            return
+
+        if self._spill is None:
+            try:
+                self._spill = tempfile.TemporaryFile(prefix='shellama-output-', dir=self.spill_dir)
+            except OSError as e:
+                logger.warning(f"Cannot create output spill file, dropping old output: {str(e)}")
+                self.max_spill_bytes = 0
+                return
+            self._spill_start = offset
+
+        if len(chunk) > self.max_spill_bytes:
+            offset += len(chunk) - self.max_spill_bytes
+            chunk = chunk[-self.max_spill_bytes:]
+
+        # Evicted data is contiguous with what is already spilled, unless its head was cut above
+        self._write_ring(offset, chunk)
+
+        overflow = self._spill_size - self.max_spill_bytes
+        if overflow > 0:
+            self._spill_start += overflow
+            self._spill_size = self.max_spill_bytes
+
+    def _write_ring(self, offset: int, piece: bytes) -> None:
+        """Write data at its ring position in the spill file. Must be called with the lock held."""
+        if not self._spill_size:
+            self._spill_start = offset
+        position = offset % self.max_spill_bytes
+        first = piece[:self.max_spill_bytes - position]
+        self._spill.seek(position)
+        self._spill.write(first)
+        if len(first) < len(piece):
+            self._spill.seek(0)
+            self._spill.write(piece[len(first):])
+        self._spill_size = offset + len(piece) - self._spill_start
+
+    def _read_ring(self, offset: int, length: int) -> bytes:
+        """Read data from the spill file. Must be called with the lock held."""
+        position = offset % self.max_spill_bytes
+        first = min(length, self.max_spill_bytes - position)
+        self._spill.seek(position)
+        data = self._spill.read(first)
+        if first < length:
+            self._spill.seek(0)
+            data += self._spill.read(length - first)
+        return data
+
+    def read(self, offset: int = 0, max_bytes: Optional[int] = None) -> Tuple[bytes, int, int]:
+        """
+        Read buffered data from an offset without blocking.
+
+        Args:
+            offset (int, optional): Offset to read from. Defaults to 0.
+            max_bytes (int, optional): Maximum number of bytes to return. Defaults to None (all).
+
+        Returns:
+            Tuple[bytes, int, int]: The data, the offset it actually starts at (later than
+                the requested offset if that data was dropped) and the offset to read from next
+        """
+        with self._lock:
+            offset = max(offset, self._start())
+            stop = self._end if max_bytes is None else min(self._end, offset + max_bytes)
+            if offset >= stop:
+                return b'', min(offset, self._end), min(offset, self._end)
+
+            parts = []
+            memory_start = self._chunks[0][0] if self._chunks else self._end
+            if offset < memory_start and self._spill_size:
+                # Spilled offsets and memory offsets are contiguous
+                spill_stop = min(stop, memory_start)
+                parts.append(self._read_ring(offset, spill_stop - offset))
+
+            for chunk_offset, chunk in self._chunks:
+                chunk_end = chunk_offset + len(chunk)
+                if chunk_end <= offset:
+                    continue
+                if chunk_offset >= stop:
+                    break
+                parts.append(chunk[max(0, offset - chunk_offset):stop - chunk_offset])
+
+            return b''.join(parts), offset, stop
+
+    def close(self) -> None:
+        """Release the spill file and the buffered data."""
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+            self._spill_size = 0
+            self._chunks.clear()
+            self._memory_bytes = 0
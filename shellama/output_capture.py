@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Output Capture Module
+
+This module bounds the memory used to collect the output of a command. Each
+stream keeps at most a configured number of bytes: the beginning and the end
+of the output, joined by a truncation marker. Output beyond the cap is
+written in full to an overflow file that clients can fetch by ID until it
+expires; all overflow files together share one disk budget. Bytes are only decoded once the command has finished, and then only
+the bounded part that is returned.
+"""
+
+import io
+import os
+import time
+import uuid
+import codecs
+import locale
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+from shellama.logger import logger
+from shellama.process_utils import is_process_running
+
+
+# Bytes of each output stream returned in a command result
+OUTPUT_LIMIT = int(os.environ.get('SHELLAMA_OUTPUT_LIMIT', 1024 * 1024))
+
+# Bytes of each output stream kept in an overflow file once the limit is exceeded (0 disables overflow files)
+OVERFLOW_MAX_BYTES = int(os.environ.get('SHELLAMA_OUTPUT_OVERFLOW_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Bytes of all overflow files together; output beyond it is dropped from the files
+OVERFLOW_TOTAL_MAX_BYTES = int(os.environ.get('SHELLAMA_OUTPUT_OVERFLOW_TOTAL_MAX_BYTES', 4 * 1024 * 1024 * 1024))
+
+# Seconds an overflow file can be fetched
+OVERFLOW_TTL = int(os.environ.get('SHELLAMA_OUTPUT_OVERFLOW_TTL', 60 * 60))
+
+# Directory for overflow files (defaults to the system temporary directory)
+OVERFLOW_DIR = os.environ.get('SHELLAMA_OUTPUT_OVERFLOW_DIR') or None
+
+# Overflow files are named after the process writing them, so leftovers of dead processes can be found;
+# the token tells this process apart from an earlier one with the same pid (e.g. pid 1 in a container)
+_OVERFLOW_PREFIX = 'shellama-output-'
+_PROCESS_TOKEN = uuid.uuid4().hex[:8]
+
+
+def _decode(data: bytes) -> str:
+    """Decode output like text mode subprocesses do."""
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace'), translate=True)
+    return decoder.decode(bytes(data), final=True)
+
+
+class CappedOutput:
+    """Class collecting one output stream in bounded memory."""
+
+    def __init__(self, limit: int = OUTPUT_LIMIT, overflow_max_bytes: int = OVERFLOW_MAX_BYTES,
+                 overflow_dir: Optional[str] = OVERFLOW_DIR, store: Optional['OverflowStore'] = None):
+        """
+        Initialize the capture.
+
+        Args:
+            limit (int, optional): Bytes kept in memory, half from the start and half from the end
+                of the output. Defaults to OUTPUT_LIMIT.
+            overflow_max_bytes (int, optional): Bytes written to the overflow file. Defaults to OVERFLOW_MAX_BYTES.
+            overflow_dir (str, optional): Directory for the overflow file. Defaults to OVERFLOW_DIR.
+            store (OverflowStore, optional): Store whose disk budget the overflow file uses.
+                Defaults to the global overflow store.
+        """
+        self.limit = limit
+        self.store = store if store is not None else overflow_store
+        self.overflow_max_bytes = overflow_max_bytes
+        self.overflow_dir = overflow_dir
+        self.head_size = limit // 2
+        self.tail_size = limit - self.head_size
+        self.total = 0
+        self.truncated = False
+        self.overflow_path: Optional[str] = None
+        self.overflow_complete = True
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._file = None
+        self.overflow_bytes = 0
+
+    def write(self, data: bytes) -> None:
+        """
+        Add output, dropping the middle of the output beyond the limit.
+
+        Args:
+            data (bytes): Output read from the pipe
+        """
+        if not data:
+            return
+        self.total += len(data)
+        if self.truncated:
+            self._spill(data)
+
+        room = self.head_size - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        self._tail += data
+
+        excess = len(self._tail) - self.tail_size
+        if excess > 0:
+            if not self.truncated:
+                self.truncated = True
+                self._open_overflow()
+            del self._tail[:excess]
+
+    def _open_overflow(self) -> None:
+        """Start the overflow file with all the output seen so far."""
+        if self.overflow_max_bytes <= 0:
+            self.overflow_complete = False
+            return
+        try:
+            prefix = f'{_OVERFLOW_PREFIX}{os.getpid()}-{_PROCESS_TOKEN}-'
+            fd, self.overflow_path = tempfile.mkstemp(prefix=prefix, suffix='.log', dir=self.overflow_dir)
+            self._file = os.fdopen(fd, 'wb')
+        except OSError as e:
+            logger.warning(f"Cannot create output overflow file, dropping the middle of the output: {str(e)}")
+            self.overflow_path = None
+            self.overflow_complete = False
+            return
+        self._spill(bytes(self._head))
+        self._spill(bytes(self._tail))
+
+    def _spill(self, data: bytes) -> None:
+        """Append output to the overflow file up to its cap."""
+        if self._file is None:
+            return
+        room = self.overflow_max_bytes - self.overflow_bytes
+        if len(data) > room:
+            data = data[:room]
+            self.overflow_complete = False
+        granted = self.store.reserve(len(data))
+        if granted < len(data):
+            data = data[:granted]
+            self.overflow_complete = False
+        try:
+            self._file.write(data)
+            self.overflow_bytes += len(data)
+        except OSError as e:
+            logger.warning(f"Cannot write output overflow file {self.overflow_path}: {str(e)}")
+            self.store.release(len(data))
+            self.overflow_complete = False
+            self.close()
+            return
+        if not self.overflow_complete:
+            self.close()
+
+    @property
+    def omitted(self) -> int:
+        """Number of bytes left out of text()."""
+        return self.total - len(self._head) - len(self._tail)
+
+    def text(self) -> str:
+        """
+        Decode the kept output.
+
+        Returns:
+            str: The output, or its start and end joined by a truncation marker
+        """
+        if not self.truncated:
+            return _decode(self._head + self._tail)
+        tail = self._tail
+        # Skip a multi-byte character cut in half at the start of the tail
+        skip = 0
+        while skip < min(3, len(tail)) and 0x80 <= tail[skip] < 0xC0:
+            skip += 1
+        return (_decode(self._head) + f'\n[... {self.omitted + skip} bytes truncated ...]\n'
+                + _decode(tail[skip:]))
+
+    def close(self) -> None:
+        """Close the overflow file, keeping it for fetching."""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def discard(self) -> None:
+        """Close and delete the overflow file."""
+        self.close()
+        if self.overflow_path is not None:
+            try:
+                os.unlink(self.overflow_path)
+            except OSError:
+                pass
+            self.overflow_path = None
+            self.store.release(self.overflow_bytes)
+            self.overflow_bytes = 0
+
+
+class OverflowStore:
+    """Class keeping the overflow files of finished commands until they expire."""
+
+    def __init__(self, ttl: int = OVERFLOW_TTL, max_total_bytes: int = OVERFLOW_TOTAL_MAX_BYTES):
+        """
+        Initialize the store.
+
+        Args:
+            ttl (int, optional): Seconds an overflow file is kept. Defaults to OVERFLOW_TTL.
+            max_total_bytes (int, optional): Bytes of all overflow files together, including
+                those still being written. Defaults to OVERFLOW_TOTAL_MAX_BYTES.
+        """
+        self.ttl = ttl
+        self.max_total_bytes = max_total_bytes
+        self.used_bytes = 0
+        self._outputs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, size: int) -> int:
+        """
+        Take disk space for overflow output from the budget.
+
+        Expired files are deleted first if the budget is short.
+
+        Args:
+            size (int): Bytes about to be written
+
+        Returns:
+            int: Bytes that may be written, fewer than requested when the budget is used up
+        """
+        with self._lock:
+            short = self.used_bytes + size > self.max_total_bytes
+        if short:
+            self._expire()
+        with self._lock:
+            granted = max(0, min(size, self.max_total_bytes - self.used_bytes))
+            self.used_bytes += granted
+        return granted
+
+    def release(self, size: int) -> None:
+        """
+        Return disk space of deleted overflow output to the budget.
+
+        Args:
+            size (int): Bytes given back
+        """
+        with self._lock:
+            self.used_bytes = max(0, self.used_bytes - size)
+
+    def sweep(self, directory: Optional[str] = OVERFLOW_DIR) -> int:
+        """
+        Delete overflow files left behind by processes that are no longer running.
+
+        Args:
+            directory (str, optional): Directory of the overflow files. Defaults to OVERFLOW_DIR.
+
+        Returns:
+            int: Number of files deleted
+        """
+        directory = directory or tempfile.gettempdir()
+        deleted = 0
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            logger.warning(f"Cannot sweep output overflow files in {directory}: {str(e)}")
+            return 0
+        for entry in entries:
+            if not entry.name.startswith(_OVERFLOW_PREFIX):
+                continue
+            pid, token = (entry.name[len(_OVERFLOW_PREFIX):].split('-') + [''])[:2]
+            # Files of running servers are kept; files named before pids were recorded are leftovers too
+            if pid.isdigit() and is_process_running(int(pid)) and (int(pid) != os.getpid() or token == _PROCESS_TOKEN):
+                continue
+            try:
+                os.unlink(entry.path)
+                deleted += 1
+            except OSError:
+                continue
+        if deleted:
+            logger.info(f"Deleted {deleted} leftover output overflow files in {directory}")
+        return deleted
+
+    def register(self, captures: Dict[str, CappedOutput]) -> Optional[str]:
+        """
+        Keep the overflow files of a finished command.
+
+        Args:
+            captures (Dict[str, CappedOutput]): Captured output by stream name
+
+        Returns:
+            Optional[str]: ID under which the files can be fetched, or None if there are none
+        """
+        streams = {}
+        disk_bytes = 0
+        for name, capture in captures.items():
+            capture.close()
+            if capture.overflow_path is not None:
+                streams[name] = {'path': capture.overflow_path, 'size': capture.total,
+                                 'complete': capture.overflow_complete}
+                disk_bytes += capture.overflow_bytes
+        self._expire()
+        if not streams:
+            return None
+
+        output_id = uuid.uuid4().hex
+        with self._lock:
+            self._outputs[output_id] = {'streams': streams, 'disk_bytes': disk_bytes, 'created_at': time.time()}
+        return output_id
+
+    def get(self, output_id: str, stream: str) -> Dict[str, Any]:
+        """
+        Get an overflow file.
+
+        Args:
+            output_id (str): ID returned by register()
+            stream (str): 'stdout' or 'stderr'
+
+        Returns:
+            Dict[str, Any]: Dictionary with the path, the size of the whole stream and whether
+                the file holds all of it
+
+        Raises:
+            KeyError: If there is no such overflow file
+        """
+        self._expire()
+        with self._lock:
+            return dict(self._outputs[output_id]['streams'][stream])
+
+    def remove(self, output_id: str) -> None:
+        """
+        Delete the overflow files of a command.
+
+        Args:
+            output_id (str): ID returned by register()
+
+        Raises:
+            KeyError: If the ID is unknown
+        """
+        with self._lock:
+            output = self._outputs.pop(output_id)
+        self._delete(output)
+
+    def _expire(self) -> None:
+        """Delete overflow files older than the TTL."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [output_id for output_id, output in self._outputs.items() if output['created_at'] < cutoff]
+            outputs = [self._outputs.pop(output_id) for output_id in expired]
+        for output in outputs:
+            self._delete(output)
+
+    def _delete(self, output: Dict[str, Any]) -> None:
+        for stream in output['streams'].values():
+            try:
+                os.unlink(stream['path'])
+            except OSError:
+                pass
+        self.release(output['disk_bytes'])
+
+
+# Create a global instance
+overflow_store = OverflowStore()
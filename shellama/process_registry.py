@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Process Registry Module
+
+This module keeps track of background processes started through the API.
+The number of running processes is capped, exited processes are reaped with
+``waitpid`` by a collector thread so they do not linger as zombies, and the
+least recently used finished processes are forgotten once too many are kept.
+"""
+
+import os
+import time
+import uuid
+import signal
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Union
+
+from shellama.limits import ResourceLimits
+from shellama.logger import logger
+from shellama.shell import BackgroundProcess
+
+
+# Maximum number of background processes running at the same time
+MAX_BACKGROUND_PROCESSES = int(os.environ.get('SHELLAMA_MAX_BACKGROUND_PROCESSES', 256))
+
+# Maximum number of finished background processes kept for status queries
+MAX_RETAINED_PROCESSES = int(os.environ.get('SHELLAMA_MAX_RETAINED_PROCESSES', 1000))
+
+# Seconds between two checks for exited background processes
+PROCESS_REAP_INTERVAL = float(os.environ.get('SHELLAMA_PROCESS_REAP_INTERVAL', 1.0))
+
+
+def parse_signal(value: Union[int, str]) -> signal.Signals:
+    """
+    Convert a signal number or name to a signal.
+
+    Args:
+        value (Union[int, str]): Signal number, or name with or without the SIG prefix
+
+    Returns:
+        signal.Signals: The signal
+
+    Raises:
+        ValueError: If the signal is unknown
+    """
+    try:
+        if isinstance(value, int) or str(value).isdigit():
+            return signal.Signals(int(value))
+        name = str(value).upper()
+        return signal.Signals[name if name.startswith('SIG') else f'SIG{name}']
+    except (KeyError, ValueError):
+        raise ValueError(f"Unknown signal: {value}")
+
+
+class ProcessRegistry:
+    """Thread-safe registry of background processes."""
+
+    def __init__(self, max_running: int = MAX_BACKGROUND_PROCESSES, max_retained: int = MAX_RETAINED_PROCESSES,
+                 reap_interval: float = PROCESS_REAP_INTERVAL):
+        """
+        Initialize the registry.
+
+        Args:
+            max_running (int, optional): Maximum number of running processes. Defaults to MAX_BACKGROUND_PROCESSES.
+            max_retained (int, optional): Maximum number of finished processes kept. Defaults to MAX_RETAINED_PROCESSES.
+            reap_interval (float, optional): Seconds between checks for exited processes.
+                Defaults to PROCESS_REAP_INTERVAL.
+        """
+        self.max_running = max_running
+        self.max_retained = max_retained
+        self.reap_interval = reap_interval
+        # Ordered from least to most recently used
+        self._processes: 'OrderedDict[str, BackgroundProcess]' = OrderedDict()
+        self._running: Dict[str, BackgroundProcess] = {}
+        self._lock = threading.Lock()
+        self._collector: Optional[threading.Thread] = None
+
+    def start(self, command: str, cwd: Optional[str] = None, shell: bool = False,
+              env: Optional[Dict[str, str]] = None, limits: Optional[ResourceLimits] = None) -> BackgroundProcess:
+        """
+        Start a background process.
+
+        Args:
+            command (str): The command to execute
+            cwd (str, optional): The working directory to execute the command in. Defaults to None.
+            shell (bool, optional): Whether to use shell execution. Defaults to False.
+            env (Dict[str, str], optional): Environment variables to set. Defaults to None.
+            limits (ResourceLimits, optional): CPU, memory and process limits. Defaults to None.
+
+        Returns:
+            BackgroundProcess: The started process, with its registry ID in ``process_id``
+
+        Raises:
+            RuntimeError: If the maximum number of running processes is reached
+            OSError: If the process could not be started
+        """
+        process = BackgroundProcess(command, cwd=cwd, shell=shell, env=env, limits=limits)
+        process.process_id = uuid.uuid4().hex
+
+        with self._lock:
+            self._collect()
+            if len(self._running) >= self.max_running:
+                raise RuntimeError(f"Too many background processes running (limit {self.max_running})")
+            if not process.start():
+                raise OSError(process.error)
+            self._processes[process.process_id] = process
+            self._running[process.process_id] = process
+            self._ensure_collector()
+
+        return process
+
+    def get(self, process_id: str) -> BackgroundProcess:
+        """
+        Get a background process and mark it as recently used.
+
+        Args:
+            process_id (str): ID of the process
+
+        Returns:
+            BackgroundProcess: The process
+
+        Raises:
+            KeyError: If there is no process with this ID
+        """
+        with self._lock:
+            process = self._processes.get(process_id)
+            if process is None:
+                raise KeyError(f"Process not found: {process_id}")
+            self._processes.move_to_end(process_id)
+            return process
+
+    def list(self) -> List[BackgroundProcess]:
+        """
+        List the known background processes, least recently used first.
+
+        Returns:
+            List[BackgroundProcess]: The processes
+        """
+        with self._lock:
+            self._collect()
+            return list(self._processes.values())
+
+    def signal(self, process_id: str, signum: Union[int, str]) -> signal.Signals:
+        """
+        Send a signal to a running background process.
+
+        Args:
+            process_id (str): ID of the process
+            signum (Union[int, str]): Signal number or name
+
+        Returns:
+            signal.Signals: The signal that was sent
+
+        Raises:
+            KeyError: If there is no process with this ID
+            ValueError: If the signal is unknown
+            ProcessLookupError: If the process has already exited
+        """
+        sig = parse_signal(signum)
+        process = self.get(process_id)
+        if not process.is_running():
+            raise ProcessLookupError(f"Process has already exited: {process_id}")
+
+        logger.info(f"Sending {sig.name} to background process {process_id} (pid {process.process.pid})")
+        process.process.send_signal(sig)
+        return sig
+
+    def stop(self, process_id: str) -> BackgroundProcess:
+        """
+        Stop a background process, keeping its status and output.
+
+        Args:
+            process_id (str): ID of the process
+
+        Returns:
+            BackgroundProcess: The stopped process
+
+        Raises:
+            KeyError: If there is no process with this ID
+        """
+        process = self.get(process_id)
+        if process.is_running():
+            process.stop()
+        with self._lock:
+            self._collect()
+        return process
+
+    def remove(self, process_id: str) -> None:
+        """
+        Stop a background process if needed and forget it.
+
+        Args:
+            process_id (str): ID of the process
+
+        Raises:
+            KeyError: If there is no process with this ID
+        """
+        process = self.stop(process_id)
+        with self._lock:
+            self._processes.pop(process_id, None)
+            self._running.pop(process_id, None)
+        process.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get registry statistics.
+
+        Returns:
+            Dict[str, Any]: Dictionary with the number of running and retained processes and the limits
+        """
+        with self._lock:
+            self._collect()
+            return {
+                'running': len(self._running),
+                'retained': len(self._processes),
+                'max_running': self.max_running,
+                'max_retained': self.max_retained
+            }
+
+    def _collect(self) -> None:
+        """Reap exited processes and forget the oldest finished ones. Must be called with the lock held."""
+        for process_id, process in list(self._running.items()):
+            if not process.is_running():
+                del self._running[process_id]
+                logger.info(f"Background process {process_id} exited with code {process.process.returncode}")
+
+        finished = len(self._processes) - len(self._running)
+        if finished <= self.max_retained:
+            return
+        for process_id in list(self._processes):
+            if finished <= self.max_retained:
+                break
+            if process_id not in self._running:
+                self._processes.pop(process_id).close()
+                finished -= 1
+
+    def _ensure_collector(self) -> None:
+        """Start the thread reaping exited processes. Must be called with the lock held."""
+        if self._collector is None or not self._collector.is_alive():
+            self._collector = threading.Thread(target=self._collect_loop, name='shellama-process-reaper', daemon=True)
+            self._collector.start()
+
+    def _collect_loop(self) -> None:
+        """Reap exited processes periodically until none are running."""
+        while True:
+            time.sleep(self.reap_interval)
+            with self._lock:
+                self._collect()
+                if not self._running:
+                    self._collector = None
+                    return
+
+
+def process_summary(process: BackgroundProcess) -> Dict[str, Any]:
+    """
+    Summarise a background process without its output.
+
+    Args:
+        process (BackgroundProcess): The process
+
+    Returns:
+        Dict[str, Any]: Dictionary with the process ID, command, state and output sizes
+    """
+    running = process.is_running()
+    return {
+        'process_id': process.process_id,
+        'command': process.command,
+        'pid': process.process.pid,
+        'running': running,
+        'exit_code': process.process.returncode,
+        'started': process.start_time,
+        'finished': process.end_time,
+        'execution_time': (process.end_time or time.time()) - process.start_time,
+        'output_size': {'stdout': process.stdout.end, 'stderr': process.stderr.end}
+    }
+
+
+# Create a global instance
+process_registry = ProcessRegistry()
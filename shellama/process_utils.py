@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Process Utilities Module
+
+This module provides small helpers about operating system processes that
+several modules share, such as checking whether the server that left a file
+behind is still running.
+"""
+
+import os
+
+
+def is_process_running(pid: int) -> bool:
+    """
+    Check whether a process exists.
+
+    Args:
+        pid (int): Process ID
+
+    Returns:
+        bool: True if the process exists, including processes of other users
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Owned by another user
+        return True
+    return True
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Background Deletion Module
+
+This module deletes directory trees off the request path. A tree is first
+renamed into a trash location on the same filesystem, which is atomic and
+frees its original path immediately, and is then removed by a background job
+that unlinks files from several directories in parallel with ``os.scandir``.
+Jobs wait in a queue for one of a few job threads, and all of them share one
+bounded pool of unlinking threads.
+Each trashed tree is recorded in a journal of symbolic links, so trees left
+behind by a server that stopped before finishing are deleted when the next
+one starts. Listings hide trashed siblings (see is_trash_name).
+"""
+
+import os
+import time
+import uuid
+import errno
+import queue
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from shellama.logger import logger
+from shellama.process_utils import is_process_running
+
+
+# Directory receiving trees that are being deleted; must be on the same filesystem to be used
+TRASH_DIR = os.environ.get('SHELLAMA_TRASH_DIR')
+
+# Name prefix of the hidden siblings trees are moved to when TRASH_DIR cannot be used
+TRASH_PREFIX = '.shellama-trash-'
+
+# Number of threads unlinking files, shared by all deletions
+REAPER_WORKERS = int(os.environ.get('SHELLAMA_REAPER_WORKERS', min(32, (os.cpu_count() or 1) * 4)))
+
+# Number of deletion jobs run at the same time; later ones wait in a queue
+REAPER_JOBS = int(os.environ.get('SHELLAMA_REAPER_JOBS', 2))
+
+# Maximum number of finished deletion jobs kept for status queries
+MAX_FINISHED_JOBS = 1000
+
+# Maximum number of errors included in a result
+MAX_REPORTED_ERRORS = 100
+
+# Minimum number of seconds between two progress updates
+PROGRESS_INTERVAL = 0.25
+
+_jobs: 'OrderedDict[str, DeleteJob]' = OrderedDict()
+_jobs_lock = threading.Lock()
+
+# Jobs waiting for a job thread, and the job threads started so far
+_queue: 'queue.Queue[Tuple[DeleteJob, Optional[int]]]' = queue.Queue()
+_runners: List[threading.Thread] = []
+
+# Threads unlinking files for every deletion
+_unlink_pool = ThreadPoolExecutor(max_workers=REAPER_WORKERS, thread_name_prefix='shellama-unlink')
+
+# Links named <pid>-<job id> pointing at the trashed trees that are not deleted yet
+_JOURNAL_DIR = os.path.join(tempfile.gettempdir(), f'shellama-trash-journal-{os.getuid()}')
+
+
+def is_trash_name(name: str) -> bool:
+    """
+    Check whether a directory entry is a tree waiting to be deleted, which listings leave out.
+
+    Args:
+        name (str): Name of the entry
+
+    Returns:
+        bool: True for trashed siblings
+    """
+    return name.startswith(TRASH_PREFIX)
+
+
+def _clear_directory(path: str) -> Tuple[List[str], int, List[str]]:
+    """
+    Unlink every non-directory entry directly inside a directory.
+
+    Args:
+        path (str): Path of the directory
+
+    Returns:
+        Tuple[List[str], int, List[str]]: The subdirectories, the number of removed files and the errors
+    """
+    subdirs = []
+    removed = 0
+    errors = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    else:
+                        os.unlink(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    errors.append(f"{entry.path}: {e.strerror}")
+    except OSError as e:
+        errors.append(f"{path}: {e.strerror}")
+    return subdirs, removed, errors
+
+
+def remove_tree(directory_path: str, workers: Optional[int] = None,
+                progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Remove a directory tree, unlinking files from several directories in parallel.
+
+    Directories are cleared on the shared unlinking pool. Symbolic links are
+    removed, not followed. Entries that cannot be removed are reported in the
+    result instead of stopping the deletion.
+
+    Args:
+        directory_path (str): Path to the directory
+        workers (int, optional): Number of directories cleared at once, at most REAPER_WORKERS.
+            Defaults to REAPER_WORKERS.
+        progress (Callable[[Dict[str, Any]], None], optional): Function called periodically
+            with the number of files and directories removed so far. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: Dictionary with the removed file and directory counts and any errors
+    """
+    start_time = time.time()
+    totals = {'files': 0, 'directories': 0}
+    directories = [directory_path]
+    errors: List[str] = []
+    error_count = 0
+    last_report = 0.0
+
+    def record_errors(messages: List[str]) -> None:
+        nonlocal error_count
+        error_count += len(messages)
+        errors.extend(messages[:MAX_REPORTED_ERRORS - len(errors)])
+
+    limit = min(workers or REAPER_WORKERS, REAPER_WORKERS)
+    waiting = [directory_path]
+    pending: Set[Future] = set()
+    while waiting or pending:
+        while waiting and len(pending) < limit:
+            pending.add(_unlink_pool.submit(_clear_directory, waiting.pop()))
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            subdirs, removed, messages = future.result()
+            totals['files'] += removed
+            record_errors(messages)
+            directories.extend(subdirs)
+            waiting.extend(subdirs)
+
+        if progress is not None and time.time() - last_report >= PROGRESS_INTERVAL:
+            last_report = time.time()
+            progress(dict(totals))
+
+    # Subdirectories are always discovered after their parent, so this removes children first
+    for path in reversed(directories):
+        try:
+            os.rmdir(path)
+            totals['directories'] += 1
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            if e.errno != errno.ENOTEMPTY or not error_count:
+                record_errors([f"{path}: {e.strerror}"])
+
+    return dict(
+        totals,
+        errors=errors,
+        error_count=error_count,
+        execution_time=time.time() - start_time
+    )
+
+
+class DeleteJob:
+    """Class representing the background deletion of one directory tree."""
+
+    def __init__(self, path: str, trash_path: str, job_id: str):
+        """
+        Initialize a deletion job.
+
+        Args:
+            path (str): Original path of the directory
+            trash_path (str): Path the directory was moved to
+            job_id (str): ID of the job
+        """
+        self.job_id = job_id
+        self.path = path
+        self.trash_path = trash_path
+        self.status = 'pending'
+        self.progress: Dict[str, Any] = {'files': 0, 'directories': 0}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+        # Journal entry removed once the tree is gone
+        self.journal_path: Optional[str] = None
+
+    def run(self, workers: Optional[int] = None) -> None:
+        """
+        Remove the trashed tree and record the outcome.
+
+        Args:
+            workers (int, optional): Number of directories cleared at once. Defaults to REAPER_WORKERS.
+        """
+        self.status = 'running'
+        try:
+            self.result = remove_tree(self.trash_path, workers, self._update_progress)
+            self.progress = {k: self.result[k] for k in ('files', 'directories')}
+            self.status = 'failed' if self.result['error_count'] else 'completed'
+            if self.result['error_count']:
+                self.error = f"{self.result['error_count']} entries could not be removed"
+                logger.error(f"Error deleting {self.path} (job {self.job_id}): {self.error}")
+            else:
+                logger.info(f"Deleted {self.path} (job {self.job_id}): {self.progress['files']} files "
+                            f"in {self.result['execution_time']:.2f}s")
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+            logger.error(f"Error deleting {self.path} (job {self.job_id}): {str(e)}")
+        finally:
+            if self.journal_path is not None and self.status == 'completed':
+                try:
+                    os.unlink(self.journal_path)
+                except OSError:
+                    pass
+            self.finished_at = time.time()
+            self.done.set()
+            _forget_finished_jobs()
+
+    def _update_progress(self, totals: Dict[str, Any]) -> None:
+        self.progress = totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the deletion job to a dictionary"""
+        info = {
+            'job_id': self.job_id,
+            'path': self.path,
+            'trash_path': self.trash_path,
+            'status': self.status,
+            'files_removed': self.progress['files'],
+            'directories_removed': self.progress['directories'],
+            'created': self.created_at,
+            'finished': self.finished_at,
+            'error': self.error
+        }
+        if self.result is not None:
+            info['errors'] = self.result['errors']
+            info['execution_time'] = self.result['execution_time']
+        return info
+
+
+def _forget_finished_jobs() -> None:
+    """Drop the oldest finished jobs beyond MAX_FINISHED_JOBS."""
+    with _jobs_lock:
+        finished = [job_id for job_id, job in _jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _jobs[job_id]
+
+
+def _trash_path_for(directory_path: str, job_id: str) -> str:
+    """
+    Choose where to move a directory before it is deleted.
+
+    The configured TRASH_DIR is used if it is on the same filesystem as the
+    directory, otherwise a hidden sibling of the directory, so the move is
+    always a rename and never a copy.
+    """
+    parent = os.path.dirname(os.path.abspath(directory_path))
+    if TRASH_DIR:
+        try:
+            os.makedirs(TRASH_DIR, exist_ok=True)
+            if os.stat(TRASH_DIR).st_dev == os.stat(parent).st_dev:
+                return os.path.join(TRASH_DIR, job_id)
+        except OSError as e:
+            logger.warning(f"Cannot use trash directory {TRASH_DIR}: {str(e)}")
+    return os.path.join(parent, f"{TRASH_PREFIX}{job_id}")
+
+
+def _journal_dir() -> Optional[str]:
+    """Create the journal directory if needed; None if it is missing or others could write to it."""
+    try:
+        os.makedirs(_JOURNAL_DIR, mode=0o700, exist_ok=True)
+        stats = os.lstat(_JOURNAL_DIR)
+    except OSError as e:
+        logger.warning(f"Cannot use trash journal {_JOURNAL_DIR}: {str(e)}")
+        return None
+    # Every link in it names a tree to delete, so nobody else may add links
+    if stats.st_uid != os.getuid() or stats.st_mode & 0o022 or not os.path.isdir(_JOURNAL_DIR):
+        logger.warning(f"Not using trash journal {_JOURNAL_DIR}: not a private directory")
+        return None
+    return _JOURNAL_DIR
+
+
+def _run_jobs() -> None:
+    """Run queued deletion jobs one after another."""
+    while True:
+        job, workers = _queue.get()
+        job.run(workers)
+
+
+def _start(job: DeleteJob, workers: Optional[int]) -> DeleteJob:
+    """Record a job and queue it for the job threads, starting them on first use."""
+    with _jobs_lock:
+        _jobs[job.job_id] = job
+        while len(_runners) < REAPER_JOBS:
+            runner = threading.Thread(target=_run_jobs, name=f"shellama-reaper-{len(_runners)}", daemon=True)
+            runner.start()
+            _runners.append(runner)
+    _queue.put((job, workers))
+    return job
+
+
+def schedule_delete(directory_path: str, workers: Optional[int] = None) -> DeleteJob:
+    """
+    Move a directory out of the way and delete it in the background.
+
+    The directory is gone from its original path when this function returns.
+
+    Args:
+        directory_path (str): Path to the directory to delete
+        workers (int, optional): Number of directories cleared at once. Defaults to REAPER_WORKERS.
+
+    Returns:
+        DeleteJob: The deletion job
+
+    Raises:
+        FileNotFoundError: If the directory does not exist
+        NotADirectoryError: If the path is not a directory or is a symbolic link
+        IOError: If the directory cannot be moved
+    """
+    logger.info(f"Scheduling background deletion of {directory_path}")
+
+    if os.path.islink(directory_path) or (os.path.exists(directory_path) and not os.path.isdir(directory_path)):
+        raise NotADirectoryError(errno.ENOTDIR, 'Not a directory', directory_path)
+
+    job_id = uuid.uuid4().hex
+    trash_path = _trash_path_for(directory_path, job_id)
+    os.rename(directory_path, trash_path)
+
+    job = DeleteJob(directory_path, trash_path, job_id)
+    journal = _journal_dir()
+    if journal is not None:
+        try:
+            os.symlink(os.path.abspath(trash_path), os.path.join(journal, f"{os.getpid()}-{job_id}"))
+            job.journal_path = os.path.join(journal, f"{os.getpid()}-{job_id}")
+        except OSError as e:
+            logger.warning(f"Cannot record {trash_path} in the trash journal: {str(e)}")
+    return _start(job, workers)
+
+
+def sweep_leftovers(workers: Optional[int] = None) -> List[DeleteJob]:
+    """
+    Delete trees left in the trash by servers that stopped before deleting them.
+
+    Trees of running servers and of this server's own jobs are left alone.
+
+    Args:
+        workers (int, optional): Number of directories cleared at once per tree. Defaults to REAPER_WORKERS.
+
+    Returns:
+        List[DeleteJob]: The deletion jobs started
+    """
+    if not os.path.isdir(_JOURNAL_DIR) or _journal_dir() is None:
+        return []
+    jobs = []
+    for entry in list(os.scandir(_JOURNAL_DIR)):
+        pid, _, job_id = entry.name.partition('-')
+        with _jobs_lock:
+            if job_id in _jobs:
+                continue
+        if pid.isdigit() and int(pid) != os.getpid() and is_process_running(int(pid)):
+            continue
+        try:
+            trash_path = os.readlink(entry.path)
+        except OSError:
+            continue
+        # Only ever delete what schedule_delete could have trashed for this job
+        name = os.path.basename(trash_path)
+        if not os.path.isabs(trash_path) or name not in (f"{TRASH_PREFIX}{job_id}", job_id):
+            logger.warning(f"Ignoring unexpected trash journal entry {entry.path} -> {trash_path}")
+            continue
+        if not os.path.isdir(trash_path) or os.path.islink(trash_path):
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+            continue
+        logger.info(f"Deleting {trash_path} left in the trash by an earlier server")
+        job = DeleteJob(trash_path, trash_path, job_id)
+        job.journal_path = entry.path
+        jobs.append(_start(job, workers))
+    return jobs
+
+
+def get_job(job_id: str) -> DeleteJob:
+    """
+    Get a deletion job.
+
+    Args:
+        job_id (str): ID of the job
+
+    Returns:
+        DeleteJob: The deletion job
+
+    Raises:
+        KeyError: If there is no job with this ID
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        raise KeyError(f"Deletion job not found: {job_id}")
+    return job
+
+
+def list_jobs() -> List[DeleteJob]:
+    """
+    List the known deletion jobs, oldest first.
+
+    Returns:
+        List[DeleteJob]: The deletion jobs
+    """
+    with _jobs_lock:
+        return list(_jobs.values())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Repository Pool Module
+
+This module keeps ``git.Repo`` handles open between requests. A handle holds
+GitPython's persistent ``git cat-file --batch`` processes, so reusing one skips
+repository discovery and Git process startup. A handle is used by one thread
+at a time: callers lease it and return it when done. Idle handles are keyed by
+the real path of the repository, closed least recently used first when too
+many are open, and closed after an idle timeout or at shutdown.
+"""
+
+import os
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+import git
+from git import Repo
+
+from shellama.logger import logger
+
+
+# Maximum number of idle repository handles kept open
+MAX_OPEN_REPOS = int(os.environ.get('SHELLAMA_MAX_OPEN_REPOS', 16))
+
+# Seconds after its last use before an idle repository handle is closed
+REPO_IDLE_TIMEOUT = float(os.environ.get('SHELLAMA_REPO_IDLE_TIMEOUT', 300))
+
+
+class RepoPool:
+    """Thread-safe pool of open repository handles."""
+
+    def __init__(self, max_repos: int = MAX_OPEN_REPOS, idle_timeout: float = REPO_IDLE_TIMEOUT):
+        """
+        Initialize the pool.
+
+        Args:
+            max_repos (int, optional): Maximum number of idle handles kept open. Defaults to MAX_OPEN_REPOS.
+            idle_timeout (float, optional): Seconds before an unused handle is closed.
+                Defaults to REPO_IDLE_TIMEOUT.
+        """
+        self.max_repos = max_repos
+        self.idle_timeout = idle_timeout
+        # Real path -> idle handles with the time they were returned, least recently used path first
+        self._idle: 'OrderedDict[str, List[Tuple[Repo, float]]]' = OrderedDict()
+        self._idle_count = 0
+        self._leased = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def lease(self, directory_path: str) -> Iterator[Repo]:
+        """
+        Borrow a handle for a repository, opening one if none is idle.
+
+        Args:
+            directory_path (str): Path to the Git repository
+
+        Yields:
+            Repo: Git repository object, for use by the calling thread only
+
+        Raises:
+            git.InvalidGitRepositoryError: If the directory is not a Git repository
+            git.NoSuchPathError: If the directory does not exist
+        """
+        key = os.path.realpath(directory_path)
+        stale: List[Repo] = []
+        repo = None
+        with self._lock:
+            stale.extend(self._take_idle())
+            handles = self._idle.get(key)
+            if handles:
+                repo, _returned = handles.pop()
+                self._idle_count -= 1
+                if not handles:
+                    del self._idle[key]
+            self._leased += 1
+        self._close(stale)
+
+        try:
+            # The repository may have been deleted or re-created since the handle was opened
+            if repo is not None and not os.path.isdir(repo.git_dir):
+                self._close([repo])
+                repo = None
+            if repo is None:
+                try:
+                    repo = Repo(key)
+                except git.InvalidGitRepositoryError:
+                    logger.error(f"Directory {directory_path} is not a Git repository")
+                    raise
+                with self._lock:
+                    self.misses += 1
+            else:
+                with self._lock:
+                    self.hits += 1
+        except BaseException:
+            with self._lock:
+                self._leased -= 1
+            raise
+
+        try:
+            yield repo
+        except (git.GitCommandError, GeneratorExit):
+            # Failed Git calls and generators closed early leave the handle usable
+            self._release(key, repo)
+            raise
+        except BaseException:
+            # A failed command may leave the handle's persistent processes mid-response
+            with self._lock:
+                self._leased -= 1
+            self._close([repo])
+            raise
+        self._release(key, repo)
+
+    def _release(self, key: str, repo: Repo) -> None:
+        """Return a leased handle, closing the least recently used ones beyond the limit."""
+        with self._lock:
+            self._leased -= 1
+            if self._closed:
+                stale = [repo]
+            else:
+                self._idle.setdefault(key, []).append((repo, time.monotonic()))
+                self._idle.move_to_end(key)
+                self._idle_count += 1
+                stale = self._take_idle()
+        self._close(stale)
+
+    def _take_idle(self) -> List[Repo]:
+        """
+        Remove expired handles and handles beyond the limit. Must be called with the lock held.
+
+        Returns:
+            List[Repo]: The handles to close
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        stale = []
+        for key in list(self._idle):
+            handles = self._idle[key]
+            while handles and handles[0][1] < cutoff:
+                stale.append(handles.pop(0)[0])
+            if not handles:
+                del self._idle[key]
+        self._idle_count -= len(stale)
+
+        while self._idle_count > self.max_repos:
+            key, handles = next(iter(self._idle.items()))
+            stale.append(handles.pop(0)[0])
+            self._idle_count -= 1
+            if not handles:
+                del self._idle[key]
+        return stale
+
+    @staticmethod
+    def _close(repos: List[Repo]) -> None:
+        """Close handles and their Git processes."""
+        for repo in repos:
+            try:
+                repo.close()
+            except Exception as e:
+                logger.warning(f"Error closing repository {repo.git_dir}: {str(e)}")
+
+    def clear(self) -> None:
+        """Close all idle handles."""
+        with self._lock:
+            stale = [repo for handles in self._idle.values() for repo, _returned in handles]
+            self._idle.clear()
+            self._idle_count = 0
+        self._close(stale)
+
+    def shutdown(self) -> None:
+        """Close all idle handles, and leased handles when they are returned."""
+        with self._lock:
+            self._closed = True
+        self.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get pool statistics.
+
+        Returns:
+            Dict[str, Any]: Dictionary with the open handles and how often a handle was reused
+        """
+        with self._lock:
+            return {
+                'repositories': len(self._idle),
+                'idle': self._idle_count,
+                'leased': self._leased,
+                'max_repos': self.max_repos,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# Create a global instance
+repo_pool = RepoPool()
+atexit.register(repo_pool.shutdown)
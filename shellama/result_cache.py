@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Command Result Cache Module
+
+This module memoizes the results of deterministic, read-only commands such as
+``git rev-parse HEAD`` or ``python --version``. Callers opt in per command with
+a cache policy. The cache key covers the arguments, the working directory, an
+allowlist of environment variables and the inode, mtime and size of declared
+input files, so a changed input yields a new key rather than a stale result.
+Results live in a bounded LRU with a TTL and can also be kept on disk, so they
+survive restarts.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from shellama.limits import ResourceLimits
+from shellama.logger import logger
+
+
+# Maximum number of command results kept in memory
+RESULT_CACHE_SIZE = int(os.environ.get('SHELLAMA_RESULT_CACHE_SIZE', 1024))
+
+# Maximum bytes of command output kept in memory
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('SHELLAMA_RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Default seconds a cached result is served
+RESULT_CACHE_TTL = float(os.environ.get('SHELLAMA_RESULT_CACHE_TTL', 300))
+
+# Directory for the on-disk result store (disabled if unset)
+RESULT_CACHE_DIR = os.environ.get('SHELLAMA_RESULT_CACHE_DIR') or None
+
+
+class CachePolicy:
+    """Class describing how a command result may be cached."""
+
+    def __init__(self, ttl: float = RESULT_CACHE_TTL, env: Optional[List[str]] = None,
+                 inputs: Optional[List[str]] = None):
+        """
+        Initialize the policy.
+
+        Args:
+            ttl (float, optional): Seconds the result is served. Defaults to RESULT_CACHE_TTL.
+            env (List[str], optional): Environment variables that are part of the key. Defaults to None.
+            inputs (List[str], optional): Files whose inode, mtime and size are part of the key,
+                relative to the working directory. Defaults to None.
+
+        Raises:
+            ValueError: If the TTL is not positive
+        """
+        if ttl <= 0:
+            raise ValueError("Cache ttl must be positive")
+        self.ttl = ttl
+        self.env = sorted(set(env or ()))
+        self.inputs = list(inputs or ())
+
+    @classmethod
+    def from_request(cls, value: Any) -> Optional['CachePolicy']:
+        """
+        Build a policy from the ``cache`` field of a request.
+
+        Args:
+            value (Any): ``true`` for the default policy, or a dictionary with optional
+                ttl, env and inputs keys
+
+        Returns:
+            Optional[CachePolicy]: The policy, or None if caching is not requested
+
+        Raises:
+            ValueError: If the policy is not valid
+        """
+        if not value:
+            return None
+        if value is True:
+            return cls()
+        if not isinstance(value, dict):
+            raise ValueError("cache must be true or an object")
+        unknown = set(value) - {'ttl', 'env', 'inputs'}
+        if unknown:
+            raise ValueError(f"Unknown cache options: {', '.join(sorted(unknown))}")
+        for name in ('env', 'inputs'):
+            items = value.get(name)
+            if items is not None and not (isinstance(items, list) and all(isinstance(i, str) for i in items)):
+                raise ValueError(f"cache {name} must be a list of strings")
+        try:
+            ttl = float(value['ttl']) if value.get('ttl') is not None else RESULT_CACHE_TTL
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid cache ttl: {value['ttl']}")
+        return cls(ttl=ttl, env=value.get('env'), inputs=value.get('inputs'))
+
+
+def _fingerprint(path: str) -> Optional[Tuple[int, int, int, int]]:
+    """Identify a version of a file by device, inode, mtime and size."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _result_size(result: Dict[str, Any]) -> int:
+    return len(result.get('stdout') or '') + len(result.get('stderr') or '') + 256
+
+
+class ResultCache:
+    """Bounded LRU cache of command results with expiry and an optional disk store."""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 store_dir: Optional[str] = RESULT_CACHE_DIR):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int, optional): Maximum number of results in memory. Defaults to RESULT_CACHE_SIZE.
+            max_bytes (int, optional): Maximum output bytes in memory. Defaults to RESULT_CACHE_MAX_BYTES.
+            store_dir (str, optional): Directory of the disk store. Defaults to RESULT_CACHE_DIR.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store_dir = store_dir
+        # key -> (expires_at monotonic, size, result)
+        self._entries: 'OrderedDict[str, Tuple[float, int, Dict[str, Any]]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def make_key(self, args: Any, shell: bool, cwd: Optional[str], env: Optional[Dict[str, str]],
+                 policy: CachePolicy, limits: Optional[ResourceLimits] = None,
+                 output_limit: Optional[int] = None) -> str:
+        """
+        Build the cache key of a command.
+
+        Args:
+            args (Any): Argument list, or the command string for shell execution
+            shell (bool): Whether the command runs through the shell
+            cwd (str, optional): Working directory
+            env (Dict[str, str], optional): Environment of the command (None for the server's)
+            policy (CachePolicy): Policy naming the environment variables and input files
+            limits (ResourceLimits, optional): Resource limits of the command. Defaults to None.
+            output_limit (int, optional): Bytes of output kept in the result. Defaults to None.
+
+        Returns:
+            str: Hex digest identifying the command and its inputs
+        """
+        cwd = os.path.realpath(cwd or os.getcwd())
+        environ = os.environ if env is None else env
+        material = {
+            'args': args,
+            'shell': shell,
+            'cwd': cwd,
+            'env': [(name, environ.get(name)) for name in policy.env],
+            'inputs': [(path, _fingerprint(os.path.join(cwd, path))) for path in policy.inputs],
+            # A run killed by a limit or truncated must not be served to callers without them
+            'limits': limits.to_dict() if limits is not None else None,
+            'output_limit': output_limit
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True).encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a result.
+
+        Args:
+            key (str): Key from make_key()
+
+        Returns:
+            Optional[Dict[str, Any]]: A copy of the cached result, or None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[2])
+                self._drop(key)
+                self.expirations += 1
+
+        result, expires_at = self._load(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, result, now + (expires_at - time.time()))
+        return dict(result)
+
+    def put(self, key: str, result: Dict[str, Any], ttl: float) -> None:
+        """
+        Store a result.
+
+        Args:
+            key (str): Key from make_key()
+            result (Dict[str, Any]): Result of the command
+            ttl (float): Seconds the result is served
+        """
+        with self._lock:
+            self.stores += 1
+            self._insert(key, result, time.monotonic() + ttl)
+        self._save(key, result, time.time() + ttl)
+
+    def clear(self) -> None:
+        """Drop every cached result, including the disk store."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.store_dir:
+            try:
+                for entry in os.scandir(self.store_dir):
+                    if entry.name.endswith('.json'):
+                        try:
+                            os.unlink(entry.path)
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dict[str, Any]: Dictionary with hit/miss counters and cache size
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'disk_store': self.store_dir
+            }
+
+    def _insert(self, key: str, result: Dict[str, Any], expires_at: float) -> None:
+        """Add a result, evicting the least recently used ones. Must be called with the lock held."""
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (expires_at, size, result)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _old_key, (_expires_at, old_size, _result) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        """Remove a result from memory. Must be called with the lock held."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.store_dir, f'{key}.json')
+
+    def _load(self, key: str) -> Tuple[Optional[Dict[str, Any]], float]:
+        """Read a result from the disk store."""
+        if not self.store_dir:
+            return None, 0.0
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None, 0.0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot read cached result {path}: {str(e)}")
+            return None, 0.0
+        if record.get('expires_at', 0) <= time.time():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None, 0.0
+        return record.get('result'), record['expires_at']
+
+    def _save(self, key: str, result: Dict[str, Any], expires_at: float) -> None:
+        """Write a result to the disk store atomically."""
+        if not self.store_dir:
+            return
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix='.result-', dir=self.store_dir)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'expires_at': expires_at, 'result': result}, f)
+                os.replace(temp_path, self._path(key))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Cannot store cached result in {self.store_dir}: {str(e)}")
+
+
+# Create a global instance
+result_cache = ResultCache()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sandbox Exec Helper
+
+This script applies the resource limits of one command to itself and then
+replaces itself with the command. The limits are thereby set without running
+Python code between fork and exec in the server, which is not safe in a
+threaded process and not possible in the launcher. It joins the command's
+cgroup, if there is one, and sets the rlimits; both are kept across ``exec``.
+
+Without a cgroup the usage of the command can only be read from ``wait4``,
+which nothing else is sure to call: asyncio reaps the command itself on some
+Python versions. The helper then forks instead, waits for the command with
+``wait4``, writes its resource usage to the file named in the limits and exits
+like the command did. Signals sent to the helper are passed on to the command.
+
+It imports only the standard library so that it starts quickly; it is run as
+``python -I -S sandbox_exec.py <limits as JSON> <command> [<argument> ...]``.
+"""
+
+import os
+import sys
+import json
+import signal
+import resource
+from typing import Any, Dict, List
+
+# Resource usage fields written for the server (shellama.limits.RUSAGE_FIELDS)
+_RUSAGE_FIELDS = ('ru_maxrss', 'ru_utime', 'ru_stime', 'ru_inblock', 'ru_oublock')
+
+# Signals passed on to the command while the helper waits for it
+_FORWARDED_SIGNALS = (signal.SIGHUP, signal.SIGINT, signal.SIGQUIT, signal.SIGTERM, signal.SIGUSR1,
+                      signal.SIGUSR2, signal.SIGALRM, signal.SIGCONT, signal.SIGTSTP, signal.SIGWINCH)
+
+
+def apply(config: Dict[str, Any]) -> None:
+    """Move this process into its cgroup and set its rlimits."""
+    if config.get('cgroup_procs'):
+        # Writing 0 moves the writing process
+        fd = os.open(config['cgroup_procs'], os.O_WRONLY)
+        try:
+            os.write(fd, b'0')
+        finally:
+            os.close(fd)
+    if config.get('memory') is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (config['memory'], config['memory']))
+    if config.get('pids') is not None:
+        # Counts every process of the user, not just this command's
+        resource.setrlimit(resource.RLIMIT_NPROC, (config['pids'], config['pids']))
+    if config.get('cpu_time') is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, (config['cpu_time'], config['cpu_time'] + 1))
+
+
+def execute(config: Dict[str, Any], args: List[str]) -> int:
+    """Apply the limits and replace this process with the command; returns only on failure."""
+    try:
+        apply(config)
+        os.execvp(args[0], args)
+    except OSError as e:
+        sys.stderr.write(f"shellama: {args[0]}: {e.strerror}\n")
+        return 127 if isinstance(e, FileNotFoundError) else 126
+    return 126
+
+
+def supervise(config: Dict[str, Any], args: List[str]) -> int:
+    """Run the command in a child, write its resource usage and return its exit status."""
+    # Blocked across fork so that no signal arrives before it can be passed on
+    signal.pthread_sigmask(signal.SIG_BLOCK, _FORWARDED_SIGNALS)
+    pid = os.fork()
+    if pid == 0:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, _FORWARDED_SIGNALS)
+        os._exit(execute(config, args))
+
+    def forward(signum, _frame):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    for signum in _FORWARDED_SIGNALS:
+        signal.signal(signum, forward)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, _FORWARDED_SIGNALS)
+
+    _, status, rusage = os.wait4(pid, 0)
+    try:
+        with open(config['rusage_path'], 'w', encoding='ascii') as f:
+            json.dump({name: getattr(rusage, name) for name in _RUSAGE_FIELDS}, f)
+    except OSError:
+        pass
+
+    if os.WIFSIGNALED(status):
+        # Die of the same signal, so the server sees the command's status
+        signum = os.WTERMSIG(status)
+        signal.signal(signum, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, [signum])
+        os.kill(os.getpid(), signum)
+    return os.WEXITSTATUS(status)
+
+
+def main(argv: List[str]) -> int:
+    """
+    Apply the limits and run the command.
+
+    Args:
+        argv (List[str]): This script, the limits as JSON, then the command line
+
+    Returns:
+        int: Exit code like the shell's if the command cannot be run, or the command's exit
+            code when its usage is reported; otherwise it does not return
+    """
+    config = json.loads(argv[1])
+    args = argv[2:]
+    if config.get('rusage_path'):
+        return supervise(config, args)
+    return execute(config, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Command Scheduler Module
+
+This module decides which waiting command gets the next free execution slot.
+Commands belong to a priority class (interactive, normal or batch) and a
+tenant. Higher classes are always served first, and a few slots are kept for
+interactive commands so that a burst of batch work cannot delay them. Within a
+class, tenants take turns, and each tenant's commands run earliest deadline
+first. Commands whose deadline passes while they wait are never started.
+When a queue is full, commands are rejected with an estimate of when to retry.
+
+The scheduler lives on the executor's event loop and is not thread-safe.
+"""
+
+import os
+import math
+import heapq
+import asyncio
+import itertools
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from shellama.logger import logger
+
+
+# Priority classes, highest first
+PRIORITY_CLASSES = ('interactive', 'normal', 'batch')
+
+# Execution slots kept free for interactive commands (defaults to an eighth of the slots)
+INTERACTIVE_RESERVED_SLOTS = os.environ.get('SHELLAMA_INTERACTIVE_RESERVED_SLOTS')
+
+# Maximum number of commands waiting in each priority class
+SCHEDULER_MAX_QUEUED = int(os.environ.get('SHELLAMA_SCHEDULER_MAX_QUEUED', 1024))
+
+# Maximum number of commands one tenant may have waiting in each priority class
+SCHEDULER_MAX_QUEUED_PER_TENANT = int(os.environ.get('SHELLAMA_SCHEDULER_MAX_QUEUED_PER_TENANT', 256))
+
+# Weight of the latest command in the running average of execution times
+_RUN_TIME_SMOOTHING = 0.2
+
+
+class SchedulerFull(Exception):
+    """Raised when a command cannot be queued; ``retry_after`` is a suggested delay in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a command's deadline passes before it could start."""
+
+
+class _Job:
+    """A command waiting for a slot."""
+
+    __slots__ = ('deadline', 'seq', 'tenant', 'future')
+
+    def __init__(self, deadline: float, seq: int, tenant: str, future: asyncio.Future):
+        self.deadline = deadline
+        self.seq = seq
+        self.tenant = tenant
+        self.future = future
+
+    def __lt__(self, other: '_Job') -> bool:
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+
+class Scheduler:
+    """Class handing out execution slots by priority, tenant and deadline."""
+
+    def __init__(self, slots: int, reserved: Optional[int] = None, max_queued: int = SCHEDULER_MAX_QUEUED,
+                 max_queued_per_tenant: int = SCHEDULER_MAX_QUEUED_PER_TENANT):
+        """
+        Initialize the scheduler.
+
+        Args:
+            slots (int): Number of commands that may run at once
+            reserved (int, optional): Slots only interactive commands may use.
+                Defaults to SHELLAMA_INTERACTIVE_RESERVED_SLOTS or an eighth of the slots.
+            max_queued (int, optional): Waiting commands per class. Defaults to SCHEDULER_MAX_QUEUED.
+            max_queued_per_tenant (int, optional): Waiting commands per tenant and class.
+                Defaults to SCHEDULER_MAX_QUEUED_PER_TENANT.
+        """
+        if reserved is None:
+            reserved = int(INTERACTIVE_RESERVED_SLOTS) if INTERACTIVE_RESERVED_SLOTS else max(1, slots // 8)
+        self.slots = slots
+        self.reserved = max(0, min(reserved, slots - 1))
+        self.max_queued = max_queued
+        self.max_queued_per_tenant = max_queued_per_tenant
+        # Per class: tenant -> heap of jobs, in round-robin order
+        self._queues: Dict[str, 'OrderedDict[str, List[_Job]]'] = {p: OrderedDict() for p in PRIORITY_CLASSES}
+        self._queued = {p: 0 for p in PRIORITY_CLASSES}
+        self._running = {p: 0 for p in PRIORITY_CLASSES}
+        self._run_time = {p: 1.0 for p in PRIORITY_CLASSES}
+        self._seq = itertools.count()
+        self.rejected = 0
+        self.expired = 0
+
+    @property
+    def running(self) -> int:
+        """Number of slots in use."""
+        return sum(self._running.values())
+
+    def _can_start(self, priority: str) -> bool:
+        limit = self.slots if priority == 'interactive' else self.slots - self.reserved
+        return self.running < limit
+
+    async def acquire(self, priority: str = 'normal', tenant: Optional[str] = None,
+                      deadline: Optional[float] = None) -> None:
+        """
+        Wait for an execution slot. Must be followed by release().
+
+        Args:
+            priority (str, optional): Priority class. Defaults to 'normal'.
+            tenant (str, optional): Tenant sharing its class fairly with other tenants. Defaults to None.
+            deadline (float, optional): Loop time by which the command must have started. Defaults to None.
+
+        Raises:
+            ValueError: If the priority class is unknown
+            SchedulerFull: If the class or the tenant has too many commands waiting
+            DeadlineExceeded: If the deadline passes first
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITY_CLASSES)}")
+        tenant = tenant or ''
+        higher_waiting = any(self._queued[p] for p in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(priority) + 1])
+        if not higher_waiting and self._can_start(priority):
+            self._running[priority] += 1
+            return
+
+        self.check(priority, tenant)
+
+        queue = self._queues[priority]
+        loop = asyncio.get_running_loop()
+        job = _Job(deadline if deadline is not None else math.inf, next(self._seq), tenant, loop.create_future())
+        heapq.heappush(queue.setdefault(tenant, []), job)
+        self._queued[priority] += 1
+
+        timeout = None if deadline is None else max(0.0, deadline - loop.time())
+        try:
+            await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            expired = isinstance(e, asyncio.TimeoutError)
+            if job.future.done() and not job.future.cancelled():
+                # The slot was granted just as the wait ended
+                if expired:
+                    return
+                self.release(priority)
+                raise
+            job.future.cancel()
+            self._remove(priority, job)
+            if expired:
+                self.expired += 1
+                raise DeadlineExceeded("Deadline passed before the command could start")
+            raise
+
+    def check(self, priority: str, tenant: Optional[str] = None) -> None:
+        """
+        Check that a command of a class and tenant could be queued now.
+
+        Args:
+            priority (str): Priority class
+            tenant (str, optional): Tenant of the command. Defaults to None.
+
+        Raises:
+            SchedulerFull: If the class or the tenant has too many commands waiting
+        """
+        tenant = tenant or ''
+        queue = self._queues[priority]
+        if self._queued[priority] >= self.max_queued or len(queue.get(tenant, ())) >= self.max_queued_per_tenant:
+            self.rejected += 1
+            logger.warning(f"Rejecting {priority} command of tenant {tenant!r}: queue is full")
+            raise SchedulerFull(f"Too many {priority} commands waiting", self.retry_after(priority))
+
+    def release(self, priority: str, run_time: Optional[float] = None) -> None:
+        """
+        Return a slot and start waiting commands.
+
+        Args:
+            priority (str): Priority class the slot was acquired for
+            run_time (float, optional): Seconds the command ran, for retry estimates. Defaults to None.
+        """
+        self._running[priority] -= 1
+        if run_time is not None:
+            self._run_time[priority] += _RUN_TIME_SMOOTHING * (run_time - self._run_time[priority])
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to the best waiting commands."""
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            while queue and self._can_start(priority):
+                # Take the next tenant in turn and its most urgent command
+                tenant, jobs = queue.popitem(last=False)
+                job = heapq.heappop(jobs)
+                if jobs:
+                    queue[tenant] = jobs
+                self._queued[priority] -= 1
+                if not job.future.done():
+                    self._running[priority] += 1
+                    job.future.set_result(None)
+            if queue:
+                # Lower classes never overtake a waiting higher class
+                return
+
+    def _remove(self, priority: str, job: _Job) -> None:
+        """Drop a job that stopped waiting."""
+        jobs = self._queues[priority].get(job.tenant)
+        if jobs is None or job not in jobs:
+            return
+        jobs.remove(job)
+        heapq.heapify(jobs)
+        if not jobs:
+            del self._queues[priority][job.tenant]
+        self._queued[priority] -= 1
+
+    def retry_after(self, priority: str) -> int:
+        """
+        Estimate when a rejected command of a class would find room.
+
+        Args:
+            priority (str): Priority class
+
+        Returns:
+            int: Seconds to wait, at least 1
+        """
+        ahead = sum(self._queued[p] for p in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(priority) + 1])
+        slots = self.slots if priority == 'interactive' else max(1, self.slots - self.reserved)
+        return max(1, math.ceil(ahead * self._run_time[priority] / slots))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get scheduler statistics.
+
+        Returns:
+            Dict[str, Any]: Dictionary with running and waiting commands per class and rejection counters
+        """
+        return {
+            'slots': self.slots,
+            'reserved_interactive': self.reserved,
+            'classes': {
+                p: {
+                    'running': self._running[p],
+                    'queued': self._queued[p],
+                    'tenants': len(self._queues[p]),
+                    'average_run_time': self._run_time[p]
+                } for p in PRIORITY_CLASSES
+            },
+            'rejected': self.rejected,
+            'expired': self.expired
+        }
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shell Sessions Module
+
+This module keeps long-lived shell processes that run a series of commands,
+so the working directory and exported variables persist between commands and
+each command avoids the cost of starting a new shell. Commands are framed with
+random end markers on stdout and stderr. A small pool of pre-started spare
+shells makes creating a session as cheap as running a command, and sessions
+that stay idle too long are closed.
+"""
+
+import os
+import time
+import uuid
+import shlex
+import signal
+import locale
+import selectors
+import threading
+import subprocess
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from shellama.logger import logger
+
+
+# Shell started for each session
+SESSION_SHELL = os.environ.get('SHELLAMA_SESSION_SHELL', '/bin/sh')
+
+# Maximum number of open sessions
+MAX_SESSIONS = int(os.environ.get('SHELLAMA_MAX_SESSIONS', 64))
+
+# Seconds after its last command before a session is closed
+SESSION_IDLE_TIMEOUT = float(os.environ.get('SHELLAMA_SESSION_IDLE_TIMEOUT', 600))
+
+# Number of pre-started shells kept ready for new sessions
+SESSION_POOL_SIZE = int(os.environ.get('SHELLAMA_SESSION_POOL_SIZE', 2))
+
+_READ_SIZE = 64 * 1024
+
+
+class ShellSession:
+    """Class representing one long-lived shell process."""
+
+    def __init__(self, cwd: Optional[str] = None, shell: str = SESSION_SHELL):
+        """
+        Start the shell.
+
+        Args:
+            cwd (str, optional): Initial working directory. Defaults to None (the server's).
+            shell (str, optional): Shell executable. Defaults to SESSION_SHELL.
+        """
+        self.session_id = uuid.uuid4().hex
+        self.shell = shell
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.cwd = os.path.abspath(cwd or os.getcwd())
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._encoding = locale.getpreferredencoding(False)
+        self.process = subprocess.Popen(
+            [shell],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=True
+        )
+        for pipe in (self.process.stdout, self.process.stderr):
+            os.set_blocking(pipe.fileno(), False)
+
+    @property
+    def alive(self) -> bool:
+        """Whether the shell process is still running."""
+        return self.process.poll() is None
+
+    def run(self, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run a command in the session's shell.
+
+        The command runs in the shell itself, so ``cd`` and ``export`` affect
+        later commands. Its standard input is ``/dev/null``. If it times out the
+        whole session is killed; if it exits the shell the session is closed.
+
+        Args:
+            command (str): The command to run
+            timeout (float, optional): Timeout in seconds. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: Dictionary with command execution results and the new working directory
+        """
+        with self._lock:
+            try:
+                return self._run(command, timeout)
+            finally:
+                if not self.alive:
+                    self._close_pipes()
+
+    def _run(self, command: str, timeout: Optional[float]) -> Dict[str, Any]:
+        """Run a command. Must be called with the session lock held."""
+        start_time = time.time()
+        self.last_used = start_time
+        self.commands += 1
+        deadline = start_time + timeout if timeout else None
+
+        marker = f"__shellama_{uuid.uuid4().hex}__".encode('ascii')
+        # 'command eval' keeps the shell alive on syntax errors; the status and cwd are framed by markers
+        script = (
+            f"command eval {shlex.quote(command)} </dev/null\n"
+            f"__shellama_status=$?\n"
+            f"printf '%s %d %s%s' '{marker.decode()}' \"$__shellama_status\" \"$PWD\" '{marker.decode()}'\n"
+            f"printf '%s' '{marker.decode()}' >&2\n"
+        ).encode(self._encoding, errors='surrogateescape')
+
+        try:
+            self.process.stdin.write(script)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            return self._result(start_time, False, None, b'', b'', 'Session has exited')
+
+        try:
+            return self._collect(command, marker, deadline, timeout, start_time)
+        except BaseException:
+            # The shell may still print this command's markers, which would end the next command early
+            self.close()
+            raise
+
+    def _collect(self, command: str, marker: bytes, deadline: Optional[float], timeout: Optional[float],
+                 start_time: float) -> Dict[str, Any]:
+        """Read the output of a command sent to the shell and build its result."""
+        stdout, stderr, outcome = self._read_until(marker, deadline)
+
+        if outcome == 'complete':
+            output, trailer = stdout.split(marker, 1)
+            status, cwd = trailer[:-len(marker)].lstrip(b' ').split(b' ', 1)
+            self.cwd = cwd.decode(self._encoding, errors='replace')
+            exit_code = int(status)
+            error = None if exit_code == 0 else f"Command failed with exit code {exit_code}"
+            return self._result(start_time, exit_code == 0, exit_code, output, stderr[:-len(marker)], error)
+
+        if outcome == 'timeout':
+            logger.error(f"Command timed out after {timeout} seconds in session {self.session_id}: {command}")
+            self.close()
+            return self._result(start_time, False, None, stdout, stderr,
+                                f"Command timed out after {timeout} seconds, session closed")
+
+        # The command exited the shell
+        exit_code = self.process.wait()
+        self.close()
+        return self._result(start_time, exit_code == 0, exit_code, stdout, stderr,
+                            None if exit_code == 0 else f"Session exited with code {exit_code}")
+
+    def _read_until(self, marker: bytes, deadline: Optional[float]):
+        """
+        Read both pipes until the end markers arrive, the shell exits or the deadline passes.
+
+        Returns:
+            Tuple[bytes, bytes, str]: The stdout and stderr data and 'complete', 'eof' or 'timeout'
+        """
+        buffers = {self.process.stdout.fileno(): bytearray(), self.process.stderr.fileno(): bytearray()}
+        stdout_fd, stderr_fd = self.process.stdout.fileno(), self.process.stderr.fileno()
+
+        def complete() -> bool:
+            # Runs after every read, so the scan of the whole output comes last
+            return (buffers[stdout_fd].endswith(marker) and buffers[stderr_fd].endswith(marker)
+                    and buffers[stdout_fd].count(marker) >= 2)
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(stdout_fd, selectors.EVENT_READ)
+            selector.register(stderr_fd, selectors.EVENT_READ)
+            while not complete():
+                if stdout_fd not in selector.get_map():
+                    return bytes(buffers[stdout_fd]), bytes(buffers[stderr_fd]), 'eof'
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return bytes(buffers[stdout_fd]), bytes(buffers[stderr_fd]), 'timeout'
+                for key, _ in selector.select(remaining):
+                    try:
+                        data = os.read(key.fd, _READ_SIZE)
+                    except BlockingIOError:
+                        continue
+                    if data:
+                        buffers[key.fd] += data
+                    else:
+                        selector.unregister(key.fd)
+
+        return bytes(buffers[stdout_fd]), bytes(buffers[stderr_fd]), 'complete'
+
+    def _result(self, start_time: float, success: bool, exit_code: Optional[int], stdout: bytes,
+                stderr: bytes, error: Optional[str]) -> Dict[str, Any]:
+        result = {
+            'success': success,
+            'exit_code': exit_code,
+            'stdout': stdout.decode(self._encoding, errors='replace'),
+            'stderr': stderr.decode(self._encoding, errors='replace'),
+            'cwd': self.cwd,
+            'alive': self.alive,
+            'execution_time': time.time() - start_time
+        }
+        if error:
+            result['error'] = error
+        return result
+
+    def close(self) -> None:
+        """Kill the shell and everything it started, interrupting any running command."""
+        if self.alive:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                self.process.kill()
+        self.process.wait()
+        # A running command closes the pipes itself once it sees the shell exit
+        if self._lock.acquire(blocking=False):
+            try:
+                self._close_pipes()
+            finally:
+                self._lock.release()
+
+    def _close_pipes(self) -> None:
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the session to a dictionary"""
+        return {
+            'session_id': self.session_id,
+            'pid': self.process.pid,
+            'shell': self.shell,
+            'cwd': self.cwd,
+            'alive': self.alive,
+            'commands': self.commands,
+            'created': self.created_at,
+            'last_used': self.last_used
+        }
+
+
+class SessionManager:
+    """Thread-safe registry of shell sessions with a pool of spare shells."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_timeout: float = SESSION_IDLE_TIMEOUT,
+                 pool_size: int = SESSION_POOL_SIZE):
+        """
+        Initialize the manager. Spare shells are started on first use.
+
+        Args:
+            max_sessions (int, optional): Maximum number of open sessions. Defaults to MAX_SESSIONS.
+            idle_timeout (float, optional): Seconds before an unused session is closed.
+                Defaults to SESSION_IDLE_TIMEOUT.
+            pool_size (int, optional): Number of spare shells kept ready. Defaults to SESSION_POOL_SIZE.
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.pool_size = pool_size
+        self._sessions: 'OrderedDict[str, ShellSession]' = OrderedDict()
+        self._spares: Deque[ShellSession] = deque()
+        self._refilling = False
+        self._lock = threading.Lock()
+
+    def create(self, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None) -> ShellSession:
+        """
+        Open a session, using a spare shell when one is ready.
+
+        Args:
+            cwd (str, optional): Initial working directory. Defaults to None (the server's).
+            env (Dict[str, str], optional): Variables exported in the session. Defaults to None.
+
+        Returns:
+            ShellSession: The new session
+
+        Raises:
+            RuntimeError: If the maximum number of sessions is open
+            OSError: If the working directory or environment cannot be set up
+        """
+        with self._lock:
+            self._evict_idle()
+            if len(self._sessions) >= self.max_sessions:
+                raise RuntimeError(f"Too many shell sessions open (limit {self.max_sessions})")
+            session = None
+            while self._spares and session is None:
+                spare = self._spares.popleft()
+                if spare.alive:
+                    session = spare
+                else:
+                    spare.close()
+            self._refill()
+
+        if session is None:
+            session = ShellSession()
+
+        setup = []
+        if cwd:
+            setup.append(f"cd -- {shlex.quote(cwd)}")
+        for name, value in (env or {}).items():
+            if not name.isidentifier():
+                session.close()
+                raise OSError(f"Invalid environment variable name: {name}")
+            setup.append(f"export {name}={shlex.quote(str(value))}")
+        if setup:
+            result = session.run(' && '.join(setup))
+            if not result['success']:
+                session.close()
+                raise OSError(result['stderr'].strip() or result.get('error'))
+            session.commands = 0
+
+        with self._lock:
+            self._sessions[session.session_id] = session
+        logger.info(f"Opened shell session {session.session_id} (pid {session.process.pid}, cwd {session.cwd})")
+        return session
+
+    def get(self, session_id: str) -> ShellSession:
+        """
+        Get an open session.
+
+        Args:
+            session_id (str): ID of the session
+
+        Returns:
+            ShellSession: The session
+
+        Raises:
+            KeyError: If there is no open session with this ID
+        """
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise KeyError(f"Session not found: {session_id}")
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def run(self, session_id: str, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run a command in a session, closing the session if the command ended it.
+
+        Args:
+            session_id (str): ID of the session
+            command (str): The command to run
+            timeout (float, optional): Timeout in seconds. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: Dictionary with command execution results
+
+        Raises:
+            KeyError: If there is no open session with this ID
+        """
+        session = self.get(session_id)
+        logger.info(f"Running command in session {session_id}: {command}")
+        try:
+            result = session.run(command, timeout)
+        finally:
+            if not session.alive:
+                self.close(session_id)
+        return result
+
+    def list(self) -> List[ShellSession]:
+        """
+        List the open sessions, least recently used first.
+
+        Returns:
+            List[ShellSession]: The sessions
+        """
+        with self._lock:
+            self._evict_idle()
+            return list(self._sessions.values())
+
+    def close(self, session_id: str) -> None:
+        """
+        Close a session.
+
+        Args:
+            session_id (str): ID of the session
+
+        Raises:
+            KeyError: If there is no open session with this ID
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            raise KeyError(f"Session not found: {session_id}")
+        logger.info(f"Closing shell session {session_id}")
+        session.close()
+
+    def shutdown(self) -> None:
+        """Close all sessions and spare shells."""
+        with self._lock:
+            sessions = list(self._sessions.values()) + list(self._spares)
+            self._sessions.clear()
+            self._spares.clear()
+            self.pool_size = 0
+        for session in sessions:
+            session.close()
+
+    def _evict_idle(self) -> None:
+        """Close sessions idle for longer than the timeout. Must be called with the lock held."""
+        cutoff = time.time() - self.idle_timeout
+        for session_id, session in list(self._sessions.items()):
+            if session.last_used < cutoff and not session._lock.locked():
+                logger.info(f"Closing idle shell session {session_id}")
+                del self._sessions[session_id]
+                session.close()
+
+    def _refill(self) -> None:
+        """Start spare shells in the background up to the pool size. Must be called with the lock held."""
+        if self._refilling or len(self._spares) >= self.pool_size:
+            return
+        self._refilling = True
+
+        def refill():
+            try:
+                while True:
+                    with self._lock:
+                        if len(self._spares) >= self.pool_size:
+                            return
+                    spare = ShellSession()
+                    with self._lock:
+                        self._spares.append(spare)
+            except OSError as e:
+                logger.warning(f"Cannot start spare shell: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refilling = False
+
+        threading.Thread(target=refill, name='shellama-session-pool', daemon=True).start()
+
+
+# Create a global instance
+session_manager = SessionManager()
@@ -7,34 +7,79 @@ Shell Command Execution Module
 This module provides functions for executing shell commands and managing processes.
 """
 
+import io
 import os
+import math
+import codecs
+import locale
+import threading
 import subprocess
-from typing import Dict, Any, List, Optional, Tuple, Union
+import concurrent.futures
+from typing import Dict, Any, BinaryIO, Iterator, List, Optional, Tuple, Union
 import shlex
 import signal
 import time
 
 from shellama.logger import logger
+from shellama.executor import command_executor
+from shellama.limits import CommandSandbox, ResourceLimits
+from shellama.output_buffer import OutputBuffer
+from shellama.result_cache import CachePolicy, result_cache
+from shellama.scheduler import SchedulerFull
+
+
+# Modes accepted by iter_batch
+BATCH_MODES = ('sequential', 'parallel', 'fail_fast')
+
+# Maximum number of commands accepted in one batch request
+BATCH_MAX_COMMANDS = int(os.environ.get('SHELLAMA_BATCH_MAX_COMMANDS', 500))
+
+# Default maximum number of commands of a batch running at once in parallel mode
+BATCH_MAX_PARALLEL = int(os.environ.get('SHELLAMA_BATCH_MAX_PARALLEL', 8))
+
+# Bytes read from a background process pipe at a time
+_PUMP_READ_SIZE = 64 * 1024
 
 
 def execute_command(command: str, cwd: Optional[str] = None, timeout: Optional[int] = None, 
-                   shell: bool = False, env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+                   shell: bool = False, env: Optional[Dict[str, str]] = None,
+                   limits: Optional[ResourceLimits] = None,
+                   cache: Optional[CachePolicy] = None, output_limit: Optional[int] = None,
+                   priority: str = 'normal', tenant: Optional[str] = None,
+                   deadline: Optional[float] = None) -> Dict[str, Any]:
     """
     Execute a shell command and return the result.
     
+    The command runs on the shared asyncio executor (see executor.CommandExecutor),
+    so it counts against SHELLAMA_MAX_CONCURRENT_COMMANDS and may wait for a slot.
+    Standard input is not inherited.
+    
     Args:
         command (str): The command to execute
         cwd (str, optional): The working directory to execute the command in. Defaults to None.
-        timeout (int, optional): Timeout in seconds. Defaults to None.
+        timeout (int, optional): Timeout in seconds. Defaults to SHELLAMA_COMMAND_TIMEOUT.
         shell (bool, optional): Whether to use shell execution. Defaults to False.
         env (Dict[str, str], optional): Environment variables to set. Defaults to None.
+        limits (ResourceLimits, optional): CPU, memory and process limits. The result then has a
+            ``resources`` entry with the limits mode and the usage. Defaults to None.
+        cache (CachePolicy, optional): Serve the result from the result cache when the command,
+            working directory, listed environment variables and input files are unchanged.
+            The result then has a ``cached`` flag. Defaults to None (always run).
+        output_limit (int, optional): Bytes of each stream kept in the result, at most
+            SHELLAMA_OUTPUT_LIMIT. Longer output keeps its start and end, sets ``truncated``
+            and is saved in full under ``output_id``. Defaults to SHELLAMA_OUTPUT_LIMIT.
+        priority (str, optional): Scheduling class when all execution slots are busy:
+            'interactive', 'normal' or 'batch'. Defaults to 'normal'.
+        tenant (str, optional): Tenant sharing its class fairly with other tenants. Defaults to None.
+        deadline (float, optional): Seconds within which the command must start. Defaults to None.
         
     Returns:
-        Dict[str, Any]: Dictionary with command execution results
-        
+        Dict[str, Any]: Dictionary with command execution results. ``success`` is False and
+            ``error`` is set if the command could not be started, timed out or returned a
+            non-zero exit code.
+    
     Raises:
-        subprocess.TimeoutExpired: If the command times out
-        subprocess.CalledProcessError: If the command returns a non-zero exit code
+        SchedulerFull: If too many commands are waiting for a slot
     """
     logger.info(f"Executing command: {command}")
     
@@ -44,52 +89,28 @@ def execute_command(command: str, cwd: Optional[str] = None, timeout: Optional[i
         # Split the command into arguments if not using shell
         args = command if shell else shlex.split(command)
         
-        # Execute the command
-        process = subprocess.run(
-            args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True,
-            cwd=cwd,
-            timeout=timeout,
-            shell=shell,
-            env=env
-        )
-        
-        end_time = time.time()
-        execution_time = end_time - start_time
+        if cache is not None:
+            key = result_cache.make_key(args, shell, cwd, env, cache, limits, output_limit)
+            cached = result_cache.get(key)
+            if cached is not None:
+                cached['cached'] = True
+                return cached
         
-        return {
-            'success': True,
-            'exit_code': process.returncode,
-            'stdout': process.stdout,
-            'stderr': process.stderr,
-            'execution_time': execution_time
-        }
-    
-    except subprocess.TimeoutExpired as e:
-        logger.error(f"Command timed out after {timeout} seconds: {command}")
-        return {
-            'success': False,
-            'exit_code': None,
-            'stdout': e.stdout if hasattr(e, 'stdout') and e.stdout else '',
-            'stderr': e.stderr if hasattr(e, 'stderr') and e.stderr else '',
-            'error': f"Command timed out after {timeout} seconds",
-            'execution_time': time.time() - start_time
-        }
-    
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Command failed with exit code {e.returncode}: {command}")
-        return {
-            'success': False,
-            'exit_code': e.returncode,
-            'stdout': e.stdout,
-            'stderr': e.stderr,
-            'error': f"Command failed with exit code {e.returncode}",
-            'execution_time': time.time() - start_time
-        }
+        result = command_executor.execute(args, shell=shell, cwd=cwd, env=env, timeout=timeout, limits=limits,
+                                          output_limit=output_limit, priority=priority, tenant=tenant,
+                                          deadline=deadline)
+        
+        if cache is not None:
+            # Timeouts and start failures say nothing about the command, so they are not cached;
+            # truncated output refers to an overflow file that expires before the cached result
+            truncated = any((result.get('truncated') or {}).values()) or 'output_id' in result
+            if result['exit_code'] is not None and not truncated:
+                result_cache.put(key, dict(result), cache.ttl)
+            result['cached'] = False
+        return result
     
+    except SchedulerFull:
+        raise
     except Exception as e:
         logger.error(f"Error executing command {command}: {str(e)}")
         return {
@@ -102,11 +123,194 @@ def execute_command(command: str, cwd: Optional[str] = None, timeout: Optional[i
         }
 
 
+def check_timeout(timeout: Any) -> Optional[float]:
+    """
+    Check a timeout given by a client.
+    
+    Args:
+        timeout (Any): Timeout in seconds, or None for the default
+    
+    Returns:
+        Optional[float]: The timeout
+    
+    Raises:
+        ValueError: If the timeout is not a positive number
+    """
+    if timeout is None:
+        return None
+    # bool is an int, and strings would only fail once the command is running
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not 0 < timeout < math.inf:
+        raise ValueError("timeout must be a positive number of seconds")
+    return timeout
+
+
+def check_batch(commands: List[Union[str, Dict[str, Any]]], mode: str = 'sequential',
+                max_parallel: Optional[int] = None, timeout: Optional[float] = None) -> None:
+    """
+    Check the commands and options of a batch before any of it runs.
+    
+    Args:
+        commands (List[Union[str, Dict[str, Any]]]): Commands to execute, see iter_batch
+        mode (str, optional): Batch mode. Defaults to 'sequential'.
+        max_parallel (int, optional): Maximum number of commands running at once. Defaults to None.
+        timeout (float, optional): Default timeout in seconds per command. Defaults to None.
+    
+    Raises:
+        ValueError: If the mode, an option or a command is invalid
+    """
+    if mode not in BATCH_MODES:
+        raise ValueError(f"Unknown batch mode: {mode}")
+    if max_parallel is not None and (type(max_parallel) is not int or max_parallel < 1):
+        raise ValueError("max_parallel must be a positive integer")
+    check_timeout(timeout)
+    for index, item in enumerate(commands):
+        if isinstance(item, dict):
+            if not isinstance(item.get('command'), str) or not isinstance(item.get('cwd') or '', str):
+                raise ValueError(f"Command {index} must have a string command and cwd")
+            check_timeout(item.get('timeout'))
+        elif not isinstance(item, str):
+            raise ValueError(f"Command {index} must be a string or an object with a command")
+
+
+def iter_batch(commands: List[Union[str, Dict[str, Any]]], mode: str = 'sequential',
+               max_parallel: Optional[int] = None, cwd: Optional[str] = None, timeout: Optional[int] = None,
+               shell: bool = False, env: Optional[Dict[str, str]] = None,
+               limits: Optional[ResourceLimits] = None, priority: str = 'batch',
+               tenant: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Execute a batch of commands and yield each result as it completes.
+    
+    The batch is checked when this function is called; the commands run on
+    the shared asyncio executor while the returned iterator is consumed. In
+    parallel mode at most ``max_parallel`` of them are submitted at a time.
+    Closing the iterator early kills the commands that are still running.
+    
+    Args:
+        commands (List[Union[str, Dict[str, Any]]]): Commands to execute, either command strings or
+            dictionaries with a ``command`` key and optional ``cwd``, ``timeout`` and ``shell`` overrides
+        mode (str, optional): 'sequential' runs the commands one after another, 'parallel' runs them
+            concurrently and 'fail_fast' runs them one after another until one fails. Defaults to 'sequential'.
+        max_parallel (int, optional): Maximum number of commands running at once in parallel mode.
+            Defaults to BATCH_MAX_PARALLEL.
+        cwd (str, optional): Default working directory. Defaults to None.
+        timeout (int, optional): Default timeout in seconds per command. Defaults to None.
+        shell (bool, optional): Whether to use shell execution by default. Defaults to False.
+        env (Dict[str, str], optional): Environment variables to set. Defaults to None.
+        limits (ResourceLimits, optional): Resource limits applied to each command. Defaults to None.
+        priority (str, optional): Scheduling class of the commands. Defaults to 'batch'.
+        tenant (str, optional): Tenant the commands are scheduled for. Defaults to None.
+        
+    Returns:
+        Iterator[Dict[str, Any]]: Command execution results with the ``index`` and ``command`` they
+            belong to. Commands not run after a failure in fail_fast mode are yielded with ``skipped`` set.
+    
+    Raises:
+        ValueError: If the mode, an option or a command is invalid
+    """
+    check_batch(commands, mode, max_parallel, timeout)
+    return _iter_batch(commands, mode, max_parallel, cwd, timeout, shell, env, limits, priority, tenant)
+
+
+def _iter_batch(commands: List[Union[str, Dict[str, Any]]], mode: str, max_parallel: Optional[int],
+                cwd: Optional[str], timeout: Optional[float], shell: bool, env: Optional[Dict[str, str]],
+                limits: Optional[ResourceLimits], priority: str, tenant: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Submit the commands of a checked batch and yield their results as they complete."""
+    limit = (max_parallel or BATCH_MAX_PARALLEL) if mode == 'parallel' else 1
+    logger.info(f"Executing batch of {len(commands)} commands (mode={mode}, max_parallel={limit})")
+    
+    def submit(index: int) -> Any:
+        item = commands[index]
+        if not isinstance(item, dict):
+            item = {'command': item}
+        use_shell = item.get('shell', shell)
+        args = item['command'] if use_shell else shlex.split(item['command'])
+        return command_executor.submit(args, shell=use_shell, cwd=item.get('cwd', cwd), env=env,
+                                       timeout=item.get('timeout', timeout), limits=limits, priority=priority,
+                                       tenant=tenant)
+    
+    def describe(index: int) -> Dict[str, Any]:
+        item = commands[index]
+        return {'index': index, 'command': item.get('command') if isinstance(item, dict) else item}
+    
+    pending: Dict[Any, int] = {}
+    next_index = 0
+    failed = False
+    try:
+        while next_index < len(commands) or pending:
+            while next_index < len(commands) and len(pending) < limit and not failed:
+                try:
+                    pending[submit(next_index)] = next_index
+                except ValueError as e:
+                    yield dict(describe(next_index), success=False, exit_code=None, stdout='', stderr='',
+                               error=f"Invalid command: {str(e)}", execution_time=0)
+                    failed = mode == 'fail_fast'
+                next_index += 1
+            
+            if failed and not pending:
+                # Report the commands that were not run
+                for index in range(next_index, len(commands)):
+                    yield dict(describe(index), success=False, skipped=True,
+                               error='Skipped after an earlier command failed')
+                return
+            
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    result = future.result()
+                except SchedulerFull as e:
+                    result = {'success': False, 'exit_code': None, 'stdout': '', 'stderr': '',
+                              'error': str(e), 'execution_time': 0}
+                failed = failed or (mode == 'fail_fast' and not result['success'])
+                yield dict(describe(index), **result)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def execute_batch(commands: List[Union[str, Dict[str, Any]]], mode: str = 'sequential',
+                  max_parallel: Optional[int] = None, cwd: Optional[str] = None, timeout: Optional[int] = None,
+                  shell: bool = False, env: Optional[Dict[str, str]] = None,
+                  limits: Optional[ResourceLimits] = None, priority: str = 'batch',
+                  tenant: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Execute a batch of commands and return all results.
+    
+    Args:
+        commands (List[Union[str, Dict[str, Any]]]): Commands to execute, see iter_batch
+        mode (str, optional): 'sequential', 'parallel' or 'fail_fast'. Defaults to 'sequential'.
+        max_parallel (int, optional): Maximum number of commands running at once in parallel mode.
+            Defaults to BATCH_MAX_PARALLEL.
+        cwd (str, optional): Default working directory. Defaults to None.
+        timeout (int, optional): Default timeout in seconds per command. Defaults to None.
+        shell (bool, optional): Whether to use shell execution by default. Defaults to False.
+        env (Dict[str, str], optional): Environment variables to set. Defaults to None.
+        limits (ResourceLimits, optional): Resource limits applied to each command. Defaults to None.
+        priority (str, optional): Scheduling class of the commands. Defaults to 'batch'.
+        tenant (str, optional): Tenant the commands are scheduled for. Defaults to None.
+    
+    Returns:
+        Dict[str, Any]: Dictionary with the overall success, the results in command order and the execution time
+    
+    Raises:
+        ValueError: If the mode, an option or a command is invalid
+    """
+    start_time = time.time()
+    results = sorted(iter_batch(commands, mode, max_parallel, cwd, timeout, shell, env, limits, priority, tenant),
+                     key=lambda result: result['index'])
+    return {
+        'success': all(result['success'] for result in results),
+        'results': results,
+        'execution_time': time.time() - start_time
+    }
+
+
 class BackgroundProcess:
     """Class for managing background processes."""
     
     def __init__(self, command: str, cwd: Optional[str] = None, 
-                shell: bool = False, env: Optional[Dict[str, str]] = None):
+                shell: bool = False, env: Optional[Dict[str, str]] = None,
+                limits: Optional[ResourceLimits] = None):
         """
         Initialize a background process.
         
@@ -115,20 +319,30 @@ class BackgroundProcess:
             cwd (str, optional): The working directory to execute the command in. Defaults to None.
             shell (bool, optional): Whether to use shell execution. Defaults to False.
             env (Dict[str, str], optional): Environment variables to set. Defaults to None.
+            limits (ResourceLimits, optional): CPU, memory and process limits. Defaults to None.
         """
         self.command = command
         self.cwd = cwd
         self.shell = shell
         self.env = env
+        self.limits = limits
+        self.resources = None
+        self._sandbox = None
         self.process = None
         self.start_time = None
-        self.stdout = []
-        self.stderr = []
+        self.end_time = None
+        self.error = None
+        self.stdout = OutputBuffer()
+        self.stderr = OutputBuffer()
+        self._readers: List[threading.Thread] = []
     
     def start(self) -> bool:
         """
         Start the background process.
         
+        Both output pipes are drained continuously by reader threads into
+        bounded output buffers, so the process never blocks on a full pipe.
+        
         Returns:
             bool: True if the process was started successfully, False otherwise
         """
@@ -137,23 +351,39 @@ class BackgroundProcess:
         try:
             # Split the command into arguments if not using shell
             args = self.command if self.shell else shlex.split(self.command)
+            use_shell = self.shell
+            
+            if self.limits is not None:
+                self._sandbox = CommandSandbox(self.limits)
+                args = self._sandbox.command(['/bin/sh', '-c', args] if use_shell else args)
+                use_shell = False
             
             # Start the process
             self.process = subprocess.Popen(
                 args,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
                 cwd=self.cwd,
-                shell=self.shell,
+                shell=use_shell,
                 env=self.env
             )
             
             self.start_time = time.time()
+            self._readers = [
+                threading.Thread(target=_pump_output, args=(self.process.stdout, self.stdout),
+                                 name=f"shellama-stdout-{self.process.pid}", daemon=True),
+                threading.Thread(target=_pump_output, args=(self.process.stderr, self.stderr),
+                                 name=f"shellama-stderr-{self.process.pid}", daemon=True)
+            ]
+            for reader in self._readers:
+                reader.start()
             return True
         
         except Exception as e:
             logger.error(f"Error starting background process {self.command}: {str(e)}")
+            self.error = str(e)
+            if self._sandbox is not None:
+                self.resources = self._sandbox.finish()
             return False
     
     def stop(self) -> bool:
@@ -179,7 +409,13 @@ class BackgroundProcess:
                 # If the process doesn't terminate within the timeout, kill it
                 logger.warning(f"Process did not terminate, killing it: {self.command}")
                 self.process.kill()
+                self.process.wait()
             
+            self.is_running()
+            
+            # Collect the output written just before the process exited
+            for reader in self._readers:
+                reader.join(timeout=1)
             return True
         
         except Exception as e:
@@ -196,11 +432,29 @@ class BackgroundProcess:
         if not self.process:
             return False
         
-        return self.process.poll() is None
+        # poll() reaps the process with waitpid() once it has exited
+        if self.process.poll() is None:
+            return True
+        if self.end_time is None:
+            self.end_time = time.time()
+            sandbox, self._sandbox = self._sandbox, None
+            if sandbox is not None:
+                self.resources = sandbox.finish()
+        return False
     
-    def get_status(self) -> Dict[str, Any]:
+    def get_status(self, stdout_offset: int = 0, stderr_offset: int = 0,
+                   max_bytes: Optional[int] = None) -> Dict[str, Any]:
         """
-        Get the status of the process.
+        Get the status of the process without blocking.
+        
+        Output is returned from the given offsets, so a caller can poll for new
+        output by passing back the ``offsets`` of the previous call. Output older
+        than the buffers keep is skipped and flagged in ``truncated``.
+        
+        Args:
+            stdout_offset (int, optional): Offset to read stdout from. Defaults to 0.
+            stderr_offset (int, optional): Offset to read stderr from. Defaults to 0.
+            max_bytes (int, optional): Maximum number of bytes returned per stream. Defaults to None (all).
         
         Returns:
             Dict[str, Any]: Dictionary with process status information
@@ -211,37 +465,67 @@ class BackgroundProcess:
                 'exit_code': None,
                 'stdout': '',
                 'stderr': '',
+                'offsets': {'stdout': 0, 'stderr': 0},
+                'truncated': {'stdout': False, 'stderr': False},
                 'execution_time': 0
             }
         
         # Check if the process has terminated
-        exit_code = self.process.poll()
-        running = exit_code is None
+        running = self.is_running()
+        exit_code = self.process.returncode
         
-        # Get the stdout and stderr output
-        stdout = ''
-        stderr = ''
+        resources = self.resources
+        sandbox = self._sandbox
+        if running and sandbox is not None:
+            resources = {'mode': sandbox.mode, 'limits': self.limits.to_dict(),
+                         'unenforced': sandbox.unenforced, 'usage': sandbox.usage()}
         
-        if self.process.stdout:
-            stdout_data = self.process.stdout.read()
-            if stdout_data:
-                self.stdout.append(stdout_data)
-        
-        if self.process.stderr:
-            stderr_data = self.process.stderr.read()
-            if stderr_data:
-                self.stderr.append(stderr_data)
-        
-        stdout = ''.join(self.stdout)
-        stderr = ''.join(self.stderr)
+        stdout, stdout_start, stdout_next = self.stdout.read(stdout_offset, max_bytes)
+        stderr, stderr_start, stderr_next = self.stderr.read(stderr_offset, max_bytes)
         
         # Calculate execution time
-        execution_time = time.time() - self.start_time if self.start_time else 0
+        execution_time = (self.end_time or time.time()) - self.start_time
         
         return {
             'running': running,
             'exit_code': exit_code,
-            'stdout': stdout,
-            'stderr': stderr,
+            'pid': self.process.pid,
+            'stdout': stdout.decode('utf-8', errors='replace'),
+            'stderr': stderr.decode('utf-8', errors='replace'),
+            'offsets': {'stdout': stdout_next, 'stderr': stderr_next},
+            'truncated': {'stdout': stdout_start > stdout_offset, 'stderr': stderr_start > stderr_offset},
+            'resources': resources,
             'execution_time': execution_time
         }
+    
+    def close(self) -> None:
+        """Release the output buffers and their spill files."""
+        self.stdout.close()
+        self.stderr.close()
+
+
+def _pump_output(pipe: BinaryIO, buffer: OutputBuffer) -> None:
+    """
+    Copy a pipe into an output buffer until the pipe is closed.
+    
+    Output is decoded like text mode pipes and stored as UTF-8, so offsets
+    returned to callers always fall on character boundaries.
+    
+    Args:
+        pipe (BinaryIO): Pipe to read
+        buffer (OutputBuffer): Buffer to fill
+    """
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace'), translate=True)
+    try:
+        while True:
+            data = pipe.read1(_PUMP_READ_SIZE)
+            text = decoder.decode(data, final=not data)
+            if text:
+                buffer.write(text.encode('utf-8'))
+            if not data:
+                break
+    except (OSError, ValueError) as e:
+        logger.debug(f"Stopped reading process output: {str(e)}")
+    finally:
+        pipe.close()
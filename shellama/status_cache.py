@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Git Status Cache Module
+
+This module keeps the last status of each repository and serves it again
+until something changes. Every directory of the working tree is watched with
+inotify, as are the Git directory and the refs. A change to the index, HEAD,
+a ref or a ``.gitignore`` file causes a full rescan. A change in the working
+tree causes only the changed paths to be queried again, unless untracked
+directories are collapsed, and the result is merged into the recorded status. Repositories that cannot be watched are rescanned
+once their status is older than a short polling interval.
+
+The cache calls Git with ``--no-optional-locks`` so that its own status calls
+do not rewrite the index and invalidate the cache.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from shellama import git_status
+from shellama.logger import logger
+from shellama.watcher import IN_CREATE, IN_DELETE_SELF, IN_IGNORED, IN_ISDIR, IN_MOVE_SELF, IN_MOVED_TO, Watcher
+
+
+# Maximum number of repositories whose status is kept
+GIT_STATUS_CACHE_SIZE = int(os.environ.get('SHELLAMA_GIT_STATUS_CACHE_SIZE', 16))
+
+# Maximum number of directories watched in one repository; larger repositories are polled
+GIT_STATUS_MAX_WATCHES = int(os.environ.get('SHELLAMA_GIT_STATUS_MAX_WATCHES', 20000))
+
+# Maximum number of changed paths queried again before a full rescan is cheaper
+GIT_STATUS_MAX_PARTIAL = int(os.environ.get('SHELLAMA_GIT_STATUS_MAX_PARTIAL', 256))
+
+# Seconds the status of a repository that cannot be watched may be served
+GIT_STATUS_POLL_INTERVAL = float(os.environ.get('SHELLAMA_GIT_STATUS_POLL_INTERVAL', 1.0))
+
+# Status lists whose entries are paths or dictionaries with a path
+_STATUS_LISTS = ('staged', 'unstaged', 'untracked', 'renamed', 'conflicted', 'modified', 'added', 'deleted')
+
+
+class _RepoState:
+    """The recorded status of one working tree."""
+
+    __slots__ = ('worktree', 'git_dirs', 'untracked', 'status', 'dirs', 'watched', 'dirty', 'full',
+                 'loaded_at', 'refreshing', '_digest')
+
+    def __init__(self, worktree: str, git_dirs: Tuple[str, ...], untracked: str):
+        self.worktree = worktree
+        self.git_dirs = git_dirs
+        self.untracked = untracked
+        self.status: Optional[Dict[str, Any]] = None
+        self.dirs: Set[str] = set()
+        self.watched = False
+        # Working tree paths changed since the status was recorded
+        self.dirty: Set[str] = set()
+        self.full = True
+        self.loaded_at = 0.0
+        # Set by the thread refreshing the status; other threads wait for it
+        self.refreshing: Optional[threading.Event] = None
+        self._digest: Optional[str] = None
+
+    @property
+    def digest(self) -> str:
+        """Digest of the recorded status, computed once per change."""
+        if self._digest is None:
+            data = json.dumps(self.status, sort_keys=True, default=str)
+            self._digest = hashlib.sha1(data.encode('utf-8', 'surrogateescape')).hexdigest()
+        return self._digest
+
+
+def _entry_path(entry: Any) -> str:
+    return entry if isinstance(entry, str) else entry['path']
+
+
+def _under(path: str, changed: List[str]) -> bool:
+    """Whether a status path is one of the changed paths or lies below one."""
+    path = path.rstrip('/')
+    return any(path == prefix or path.startswith(prefix + '/') or prefix.startswith(path + '/')
+               for prefix in changed)
+
+
+def merge_status(status: Dict[str, Any], update: Dict[str, Any], paths: List[str]) -> Dict[str, Any]:
+    """
+    Replace the entries for some paths in a recorded status.
+
+    Args:
+        status (Dict[str, Any]): The recorded status of the whole working tree
+        update (Dict[str, Any]): The status of the changed paths
+        paths (List[str]): The changed paths, relative to the working tree
+
+    Returns:
+        Dict[str, Any]: New status; the given ones are not modified
+    """
+    merged = {'branch': update['branch']}
+    for name in _STATUS_LISTS:
+        kept = [entry for entry in status[name] if not _under(_entry_path(entry), paths)]
+        merged[name] = sorted(kept + update[name], key=_entry_path)
+    return merged
+
+
+class StatusCache:
+    """Bounded LRU cache of repository statuses kept fresh by inotify."""
+
+    def __init__(self, max_repos: int = GIT_STATUS_CACHE_SIZE, max_watches: int = GIT_STATUS_MAX_WATCHES,
+                 max_partial: int = GIT_STATUS_MAX_PARTIAL, poll_interval: float = GIT_STATUS_POLL_INTERVAL):
+        """
+        Initialize the cache.
+
+        Args:
+            max_repos (int, optional): Maximum number of repositories kept. Defaults to GIT_STATUS_CACHE_SIZE.
+            max_watches (int, optional): Maximum number of watched directories per repository.
+                Defaults to GIT_STATUS_MAX_WATCHES.
+            max_partial (int, optional): Maximum number of changed paths refreshed on their own.
+                Defaults to GIT_STATUS_MAX_PARTIAL.
+            poll_interval (float, optional): Lifetime of the status of unwatched repositories in
+                seconds. Defaults to GIT_STATUS_POLL_INTERVAL.
+        """
+        self.max_repos = max_repos
+        self.max_watches = max_watches
+        self.max_partial = max_partial
+        self.poll_interval = poll_interval
+        self._repos: 'OrderedDict[str, _RepoState]' = OrderedDict()
+        # Watched directory -> (working tree, whether it belongs to the Git directory)
+        self._owners: Dict[str, Tuple[str, bool]] = {}
+        self._watcher = Watcher()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.partial_refreshes = 0
+        self.evictions = 0
+
+    def get(self, repo_path: str, untracked: str = 'all') -> Dict[str, Any]:
+        """
+        Get the status of a repository, refreshing only what changed since the last call.
+
+        Args:
+            repo_path (str): Path to the Git repository
+            untracked (str, optional): How to list untracked files: 'all', 'normal' or 'no'.
+                Defaults to 'all'.
+
+        Returns:
+            Dict[str, Any]: The status (see shellama.git_status), whose ``timing`` tells whether
+                it was cached. The lists are shared with the cache and must not be modified.
+
+        Raises:
+            ValueError: If the untracked mode is unknown
+            git.InvalidGitRepositoryError: If the directory is not a Git repository
+            git.GitCommandError: If Git fails
+        """
+        start_time = time.perf_counter()
+        state, status, refreshed = self._lookup(repo_path, untracked)
+        timing = {
+            'elapsed': time.perf_counter() - start_time,
+            'entries': sum(len(status[name]) for name in ('staged', 'unstaged', 'untracked', 'conflicted')),
+            'cached': refreshed is None,
+            'refreshed_paths': refreshed,
+            'watched': state.watched
+        }
+        return dict(status, timing=timing)
+
+    def digest(self, repo_path: str, untracked: str = 'all') -> str:
+        """
+        Get a digest that changes whenever the status of a repository changes.
+
+        Args:
+            repo_path (str): Path to the Git repository
+            untracked (str, optional): How to list untracked files. Defaults to 'all'.
+
+        Returns:
+            str: Hex digest of the status
+        """
+        state, _status, _refreshed = self._lookup(repo_path, untracked)
+        with self._lock:
+            return state.digest
+
+    def _lookup(self, repo_path: str, untracked: str) -> Tuple[_RepoState, Dict[str, Any], Optional[Any]]:
+        """
+        Get the state and status of a repository, refreshing them if needed.
+
+        Also returns what was refreshed: None for a cache hit, 'all' for a full
+        scan, or the number of changed paths queried again.
+        """
+        if untracked not in ('all', 'normal', 'no'):
+            raise ValueError("untracked must be 'all', 'normal' or 'no'")
+        worktree = os.path.realpath(repo_path)
+
+        while True:
+            with self._lock:
+                self._process_events()
+                state = self._repos.get(worktree)
+                if state is not None and state.untracked != untracked:
+                    state.untracked, state.full = untracked, True
+                if state is not None and self._is_fresh(state):
+                    self._repos.move_to_end(worktree)
+                    self.hits += 1
+                    return state, state.status, None
+
+                if state is None:
+                    state = self._watch_repo(worktree, untracked)
+                    # Registered before scanning so that changes made during the scan are recorded
+                    self._store(state)
+                refreshing = state.refreshing
+                if refreshing is None:
+                    # Pathspecs stop Git from collapsing untracked directories, so a partial
+                    # refresh in 'normal' mode would list files that a full scan reports as 'dir/'
+                    if (state.status is None or state.full or not state.watched or state.untracked == 'normal'
+                            or len(state.dirty) > self.max_partial):
+                        paths = None
+                        self.misses += 1
+                    else:
+                        paths = sorted(state.dirty)
+                        self.partial_refreshes += 1
+                    # Changes from now on are recorded for the next call
+                    state.full = False
+                    state.dirty = set()
+                    state.refreshing = threading.Event()
+                    break
+            # Another thread is refreshing this repository; use its result
+            refreshing.wait()
+
+        try:
+            update = git_status.get_status(worktree, untracked, paths, optional_locks=False)
+        except Exception:
+            with self._lock:
+                state.full = True
+                if state.status is None:
+                    self._forget(state)
+                state.refreshing.set()
+                state.refreshing = None
+            raise
+        del update['timing']
+
+        with self._lock:
+            if paths is None:
+                state.status = update
+                state.loaded_at = time.monotonic()
+            else:
+                state.status = merge_status(state.status, update, paths)
+            state._digest = None
+            if self._repos.get(worktree) is state:
+                self._repos.move_to_end(worktree)
+            status, digest = state.status, state.digest
+            state.refreshing.set()
+            state.refreshing = None
+        logger.debug(f"Refreshed git status of {worktree} ({'all' if paths is None else len(paths)} paths, "
+                     f"digest {digest[:8]})")
+        return state, status, 'all' if paths is None else len(paths)
+
+    def _is_fresh(self, state: _RepoState) -> bool:
+        """Check whether the recorded status can be served. Must be called with the lock held."""
+        if state.status is None or state.full:
+            return False
+        if state.watched:
+            return not state.dirty
+        # Polling fallback for repositories that could not be watched
+        return time.monotonic() - state.loaded_at <= self.poll_interval
+
+    def _watch_repo(self, worktree: str, untracked: str) -> _RepoState:
+        """Watch a working tree, its Git directory and its refs. Must be called with the lock held."""
+        git_dir = os.path.join(worktree, '.git')
+        common_dir = git_dir
+        if os.path.isfile(git_dir):
+            # Linked worktrees and submodules point to their Git directory
+            with open(git_dir, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+            if content.startswith('gitdir:'):
+                git_dir = os.path.normpath(os.path.join(worktree, content[len('gitdir:'):].strip()))
+            common_dir = git_dir
+            commondir_file = os.path.join(git_dir, 'commondir')
+            if os.path.isfile(commondir_file):
+                with open(commondir_file, 'r', encoding='utf-8') as f:
+                    common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+        state = _RepoState(worktree, tuple({git_dir, common_dir}), untracked)
+        if not self._watcher.available or not os.path.isdir(git_dir):
+            return state
+
+        directories = list(state.git_dirs)
+        for root in [os.path.join(common_dir, 'refs')] + [worktree]:
+            directories.extend(self._walk(root))
+            if len(directories) > self.max_watches:
+                logger.info(f"Not watching {worktree}: more than {self.max_watches} directories")
+                return state
+
+        state.watched = True
+        for directory in directories:
+            self._add_watch(state, directory)
+        return state
+
+    @staticmethod
+    def _walk(root: str) -> List[str]:
+        """List a directory and its subdirectories, skipping Git directories and nested repositories."""
+        directories = []
+        for current, subdirectories, _files in os.walk(root):
+            directories.append(current)
+            subdirectories[:] = [name for name in subdirectories if name != '.git'
+                                 and not os.path.exists(os.path.join(current, name, '.git'))]
+        return directories
+
+    def _add_watch(self, state: _RepoState, directory: str) -> None:
+        """Watch one directory of a repository. Must be called with the lock held."""
+        if self._watcher.watch(directory):
+            in_git_dir = any(directory == d or directory.startswith(d + os.sep) for d in state.git_dirs)
+            self._owners[directory] = (state.worktree, in_git_dir)
+            state.dirs.add(directory)
+        else:
+            # Changes below an unwatched directory would go unnoticed
+            state.watched = False
+
+    def _forget(self, state: _RepoState) -> None:
+        """Drop a repository so that it is watched again from scratch. Must be called with the lock held."""
+        if self._repos.get(state.worktree) is state:
+            del self._repos[state.worktree]
+        self._unwatch_repo(state)
+
+    def _unwatch_repo(self, state: _RepoState) -> None:
+        """Stop watching a repository. Must be called with the lock held."""
+        for directory in state.dirs:
+            if self._owners.get(directory, (None,))[0] == state.worktree:
+                del self._owners[directory]
+                self._watcher.unwatch(directory)
+        state.dirs.clear()
+
+    def _process_events(self) -> None:
+        """Record the changes reported since the last call. Must be called with the lock held."""
+        for directory, name, mask in self._watcher.read_events():
+            if directory is None:
+                logger.warning("inotify event queue overflowed, rescanning all repositories")
+                for state in self._repos.values():
+                    state.full = True
+                continue
+
+            owner = self._owners.get(directory)
+            state = self._repos.get(owner[0]) if owner is not None else None
+            if state is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & IN_MOVE_SELF or (mask & IN_DELETE_SELF and
+                                       (directory in state.git_dirs or directory == state.worktree)):
+                # The watches no longer match the paths
+                self._forget(state)
+                continue
+            if mask & (IN_DELETE_SELF | IN_IGNORED):
+                state.dirs.discard(directory)
+                self._owners.pop(directory, None)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and name != '.git':
+                self._watch_new_directory(state, path, owner[1])
+
+            if owner[1]:
+                # Lock files come and go while Git works; the renamed result is what matters
+                if not name.endswith('.lock'):
+                    state.full = True
+            elif name == '.gitignore' or path == state.worktree:
+                state.full = True
+            else:
+                state.dirty.add(os.path.relpath(path, state.worktree))
+
+    def _watch_new_directory(self, state: _RepoState, path: str, in_git_dir: bool) -> None:
+        """Watch a directory created in a watched repository. Must be called with the lock held."""
+        if in_git_dir and not any(path.startswith(os.path.join(d, 'refs') + os.sep) for d in state.git_dirs):
+            return
+        if not in_git_dir and os.path.exists(os.path.join(path, '.git')):
+            return
+        for directory in self._walk(path):
+            if len(state.dirs) >= self.max_watches:
+                state.watched = False
+                return
+            self._add_watch(state, directory)
+
+    def _store(self, state: _RepoState) -> None:
+        """Keep a state, evicting the least recently used ones. Must be called with the lock held."""
+        self._repos[state.worktree] = state
+        self._repos.move_to_end(state.worktree)
+        while len(self._repos) > self.max_repos:
+            _worktree, old = self._repos.popitem(last=False)
+            self.evictions += 1
+            self._unwatch_repo(old)
+
+    def invalidate(self, repo_path: Optional[str] = None) -> None:
+        """
+        Forget recorded statuses.
+
+        Args:
+            repo_path (str, optional): Repository to forget. Defaults to None (all repositories).
+        """
+        with self._lock:
+            if repo_path is None:
+                worktrees = list(self._repos)
+            else:
+                worktrees = [os.path.realpath(repo_path)]
+            for worktree in worktrees:
+                state = self._repos.get(worktree)
+                if state is not None:
+                    self._forget(state)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dict[str, Any]: Dictionary with hit/miss counters and the watched repositories
+        """
+        with self._lock:
+            return {
+                'repositories': len(self._repos),
+                'max_repos': self.max_repos,
+                'watched_directories': len(self._owners),
+                'hits': self.hits,
+                'misses': self.misses,
+                'partial_refreshes': self.partial_refreshes,
+                'evictions': self.evictions,
+                'inotify': self._watcher.available
+            }
+
+
+# Create a global instance
+status_cache = StatusCache()
@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Terminals Module
+
+This module runs interactive programs (shells, REPLs, ``top``) on a
+pseudo-terminal, so they see a real terminal with a window size and their
+output is not block-buffered. A reader thread drains each terminal into a
+scrollback buffer with absolute offsets. Clients acknowledge output by
+reading from an offset; when too much output is unacknowledged the reader
+stops draining the terminal, so a slow client pauses the program instead of
+growing memory. Terminals can be bridged to a WebSocket with ``bridge``.
+"""
+
+import os
+import pty
+import sys
+import json
+import time
+import uuid
+import errno
+import fcntl
+import shlex
+import select
+import shutil
+import signal
+import struct
+import termios
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from shellama.logger import logger
+from shellama.output_buffer import OutputBuffer
+
+
+# Program started in a terminal when no command is given
+TERMINAL_SHELL = os.environ.get('SHELLAMA_TERMINAL_SHELL', os.environ.get('SHELL', '/bin/sh'))
+
+# TERM value set for programs in a terminal
+TERMINAL_TERM = os.environ.get('SHELLAMA_TERMINAL_TERM', 'xterm-256color')
+
+# Maximum number of open terminals
+MAX_TERMINALS = int(os.environ.get('SHELLAMA_MAX_TERMINALS', 32))
+
+# Seconds without input, output or an attached client before a terminal is closed
+TERMINAL_IDLE_TIMEOUT = float(os.environ.get('SHELLAMA_TERMINAL_IDLE_TIMEOUT', 1800))
+
+# Bytes of recent output kept for clients that reconnect
+TERMINAL_SCROLLBACK = int(os.environ.get('SHELLAMA_TERMINAL_SCROLLBACK', 1024 * 1024))
+
+# Bytes of output a client may fall behind before the program is paused
+TERMINAL_FLOW_WINDOW = int(os.environ.get('SHELLAMA_TERMINAL_FLOW_WINDOW', 256 * 1024))
+
+# Seconds a write waits for a program that is not reading its input
+TERMINAL_WRITE_TIMEOUT = float(os.environ.get('SHELLAMA_TERMINAL_WRITE_TIMEOUT', 1.0))
+
+_READ_SIZE = 64 * 1024
+
+# Takes the controlling terminal and execs the program (see tty_exec.py)
+_EXEC_HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tty_exec.py')
+
+
+class TerminalBusy(OSError):
+    """Raised when a program does not read its input in time; ``written`` bytes were sent."""
+
+    def __init__(self, written: int):
+        super().__init__(errno.EAGAIN, f"Terminal is not reading input ({written} bytes written)")
+        self.written = written
+
+
+def _set_window_size(fd: int, rows: int, cols: int) -> None:
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack('HHHH', rows, cols, 0, 0))
+
+
+class Terminal:
+    """Class representing one program running on a pseudo-terminal."""
+
+    def __init__(self, command: Optional[str] = None, cwd: Optional[str] = None, shell: bool = False,
+                 env: Optional[Dict[str, str]] = None, rows: int = 24, cols: int = 80,
+                 scrollback: int = TERMINAL_SCROLLBACK, flow_window: int = TERMINAL_FLOW_WINDOW):
+        """
+        Start a program on a new pseudo-terminal.
+
+        Args:
+            command (str, optional): The command to run. Defaults to None (TERMINAL_SHELL).
+            cwd (str, optional): The working directory. Defaults to None (the server's).
+            shell (bool, optional): Whether to run the command through /bin/sh. Defaults to False.
+            env (Dict[str, str], optional): Variables added to the server's environment. Defaults to None.
+            rows (int, optional): Window height. Defaults to 24.
+            cols (int, optional): Window width. Defaults to 80.
+            scrollback (int, optional): Bytes of output kept. Defaults to TERMINAL_SCROLLBACK.
+            flow_window (int, optional): Unacknowledged bytes before the program is paused.
+                Defaults to TERMINAL_FLOW_WINDOW.
+
+        Raises:
+            OSError: If the program cannot be started
+            ValueError: If the command or window size is not valid
+        """
+        if rows <= 0 or cols <= 0:
+            raise ValueError("Terminal rows and cols must be positive")
+        self.terminal_id = uuid.uuid4().hex
+        self.command = command or TERMINAL_SHELL
+        self.rows = rows
+        self.cols = cols
+        self.flow_window = min(flow_window, scrollback)
+        self.created_at = time.time()
+        self.last_activity = self.created_at
+        self.exit_code: Optional[int] = None
+        self.attached = 0
+        self.output = OutputBuffer(max_bytes=scrollback, max_spill_bytes=0)
+        self._acked = 0
+        self._eof = False
+        self._closed = False
+        self._cond = threading.Condition()
+        # Guards the master descriptor, which the reader closes once the program is gone
+        self._fd_lock = threading.Lock()
+
+        if command and shell:
+            args = ['/bin/sh', '-c', command]
+        else:
+            args = shlex.split(self.command)
+        environ = dict(os.environ)
+        environ.update(env or {})
+        environ['TERM'] = (env or {}).get('TERM', TERMINAL_TERM)
+        if not args:
+            raise ValueError("Terminal command is empty")
+        if os.sep not in args[0] and shutil.which(args[0], path=environ.get('PATH')) is None:
+            # The helper would only report this on the terminal
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), args[0])
+
+        master, slave = pty.openpty()
+        try:
+            _set_window_size(slave, rows, cols)
+            # The new session gets the terminal from the helper, not from Python code run after fork
+            self.process = subprocess.Popen([sys.executable, '-I', '-S', _EXEC_HELPER] + args, stdin=slave,
+                                            stdout=slave, stderr=slave, cwd=cwd, env=environ,
+                                            start_new_session=True)
+        except Exception:
+            os.close(master)
+            raise
+        finally:
+            os.close(slave)
+        # Writes must not block while the program is paused and not reading its input
+        os.set_blocking(master, False)
+        self._master: Optional[int] = master
+
+        self._reader = threading.Thread(target=self._pump, name=f'shellama-terminal-{self.terminal_id[:8]}',
+                                        daemon=True)
+        self._reader.start()
+
+    @property
+    def running(self) -> bool:
+        """Whether the program has not exited yet."""
+        return self.process.poll() is None
+
+    def _pump(self) -> None:
+        """Drain the terminal into the scrollback buffer, pausing while the client is too far behind."""
+        try:
+            while True:
+                with self._cond:
+                    while self.output.end - self._acked >= self.flow_window and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        break
+                try:
+                    data = os.read(self._master, _READ_SIZE)
+                except BlockingIOError:
+                    # Wait for output or for the program to hang up
+                    select.select([self._master], [], [])
+                    continue
+                except OSError as e:
+                    # EIO means every process has closed the terminal
+                    if e.errno != errno.EIO:
+                        logger.warning(f"Error reading terminal {self.terminal_id}: {str(e)}")
+                    break
+                if not data:
+                    break
+                self.output.write(data)
+                with self._cond:
+                    self.last_activity = time.time()
+                    self._cond.notify_all()
+        finally:
+            try:
+                self.exit_code = self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+            with self._fd_lock:
+                os.close(self._master)
+                self._master = None
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+
+    def read(self, offset: int = 0, max_bytes: Optional[int] = None,
+             timeout: float = 0) -> Tuple[bytes, int, int]:
+        """
+        Read output from an offset, acknowledging everything before it.
+
+        Args:
+            offset (int, optional): Offset to read from. Defaults to 0.
+            max_bytes (int, optional): Maximum number of bytes to return. Defaults to None (all).
+            timeout (float, optional): Seconds to wait for output past the offset. Defaults to 0.
+
+        Returns:
+            Tuple[bytes, int, int]: The data, the offset it starts at and the offset to read from next
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if offset > self._acked:
+                self._acked = min(offset, self.output.end)
+                self._cond.notify_all()
+            while self.output.end <= offset and not self._eof:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return self.output.read(offset, max_bytes)
+
+    @property
+    def finished(self) -> bool:
+        """Whether the program has exited and all its output has been buffered."""
+        with self._cond:
+            return self._eof
+
+    def write(self, data: bytes, timeout: float = TERMINAL_WRITE_TIMEOUT) -> None:
+        """
+        Send input to the program.
+
+        The terminal is not locked while waiting for the program to read, so
+        resizing and closing are never held up by a program that is paused.
+
+        Args:
+            data (bytes): Keystrokes or pasted text
+            timeout (float, optional): Seconds to wait while the program is not reading.
+                Defaults to TERMINAL_WRITE_TIMEOUT.
+
+        Raises:
+            TerminalBusy: If the program did not read all the data in time
+            OSError: If the terminal is closed
+        """
+        view = memoryview(data)
+        written = 0
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._fd_lock:
+                if self._master is None:
+                    raise OSError(errno.EIO, "Terminal is closed")
+                try:
+                    while written < len(view):
+                        written += os.write(self._master, view[written:])
+                except BlockingIOError:
+                    pass
+                master = self._master
+            if written == len(view):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TerminalBusy(written)
+            try:
+                select.select([], [master], [], min(remaining, 0.1))
+            except (OSError, ValueError):
+                # Closed meanwhile; the next attempt reports it
+                pass
+        self.last_activity = time.time()
+
+    def resize(self, rows: int, cols: int) -> None:
+        """
+        Change the window size. The program receives SIGWINCH.
+
+        Args:
+            rows (int): Window height
+            cols (int): Window width
+
+        Raises:
+            ValueError: If the size is not valid
+            OSError: If the terminal is closed
+        """
+        if rows <= 0 or cols <= 0:
+            raise ValueError("Terminal rows and cols must be positive")
+        with self._fd_lock:
+            if self._master is None:
+                raise OSError(errno.EIO, "Terminal is closed")
+            _set_window_size(self._master, rows, cols)
+        self.rows = rows
+        self.cols = cols
+
+    def close(self) -> None:
+        """Hang up the terminal and kill its processes."""
+        for sig, grace in ((signal.SIGHUP, 1.0), (signal.SIGKILL, 1.0)):
+            if not self.running:
+                break
+            try:
+                os.killpg(self.process.pid, sig)
+            except (ProcessLookupError, PermissionError):
+                break
+            try:
+                self.process.wait(timeout=grace)
+            except subprocess.TimeoutExpired:
+                pass
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._reader.join(timeout=1.0)
+        if self._reader.is_alive():
+            logger.warning(f"Terminal {self.terminal_id} is still held open by a background process")
+        self.output.close()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the terminal to a dictionary"""
+        return {
+            'id': self.terminal_id,
+            'command': self.command,
+            'pid': self.process.pid,
+            'running': self.running,
+            'exit_code': self.process.returncode,
+            'rows': self.rows,
+            'cols': self.cols,
+            'attached': self.attached,
+            'output_end': self.output.end,
+            'created_at': self.created_at,
+            'last_activity': self.last_activity
+        }
+
+
+def bridge(terminal: Terminal, ws: Any, offset: int = 0) -> None:
+    """
+    Connect a terminal to a WebSocket until either side closes.
+
+    Output is sent as binary frames, starting with the scrollback from the
+    offset. Binary frames from the client are written to the terminal; text
+    frames are JSON control messages, currently ``{"type": "resize", "rows":
+    ..., "cols": ...}``. When the program exits, ``{"type": "exit",
+    "exit_code": ...}`` is sent. A client that stops reading pauses the program.
+
+    Args:
+        terminal (Terminal): The terminal
+        ws (Any): WebSocket with ``send``, ``receive(timeout)`` and ``close``, such as flask-sock's
+        offset (int, optional): Output offset to start sending from. Defaults to 0.
+    """
+    stop = threading.Event()
+    terminal.attached += 1
+
+    def send_output():
+        position = offset
+        try:
+            while not stop.is_set():
+                data, _start, position = terminal.read(position, _READ_SIZE, timeout=0.5)
+                if data:
+                    ws.send(data)
+                elif terminal.finished and position >= terminal.output.end:
+                    ws.send(json.dumps({'type': 'exit', 'exit_code': terminal.exit_code}))
+                    break
+        except Exception as e:
+            logger.debug(f"Terminal {terminal.terminal_id} output stopped: {str(e)}")
+        finally:
+            stop.set()
+
+    sender = threading.Thread(target=send_output, name=f'shellama-terminal-ws-{terminal.terminal_id[:8]}',
+                              daemon=True)
+    sender.start()
+    try:
+        while not stop.is_set():
+            message = ws.receive(timeout=0.5)
+            if message is None:
+                continue
+            if isinstance(message, (bytes, bytearray)):
+                data = bytes(message)
+                while data and not stop.is_set():
+                    try:
+                        terminal.write(data)
+                        break
+                    except TerminalBusy as e:
+                        # The program is paused by flow control; keep the rest until it reads
+                        data = data[e.written:]
+                continue
+            try:
+                control = json.loads(message)
+                if control.get('type') == 'resize':
+                    terminal.resize(int(control['rows']), int(control['cols']))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                logger.warning(f"Invalid terminal control message: {str(e)}")
+    except Exception as e:
+        logger.debug(f"Terminal {terminal.terminal_id} input stopped: {str(e)}")
+    finally:
+        stop.set()
+        sender.join(timeout=1.0)
+        terminal.attached -= 1
+        terminal.last_activity = time.time()
+
+
+class TerminalManager:
+    """Thread-safe registry of open terminals."""
+
+    def __init__(self, max_terminals: int = MAX_TERMINALS, idle_timeout: float = TERMINAL_IDLE_TIMEOUT):
+        """
+        Initialize the manager.
+
+        Args:
+            max_terminals (int, optional): Maximum number of open terminals. Defaults to MAX_TERMINALS.
+            idle_timeout (float, optional): Seconds before an unused terminal is closed.
+                Defaults to TERMINAL_IDLE_TIMEOUT.
+        """
+        self.max_terminals = max_terminals
+        self.idle_timeout = idle_timeout
+        self._terminals: 'OrderedDict[str, Terminal]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, command: Optional[str] = None, **kwargs: Any) -> Terminal:
+        """
+        Open a terminal.
+
+        Args:
+            command (str, optional): The command to run. Defaults to None (TERMINAL_SHELL).
+            **kwargs: Options accepted by Terminal
+
+        Returns:
+            Terminal: The new terminal
+
+        Raises:
+            RuntimeError: If the maximum number of terminals is open
+            OSError: If the program cannot be started
+            ValueError: If the command or window size is not valid
+        """
+        with self._lock:
+            idle = self._evict_idle()
+            if len(self._terminals) >= self.max_terminals:
+                raise RuntimeError(f"Too many terminals open (limit {self.max_terminals})")
+            # Reserve the slot while the program starts
+            placeholder = uuid.uuid4().hex
+            self._terminals[placeholder] = None
+        self._close_all(idle)
+
+        try:
+            terminal = Terminal(command, **kwargs)
+        finally:
+            with self._lock:
+                del self._terminals[placeholder]
+        with self._lock:
+            self._terminals[terminal.terminal_id] = terminal
+        logger.info(f"Opened terminal {terminal.terminal_id} (pid {terminal.process.pid}): {terminal.command}")
+        return terminal
+
+    def get(self, terminal_id: str) -> Terminal:
+        """
+        Get an open terminal.
+
+        Args:
+            terminal_id (str): ID of the terminal
+
+        Returns:
+            Terminal: The terminal
+
+        Raises:
+            KeyError: If there is no open terminal with this ID
+        """
+        with self._lock:
+            terminal = self._terminals.get(terminal_id)
+            if terminal is None:
+                raise KeyError(f"Terminal not found: {terminal_id}")
+            self._terminals.move_to_end(terminal_id)
+            return terminal
+
+    def list(self) -> List[Terminal]:
+        """
+        List the open terminals, least recently used first.
+
+        Returns:
+            List[Terminal]: The terminals
+        """
+        with self._lock:
+            idle = self._evict_idle()
+            terminals = [terminal for terminal in self._terminals.values() if terminal is not None]
+        self._close_all(idle)
+        return terminals
+
+    def close(self, terminal_id: str) -> None:
+        """
+        Close a terminal.
+
+        Args:
+            terminal_id (str): ID of the terminal
+
+        Raises:
+            KeyError: If there is no open terminal with this ID
+        """
+        with self._lock:
+            terminal = self._terminals.get(terminal_id)
+            if terminal is None:
+                raise KeyError(f"Terminal not found: {terminal_id}")
+            del self._terminals[terminal_id]
+        logger.info(f"Closing terminal {terminal_id}")
+        terminal.close()
+
+    def shutdown(self) -> None:
+        """Close all terminals."""
+        with self._lock:
+            terminals = [terminal for terminal in self._terminals.values() if terminal is not None]
+            self._terminals.clear()
+        self._close_all(terminals)
+
+    def _evict_idle(self) -> List[Terminal]:
+        """Remove terminals idle for longer than the timeout. Must be called with the lock held."""
+        cutoff = time.time() - self.idle_timeout
+        idle = []
+        for terminal_id, terminal in list(self._terminals.items()):
+            if terminal is not None and not terminal.attached and terminal.last_activity < cutoff:
+                logger.info(f"Closing idle terminal {terminal_id}")
+                del self._terminals[terminal_id]
+                idle.append(terminal)
+        return idle
+
+    @staticmethod
+    def _close_all(terminals: List[Terminal]) -> None:
+        # Closing waits for the programs to exit, so it happens outside the lock
+        for terminal in terminals:
+            terminal.close()
+
+
+# Create a global instance
+terminal_manager = TerminalManager()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tree Copy Module
+
+This module copies directory trees with a bounded thread pool. File data is
+copied inside the kernel where possible: a reflink (FICLONE) shares the
+blocks on copy-on-write filesystems, ``os.copy_file_range`` and
+``os.sendfile`` avoid user-space buffers elsewhere, and a plain buffered
+copy is the last resort.
+"""
+
+import os
+import stat
+import time
+import errno
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from shellama.logger import logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Number of threads copying files in parallel
+COPY_WORKERS = int(os.environ.get('SHELLAMA_COPY_WORKERS', min(32, (os.cpu_count() or 1) * 4)))
+
+# Minimum number of seconds between two progress reports
+PROGRESS_INTERVAL = 0.25
+
+# ioctl request sharing all blocks of one file with another (linux/fs.h)
+FICLONE = 0x40049409
+
+# Errors meaning a copy method is not supported for a pair of files
+_UNSUPPORTED_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EBADF}
+
+# (method, (source device, destination device)) pairs on which a copy method failed
+_unsupported: Set[Tuple[str, Tuple[int, int]]] = set()
+_unsupported_lock = threading.Lock()
+
+
+def _is_supported(method: str, devices: Tuple[int, int]) -> bool:
+    """Check whether a copy method has not failed between two devices before."""
+    with _unsupported_lock:
+        return (method, devices) not in _unsupported
+
+
+def _mark_unsupported(method: str, devices: Tuple[int, int]) -> None:
+    """Remember that a copy method does not work between two devices."""
+    with _unsupported_lock:
+        _unsupported.add((method, devices))
+
+
+def _copy_data(src_fd: int, dst_fd: int, size: int, devices: Tuple[int, int]) -> str:
+    """
+    Copy the data of an open file into another using the fastest available method.
+
+    Args:
+        src_fd (int): Descriptor of the source file, positioned at the start
+        dst_fd (int): Descriptor of the empty destination file
+        size (int): Size of the source file
+        devices (Tuple[int, int]): Devices of the source and destination files, used to
+            remember unsupported methods
+
+    Returns:
+        str: Name of the method used ('reflink', 'copy_file_range', 'sendfile' or 'read_write')
+    """
+    if fcntl is not None and _is_supported('reflink', devices):
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            return 'reflink'
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRORS:
+                raise
+            _mark_unsupported('reflink', devices)
+
+    copied = 0
+    method = 'read_write'
+
+    if hasattr(os, 'copy_file_range') and _is_supported('copy_file_range', devices):
+        try:
+            while copied < size:
+                count = os.copy_file_range(src_fd, dst_fd, min(size - copied, 1 << 30))
+                if count == 0:
+                    break
+                copied += count
+            method = 'copy_file_range'
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRORS or copied:
+                raise
+            _mark_unsupported('copy_file_range', devices)
+
+    if method == 'read_write' and hasattr(os, 'sendfile') and _is_supported('sendfile', devices):
+        try:
+            while copied < size:
+                count = os.sendfile(dst_fd, src_fd, copied, min(size - copied, 1 << 30))
+                if count == 0:
+                    break
+                copied += count
+            os.lseek(src_fd, copied, os.SEEK_SET)
+            method = 'sendfile'
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRORS or copied:
+                raise
+            _mark_unsupported('sendfile', devices)
+
+    # Copy whatever is left, e.g. if the file grew or the kernel reported a short copy
+    while True:
+        chunk = os.read(src_fd, 1024 * 1024)
+        if not chunk:
+            break
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+    return method
+
+
+def copy_file(source_path: str, destination_path: str) -> str:
+    """
+    Copy a file with its permission bits and timestamps, like ``shutil.copy2``.
+
+    Args:
+        source_path (str): Path to the source file
+        destination_path (str): Path to the destination file
+
+    Returns:
+        str: Name of the copy method used
+
+    Raises:
+        shutil.SpecialFileError: If the source is not a regular file, e.g. a named pipe
+    """
+    # Non-blocking, so that opening a named pipe does not wait for a writer
+    src_fd = os.open(source_path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        stats = os.fstat(src_fd)
+        if not stat.S_ISREG(stats.st_mode):
+            raise shutil.SpecialFileError(f"`{source_path}` is not a regular file")
+        os.set_blocking(src_fd, True)
+        dst_fd = os.open(destination_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            devices = (stats.st_dev, os.fstat(dst_fd).st_dev)
+            method = _copy_data(src_fd, dst_fd, stats.st_size, devices)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    shutil.copystat(source_path, destination_path)
+    return method
+
+
+def plan_copy(source_path: str, destination_path: str) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str, int]],
+                                                                List[Tuple[str, str, str]]]:
+    """
+    List the directories and files a tree copy would create.
+
+    Symbolic links are followed, as with ``shutil.copytree``. Entries that
+    cannot be read, such as dangling symbolic links, are reported as errors
+    instead of stopping the plan.
+
+    Args:
+        source_path (str): Path to the source directory
+        destination_path (str): Path to the destination directory
+
+    Returns:
+        Tuple[List[Tuple[str, str]], List[Tuple[str, str, int]], List[Tuple[str, str, str]]]: The
+            (source, destination) directories, parents first, the (source, destination, size)
+            files, and the (source, destination, error) entries that cannot be copied
+    """
+    directories = [(source_path, destination_path)]
+    files = []
+    errors = []
+
+    index = 0
+    while index < len(directories):
+        source_dir, destination_dir = directories[index]
+        index += 1
+        try:
+            with os.scandir(source_dir) as entries:
+                entries = sorted(entries, key=lambda e: e.name)
+        except OSError as e:
+            errors.append((source_dir, destination_dir, str(e)))
+            continue
+        for entry in entries:
+            target = os.path.join(destination_dir, entry.name)
+            try:
+                if entry.is_dir():
+                    directories.append((entry.path, target))
+                else:
+                    files.append((entry.path, target, entry.stat().st_size))
+            except OSError as e:
+                errors.append((entry.path, target, str(e)))
+
+    return directories, files, errors
+
+
+def copy_tree(source_path: str, destination_path: str, workers: Optional[int] = None, dry_run: bool = False,
+              progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Copy a directory tree, copying files in parallel.
+
+    Args:
+        source_path (str): Path to the source directory
+        destination_path (str): Path to the destination directory, which must not exist
+        workers (int, optional): Number of copying threads. Defaults to COPY_WORKERS.
+        dry_run (bool, optional): Only return the manifest of what would be copied. Defaults to False.
+        progress (Callable[[Dict[str, Any]], None], optional): Function called periodically
+            with the number of files and bytes copied so far. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: Dictionary with the copied file, directory and byte counts and the
+            number of files copied with each method, or the manifest for a dry run
+
+    Raises:
+        FileNotFoundError: If the source directory does not exist
+        FileExistsError: If the destination already exists
+        shutil.Error: If some files could not be copied, with the list of errors
+    """
+    logger.info(f"Copying tree from {source_path} to {destination_path} (workers={workers}, dry_run={dry_run})")
+
+    if not os.path.isdir(source_path):
+        raise FileNotFoundError(errno.ENOENT, 'Source directory not found', source_path)
+    if os.path.lexists(destination_path):
+        raise FileExistsError(errno.EEXIST, 'Destination already exists', destination_path)
+
+    start_time = time.time()
+    directories, files, errors = plan_copy(source_path, destination_path)
+    total_bytes = sum(size for _, _, size in files)
+
+    if dry_run:
+        manifest = [{'type': 'directory', 'source': src, 'destination': dst} for src, dst in directories]
+        manifest.extend({'type': 'file', 'source': src, 'destination': dst, 'size': size}
+                        for src, dst, size in files)
+        return {
+            'dry_run': True,
+            'directories': len(directories),
+            'files': len(files),
+            'bytes': total_bytes,
+            'manifest': manifest,
+            'errors': errors
+        }
+
+    for _, destination_dir in directories:
+        os.mkdir(destination_dir)
+
+    methods: Dict[str, int] = {}
+    copied_files = 0
+    copied_bytes = 0
+    last_report = 0.0
+
+    with ThreadPoolExecutor(max_workers=workers or COPY_WORKERS) as executor:
+        futures = {executor.submit(copy_file, src, dst): (src, dst, size) for src, dst, size in files}
+        for future in as_completed(futures):
+            src, dst, size = futures[future]
+            try:
+                method = future.result()
+            except OSError as e:
+                errors.append((src, dst, str(e)))
+                continue
+
+            methods[method] = methods.get(method, 0) + 1
+            copied_files += 1
+            copied_bytes += size
+
+            if progress is not None and time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                progress({
+                    'files_copied': copied_files,
+                    'bytes_copied': copied_bytes,
+                    'files': len(files),
+                    'bytes': total_bytes
+                })
+
+    # Copy directory metadata last, children first, so file creation does not change it
+    for source_dir, destination_dir in reversed(directories):
+        try:
+            shutil.copystat(source_dir, destination_dir)
+        except OSError as e:
+            errors.append((source_dir, destination_dir, str(e)))
+
+    if errors:
+        raise shutil.Error(errors)
+
+    return {
+        'dry_run': False,
+        'directories': len(directories),
+        'files': copied_files,
+        'bytes': copied_bytes,
+        'methods': methods,
+        'execution_time': time.time() - start_time
+    }
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Terminal Exec Helper
+
+This script makes the terminal on its standard input the controlling terminal
+of its session and then replaces itself with the command. It is started in a
+new session on the slave side of a pseudo-terminal, so that no Python code has
+to run between fork and exec in the threaded server.
+
+It imports only the standard library so that it starts quickly; it is run as
+``python -I -S tty_exec.py <command> [<argument> ...]``.
+"""
+
+import os
+import sys
+import fcntl
+import termios
+from typing import List
+
+
+def main(argv: List[str]) -> int:
+    """
+    Take the terminal and run the command.
+
+    Args:
+        argv (List[str]): This script, then the command line
+
+    Returns:
+        int: Exit code like the shell's if the command cannot be run; otherwise it does not return
+    """
+    args = argv[1:]
+    try:
+        fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+        os.execvp(args[0], args)
+    except OSError as e:
+        sys.stderr.write(f"shellama: {args[0]}: {e.strerror}\n")
+        return 127 if isinstance(e, FileNotFoundError) else 126
+    return 126
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Upload Sessions Module
+
+This module provides chunked, resumable file uploads. Each upload session
+streams its parts into a temporary file next to the target and is committed
+with an fsync followed by an atomic rename, so large uploads never have to be
+held in memory and readers never see a partially written file.
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import threading
+from typing import Dict, Any, BinaryIO, List, Optional
+
+from shellama.logger import logger
+from shellama.file_ops import STREAM_CHUNK_SIZE, temp_path_for, replace_file
+
+
+# Seconds after the last received chunk before an unfinished upload is discarded
+UPLOAD_SESSION_TTL = int(os.environ.get('SHELLAMA_UPLOAD_TTL', 24 * 60 * 60))
+
+_sessions: Dict[str, 'UploadSession'] = {}
+_sessions_lock = threading.Lock()
+
+
+class UploadSession:
+    """Class representing a single chunked upload."""
+
+    def __init__(self, file_path: str, total_size: Optional[int] = None):
+        """
+        Initialize an upload session.
+
+        Args:
+            file_path (str): Path of the file that is being uploaded
+            total_size (int, optional): Expected size of the file in bytes. Defaults to None.
+        """
+        self.upload_id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.total_size = total_size
+        self.part_path = temp_path_for(file_path, f"{self.upload_id}.part")
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._lock = threading.Lock()
+
+    @property
+    def offset(self) -> int:
+        """Number of bytes received so far."""
+        try:
+            return os.path.getsize(self.part_path)
+        except FileNotFoundError:
+            return 0
+
+    def write_chunk(self, stream: BinaryIO, offset: Optional[int] = None) -> int:
+        """
+        Append a chunk of data read from a stream.
+
+        A chunk may start before the current end of the upload, in which case
+        the data after ``offset`` is discarded first. This lets a client resume
+        from the last offset it knows was acknowledged.
+
+        Args:
+            stream (BinaryIO): Stream to read the chunk from
+            offset (int, optional): Offset the chunk starts at. Defaults to None (the current offset).
+
+        Returns:
+            int: The offset after writing the chunk
+
+        Raises:
+            ValueError: If the offset is past the received data or the chunk exceeds the expected size
+        """
+        with self._lock:
+            current = self.offset
+            if offset is None:
+                offset = current
+            if offset < 0 or offset > current:
+                raise ValueError(f"Offset mismatch for upload {self.upload_id}: "
+                                 f"expected at most {current}, got {offset}")
+
+            with open(self.part_path, 'ab') as part:
+                if offset < current:
+                    part.truncate(offset)
+                position = offset
+                while True:
+                    chunk = stream.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    position += len(chunk)
+                    if self.total_size is not None and position > self.total_size:
+                        part.truncate(offset)
+                        raise ValueError(f"Upload {self.upload_id} exceeds the expected size "
+                                         f"of {self.total_size} bytes")
+                    part.write(chunk)
+
+            self.updated_at = time.time()
+            return position
+
+    def commit(self, checksum: Optional[str] = None) -> None:
+        """
+        Move the uploaded data into place.
+
+        Args:
+            checksum (str, optional): Expected SHA-256 hex digest of the data. Defaults to None.
+
+        Raises:
+            ValueError: If the upload is incomplete or the checksum does not match
+        """
+        with self._lock:
+            received = self.offset
+            if self.total_size is not None and received != self.total_size:
+                raise ValueError(f"Upload {self.upload_id} is incomplete: "
+                                 f"received {received} of {self.total_size} bytes")
+
+            # Make sure an empty upload still produces a file
+            open(self.part_path, 'ab').close()
+
+            if checksum:
+                digest = hashlib.sha256()
+                with open(self.part_path, 'rb') as part:
+                    for chunk in iter(lambda: part.read(STREAM_CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                if digest.hexdigest() != checksum.lower():
+                    raise ValueError(f"Checksum mismatch for upload {self.upload_id}")
+
+            replace_file(self.part_path, self.file_path)
+
+    def abort(self) -> None:
+        """Discard the data received so far."""
+        with self._lock:
+            try:
+                os.remove(self.part_path)
+            except FileNotFoundError:
+                pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the upload session to a dictionary"""
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.file_path,
+            'offset': self.offset,
+            'total_size': self.total_size,
+            'created': self.created_at,
+            'updated': self.updated_at
+        }
+
+
+def _expire_sessions() -> None:
+    """Discard upload sessions that have not received data within the TTL."""
+    cutoff = time.time() - UPLOAD_SESSION_TTL
+    with _sessions_lock:
+        expired: List[UploadSession] = [s for s in _sessions.values() if s.updated_at < cutoff]
+        for session in expired:
+            del _sessions[session.upload_id]
+
+    for session in expired:
+        logger.info(f"Discarding expired upload {session.upload_id} for {session.file_path}")
+        session.abort()
+
+
+def create_upload(file_path: str, total_size: Optional[int] = None) -> UploadSession:
+    """
+    Start a new upload session.
+
+    Args:
+        file_path (str): Path of the file to upload
+        total_size (int, optional): Expected size of the file in bytes. Defaults to None.
+
+    Returns:
+        UploadSession: The new upload session
+
+    Raises:
+        ValueError: If the expected size is not a non-negative integer
+    """
+    # Booleans are ints too, but never a size
+    if total_size is not None and (type(total_size) is not int or total_size < 0):
+        raise ValueError(f"Invalid upload size: {total_size!r}")
+    logger.info(f"Starting upload to {file_path} (total_size={total_size})")
+
+    _expire_sessions()
+
+    # Write through symlinks instead of replacing the link itself
+    if os.path.islink(file_path):
+        file_path = os.path.realpath(file_path)
+
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    session = UploadSession(file_path, total_size)
+    open(session.part_path, 'xb').close()
+
+    with _sessions_lock:
+        _sessions[session.upload_id] = session
+    return session
+
+
+def get_upload(upload_id: str) -> UploadSession:
+    """
+    Get an upload session.
+
+    Args:
+        upload_id (str): ID of the upload session
+
+    Returns:
+        UploadSession: The upload session
+
+    Raises:
+        KeyError: If there is no upload session with this ID
+    """
+    with _sessions_lock:
+        session = _sessions.get(upload_id)
+    if session is None:
+        raise KeyError(f"Upload not found: {upload_id}")
+    return session
+
+
+def commit_upload(upload_id: str, checksum: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Finish an upload session and atomically move the data into place.
+
+    Args:
+        upload_id (str): ID of the upload session
+        checksum (str, optional): Expected SHA-256 hex digest of the data. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: Dictionary with the final upload information
+
+    Raises:
+        KeyError: If there is no upload session with this ID
+        ValueError: If the upload is incomplete or the checksum does not match
+    """
+    session = get_upload(upload_id)
+    logger.info(f"Committing upload {upload_id} to {session.file_path}")
+
+    info = session.to_dict()
+    session.commit(checksum)
+
+    with _sessions_lock:
+        _sessions.pop(upload_id, None)
+    return info
+
+
+def abort_upload(upload_id: str) -> bool:
+    """
+    Cancel an upload session and discard its data.
+
+    Args:
+        upload_id (str): ID of the upload session
+
+    Returns:
+        bool: True if the upload was cancelled
+
+    Raises:
+        KeyError: If there is no upload session with this ID
+    """
+    logger.info(f"Aborting upload {upload_id}")
+
+    with _sessions_lock:
+        session = _sessions.pop(upload_id, None)
+    if session is None:
+        raise KeyError(f"Upload not found: {upload_id}")
+
+    session.abort()
+    return True
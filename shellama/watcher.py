@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Filesystem Watcher Module
+
+This module provides change notifications for directories using Linux inotify.
+Events are drained without blocking whenever a consumer asks for them, so no
+background thread is required and a change made before a lookup is always
+seen by that lookup. On platforms without inotify the watcher reports itself
+as unavailable and callers are expected to fall back to polling.
+"""
+
+import os
+import ctypes
+import ctypes.util
+import errno
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from shellama.logger import logger
+
+
+# inotify event flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# Events that change what a directory listing would return
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    """Load the C library functions needed for inotify, if available."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+class Watcher:
+    """Class for watching directories for changes with inotify."""
+
+    def __init__(self, mask: int = WATCH_MASK):
+        """
+        Initialize the watcher.
+
+        Args:
+            mask (int, optional): inotify events to watch for. Defaults to WATCH_MASK.
+        """
+        self.mask = mask
+        self._fd: Optional[int] = None
+        self._paths: Dict[str, int] = {}
+        self._wds: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+        if _libc is not None:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+            else:
+                logger.warning(f"inotify unavailable: {os.strerror(ctypes.get_errno())}")
+
+    @property
+    def available(self) -> bool:
+        """Whether inotify watches can be used."""
+        return self._fd is not None
+
+    def is_watching(self, path: str) -> bool:
+        """
+        Check if a directory is being watched.
+
+        Args:
+            path (str): Path of the directory
+
+        Returns:
+            bool: True if the directory is being watched, False otherwise
+        """
+        with self._lock:
+            return path in self._paths
+
+    def watch(self, path: str) -> bool:
+        """
+        Start watching a directory.
+
+        Args:
+            path (str): Path of the directory to watch
+
+        Returns:
+            bool: True if the directory is being watched, False if it could not be watched
+        """
+        if self._fd is None:
+            return False
+
+        with self._lock:
+            if path in self._paths:
+                return True
+
+            wd = _libc.inotify_add_watch(self._fd, os.fsencode(path), self.mask | IN_ONLYDIR)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    logger.warning(f"inotify watch limit reached, not watching {path}")
+                return False
+
+            self._paths[path] = wd
+            self._wds[wd] = path
+            return True
+
+    def unwatch(self, path: str) -> None:
+        """
+        Stop watching a directory.
+
+        Args:
+            path (str): Path of the directory
+        """
+        with self._lock:
+            wd = self._paths.pop(path, None)
+            if wd is None:
+                return
+            self._wds.pop(wd, None)
+            if self._fd is not None:
+                _libc.inotify_rm_watch(self._fd, wd)
+
+    def read_events(self) -> List[Tuple[Optional[str], str, int]]:
+        """
+        Drain all pending events without blocking.
+
+        An event queue overflow is reported as a single event with a directory of
+        None, meaning that every watched directory must be considered changed.
+
+        Returns:
+            List[Tuple[Optional[str], str, int]]: List of (directory, name, mask) tuples
+        """
+        if self._fd is None:
+            return []
+
+        events = []
+        with self._lock:
+            while True:
+                try:
+                    data = os.read(self._fd, _READ_SIZE)
+                except BlockingIOError:
+                    break
+                except InterruptedError:
+                    continue
+
+                offset = 0
+                while offset + _EVENT_HEADER.size <= len(data):
+                    wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                    offset += _EVENT_HEADER.size
+                    name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                    offset += length
+
+                    if mask & IN_Q_OVERFLOW:
+                        events.append((None, '', mask))
+                        continue
+
+                    path = self._wds.get(wd)
+                    if mask & IN_IGNORED:
+                        # The kernel removed the watch, e.g. because the directory was deleted
+                        self._wds.pop(wd, None)
+                        if path is not None and self._paths.get(path) == wd:
+                            del self._paths[path]
+                    if path is not None:
+                        events.append((path, name, mask))
+
+        return events
+
+    def close(self) -> None:
+        """Stop watching all directories and release the inotify descriptor."""
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._paths.clear()
+            self._wds.clear()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Workspace Module
+
+This module reports the status of every Git repository below a workspace
+root. Repositories are found by walking the root down to a limited depth; the
+list is kept in an index that stays valid while the modification times of the
+walked directories are unchanged, so later requests only stat those
+directories. Repositories are then queried in parallel on a bounded thread
+pool, each thread driving its own Git process, and results are yielded as soon
+as each repository is done.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import git
+
+from shellama import git_status
+from shellama.logger import logger
+from shellama.repo_pool import repo_pool
+
+
+# How many directory levels below the workspace root are searched for repositories
+WORKSPACE_DEPTH = int(os.environ.get('SHELLAMA_WORKSPACE_DEPTH', 3))
+
+# Number of repositories queried at the same time
+WORKSPACE_WORKERS = int(os.environ.get('SHELLAMA_WORKSPACE_WORKERS', min(16, (os.cpu_count() or 1) * 2)))
+
+# Maximum number of workspace roots kept in the repository index
+REPO_INDEX_SIZE = int(os.environ.get('SHELLAMA_REPO_INDEX_SIZE', 32))
+
+# Seconds a fetch may take before Git is stopped
+WORKSPACE_FETCH_TIMEOUT = float(os.environ.get('SHELLAMA_WORKSPACE_FETCH_TIMEOUT', 60))
+
+
+class RepoIndex:
+    """Thread-safe cache of the repositories found below workspace roots."""
+
+    def __init__(self, max_roots: int = REPO_INDEX_SIZE):
+        """
+        Initialize the repository index.
+
+        Args:
+            max_roots (int, optional): Maximum number of roots kept. Defaults to REPO_INDEX_SIZE.
+        """
+        self.max_roots = max_roots
+        # (root, depth) -> (repositories, {walked directory: mtime_ns})
+        self._entries: 'OrderedDict[Tuple[str, int], Tuple[List[str], Dict[str, int]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, root: str, depth: int = WORKSPACE_DEPTH, refresh: bool = False) -> Tuple[List[str], bool]:
+        """
+        Find the repositories below a directory.
+
+        Directories whose names start with a dot are skipped, symbolic links are
+        not followed, and repositories are not searched for nested repositories.
+
+        Args:
+            root (str): Path to the workspace root
+            depth (int, optional): Directory levels below the root to search. Defaults to WORKSPACE_DEPTH.
+            refresh (bool, optional): Walk the root even if the index is valid. Defaults to False.
+
+        Returns:
+            Tuple[List[str], bool]: Sorted absolute paths of the repositories, and whether
+                they came from the index
+
+        Raises:
+            FileNotFoundError: If the root directory does not exist
+        """
+        root = os.path.realpath(root)
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"Directory not found: {root}")
+        key = (root, depth)
+
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and not refresh and self._is_valid(entry[1]):
+            with self._lock:
+                self.hits += 1
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            return list(entry[0]), True
+
+        repositories, directories = self._walk(root, depth)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (repositories, directories)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_roots:
+                self._entries.popitem(last=False)
+        return list(repositories), False
+
+    @staticmethod
+    def _is_valid(directories: Dict[str, int]) -> bool:
+        """Check that no walked directory gained or lost entries."""
+        for path, mtime in directories.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    @staticmethod
+    def _walk(root: str, depth: int) -> Tuple[List[str], Dict[str, int]]:
+        """Walk a root and return its repositories and the walked directories with their mtimes."""
+        repositories = []
+        directories = {}
+        pending = [(root, 0)]
+        while pending:
+            path, level = pending.pop()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                with os.scandir(path) as entries:
+                    entries = list(entries)
+            except OSError as e:
+                logger.warning(f"Cannot search {path} for repositories: {str(e)}")
+                continue
+
+            if any(entry.name == '.git' for entry in entries):
+                repositories.append(path)
+                continue
+            directories[path] = mtime
+            if level == depth:
+                continue
+            for entry in entries:
+                try:
+                    if not entry.name.startswith('.') and entry.is_dir(follow_symlinks=False):
+                        pending.append((entry.path, level + 1))
+                except OSError:
+                    continue
+        repositories.sort()
+        return repositories, directories
+
+    def invalidate(self, root: Optional[str] = None) -> None:
+        """
+        Drop indexed roots.
+
+        Args:
+            root (str, optional): Root to drop. Defaults to None (all roots).
+        """
+        with self._lock:
+            if root is None:
+                self._entries.clear()
+                return
+            root = os.path.realpath(root)
+            for key in [key for key in self._entries if key[0] == root]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get index statistics.
+
+        Returns:
+            Dict[str, Any]: Number of indexed roots and repositories, hits and misses
+        """
+        with self._lock:
+            return {
+                'roots': len(self._entries),
+                'repositories': sum(len(entry[0]) for entry in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def _repository_status(path: str, untracked: str, ahead_behind: bool, fetch: bool) -> Dict[str, Any]:
+    """Fetch (optionally) and summarise the status of one repository."""
+    start_time = time.perf_counter()
+    result: Dict[str, Any] = {'path': path}
+    if fetch:
+        try:
+            with repo_pool.lease(path) as repo:
+                repo.git.fetch('--quiet', kill_after_timeout=WORKSPACE_FETCH_TIMEOUT,
+                               env={'GIT_TERMINAL_PROMPT': '0'})
+            result['fetched'] = True
+        except git.GitCommandError as e:
+            # The local status is still worth reporting
+            result['fetched'] = False
+            result['fetch_error'] = str(e)
+
+    # Dashboards must not take the index lock from editors and other Git commands
+    status = git_status.get_status(path, untracked, optional_locks=False, ahead_behind=ahead_behind)
+    counts = {name: len(status[name]) for name in ('staged', 'unstaged', 'untracked', 'conflicted')}
+    result.update(counts, branch=status['branch'], clean=not any(counts.values()),
+                  elapsed=time.perf_counter() - start_time)
+    return result
+
+
+def iter_workspace_status(root: str, depth: int = WORKSPACE_DEPTH, untracked: str = 'normal',
+                          ahead_behind: bool = True, fetch: bool = False, workers: Optional[int] = None,
+                          refresh: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Get the status of every repository below a workspace root, in completion order.
+
+    The arguments are checked and the repositories are found when this function
+    is called; Git runs while the returned iterator is consumed. Closing the
+    iterator cancels the repositories that have not started yet.
+
+    Args:
+        root (str): Path to the workspace root
+        depth (int, optional): Directory levels below the root to search. Defaults to WORKSPACE_DEPTH.
+        untracked (str, optional): How to count untracked files: 'all', 'normal' or 'no'. Defaults to 'normal'.
+        ahead_behind (bool, optional): Whether to count commits ahead of and behind upstream. Defaults to True.
+        fetch (bool, optional): Whether to fetch from the default remote first. Defaults to False.
+        workers (int, optional): Number of repositories queried at once, at most
+            WORKSPACE_WORKERS. Defaults to WORKSPACE_WORKERS.
+        refresh (bool, optional): Search the root again even if the index is valid. Defaults to False.
+
+    Returns:
+        Iterator[Dict[str, Any]]: One ``repository`` event per repository, with the branch,
+            entry counts and timing or an ``error``, then a ``summary`` event
+
+    Raises:
+        ValueError: If the depth, worker count or untracked mode is invalid
+        FileNotFoundError: If the root directory does not exist
+    """
+    if depth < 0:
+        raise ValueError("depth must not be negative")
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1")
+    if untracked not in ('all', 'normal', 'no'):
+        raise ValueError("untracked must be 'all', 'normal' or 'no'")
+
+    logger.info(f"Getting workspace status of {root} (depth={depth}, fetch={fetch})")
+    start_time = time.perf_counter()
+    repositories, cached = repo_index.find(root, depth, refresh)
+    # Each worker runs a Git process, so clients may lower the limit but not raise it
+    workers = min(workers or WORKSPACE_WORKERS, WORKSPACE_WORKERS)
+    return _iter_statuses(os.path.realpath(root), repositories, cached, untracked, ahead_behind, fetch,
+                          workers, start_time)
+
+
+def _iter_statuses(root: str, repositories: List[str], cached: bool, untracked: str, ahead_behind: bool,
+                   fetch: bool, workers: int, start_time: float) -> Iterator[Dict[str, Any]]:
+    """Query the repositories on a thread pool and yield their results as they finish."""
+    dirty = 0
+    errors = 0
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {}
+    try:
+        futures = {executor.submit(_repository_status, path, untracked, ahead_behind, fetch): path
+                   for path in repositories}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except (git.InvalidGitRepositoryError, git.NoSuchPathError) as e:
+                # The repository went away without changing an indexed directory
+                repo_index.invalidate(root)
+                result = {'path': path, 'error': f"Not a Git repository: {str(e)}"}
+            except Exception as e:
+                logger.error(f"Error getting status of Git repository in {path}: {str(e)}")
+                result = {'path': path, 'error': str(e)}
+
+            if 'error' in result:
+                errors += 1
+            elif not result['clean']:
+                dirty += 1
+            result['name'] = os.path.relpath(path, root)
+            yield dict(result, event='repository')
+    finally:
+        # Repositories not started yet are skipped (shutdown's cancel_futures needs Python 3.9)
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+    yield {
+        'event': 'summary',
+        'root': root,
+        'repositories': len(repositories),
+        'dirty': dirty,
+        'errors': errors,
+        'index_cached': cached,
+        'elapsed': time.perf_counter() - start_time
+    }
+
+
+# Create a global instance
+repo_index = RepoIndex()
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the SheLLama REST API
+"""
+
+import os
+import gzip
+import json
+import time
+import tempfile
+import unittest
+from unittest import mock
+
+from shellama import reaper
+from shellama.app import create_app
+from shellama.executor import command_executor
+
+
+class TestApp(unittest.TestCase):
+    """Test case for the REST API endpoints"""
+
+    def setUp(self):
+        """Set up test environment"""
+        # Create a temporary directory for testing
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_dir = self.temp_dir.name
+
+        self.app = create_app({'TESTING': True})
+        self.client = self.app.test_client()
+
+        # Create a test file with known content
+        self.file_path = os.path.join(self.test_dir, 'data.bin')
+        self.file_content = bytes(range(256)) * 4
+        with open(self.file_path, 'wb') as f:
+            f.write(self.file_content)
+
+    def tearDown(self):
+        """Clean up test environment"""
+        self.temp_dir.cleanup()
+
+    def test_stream_file(self):
+        """Test streaming a whole file"""
+        response = self.client.get('/file', query_string={'filename': self.file_path, 'stream': 'true'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.file_content)
+        self.assertEqual(response.headers['Content-Length'], str(len(self.file_content)))
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+
+    def test_stream_file_range(self):
+        """Test streaming a byte range of a file"""
+        response = self.client.get('/file', query_string={'filename': self.file_path, 'stream': 'true'},
+                                   headers={'Range': 'bytes=10-19'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.file_content[10:20])
+        self.assertEqual(response.headers['Content-Range'], f'bytes 10-19/{len(self.file_content)}')
+
+        # Test a range beyond the end of the file
+        response = self.client.get('/file', query_string={'filename': self.file_path, 'stream': 'true'},
+                                   headers={'Range': 'bytes=5000-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], f'bytes */{len(self.file_content)}')
+
+    def test_stream_missing_file(self):
+        """Test streaming a non-existent file"""
+        response = self.client.get('/file', query_string={
+            'filename': os.path.join(self.test_dir, 'nonexistent.bin'),
+            'stream': 'true'
+        })
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.get_json()['status'], 'error')
+
+    def test_chunked_upload(self):
+        """Test uploading a file in chunks"""
+        target = os.path.join(self.test_dir, 'uploaded.bin')
+        response = self.client.post('/file/upload', json={'filename': target, 'size': 8})
+        self.assertEqual(response.status_code, 200)
+        upload_id = response.get_json()['upload']['upload_id']
+
+        response = self.client.put(f'/file/upload/{upload_id}', data=b'abcd')
+        self.assertEqual(response.get_json()['offset'], 4)
+
+        # Test offsets that are not integers
+        for offset in ('abc', '-1', '1.5'):
+            response = self.client.put(f'/file/upload/{upload_id}?offset={offset}', data=b'xx')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(f'/file/upload/{upload_id}').get_json()['upload']['offset'], 4)
+
+        # Test a chunk at the wrong offset
+        response = self.client.put(f'/file/upload/{upload_id}?offset=6', data=b'gh')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['offset'], 4)
+
+        response = self.client.put(f'/file/upload/{upload_id}?offset=4', data=b'efgh')
+        self.assertEqual(response.get_json()['offset'], 8)
+
+        response = self.client.post(f'/file/upload/{upload_id}/commit')
+        self.assertEqual(response.status_code, 200)
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b'abcdefgh')
+
+        # Test the session is gone after committing
+        response = self.client.get(f'/file/upload/{upload_id}')
+        self.assertEqual(response.status_code, 404)
+
+        for size in ('8', -1, 1.5, True):
+            response = self.client.post('/file/upload', json={'filename': target, 'size': size})
+            self.assertEqual(response.status_code, 400)
+
+    def test_conditional_file(self):
+        """Test conditional requests for file content"""
+        query = {'filename': self.file_path, 'stream': 'true'}
+        response = self.client.get('/file', query_string=query)
+        etag = response.headers['ETag']
+
+        # Test a request with a current ETag
+        response = self.client.get('/file', query_string=query, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        # Test that the JSON representation has its own ETag
+        text_path = os.path.join(self.test_dir, 'notes.txt')
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write('Some notes')
+        stream_etag = self.client.get('/file', query_string={'filename': text_path, 'stream': 'true'}).headers['ETag']
+        response = self.client.get('/file', query_string={'filename': text_path},
+                                   headers={'If-None-Match': stream_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['content'], 'Some notes')
+
+        # Test that a changed file gets a new ETag
+        with open(self.file_path, 'ab') as f:
+            f.write(b'more')
+        response = self.client.get('/file', query_string=query, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+        # Test that an outdated If-Range sends the whole file
+        response = self.client.get('/file', query_string=query,
+                                   headers={'Range': 'bytes=0-9', 'If-Range': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), len(self.file_content) + 4)
+
+    def test_conditional_listing(self):
+        """Test conditional requests for directory listings"""
+        for path, query in (('/files', {'directory': self.test_dir}),
+                            ('/directory', {'path': self.test_dir})):
+            response = self.client.get(path, query_string=query)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+
+            response = self.client.get(path, query_string=query, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+            # Test that a new file changes the ETag
+            with open(os.path.join(self.test_dir, f'new{len(path)}.txt'), 'w', encoding='utf-8') as f:
+                f.write('New file')
+            response = self.client.get(path, query_string=query, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+
+    def test_git_status(self):
+        """Test conditional requests for the cached git status"""
+        from git import Repo
+        Repo.init(self.test_dir)
+        query = {'path': self.test_dir}
+        response = self.client.get('/git/status', query_string=query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['git_status']['untracked'], ['data.bin'])
+        etag = response.headers['ETag']
+
+        response = self.client.get('/git/status', query_string=query, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # Test that editing an untracked file is not a change, but a new file is
+        with open(self.file_path, 'ab') as f:
+            f.write(b'more')
+        response = self.client.get('/git/status', query_string=query, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        with open(os.path.join(self.test_dir, 'new.txt'), 'w', encoding='utf-8') as f:
+            f.write('New file')
+        response = self.client.get('/git/status', query_string=query, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['git_status']['untracked'], ['data.bin', 'new.txt'])
+
+        response = self.client.get('/git/status', query_string=dict(query, untracked='some'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_git_log(self):
+        """Test paging and streaming the git log"""
+        from git import Repo
+        repo = Repo.init(self.test_dir)
+        with repo.config_writer() as config:
+            config.set_value('user', 'name', 'Test')
+            config.set_value('user', 'email', 'test@example.com')
+        for number in range(3):
+            repo.git.commit('--allow-empty', m=f'commit {number}')
+        query = {'path': self.test_dir, 'limit': 2}
+
+        data = self.client.get('/git/log', query_string=query).get_json()
+        self.assertEqual([commit['message'] for commit in data['logs']], ['commit 2', 'commit 1'])
+        response = self.client.get('/git/log', query_string=dict(query, cursor=data['next_cursor'], stream='true'))
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([event['event'] for event in events], ['commit', 'page'])
+        self.assertIsNone(events[-1]['next_cursor'])
+
+        response = self.client.get('/git/log', query_string=dict(query, cursor='invalid'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_git_workspace(self):
+        """Test streaming the status of the repositories below a root"""
+        from git import Repo
+        Repo.init(os.path.join(self.test_dir, 'one'))
+        Repo.init(os.path.join(self.test_dir, 'two'))
+        response = self.client.get('/git/workspace', query_string={'root': self.test_dir})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(sorted(event['name'] for event in events[:-1]), ['one', 'two'])
+        self.assertEqual((events[-1]['event'], events[-1]['repositories']), ('summary', 2))
+
+        response = self.client.get('/git/workspace', query_string={'root': os.path.join(self.test_dir, 'missing')})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/git/workspace', query_string={'root': self.test_dir, 'depth': -1})
+        self.assertEqual(response.status_code, 400)
+
+    def test_directory_size(self):
+        """Test getting a directory size with progress reports"""
+        response = self.client.get('/directory/size', query_string={'path': self.test_dir})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['size']['size'], len(self.file_content))
+
+        response = self.client.get('/directory/size', query_string={'path': self.test_dir, 'stream': 'true'})
+        events = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual(events[-1]['event'], 'result')
+        self.assertEqual(events[-1]['size'], len(self.file_content))
+
+    def test_delete_directory_background(self):
+        """Test deleting a directory tree in the background"""
+        tree = os.path.join(self.test_dir, 'tree')
+        os.makedirs(os.path.join(tree, 'a', 'b'))
+        for name in ('one.txt', os.path.join('a', 'two.txt'), os.path.join('a', 'b', 'three.txt')):
+            with open(os.path.join(tree, name), 'w', encoding='utf-8') as f:
+                f.write(name)
+
+        response = self.client.delete('/directory', query_string={'path': tree, 'recursive': 'true'})
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(os.path.exists(tree))
+
+        job_id = response.get_json()['job']['job_id']
+        self.assertTrue(reaper.get_job(job_id).done.wait(10))
+
+        job = self.client.get(f'/directory/delete/{job_id}').get_json()['job']
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual(job['files_removed'], 3)
+        self.assertEqual(job['directories_removed'], 3)
+        self.assertFalse(os.path.exists(job['trash_path']))
+
+        response = self.client.delete('/directory', query_string={'path': tree, 'recursive': 'true'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/directory/delete/unknown').status_code, 404)
+
+    def test_shell_command(self):
+        """Test executing a command through the API"""
+        response = self.client.post('/shell', json={'command': 'echo hello', 'cwd': self.test_dir})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['output'], 'hello\n')
+        self.assertEqual(data['exit_code'], 0)
+
+        data = self.client.post('/shell', json={'command': 'sleep 10', 'timeout': 0.2}).get_json()
+        self.assertEqual(data['status'], 'error')
+        self.assertIn('timed out', data['message'])
+
+        # Timeouts are checked before anything runs
+        requests = [('/shell', {'command': 'echo hi'}), ('/shell/stream', {'command': 'echo hi'}),
+                    ('/shell/batch', {'commands': ['echo hi']})]
+        session_id = self.client.post('/sessions').get_json()['session']['session_id']
+        requests.append((f'/sessions/{session_id}/exec', {'command': 'echo hi'}))
+        for url, body in requests:
+            for timeout in ('1', -1, 0, True):
+                response = self.client.post(url, json=dict(body, timeout=timeout))
+                self.assertEqual(response.status_code, 400, (url, timeout))
+        self.client.delete(f'/sessions/{session_id}')
+
+        data = self.client.post('/shell', json={'command': 'echo hi', 'limits': {'pids': 64}}).get_json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['resources']['limits']['pids'], 64)
+
+        response = self.client.post('/shell', json={'command': 'echo hi', 'limits': {'memory': 'lots'}})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/shell', json={'command': 'echo hi', 'priority': 'urgent'})
+        self.assertEqual(response.status_code, 400)
+        data = self.client.post('/shell', json={'command': 'echo hi', 'priority': 'batch'},
+                                headers={'X-Tenant': 'ci'}).get_json()
+        self.assertEqual(data['output'], 'hi\n')
+        stats = self.client.get('/shell/scheduler').get_json()['executor']['scheduler']
+        self.assertIn('batch', stats['classes'])
+
+        # A batch is rejected as a whole while its queue is full
+        with mock.patch.object(command_executor.scheduler, 'max_queued_per_tenant', 0):
+            response = self.client.post('/shell/batch', json={'commands': ['echo hi']})
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response.headers)
+            response = self.client.post('/shell/stream', json={'command': 'echo hi'})
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response.headers)
+
+    def test_shell_output_limit(self):
+        """Test truncated command output, its overflow file and compression"""
+        command = 'seq 1 100000'
+        data = self.client.post('/shell', json={'command': command, 'output_limit': 2048}).get_json()
+        self.assertTrue(data['truncated']['stdout'])
+        self.assertTrue(data['output'].startswith('1\n2\n'))
+        self.assertTrue(data['output'].endswith('99999\n100000\n'))
+
+        response = self.client.get(f"/shell/output/{data['output_id']}/stdout")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), data['output_size']['stdout'])
+        response = self.client.get(f"/shell/output/{data['output_id']}/stdout", headers={'Range': 'bytes=0-3'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'1\n2\n')
+
+        self.assertEqual(self.client.delete(f"/shell/output/{data['output_id']}").status_code, 200)
+        self.assertEqual(self.client.get(f"/shell/output/{data['output_id']}/stdout").status_code, 404)
+
+        response = self.client.post('/shell', json={'command': 'seq 1 1000'}, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.data))['output'].count('\n'), 1000)
+
+        for output_limit in (0, -1, 'many'):
+            response = self.client.post('/shell', json={'command': command, 'output_limit': output_limit})
+            self.assertEqual(response.status_code, 400)
+
+    def test_terminals(self):
+        """Test driving a terminal over HTTP"""
+        response = self.client.post('/terminals', json={'command': '/bin/sh', 'rows': 30, 'cols': 90})
+        self.assertEqual(response.status_code, 201)
+        terminal_id = response.get_json()['terminal']['id']
+
+        self.client.post(f'/terminals/{terminal_id}/input', data=b'stty size\n')
+        output, offset = b'', 0
+        deadline = time.time() + 5
+        while b'30 90' not in output and time.time() < deadline:
+            response = self.client.get(f'/terminals/{terminal_id}/output?offset={offset}&wait=1')
+            output += response.data
+            offset = int(response.headers['X-Output-Next'])
+        self.assertIn(b'30 90', output)
+
+        response = self.client.post(f'/terminals/{terminal_id}/resize', json={'rows': 0, 'cols': 10})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.delete(f'/terminals/{terminal_id}').status_code, 200)
+        self.assertEqual(self.client.get(f'/terminals/{terminal_id}').status_code, 404)
+
+    def test_stream_shell_command(self):
+        """Test streaming command output"""
+        command = 'echo one; echo two >&2; printf three; exit 4'
+        response = self.client.post('/shell/stream', json={'command': command, 'shell': True})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        events = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertIn({'event': 'stdout', 'data': 'one\n'}, events)
+        self.assertIn({'event': 'stderr', 'data': 'two\n'}, events)
+        self.assertIn({'event': 'stdout', 'data': 'three'}, events)
+        self.assertEqual(events[-1]['event'], 'exit')
+        self.assertEqual(events[-1]['exit_code'], 4)
+        self.assertIn('execution_time', events[-1])
+
+        response = self.client.post('/shell/stream', json={'command': 'echo hi'},
+                                    headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = response.data.decode('utf-8')
+        self.assertTrue(body.startswith('event: stdout\ndata: '))
+        self.assertIn('event: exit\n', body)
+
+    def test_background_processes(self):
+        """Test managing a background process through the API"""
+        response = self.client.post('/processes', json={'command': 'echo ready; sleep 30', 'shell': True})
+        self.assertEqual(response.status_code, 201)
+        process_id = response.get_json()['process']['process_id']
+
+        for _ in range(100):
+            process = self.client.get(f'/processes/{process_id}').get_json()['process']
+            if process['stdout']:
+                break
+            time.sleep(0.05)
+        self.assertTrue(process['running'])
+        self.assertEqual(process['stdout'], 'ready\n')
+
+        query = {'stdout_offset': process['offsets']['stdout']}
+        self.assertEqual(self.client.get(f'/processes/{process_id}', query_string=query).get_json()['process']['stdout'], '')
+
+        ids = [p['process_id'] for p in self.client.get('/processes').get_json()['processes']]
+        self.assertIn(process_id, ids)
+
+        response = self.client.post(f'/processes/{process_id}/signal', json={'signal': 'TERM'})
+        self.assertEqual(response.get_json()['signal'], 'SIGTERM')
+        process = self.client.post(f'/processes/{process_id}/stop').get_json()['process']
+        self.assertFalse(process['running'])
+
+        self.assertEqual(self.client.delete(f'/processes/{process_id}').status_code, 200)
+        self.assertEqual(self.client.get(f'/processes/{process_id}').status_code, 404)
+
+    def test_shell_sessions(self):
+        """Test running commands in a shell session through the API"""
+        response = self.client.post('/sessions', json={'cwd': self.test_dir})
+        self.assertEqual(response.status_code, 201)
+        session_id = response.get_json()['session']['session_id']
+
+        self.client.post(f'/sessions/{session_id}/exec', json={'command': 'export NAME=shellama'})
+        data = self.client.post(f'/sessions/{session_id}/exec', json={'command': 'echo $NAME; ls'}).get_json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['output'], 'shellama\ndata.bin\n')
+
+        self.assertEqual(self.client.delete(f'/sessions/{session_id}').status_code, 200)
+        response = self.client.post(f'/sessions/{session_id}/exec', json={'command': 'true'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_shell_batch(self):
+        """Test executing a batch of commands in one request"""
+        commands = ['echo first', 'echo second']
+        data = self.client.post('/shell/batch', json={'commands': commands, 'mode': 'parallel'}).get_json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual([r['stdout'] for r in data['results']], ['first\n', 'second\n'])
+
+        response = self.client.post('/shell/batch', json={'commands': ['false', 'true'], 'mode': 'fail_fast',
+                                                          'stream': True})
+        events = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual([e['event'] for e in events], ['result', 'result', 'summary'])
+        self.assertTrue(events[1]['skipped'])
+        self.assertFalse(events[2]['success'])
+
+        self.assertEqual(self.client.post('/shell/batch', json={'commands': 'true'}).status_code, 400)
+        for body in ({'commands': ['echo a', {'command': 5}]}, {'commands': ['echo a', {'cwd': '/'}]},
+                     {'commands': ['echo a'], 'max_parallel': 'x'}, {'commands': ['echo a'], 'max_parallel': 0},
+                     {'commands': [{'command': 'echo a', 'timeout': '1'}]}):
+            response = self.client.post('/shell/batch', json=body)
+            self.assertEqual(response.status_code, 400, body)
+
+
+if __name__ == '__main__':
+    unittest.main()
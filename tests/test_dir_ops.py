@@ -6,11 +6,14 @@ Test directory operations module
 """
 
 import os
+import shutil
 import tempfile
+import threading
 import unittest
 from pathlib import Path
+from unittest import mock
 
-from shellama import dir_ops
+from shellama import dir_ops, dir_size, file_ops, reaper, tree_copy
 
 
 class TestDirOps(unittest.TestCase):
@@ -89,6 +92,77 @@ class TestDirOps(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             dir_ops.delete_directory(os.path.join(self.test_dir, 'nonexistent'))
 
+    def test_remove_tree(self):
+        """Test removing a tree with the parallel unlinker"""
+        tree = os.path.join(self.test_dir, 'tree')
+        os.makedirs(os.path.join(tree, 'a', 'b'))
+        os.makedirs(os.path.join(tree, 'c'))
+        for i in range(20):
+            with open(os.path.join(tree, 'a', 'b', f'{i}.txt'), 'w', encoding='utf-8') as f:
+                f.write(str(i))
+        os.symlink(self.test_dir, os.path.join(tree, 'c', 'link'))
+
+        result = reaper.remove_tree(tree, workers=4)
+        self.assertEqual(result['files'], 21)
+        self.assertEqual(result['directories'], 4)
+        self.assertEqual(result['error_count'], 0)
+        self.assertFalse(os.path.exists(tree))
+
+        # The symlink target must be untouched
+        self.assertTrue(os.path.isdir(os.path.join(self.test_dir, 'subdir1')))
+
+    def test_concurrent_deletes(self):
+        """Test that concurrent deletions share a bounded set of threads"""
+        paths = []
+        for i in range(10):
+            path = os.path.join(self.test_dir, f'tree{i}')
+            for name in ('a', 'b', 'c'):
+                os.makedirs(os.path.join(path, name))
+            paths.append(path)
+        with mock.patch.object(reaper, '_journal_dir', return_value=None):
+            jobs = [reaper.schedule_delete(path) for path in paths]
+        for job in jobs:
+            self.assertTrue(job.done.wait(10))
+            self.assertEqual(job.status, 'completed')
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+        names = [thread.name for thread in threading.enumerate()]
+        self.assertLessEqual(sum(name.startswith('shellama-reaper') for name in names), reaper.REAPER_JOBS)
+        self.assertLessEqual(sum(name.startswith('shellama-unlink') for name in names), reaper.REAPER_WORKERS)
+
+    def test_trash_leftovers(self):
+        """Test that trees left in the trash are hidden from listings and deleted at startup"""
+        journal = tempfile.mkdtemp()
+        try:
+            with mock.patch.object(reaper, '_JOURNAL_DIR', journal):
+                job = reaper.schedule_delete(os.path.join(self.test_dir, 'subdir1'))
+                self.assertTrue(job.done.wait(10))
+                self.assertEqual(os.listdir(journal), [])
+
+                # A server stopped while deleting subdir2
+                trash = os.path.join(self.test_dir, f'{reaper.TRASH_PREFIX}{"0" * 32}')
+                os.rename(os.path.join(self.test_dir, 'subdir2'), trash)
+                os.symlink(trash, os.path.join(journal, f'999999999-{"0" * 32}'))
+                # Entries pointing anywhere else are never deleted
+                os.symlink(os.path.join(self.test_dir, 'subdir3'), os.path.join(journal, f'999999999-{"1" * 32}'))
+
+                names = [info['name'] for info in dir_ops.get_directory_info(self.test_dir)['directories']]
+                self.assertEqual(names, ['subdir3'])
+                self.assertEqual([info['name'] for info in dir_ops.list_directories(self.test_dir)], ['subdir3'])
+                paths = [info['path'] for info in file_ops.list_files(self.test_dir, '**/*', use_cache=False)]
+                self.assertEqual(sorted(os.path.relpath(path, self.test_dir) for path in paths),
+                                 ['subdir3', os.path.join('subdir3', 'test.txt')])
+                self.assertEqual(file_ops.list_files(self.test_dir, '.*', use_cache=False), [])
+
+                jobs = reaper.sweep_leftovers()
+                self.assertEqual([job.trash_path for job in jobs], [trash])
+                self.assertTrue(jobs[0].done.wait(10))
+                self.assertFalse(os.path.exists(trash))
+                self.assertTrue(os.path.isdir(os.path.join(self.test_dir, 'subdir3')))
+                self.assertEqual(os.listdir(journal), [f'999999999-{"1" * 32}'])
+        finally:
+            shutil.rmtree(journal)
+
     def test_list_directories(self):
         """Test listing directories"""
         # Test listing directories
@@ -106,6 +180,22 @@ class TestDirOps(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             dir_ops.list_directories(os.path.join(self.test_dir, 'nonexistent'))
 
+    def test_get_directory_info(self):
+        """Test getting directory information"""
+        with open(os.path.join(self.test_dir, 'top.txt'), 'w', encoding='utf-8') as f:
+            f.write('Top-level file')
+
+        info = dir_ops.get_directory_info(self.test_dir)
+
+        # Verify the subdirectories and files are listed separately
+        self.assertEqual([d['name'] for d in info['directories']], self.test_subdirs)
+        self.assertEqual([f['name'] for f in info['files']], ['top.txt'])
+        self.assertEqual(info['files'][0]['size'], len('Top-level file'))
+
+        # Test with a non-existent directory
+        with self.assertRaises(FileNotFoundError):
+            dir_ops.get_directory_info(os.path.join(self.test_dir, 'nonexistent'))
+
     def test_directory_exists(self):
         """Test checking if a directory exists"""
         # Test with an existing directory
@@ -124,10 +214,41 @@ class TestDirOps(unittest.TestCase):
         # Verify the size is greater than 0
         self.assertGreater(size, 0)
 
+        # Test that a file growing in place is not hidden by cached subtotals
+        dir_size.compute_directory_size(dir_path, use_cache=True)
+        with open(os.path.join(dir_path, 'test.txt'), 'a', encoding='utf-8') as f:
+            f.write('12345')
+        self.assertEqual(dir_ops.get_directory_size(dir_path), size + 5)
+
         # Test with a non-existent directory
         with self.assertRaises(FileNotFoundError):
             dir_ops.get_directory_size(os.path.join(self.test_dir, 'nonexistent'))
 
+    def test_compute_directory_size(self):
+        """Test the parallel directory size computation"""
+        file_size = len('Content of subdir1/test.txt')
+
+        # Test that hard links are counted once and broken symlinks do not fail the scan
+        os.link(os.path.join(self.test_dir, 'subdir1', 'test.txt'),
+                os.path.join(self.test_dir, 'subdir2', 'link.txt'))
+        os.symlink(os.path.join(self.test_dir, 'nonexistent'), os.path.join(self.test_dir, 'broken'))
+        link_size = os.lstat(os.path.join(self.test_dir, 'broken')).st_size
+
+        result = dir_size.compute_directory_size(self.test_dir, workers=2, use_cache=False)
+        self.assertEqual(result['size'], 3 * file_size + link_size)
+        self.assertEqual(result['files'], 5)
+        self.assertEqual(result['directories'], 4)
+        self.assertEqual(result['error_count'], 0)
+
+        # Test that a repeated query only rescans the changed directory
+        dir_size.compute_directory_size(self.test_dir, use_cache=True)
+        with open(os.path.join(self.test_dir, 'subdir3', 'new.txt'), 'w', encoding='utf-8') as f:
+            f.write('12345')
+        result = dir_size.compute_directory_size(self.test_dir, use_cache=True)
+        self.assertEqual(result['size'], 3 * file_size + link_size + 5)
+        self.assertEqual(result['rescanned'], 1)
+        self.assertEqual(result['cached'], 3)
+
     def test_copy_directory(self):
         """Test copying a directory"""
         # Test copying a directory
@@ -147,6 +268,57 @@ class TestDirOps(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             dir_ops.copy_directory(os.path.join(self.test_dir, 'nonexistent'), dest_dir)
 
+        # Test copying onto an existing destination
+        with self.assertRaises(FileExistsError):
+            dir_ops.copy_directory(source_dir, dest_dir)
+
+    def test_copy_tree(self):
+        """Test copying a tree in parallel"""
+        dest_dir = os.path.join(self.test_dir, 'copy')
+        os.makedirs(os.path.join(self.test_dir, 'subdir1', 'nested'))
+        with open(os.path.join(self.test_dir, 'subdir1', 'nested', 'big.bin'), 'wb') as f:
+            f.write(os.urandom(3 * 1024 * 1024))
+        os.chmod(os.path.join(self.test_dir, 'subdir2', 'test.txt'), 0o640)
+
+        # Test a dry run
+        result = tree_copy.copy_tree(self.test_dir, dest_dir, dry_run=True)
+        self.assertEqual(result['files'], 4)
+        self.assertEqual(result['directories'], 5)
+        self.assertFalse(os.path.exists(dest_dir))
+
+        # Test the copy with progress reports
+        reports = []
+        result = tree_copy.copy_tree(self.test_dir, dest_dir, workers=3, progress=reports.append)
+        self.assertEqual(result['files'], 4)
+        self.assertEqual(sum(result['methods'].values()), 4)
+        self.assertTrue(reports)
+
+        for dirpath, _, filenames in os.walk(self.test_dir):
+            if dirpath.startswith(dest_dir):
+                continue
+            for filename in filenames:
+                source = os.path.join(dirpath, filename)
+                target = os.path.join(dest_dir, os.path.relpath(source, self.test_dir))
+                with open(source, 'rb') as f1, open(target, 'rb') as f2:
+                    self.assertEqual(f1.read(), f2.read())
+                self.assertEqual(os.stat(source).st_mode, os.stat(target).st_mode)
+
+    def test_copy_tree_special_files(self):
+        """Test that named pipes and dangling links are reported without stopping the copy"""
+        source_dir = os.path.join(self.test_dir, 'special')
+        dest_dir = os.path.join(self.test_dir, 'special-copy')
+        os.mkdir(source_dir)
+        os.mkfifo(os.path.join(source_dir, 'pipe'))
+        os.symlink(os.path.join(source_dir, 'missing'), os.path.join(source_dir, 'dangling'))
+        Path(source_dir, 'file.txt').write_text('data')
+
+        self.assertEqual(len(tree_copy.copy_tree(source_dir, dest_dir, dry_run=True)['errors']), 1)
+        with self.assertRaises(shutil.Error) as context:
+            tree_copy.copy_tree(source_dir, dest_dir)
+        failed = sorted(os.path.basename(source) for source, _, _ in context.exception.args[0])
+        self.assertEqual(failed, ['dangling', 'pipe'])
+        self.assertEqual(Path(dest_dir, 'file.txt').read_text(), 'data')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the asynchronous command executor
+"""
+
+import sys
+import time
+import threading
+import unittest
+
+from shellama import shell
+from shellama.executor import CommandExecutor
+
+
+class TestExecutor(unittest.TestCase):
+    """Test case for command execution"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.executor = CommandExecutor(max_concurrent=8)
+
+    def test_execute_command(self):
+        """Test the synchronous facade"""
+        result = shell.execute_command('echo hello')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['exit_code'], 0)
+        self.assertEqual(result['stdout'], 'hello\n')
+
+        result = shell.execute_command('echo out; echo err >&2; exit 3', shell=True)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['exit_code'], 3)
+        self.assertEqual(result['stdout'], 'out\n')
+        self.assertEqual(result['stderr'], 'err\n')
+        self.assertIn('exit code 3', result['error'])
+
+        result = shell.execute_command('shellama-no-such-command')
+        self.assertFalse(result['success'])
+        self.assertIsNone(result['exit_code'])
+
+    def test_timeout(self):
+        """Test that a command is killed when it times out"""
+        start = time.time()
+        result = self.executor.execute(['sh', '-c', 'echo started; sleep 30'], timeout=0.5)
+        self.assertLess(time.time() - start, 5)
+        self.assertFalse(result['success'])
+        self.assertIsNone(result['exit_code'])
+        self.assertIn('timed out', result['error'])
+        self.assertEqual(result['stdout'], 'started\n')
+
+    def test_concurrency_limit(self):
+        """Test that commands run concurrently up to the limit"""
+        start = time.time()
+        futures = [self.executor.submit([sys.executable, '-c', 'import time; time.sleep(0.5)']) for _ in range(16)]
+        results = [future.result() for future in futures]
+        elapsed = time.time() - start
+
+        self.assertTrue(all(result['success'] for result in results))
+        # Two rounds of eight commands
+        self.assertGreaterEqual(elapsed, 1.0)
+        self.assertLess(elapsed, 8.0)
+        self.assertTrue(any(result['queue_time'] >= 0.4 for result in results))
+
+    def test_output_callback(self):
+        """Test receiving output while the command runs"""
+        pieces = []
+        result = self.executor.execute(['sh', '-c', 'echo one; echo two >&2'],
+                                       on_output=lambda stream, text: pieces.append((stream, text)))
+        self.assertTrue(result['success'])
+        self.assertIn(('stdout', 'one\n'), pieces)
+        self.assertIn(('stderr', 'two\n'), pieces)
+
+    def test_stream_backpressure(self):
+        """Test that a streamed command is paused while the consumer is not reading"""
+        events = self.executor.stream([sys.executable, '-c', 'print("x" * 1000000)'], mode='chunks', max_buffered=2)
+        first = next(events)
+        self.assertEqual(first['event'], 'stdout')
+        time.sleep(0.5)
+        self.assertEqual(self.executor.stats()['running'], 1)
+
+        rest = list(events)
+        self.assertEqual(rest[-1]['event'], 'exit')
+        self.assertEqual(rest[-1]['exit_code'], 0)
+        total = len(first['data']) + sum(len(event['data']) for event in rest[:-1])
+        self.assertEqual(total, 1000001)
+
+    def test_stream_close_kills_command(self):
+        """Test that closing the stream kills the command"""
+        events = self.executor.stream(['sh', '-c', 'while true; do echo tick; done'])
+        next(events)
+        events.close()
+
+        deadline = time.time() + 5
+        while self.executor.stats()['running'] and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.executor.stats()['running'], 0)
+
+    def test_stream_from_request_thread(self):
+        """Test streaming from a thread without an event loop, like a WSGI request thread"""
+        results = []
+        thread = threading.Thread(target=lambda: results.extend(self.executor.stream(['echo', 'hi'])))
+        thread.start()
+        thread.join(10)
+        self.assertEqual([event['event'] for event in results], ['stdout', 'exit'])
+
+
+if __name__ == '__main__':
+    unittest.main()
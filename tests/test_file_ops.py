@@ -11,6 +11,7 @@ import unittest
 from pathlib import Path
 
 from shellama import file_ops
+from shellama.fs_cache import metadata_cache
 
 
 class TestFileOps(unittest.TestCase):
@@ -52,6 +53,52 @@ class TestFileOps(unittest.TestCase):
         txt_files = file_ops.list_files(self.test_dir, '*.txt')
         self.assertEqual(len(txt_files), 1)
 
+        # The cached listing is kept newest first, so hits need no sorting
+        os.utime(os.path.join(self.test_dir, 'test1.md'), (0, 4102444800))
+        files = file_ops.list_files(self.test_dir, '*.*')
+        self.assertEqual(files[0]['name'], 'test1.md')
+        cached = metadata_cache.get(self.test_dir, '*.*', lambda: self.fail('listing was scanned again'))
+        self.assertEqual(cached, files)
+
+    def test_list_files_page(self):
+        """Test listing files page by page"""
+        # Give the files distinct sizes and modification times
+        for i, filename in enumerate(self.test_files):
+            file_path = os.path.join(self.test_dir, filename)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write('x' * (i + 1) * 10)
+            os.utime(file_path, (1000 + i, 1000 + i))
+
+        # Test walking all pages sorted by name
+        names = []
+        cursor = None
+        while True:
+            page = file_ops.list_files_page(self.test_dir, '*', limit=2, cursor=cursor, sort='name')
+            self.assertEqual(page['total'], 3)
+            names.extend(f['name'] for f in page['files'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(names, sorted(self.test_files))
+
+        # Test the default order of the mtime and size sorts
+        page = file_ops.list_files_page(self.test_dir, '*', limit=1)
+        self.assertEqual(page['files'][0]['name'], 'test3.txt')
+        page = file_ops.list_files_page(self.test_dir, '*', limit=1, sort='size', order='asc')
+        self.assertEqual(page['files'][0]['name'], 'test1.md')
+
+        # Test size and modification time filters
+        page = file_ops.list_files_page(self.test_dir, '*', min_size=15, max_size=25)
+        self.assertEqual([f['name'] for f in page['files']], ['test2.md'])
+        page = file_ops.list_files_page(self.test_dir, '*.md', modified_after=1000)
+        self.assertEqual([f['name'] for f in page['files']], ['test2.md'])
+
+        # Test invalid arguments
+        with self.assertRaises(ValueError):
+            file_ops.list_files_page(self.test_dir, '*', sort='owner')
+        with self.assertRaises(ValueError):
+            file_ops.list_files_page(self.test_dir, '*', cursor='not-a-cursor')
+
     def test_read_file(self):
         """Test reading a file"""
         # Test reading an existing file
@@ -83,6 +130,17 @@ class TestFileOps(unittest.TestCase):
         with open(file_path, 'r', encoding='utf-8') as f:
             self.assertEqual(f.read(), new_content)
 
+        # Verify no temporary files were left behind
+        self.assertEqual(sorted(os.listdir(self.test_dir)), sorted(self.test_files + ['new_file.md']))
+
+        # Test writing through a symlink
+        link_path = os.path.join(self.test_dir, 'link.md')
+        os.symlink(file_path, link_path)
+        file_ops.write_file(link_path, 'Linked content')
+        self.assertTrue(os.path.islink(link_path))
+        with open(file_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'Linked content')
+
     def test_delete_file(self):
         """Test deleting a file"""
         # Test deleting an existing file
@@ -121,6 +179,47 @@ class TestFileOps(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             file_ops.get_file_info(os.path.join(self.test_dir, 'nonexistent.md'))
 
+    def test_parse_range_header(self):
+        """Test parsing HTTP Range headers"""
+        # Test explicit, open-ended and suffix ranges
+        self.assertEqual(file_ops.parse_range_header('bytes=0-9', 100), (0, 9))
+        self.assertEqual(file_ops.parse_range_header('bytes=90-', 100), (90, 99))
+        self.assertEqual(file_ops.parse_range_header('bytes=-10', 100), (90, 99))
+        self.assertEqual(file_ops.parse_range_header('bytes=50-500', 100), (50, 99))
+
+        # Test headers that fall back to the whole file
+        self.assertIsNone(file_ops.parse_range_header(None, 100))
+        self.assertIsNone(file_ops.parse_range_header('bytes=0-1,5-6', 100))
+        self.assertIsNone(file_ops.parse_range_header('items=0-9', 100))
+        self.assertIsNone(file_ops.parse_range_header('bytes=9-0', 100))
+
+        # Test unsatisfiable ranges
+        with self.assertRaises(ValueError):
+            file_ops.parse_range_header('bytes=100-', 100)
+        with self.assertRaises(ValueError):
+            file_ops.parse_range_header('bytes=-10', 0)
+
+    def test_iter_file_chunks(self):
+        """Test streaming a file in chunks"""
+        file_path = os.path.join(self.test_dir, 'test1.md')
+        handle, stats = file_ops.open_file_stream(file_path)
+        self.assertEqual(stats.st_size, len('Content of test1.md'))
+
+        # Test reading the whole file in small chunks
+        chunks = list(file_ops.iter_file_chunks(handle, chunk_size=4))
+        self.assertEqual(b''.join(chunks), b'Content of test1.md')
+        self.assertTrue(all(len(chunk) <= 4 for chunk in chunks))
+        self.assertTrue(handle.closed)
+
+        # Test reading a byte range
+        handle, _ = file_ops.open_file_stream(file_path)
+        data = b''.join(file_ops.iter_file_chunks(handle, start=11, length=5, chunk_size=2))
+        self.assertEqual(data, b'test1')
+
+        # Test opening a non-existent file
+        with self.assertRaises(FileNotFoundError):
+            file_ops.open_file_stream(os.path.join(self.test_dir, 'nonexistent.md'))
+
 
 if __name__ == '__main__':
     unittest.main()
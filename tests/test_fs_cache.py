@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test filesystem metadata cache module
+"""
+
+import os
+import tempfile
+import unittest
+
+from shellama import file_ops
+from shellama.fs_cache import MetadataCache
+
+
+class TestMetadataCache(unittest.TestCase):
+    """Test case for the directory listing cache"""
+
+    def setUp(self):
+        """Set up test environment"""
+        # Create a temporary directory for testing
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_dir = self.temp_dir.name
+        self.cache = MetadataCache(max_entries=2, poll_interval=60)
+        self.scans = 0
+
+        with open(os.path.join(self.test_dir, 'test1.md'), 'w', encoding='utf-8') as f:
+            f.write('Content of test1.md')
+
+    def tearDown(self):
+        """Clean up test environment"""
+        self.temp_dir.cleanup()
+
+    def _list(self, directory, pattern='*.md'):
+        """List a directory through the cache, counting scans"""
+        def loader():
+            self.scans += 1
+            return file_ops._scan_files(directory, pattern)
+        return self.cache.get(directory, pattern, loader)
+
+    def test_hit_and_miss(self):
+        """Test that repeated listings are served from the cache"""
+        self.assertEqual(len(self._list(self.test_dir)), 1)
+        self.assertEqual(len(self._list(self.test_dir)), 1)
+
+        self.assertEqual(self.scans, 1)
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_invalidation(self):
+        """Test that changes to the directory invalidate the listing"""
+        self._list(self.test_dir)
+
+        # Test creating a file
+        with open(os.path.join(self.test_dir, 'test2.md'), 'w', encoding='utf-8') as f:
+            f.write('Content of test2.md')
+        self.assertEqual(len(self._list(self.test_dir)), 2)
+
+        # Test modifying a file in place
+        with open(os.path.join(self.test_dir, 'test2.md'), 'a', encoding='utf-8') as f:
+            f.write(' and more')
+        files = {f['name']: f for f in self._list(self.test_dir)}
+        self.assertEqual(files['test2.md']['size'], len('Content of test2.md and more'))
+
+    def test_polling_fallback(self):
+        """Test revalidation when inotify is not available"""
+        self.cache._watcher.close()
+        self._list(self.test_dir)
+        self._list(self.test_dir)
+        self.assertEqual(self.scans, 1)
+
+        # Test that a directory mtime change is detected
+        with open(os.path.join(self.test_dir, 'test2.md'), 'w', encoding='utf-8') as f:
+            f.write('Content of test2.md')
+        self.assertEqual(len(self._list(self.test_dir)), 2)
+        self.assertEqual(self.scans, 2)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used listing is evicted"""
+        self._list(self.test_dir, '*.md')
+        self._list(self.test_dir, '*.txt')
+        self._list(self.test_dir, '*.md')
+        self._list(self.test_dir, '*')
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+        # Test that the recently used listing survived
+        self._list(self.test_dir, '*.md')
+        self.assertEqual(self.scans, 3)
+
+    def test_recursive_pattern(self):
+        """Test that recursive patterns bypass the cache"""
+        self._list(self.test_dir, '**/*.md')
+        self._list(self.test_dir, '**/*.md')
+        self.assertEqual(self.scans, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
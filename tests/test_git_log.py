@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the streaming Git log
+"""
+
+import io
+import os
+import json
+import base64
+import shutil
+import tempfile
+import unittest
+
+import git
+from git import Repo
+
+from shellama import git_ops
+from shellama.git_log import parse_log
+
+
+class TestGitLog(unittest.TestCase):
+    """Test case for the Git log"""
+
+    def setUp(self):
+        """Set up test environment with a repository holding five commits"""
+        self.test_dir = tempfile.mkdtemp()
+        self.repo = Repo.init(self.test_dir)
+        with self.repo.config_writer() as config:
+            config.set_value('user', 'name', 'Test')
+            config.set_value('user', 'email', 'test@example.com')
+        for number in range(5):
+            name = 'docs/notes.txt' if number % 2 else 'code.py'
+            self.write(name, f'{number}\n' * (number + 1))
+            self.repo.git.add(A=True)
+            author = 'Alice <alice@example.com>' if number < 3 else 'Bob <bob@example.com>'
+            date = f'2024-01-0{number + 1}T12:00:00'
+            self.repo.git.commit(m=f'commit {number}\n\nbody {number}', author=author, date=date,
+                                 env={'GIT_COMMITTER_DATE': date})
+
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+
+    def write(self, name, content):
+        """Write a file in the working tree"""
+        path = os.path.join(self.test_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_parse(self):
+        """Test parsing commits with numstat entries, binary files and renames"""
+        stream = io.BytesIO(b'\x1eaaa\x1fppp\x1fA\x1fa@x\x1f2024\x1fC\x1fc@x\x1f2024\x1fsubject\n\nbody\n\0'
+                            b'\n1\t2\tfile name\0-\t-\tblob.bin\0'
+                            b'0\t0\t\0old\0new\0'
+                            b'\x1ebbb\x1f\x1fA\x1fa@x\x1f2024\x1fC\x1fc@x\x1f2024\x1froot\n\0')
+        commits = list(parse_log(stream, numstat=True))
+        self.assertEqual([commit['hash'] for commit in commits], ['aaa', 'bbb'])
+        self.assertEqual((commits[0]['subject'], commits[0]['message']), ('subject', 'subject\n\nbody'))
+        self.assertEqual(commits[0]['files'], [
+            {'path': 'file name', 'added': 1, 'deleted': 2},
+            {'path': 'blob.bin', 'added': None, 'deleted': None},
+            {'path': 'new', 'added': 0, 'deleted': 0, 'orig_path': 'old'},
+        ])
+        self.assertEqual((commits[1]['parents'], commits[1]['files']), ([], []))
+
+    def test_pages(self):
+        """Test that cursors walk the history without repeating commits, even after new commits"""
+        first = git_ops.get_log(self.test_dir, limit=2)
+        self.assertEqual([commit['subject'] for commit in first['commits']], ['commit 4', 'commit 3'])
+        self.assertEqual(first['commits'][0]['author'], 'Bob')
+        self.assertEqual(first['commits'][0]['parents'], [first['commits'][1]['hash']])
+
+        self.write('code.py', 'later\n')
+        self.repo.git.commit('-am', 'later')
+        second = git_ops.get_log(self.test_dir, limit=2, cursor=first['next_cursor'])
+        self.assertEqual([commit['subject'] for commit in second['commits']], ['commit 2', 'commit 1'])
+        third = git_ops.get_log(self.test_dir, limit=2, cursor=second['next_cursor'])
+        self.assertEqual([commit['subject'] for commit in third['commits']], ['commit 0'])
+        self.assertIsNone(third['next_cursor'])
+
+    def test_filters(self):
+        """Test path, author, date and numstat options"""
+        log = git_ops.get_log(self.test_dir, paths=['docs'], numstat=True)
+        self.assertEqual([commit['subject'] for commit in log['commits']], ['commit 3', 'commit 1'])
+        self.assertEqual(log['commits'][0]['files'], [{'path': 'docs/notes.txt', 'added': 4, 'deleted': 2}])
+
+        log = git_ops.get_log(self.test_dir, author='Alice', since='2024-01-02T00:00:00')
+        self.assertEqual([commit['subject'] for commit in log['commits']], ['commit 2', 'commit 1'])
+
+        log = git_ops.get_log(self.test_dir, limit=1, paths=['code.py'])
+        with self.assertRaises(ValueError):
+            git_ops.get_log(self.test_dir, cursor=log['next_cursor'])
+
+    def test_stream(self):
+        """Test that a stream can be stopped early and the handle reused"""
+        events = git_ops.iter_log(self.test_dir, limit=5)
+        self.assertEqual(next(events)['event'], 'commit')
+        events.close()
+        events = list(git_ops.iter_log(self.test_dir, limit=5))
+        self.assertEqual([event['event'] for event in events], ['commit'] * 5 + ['page'])
+        self.assertIsNone(events[-1]['next_cursor'])
+
+    def test_errors(self):
+        """Test invalid arguments, empty repositories and directories that are not repositories"""
+        for options in ({'limit': 0}, {'cursor': 'not a cursor'}, {'rev': 'missing'}, {'rev': '--all'}):
+            with self.assertRaises(ValueError):
+                git_ops.get_log(self.test_dir, **options)
+
+        # Forged cursors must not pass options or bad counts to Git
+        query = git_ops.get_log(self.test_dir, limit=1)['next_cursor']
+        query = json.loads(base64.urlsafe_b64decode(query))[2]
+        for tip, skip in (('--output=/tmp/x', 0), ('a' * 40, -1), ('a' * 40, '1')):
+            cursor = base64.urlsafe_b64encode(json.dumps([tip, skip, query]).encode()).decode()
+            with self.assertRaises(ValueError):
+                git_ops.get_log(self.test_dir, limit=1, cursor=cursor)
+
+        plain = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(git.InvalidGitRepositoryError):
+                git_ops.get_log(plain)
+            Repo.init(plain)
+            self.assertEqual(git_ops.get_log(plain), {'commits': [], 'next_cursor': None})
+        finally:
+            shutil.rmtree(plain)
+
+
+if __name__ == '__main__':
+    unittest.main()
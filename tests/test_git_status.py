@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the porcelain v2 Git status engine
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import git
+from git import Repo
+
+from shellama import git_ops, git_status
+from shellama.git_status import parse_porcelain_v2
+
+
+class TestGitStatus(unittest.TestCase):
+    """Test case for Git status"""
+
+    def setUp(self):
+        """Set up test environment with a repository holding one commit"""
+        self.test_dir = tempfile.mkdtemp()
+        self.repo = Repo.init(self.test_dir)
+        with self.repo.config_writer() as config:
+            config.set_value('user', 'name', 'Test')
+            config.set_value('user', 'email', 'test@example.com')
+        for name in ('a.txt', 'b c.txt', 'old.txt'):
+            self.write(name, name + '\n')
+        self.repo.git.add(A=True)
+        self.repo.git.commit(m='initial')
+
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+
+    def write(self, name, content):
+        """Write a file in the working tree"""
+        path = os.path.join(self.test_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_parse(self):
+        """Test parsing records, including paths with spaces and renames"""
+        stream = io.BytesIO(b'# branch.oid abc\0# branch.head main\0'
+                            b'1 .M N... 100644 100644 100644 1111 1111 dir/a b.txt\0'
+                            b'2 R. N... 100644 100644 100644 2222 2222 R100 new name\0old name\0'
+                            b'? untracked file\0')
+        entries = list(parse_porcelain_v2(stream))
+        self.assertEqual([entry['kind'] for entry in entries],
+                         ['header', 'header', 'changed', 'renamed', 'untracked'])
+        self.assertEqual(entries[2]['path'], 'dir/a b.txt')
+        self.assertEqual((entries[3]['path'], entries[3]['orig_path'], entries[3]['score']),
+                         ('new name', 'old name', 'R100'))
+        self.assertEqual(entries[4]['path'], 'untracked file')
+
+    def test_status(self):
+        """Test staged, unstaged, renamed and untracked entries"""
+        self.write('a.txt', 'changed\n')
+        self.write('staged.txt', 'new\n')
+        self.repo.git.add('staged.txt')
+        self.repo.git.mv('old.txt', 'renamed.txt')
+        os.remove(os.path.join(self.test_dir, 'b c.txt'))
+        self.write('dir/untracked.txt', 'u\n')
+
+        status = git_ops.get_status(self.test_dir)
+        self.assertEqual(status['branch']['oid'], self.repo.head.commit.hexsha)
+        self.assertIn({'path': 'staged.txt', 'status': 'A'}, status['staged'])
+        self.assertIn({'path': 'renamed.txt', 'status': 'R', 'orig_path': 'old.txt'}, status['staged'])
+        self.assertEqual(status['unstaged'], [{'path': 'a.txt', 'status': 'M'},
+                                              {'path': 'b c.txt', 'status': 'D'}])
+        self.assertEqual(status['renamed'][0]['orig_path'], 'old.txt')
+        self.assertEqual(status['untracked'], ['dir/untracked.txt'])
+        self.assertEqual((status['modified'], status['added'], status['deleted']),
+                         (['a.txt'], ['staged.txt'], ['b c.txt']))
+        self.assertEqual(status['timing']['entries'], 7)
+        self.assertGreater(status['timing']['elapsed'], 0)
+
+        self.assertEqual(git_ops.get_status(self.test_dir, untracked='normal')['untracked'], ['dir/'])
+        self.assertEqual(git_ops.get_status(self.test_dir, untracked='no')['untracked'], [])
+
+    @unittest.skipUnless(git_status.GIT_UNTRACKED_CACHE, 'the untracked cache is disabled')
+    def test_untracked_cache(self):
+        """Test that listing all untracked files uses Git's untracked cache"""
+        self.write('dir/untracked.txt', 'u\n')
+        trace = os.path.join(self.test_dir, '.git', 'trace')
+        with mock.patch.dict(os.environ, {'GIT_TRACE2_PERF': trace}):
+            git_ops.get_status(self.test_dir, untracked='all')
+        with open(trace, encoding='utf-8') as f:
+            # Statistics of the untracked cache are only reported when it is used
+            self.assertIn('node-creation', f.read())
+
+    def test_conflict(self):
+        """Test that merge conflicts are reported"""
+        main = self.repo.active_branch.name
+        self.repo.git.checkout('-b', 'other')
+        self.write('a.txt', 'other\n')
+        self.repo.git.commit('-am', 'other')
+        self.repo.git.checkout(main)
+        self.write('a.txt', 'main\n')
+        self.repo.git.commit('-am', 'main')
+        with self.assertRaises(git.GitCommandError):
+            self.repo.git.merge('other')
+
+        status = git_ops.get_status(self.test_dir)
+        self.assertEqual(status['conflicted'], [{'path': 'a.txt', 'status': 'UU'}])
+        self.assertEqual(status['branch']['head'], main)
+
+    def test_errors(self):
+        """Test an unknown untracked mode and a directory that is not a repository"""
+        with self.assertRaises(ValueError):
+            git_ops.get_status(self.test_dir, untracked='some')
+        plain = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(git.InvalidGitRepositoryError):
+                git_ops.get_status(plain)
+        finally:
+            shutil.rmtree(plain)
+
+
+if __name__ == '__main__':
+    unittest.main()
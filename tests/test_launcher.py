@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test starting commands from the launcher process
+"""
+
+import os
+import unittest
+from unittest import mock
+
+from shellama.executor import CommandExecutor
+from shellama.launcher import Launcher, LauncherUnavailable
+from shellama.limits import ResourceLimits
+
+
+class TestLauncher(unittest.TestCase):
+    """Test case for the command launcher"""
+
+    def setUp(self):
+        """Set up a launcher and an executor using it"""
+        self.launcher = Launcher()
+        self.executor = CommandExecutor(max_concurrent=4, launcher=self.launcher)
+
+    def tearDown(self):
+        """Stop the launcher"""
+        self.launcher.stop()
+
+    def test_execute(self):
+        """Test output, exit codes, the working directory and the environment"""
+        result = self.executor.execute('echo out; echo err >&2; exit 3', shell=True)
+        self.assertEqual((result['stdout'], result['stderr'], result['exit_code']), ('out\n', 'err\n', 3))
+        self.assertEqual(self.launcher.spawned, 1)
+
+        result = self.executor.execute(['sh', '-c', 'pwd; echo $GREETING'], cwd='/tmp',
+                                       env=dict(os.environ, GREETING='hello'))
+        self.assertTrue(result['success'])
+        self.assertEqual(result['stdout'], '/tmp\nhello\n')
+
+        result = self.executor.execute(['shellama-no-such-command'])
+        self.assertFalse(result['success'])
+        self.assertIn('No such file', result['error'])
+
+    def test_timeout_and_limits(self):
+        """Test killing a launched command and launching limited commands"""
+        result = self.executor.execute(['sleep', '5'], timeout=0.2)
+        self.assertIn('timed out', result['error'])
+        self.assertLess(result['execution_time'], 2)
+
+        result = self.executor.execute(['echo', 'limited'], limits=ResourceLimits(cpu_time=5))
+        self.assertEqual(result['stdout'], 'limited\n')
+        self.assertEqual(self.launcher.spawned, 2)
+        self.assertGreater(result['resources']['usage']['peak_memory'], 0)
+
+    def test_restart(self):
+        """Test that the launcher is started again after it exits"""
+        self.assertTrue(self.executor.execute(['true'])['success'])
+        first = self.launcher.process.pid
+        self.launcher.stop()
+        self.assertTrue(self.executor.execute(['true'])['success'])
+        self.assertNotEqual(self.launcher.process.pid, first)
+
+    def test_fallback(self):
+        """Test that commands are started directly when the launcher cannot take them"""
+        # More than fits in one socket message, whatever the socket buffer size
+        env = dict(os.environ, **{f'BIG{number}': 'x' * 64 * 1024 for number in range(20)})
+        result = self.executor.execute(['sh', '-c', 'echo ${#BIG19}'], env=env)
+        self.assertEqual(result['stdout'], f'{64 * 1024}\n')
+        self.assertEqual(self.launcher.spawned, 0)
+
+        with mock.patch('shellama.launcher._is_supported', return_value=False):
+            launcher = Launcher()
+            executor = CommandExecutor(max_concurrent=4, launcher=launcher)
+            self.assertEqual(executor.execute(['echo', 'direct'])['stdout'], 'direct\n')
+            with self.assertRaises(LauncherUnavailable):
+                launcher.start()
+        self.assertIsNone(launcher.process)
+        self.assertFalse(executor.stats()['launcher'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test resource limits for executed commands
+"""
+
+import sys
+import time
+import signal
+import unittest
+from unittest import mock
+
+from shellama import shell
+from shellama.limits import ResourceLimits, get_cgroup_root, parse_size
+from shellama.shell import BackgroundProcess
+
+
+ALLOCATE = f'{sys.executable} -c "x = bytearray(512 * 1024 * 1024); print(len(x))"'
+
+
+class TestLimits(unittest.TestCase):
+    """Test case for resource limits"""
+
+    def test_parse_size(self):
+        """Test parsing byte sizes"""
+        self.assertEqual(parse_size(4096), 4096)
+        self.assertEqual(parse_size('512M'), 512 * 1024 ** 2)
+        self.assertEqual(parse_size('2g'), 2 * 1024 ** 3)
+        self.assertEqual(parse_size('64KiB'), 64 * 1024)
+        with self.assertRaises(ValueError):
+            parse_size('lots')
+
+    def test_from_dict(self):
+        """Test building limits from a request"""
+        self.assertIsNone(ResourceLimits.from_dict(None))
+        self.assertIsNone(ResourceLimits.from_dict({}))
+
+        limits = ResourceLimits.from_dict({'cpu': 0.5, 'memory': '256M', 'pids': 32, 'cpu_time': 10})
+        self.assertEqual(limits.to_dict(), {'cpu': 0.5, 'memory': 256 * 1024 ** 2, 'pids': 32, 'cpu_time': 10})
+
+        for invalid in ({'disk': 1}, {'memory': 'lots'}, {'pids': 0}, {'cpu': -1}):
+            with self.assertRaises(ValueError):
+                ResourceLimits.from_dict(invalid)
+
+    def test_memory_limit(self):
+        """Test that a command cannot allocate beyond its memory limit"""
+        result = shell.execute_command(ALLOCATE, shell=True)
+        self.assertTrue(result['success'])
+        self.assertNotIn('resources', result)
+
+        result = shell.execute_command(ALLOCATE, shell=True, limits=ResourceLimits(memory=128 * 1024 ** 2))
+        self.assertFalse(result['success'])
+        self.assertEqual(result['resources']['limits']['memory'], 128 * 1024 ** 2)
+        self.assertIn(result['resources']['mode'], ('cgroup', 'rlimit'))
+
+    def test_cpu_time_limit(self):
+        """Test that a command is stopped once it used its CPU time"""
+        start_time = time.time()
+        result = shell.execute_command('while :; do :; done', shell=True, timeout=30,
+                                       limits=ResourceLimits(cpu_time=1))
+        self.assertFalse(result['success'])
+        self.assertLess(time.time() - start_time, 10)
+
+    def test_background_process(self):
+        """Test limits on a background process"""
+        process = BackgroundProcess(ALLOCATE, shell=True, limits=ResourceLimits(memory=128 * 1024 ** 2))
+        self.assertTrue(process.start())
+        try:
+            deadline = time.time() + 10
+            while process.is_running() and time.time() < deadline:
+                time.sleep(0.05)
+            status = process.get_status()
+            self.assertFalse(status['running'])
+            self.assertNotEqual(status['exit_code'], 0)
+            self.assertEqual(status['resources']['limits']['memory'], 128 * 1024 ** 2)
+        finally:
+            process.close()
+
+    @mock.patch('shellama.limits.get_cgroup_root', return_value=None)
+    def test_rlimit_usage(self, _cgroup_root):
+        """Test usage accounting from wait4 in rlimit mode"""
+        result = shell.execute_command(f'{sys.executable} -c "x = bytearray(64 * 1024 * 1024)"', shell=True,
+                                       limits=ResourceLimits(memory=512 * 1024 ** 2, pids=4096))
+        self.assertTrue(result['success'])
+        self.assertEqual(result['resources']['mode'], 'rlimit')
+        self.assertEqual(result['resources']['unenforced'], ['pids'])
+        usage = result['resources']['usage']
+        self.assertGreater(usage['peak_memory'], 64 * 1024 * 1024)
+        self.assertGreater(usage['cpu_time'], 0)
+
+        result = shell.execute_command('sh -c "exit 3"', limits=ResourceLimits(cpu_time=5))
+        self.assertEqual(result['exit_code'], 3)
+        result = shell.execute_command('shellama-no-such-command', limits=ResourceLimits(cpu_time=5))
+        self.assertEqual(result['exit_code'], 127)
+        self.assertIn('shellama-no-such-command', result['stderr'])
+
+        # Signals sent to the helper reach the command, and the helper dies of the same signal
+        process = BackgroundProcess('sleep 30', limits=ResourceLimits(cpu_time=60))
+        self.assertTrue(process.start())
+        try:
+            time.sleep(0.5)
+            process.process.send_signal(signal.SIGTERM)
+            self.assertEqual(process.process.wait(timeout=5), -signal.SIGTERM)
+            self.assertFalse(process.is_running())
+        finally:
+            process.close()
+
+    @unittest.skipIf(get_cgroup_root() is None, 'cgroup v2 is not available')
+    def test_cgroup_usage(self):
+        """Test usage accounting in cgroup mode"""
+        result = shell.execute_command(f'{sys.executable} -c "x = bytearray(32 * 1024 * 1024)"', shell=True,
+                                       limits=ResourceLimits(memory=256 * 1024 ** 2, pids=16))
+        self.assertTrue(result['success'])
+        usage = result['resources']['usage']
+        self.assertEqual(result['resources']['mode'], 'cgroup')
+        self.assertGreater(usage['cpu_time'], 0)
+        if usage['peak_memory'] is not None:
+            self.assertGreater(usage['peak_memory'], 32 * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
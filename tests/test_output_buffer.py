@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the output ring buffer
+"""
+
+import unittest
+
+from shellama.output_buffer import OutputBuffer
+
+
+class TestOutputBuffer(unittest.TestCase):
+    """Test case for the output buffer"""
+
+    def test_incremental_reads(self):
+        """Test reading new output by offset"""
+        buffer = OutputBuffer(max_bytes=1024)
+        buffer.write(b'hello ')
+        data, start, next_offset = buffer.read(0)
+        self.assertEqual((data, start, next_offset), (b'hello ', 0, 6))
+
+        buffer.write(b'world')
+        self.assertEqual(buffer.read(next_offset), (b'world', 6, 11))
+        self.assertEqual(buffer.read(11), (b'', 11, 11))
+        self.assertEqual(buffer.read(0, max_bytes=3), (b'hel', 0, 3))
+
+    def test_spill_to_disk(self):
+        """Test that evicted output is still readable from the spill file"""
+        buffer = OutputBuffer(max_bytes=10, max_spill_bytes=100)
+        content = b''.join(f'{i:04d}'.encode() for i in range(20))
+        for i in range(0, len(content), 4):
+            buffer.write(content[i:i + 4])
+
+        self.assertEqual(buffer.start, 0)
+        self.assertEqual(buffer.read(0), (content, 0, 80))
+        self.assertEqual(buffer.read(37, max_bytes=10), (content[37:47], 37, 47))
+        buffer.close()
+
+    def test_drop_oldest(self):
+        """Test that output beyond both caps is dropped and reported"""
+        buffer = OutputBuffer(max_bytes=10, max_spill_bytes=20)
+        content = bytes(range(100))
+        for i in range(0, len(content), 7):
+            buffer.write(content[i:i + 7])
+
+        # Memory keeps whole chunks (91-99), the spill file the 20 bytes before them
+        self.assertEqual(buffer.start, 71)
+        data, start, next_offset = buffer.read(0)
+        self.assertEqual(start, 71)
+        self.assertEqual(next_offset, 100)
+        self.assertEqual(data, content[71:])
+
+        # Without spilling only the memory buffer is kept
+        buffer = OutputBuffer(max_bytes=10, max_spill_bytes=0)
+        buffer.write(content)
+        self.assertEqual(buffer.read(0), (content[90:], 90, 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
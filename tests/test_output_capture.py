@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test capped command output
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from shellama import shell
+from shellama.output_capture import CappedOutput, OverflowStore
+
+
+class TestOutputCapture(unittest.TestCase):
+    """Test case for capped command output"""
+
+    def test_small_output(self):
+        """Test that output within the limit is kept whole"""
+        capture = CappedOutput(limit=100)
+        capture.write(b'hello\r\n')
+        capture.write(b'world\n')
+        self.assertFalse(capture.truncated)
+        self.assertEqual(capture.text(), 'hello\nworld\n')
+        self.assertIsNone(capture.overflow_path)
+
+    def test_head_and_tail(self):
+        """Test that long output keeps its start and end and overflows to a file"""
+        capture = CappedOutput(limit=20)
+        data = bytes(range(48, 48 + 40)) * 5
+        for i in range(0, len(data), 7):
+            capture.write(data[i:i + 7])
+        capture.close()
+        try:
+            self.assertTrue(capture.truncated)
+            self.assertEqual(capture.total, 200)
+            text = capture.text()
+            self.assertTrue(text.startswith(data[:10].decode()))
+            self.assertTrue(text.endswith(data[-10:].decode()))
+            self.assertIn('[... 180 bytes truncated ...]', text)
+            with open(capture.overflow_path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            capture.discard()
+
+    def test_overflow_cap(self):
+        """Test that the overflow file stops at its cap"""
+        capture = CappedOutput(limit=10, overflow_max_bytes=50)
+        capture.write(b'x' * 100)
+        capture.close()
+        try:
+            self.assertFalse(capture.overflow_complete)
+            self.assertEqual(os.path.getsize(capture.overflow_path), 50)
+        finally:
+            capture.discard()
+
+    def test_split_character(self):
+        """Test that a character cut at the start of the tail is skipped"""
+        capture = CappedOutput(limit=8, overflow_max_bytes=0)
+        capture.write('aaaa'.encode() + 'é'.encode() * 10 + b'b')
+        self.assertNotIn('�', capture.text().split(']\n')[-1])
+
+    def test_overflow_store(self):
+        """Test keeping and expiring overflow files"""
+        store = OverflowStore(ttl=60)
+        capture = CappedOutput(limit=4)
+        capture.write(b'0123456789')
+        output_id = store.register({'stdout': capture, 'stderr': CappedOutput(limit=4)})
+        overflow = store.get(output_id, 'stdout')
+        self.assertEqual(overflow['size'], 10)
+        self.assertTrue(overflow['complete'])
+        with self.assertRaises(KeyError):
+            store.get(output_id, 'stderr')
+
+        store.ttl = -1
+        with self.assertRaises(KeyError):
+            store.get(output_id, 'stdout')
+        self.assertFalse(os.path.exists(overflow['path']))
+
+    def test_disk_budget(self):
+        """Test that overflow files share one disk budget that is returned when they are deleted"""
+        store = OverflowStore(ttl=60, max_total_bytes=30)
+        first = CappedOutput(limit=4, store=store)
+        first.write(b'x' * 20)
+        second = CappedOutput(limit=4, store=store)
+        second.write(b'y' * 20)
+        self.assertTrue(first.overflow_complete)
+        self.assertFalse(second.overflow_complete)
+        self.assertEqual(os.path.getsize(second.overflow_path), 10)
+        self.assertEqual(store.used_bytes, 30)
+
+        output_id = store.register({'stdout': first})
+        second.discard()
+        self.assertEqual(store.used_bytes, 20)
+        store.remove(output_id)
+        self.assertEqual(store.used_bytes, 0)
+
+    def test_sweep(self):
+        """Test that startup deletes the overflow files of processes that are gone"""
+        directory = tempfile.mkdtemp()
+        try:
+            capture = CappedOutput(limit=4, overflow_dir=directory, store=OverflowStore())
+            capture.write(b'0123456789')
+            capture.close()
+            process = subprocess.Popen(['true'])
+            process.wait()
+            for name in (f'shellama-output-{process.pid}-0000-x.log', f'shellama-output-{os.getpid()}-0000-x.log',
+                         'shellama-output-x.log', 'other.log'):
+                open(os.path.join(directory, name), 'w').close()
+
+            self.assertEqual(OverflowStore().sweep(directory), 3)
+            self.assertEqual(sorted(os.listdir(directory)), sorted(['other.log',
+                                                                    os.path.basename(capture.overflow_path)]))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_execute_command(self):
+        """Test the output limit of an executed command"""
+        result = shell.execute_command('head -c 100000 /dev/zero', output_limit=1000)
+        self.assertTrue(result['success'])
+        self.assertTrue(result['truncated']['stdout'])
+        self.assertFalse(result['truncated']['stderr'])
+        self.assertEqual(result['output_size']['stdout'], 100000)
+        self.assertLess(len(result['stdout']), 1100)
+        self.assertIn('output_id', result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the background process registry
+"""
+
+import time
+import signal
+import unittest
+
+from shellama.process_registry import ProcessRegistry, parse_signal
+
+
+class TestProcessRegistry(unittest.TestCase):
+    """Test case for the process registry"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.registry = ProcessRegistry(max_running=2, max_retained=2, reap_interval=0.05)
+
+    def tearDown(self):
+        """Clean up test environment"""
+        for process in self.registry.list():
+            try:
+                self.registry.remove(process.process_id)
+            except KeyError:
+                pass
+
+    def wait_for_exit(self, process, timeout=5):
+        deadline = time.time() + timeout
+        while process.is_running() and time.time() < deadline:
+            time.sleep(0.02)
+
+    def test_running_limit(self):
+        """Test that the number of running processes is capped"""
+        first = self.registry.start('sleep 30')
+        self.registry.start('sleep 30')
+        with self.assertRaises(RuntimeError):
+            self.registry.start('sleep 30')
+
+        self.registry.stop(first.process_id)
+        self.assertFalse(first.is_running())
+        self.registry.start('sleep 30')
+        self.assertEqual(self.registry.stats()['running'], 2)
+
+    def test_signal(self):
+        """Test signalling a process"""
+        process = self.registry.start('sleep 30')
+        self.assertEqual(self.registry.signal(process.process_id, 'kill'), signal.SIGKILL)
+        self.wait_for_exit(process)
+        self.assertEqual(process.process.returncode, -signal.SIGKILL)
+
+        with self.assertRaises(ProcessLookupError):
+            self.registry.signal(process.process_id, 'TERM')
+        with self.assertRaises(KeyError):
+            self.registry.signal('unknown', 'TERM')
+        with self.assertRaises(ValueError):
+            parse_signal('NOPE')
+
+    def test_reaping(self):
+        """Test that exited processes are reaped and old ones forgotten"""
+        processes = []
+        for i in range(3):
+            processes.append(self.registry.start(f'echo {i}', shell=True))
+            self.wait_for_exit(processes[-1])
+            if i == 1:
+                # Use the first process again so the second becomes the least recently used
+                self.registry.get(processes[0].process_id)
+
+        # The collector thread reaps exited processes without being asked
+        time.sleep(0.2)
+        self.assertIsNotNone(processes[-1].process.returncode)
+        self.assertEqual(self.registry.stats()['running'], 0)
+
+        # Only the two most recently used finished processes are kept
+        remaining = [p.process_id for p in self.registry.list()]
+        self.assertEqual(remaining, [processes[0].process_id, processes[2].process_id])
+        with self.assertRaises(KeyError):
+            self.registry.get(processes[1].process_id)
+
+    def test_start_failure(self):
+        """Test starting a command that does not exist"""
+        with self.assertRaises(OSError):
+            self.registry.start('shellama-no-such-command')
+        self.assertEqual(self.registry.stats()['retained'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
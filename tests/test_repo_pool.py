@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the Git repository handle pool
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import git
+from git import Repo
+
+from shellama.repo_pool import RepoPool
+
+
+class TestRepoPool(unittest.TestCase):
+    """Test case for the repository pool"""
+
+    def setUp(self):
+        """Set up test environment with two repositories"""
+        self.test_dir = tempfile.mkdtemp()
+        self.repos = []
+        for name in ('one', 'two'):
+            path = os.path.join(self.test_dir, name)
+            Repo.init(path)
+            self.repos.append(path)
+        self.pool = RepoPool(max_repos=1)
+
+    def tearDown(self):
+        """Clean up test environment"""
+        self.pool.shutdown()
+        shutil.rmtree(self.test_dir)
+
+    def test_reuse(self):
+        """Test that a returned handle is reused for the same real path"""
+        with self.pool.lease(self.repos[0]) as first:
+            pass
+        link = os.path.join(self.test_dir, 'link')
+        os.symlink(self.repos[0], link)
+        with self.pool.lease(link) as second:
+            self.assertIs(second, first)
+        self.assertEqual((self.pool.hits, self.pool.misses), (1, 1))
+
+    def test_concurrent_leases(self):
+        """Test that a handle is only leased to one caller at a time"""
+        with self.pool.lease(self.repos[0]) as first:
+            with self.pool.lease(self.repos[0]) as second:
+                self.assertIsNot(second, first)
+                self.assertEqual(self.pool.stats()['leased'], 2)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+    def test_eviction(self):
+        """Test that the least recently used handle is closed beyond the limit"""
+        with self.pool.lease(self.repos[0]) as first:
+            pass
+        with self.pool.lease(self.repos[1]):
+            pass
+        stats = self.pool.stats()
+        self.assertEqual((stats['repositories'], stats['idle']), (1, 1))
+        with self.pool.lease(self.repos[0]) as again:
+            self.assertIsNot(again, first)
+
+        expiring = RepoPool(idle_timeout=0)
+        with expiring.lease(self.repos[0]):
+            pass
+        with expiring.lease(self.repos[0]):
+            pass
+        self.assertEqual(expiring.hits, 0)
+
+    def test_errors(self):
+        """Test invalid repositories and handles dropped after unexpected errors"""
+        with self.assertRaises(git.InvalidGitRepositoryError):
+            with self.pool.lease(self.test_dir):
+                pass
+        with self.assertRaises(RuntimeError):
+            with self.pool.lease(self.repos[0]):
+                raise RuntimeError('boom')
+        stats = self.pool.stats()
+        self.assertEqual((stats['idle'], stats['leased']), (0, 0))
+
+    def test_threads(self):
+        """Test leasing from several threads"""
+        errors = []
+
+        def work():
+            try:
+                for _ in range(5):
+                    with self.pool.lease(self.repos[0]) as repo:
+                        repo.git.rev_parse('--git-dir')
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.pool.stats()['leased'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the command result cache
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from shellama import shell
+from shellama.limits import ResourceLimits
+from shellama.result_cache import CachePolicy, ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    """Test case for the command result cache"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(max_entries=2, max_bytes=1024 * 1024)
+        patcher = mock.patch.object(shell, 'result_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+
+    def test_hit_and_miss(self):
+        """Test that a repeated command is served from the cache"""
+        policy = CachePolicy()
+        first = shell.execute_command('date +%s%N', cache=policy)
+        self.assertFalse(first['cached'])
+        second = shell.execute_command('date +%s%N', cache=policy)
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['stdout'], first['stdout'])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+        # Not cached without a policy or in another directory
+        self.assertNotIn('cached', shell.execute_command('date +%s%N'))
+        self.assertFalse(shell.execute_command('date +%s%N', cwd=self.test_dir, cache=policy)['cached'])
+
+    def test_inputs_and_env(self):
+        """Test that changed input files and environment variables change the key"""
+        path = os.path.join(self.test_dir, 'data.txt')
+        with open(path, 'w') as f:
+            f.write('one\n')
+        policy = CachePolicy(env=['SHELLAMA_TEST_VALUE'], inputs=['data.txt'])
+
+        def run(value):
+            return shell.execute_command('cat data.txt', cwd=self.test_dir, env={'SHELLAMA_TEST_VALUE': value},
+                                         cache=policy)
+
+        self.assertFalse(run('a')['cached'])
+        self.assertTrue(run('a')['cached'])
+        self.assertFalse(run('b')['cached'])
+
+        with open(path, 'a') as f:
+            f.write('two\n')
+        result = run('a')
+        self.assertFalse(result['cached'])
+        self.assertEqual(result['stdout'], 'one\ntwo\n')
+
+    def test_expiry_and_eviction(self):
+        """Test the TTL and the LRU bound"""
+        self.cache.put('a', {'stdout': 'a'}, ttl=0.05)
+        self.assertIsNotNone(self.cache.get('a'))
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('a'))
+
+        for key in ('a', 'b', 'c'):
+            self.cache.put(key, {'stdout': key}, ttl=60)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('c')['stdout'], 'c')
+        stats = self.cache.stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['expirations'], 1)
+        self.assertEqual(stats['evictions'], 1)
+
+    def test_timeouts_not_cached(self):
+        """Test that a timed out command is run again"""
+        policy = CachePolicy()
+        self.assertFalse(shell.execute_command('sleep 5', timeout=0.1, cache=policy)['cached'])
+        self.assertFalse(shell.execute_command('sleep 5', timeout=0.1, cache=policy)['cached'])
+
+    def test_limits_and_truncation(self):
+        """Test that limits change the key and truncated results are not cached"""
+        policy = CachePolicy()
+        self.assertFalse(shell.execute_command('echo hi', cache=policy)['cached'])
+        self.assertFalse(shell.execute_command('echo hi', cache=policy, limits=ResourceLimits(pids=64))['cached'])
+        self.assertFalse(shell.execute_command('echo hi', cache=policy, output_limit=100)['cached'])
+        self.assertTrue(shell.execute_command('echo hi', cache=policy, output_limit=100)['cached'])
+
+        command = 'seq 1 1000'
+        self.assertFalse(shell.execute_command(command, cache=policy, output_limit=100)['cached'])
+        self.assertFalse(shell.execute_command(command, cache=policy, output_limit=100)['cached'])
+
+    def test_disk_store(self):
+        """Test that results survive in the disk store"""
+        store = os.path.join(self.test_dir, 'store')
+        ResultCache(store_dir=store).put('key', {'stdout': 'hello'}, ttl=60)
+
+        cache = ResultCache(store_dir=store)
+        self.assertEqual(cache.get('key')['stdout'], 'hello')
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+        cache.clear()
+        self.assertIsNone(ResultCache(store_dir=store).get('key'))
+
+    def test_policy_from_request(self):
+        """Test building a policy from a request"""
+        self.assertIsNone(CachePolicy.from_request(None))
+        self.assertIsNotNone(CachePolicy.from_request(True))
+        policy = CachePolicy.from_request({'ttl': 10, 'env': ['PATH'], 'inputs': ['setup.py']})
+        self.assertEqual(policy.ttl, 10)
+        for invalid in ('yes', {'ttl': 0}, {'env': 'PATH'}, {'other': 1}):
+            with self.assertRaises(ValueError):
+                CachePolicy.from_request(invalid)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the command scheduler
+"""
+
+import asyncio
+import unittest
+
+from shellama.executor import CommandExecutor
+from shellama.scheduler import DeadlineExceeded, Scheduler, SchedulerFull
+
+
+class TestScheduler(unittest.TestCase):
+    """Test case for the command scheduler"""
+
+    def run_order(self, scheduler, requests):
+        """Occupy every slot, queue the requests and return the order in which they start"""
+        order = []
+
+        async def scenario():
+            for _ in range(scheduler.slots):
+                await scheduler.acquire('interactive')
+
+            async def waiter(name, priority, tenant=None, deadline=None):
+                await scheduler.acquire(priority, tenant, deadline)
+                order.append(name)
+
+            loop = asyncio.get_running_loop()
+            tasks = []
+            for name, priority, tenant, deadline in requests:
+                tasks.append(asyncio.ensure_future(
+                    waiter(name, priority, tenant, None if deadline is None else loop.time() + deadline)))
+                await asyncio.sleep(0)
+            for _ in requests:
+                scheduler.release('interactive')
+                await asyncio.sleep(0.01)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(scenario())
+        return order
+
+    def test_priority(self):
+        """Test that higher classes start first"""
+        order = self.run_order(Scheduler(1, reserved=0), [
+            ('batch', 'batch', None, None),
+            ('normal', 'normal', None, None),
+            ('interactive', 'interactive', None, None)
+        ])
+        self.assertEqual(order, ['interactive', 'normal', 'batch'])
+
+    def test_fair_share(self):
+        """Test that tenants take turns and deadlines order a tenant's commands"""
+        order = self.run_order(Scheduler(1, reserved=0), [
+            ('a1', 'normal', 'a', None),
+            ('a2', 'normal', 'a', 30),
+            ('a3', 'normal', 'a', None),
+            ('b1', 'normal', 'b', None)
+        ])
+        self.assertEqual(order, ['a2', 'b1', 'a1', 'a3'])
+
+    def test_reserved_slots(self):
+        """Test that batch commands leave slots for interactive commands"""
+        async def scenario():
+            scheduler = Scheduler(2, reserved=1)
+            await scheduler.acquire('batch')
+            waiting = asyncio.ensure_future(scheduler.acquire('batch'))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiting.done())
+            await asyncio.wait_for(scheduler.acquire('interactive'), 1)
+            scheduler.release('batch')
+            await asyncio.sleep(0.01)
+            # The interactive command holds the only slot batch commands may use
+            self.assertFalse(waiting.done())
+            scheduler.release('interactive')
+            await asyncio.wait_for(waiting, 1)
+
+        asyncio.run(scenario())
+
+    def test_admission_and_deadline(self):
+        """Test rejecting commands when the queue is full and expiring waiting commands"""
+        async def scenario():
+            scheduler = Scheduler(1, reserved=0, max_queued=1)
+            loop = asyncio.get_running_loop()
+            await scheduler.acquire()
+            waiting = asyncio.ensure_future(scheduler.acquire(deadline=loop.time() + 0.05))
+            await asyncio.sleep(0)
+            with self.assertRaises(SchedulerFull) as context:
+                await scheduler.acquire()
+            self.assertGreaterEqual(context.exception.retry_after, 1)
+
+            with self.assertRaises(DeadlineExceeded):
+                await waiting
+            stats = scheduler.stats()
+            self.assertEqual(stats['classes']['normal']['queued'], 0)
+            self.assertEqual(stats['rejected'], 1)
+            self.assertEqual(stats['expired'], 1)
+
+        asyncio.run(scenario())
+
+    def test_executor_deadline(self):
+        """Test that a command still waiting at its deadline is not run"""
+        executor = CommandExecutor(max_concurrent=1)
+        executor.scheduler.reserved = 0
+        running = executor.submit(['sleep', '0.5'])
+        result = executor.execute(['echo', 'late'], deadline=0.1)
+        self.assertFalse(result['success'])
+        self.assertIn('Deadline', result['error'])
+        self.assertTrue(running.result()['success'])
+        self.assertEqual(executor.execute(['echo', 'hi'], priority='batch')['stdout'], 'hi\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
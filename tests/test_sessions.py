@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the persistent shell sessions
+"""
+
+import os
+import time
+import tempfile
+import unittest
+from unittest import mock
+
+from shellama.sessions import SessionManager
+
+
+class TestSessions(unittest.TestCase):
+    """Test case for shell sessions"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.realpath(self.temp_dir.name)
+        self.manager = SessionManager(max_sessions=2, idle_timeout=60, pool_size=1)
+
+    def tearDown(self):
+        """Clean up test environment"""
+        self.manager.shutdown()
+        self.temp_dir.cleanup()
+
+    def test_state_persists(self):
+        """Test that cwd and variables persist between commands"""
+        session = self.manager.create(cwd=self.test_dir, env={'GREETING': 'hello world'})
+        self.assertEqual(session.cwd, self.test_dir)
+
+        result = self.manager.run(session.session_id, 'mkdir sub && cd sub && export COUNT=3')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['cwd'], os.path.join(self.test_dir, 'sub'))
+
+        result = self.manager.run(session.session_id, 'echo "$GREETING $COUNT"; pwd; echo warn >&2; false')
+        self.assertEqual(result['stdout'], f"hello world 3\n{self.test_dir}/sub\n")
+        self.assertEqual(result['stderr'], 'warn\n')
+        self.assertEqual(result['exit_code'], 1)
+
+        # Syntax errors and commands reading stdin do not break the framing
+        self.assertEqual(self.manager.run(session.session_id, 'if')['exit_code'], 2)
+        self.assertEqual(self.manager.run(session.session_id, 'cat')['stdout'], '')
+        self.assertEqual(self.manager.run(session.session_id, 'printf partial')['stdout'], 'partial')
+
+    def test_exit_and_timeout_close_session(self):
+        """Test that a session ends when its shell exits or a command times out"""
+        session = self.manager.create()
+        result = self.manager.run(session.session_id, 'exit 4')
+        self.assertEqual(result['exit_code'], 4)
+        self.assertFalse(result['alive'])
+        with self.assertRaises(KeyError):
+            self.manager.get(session.session_id)
+
+        session = self.manager.create()
+        start = time.time()
+        result = self.manager.run(session.session_id, 'sleep 30', timeout=0.3)
+        self.assertLess(time.time() - start, 5)
+        self.assertIn('timed out', result['error'])
+        self.assertFalse(session.alive)
+
+    def test_errors_keep_framing(self):
+        """Test that a failed command never leaves its markers for the next one"""
+        session = self.manager.create()
+        # A bad timeout fails before the command is sent
+        with self.assertRaises(TypeError):
+            self.manager.run(session.session_id, 'echo first', timeout='5')
+        self.assertEqual(self.manager.run(session.session_id, 'echo second')['stdout'], 'second\n')
+
+        # Errors after the command was sent close the session
+        with mock.patch.object(session, '_read_until', side_effect=OSError('read failed')):
+            with self.assertRaises(OSError):
+                self.manager.run(session.session_id, 'echo third')
+        self.assertFalse(session.alive)
+        with self.assertRaises(KeyError):
+            self.manager.get(session.session_id)
+
+    def test_limits(self):
+        """Test the session limit and idle eviction"""
+        first = self.manager.create()
+        self.manager.create()
+        with self.assertRaises(RuntimeError):
+            self.manager.create()
+
+        first.last_used -= 120
+        self.manager.create()
+        self.assertFalse(first.alive)
+        self.assertEqual(len(self.manager.list()), 2)
+
+        self.manager.close(self.manager.list()[0].session_id)
+        with self.assertRaises(OSError):
+            self.manager.create(cwd=os.path.join(self.test_dir, 'missing'))
+        self.assertEqual(len(self.manager.list()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the background process management
+"""
+
+import time
+import unittest
+
+from shellama import shell
+from shellama.shell import BackgroundProcess
+
+
+class TestBatch(unittest.TestCase):
+    """Test case for batches of commands"""
+
+    def test_sequential(self):
+        """Test running commands one after another"""
+        result = shell.execute_batch(['echo one', 'false', {'command': 'echo $0', 'shell': True}])
+        self.assertFalse(result['success'])
+        self.assertEqual([r['index'] for r in result['results']], [0, 1, 2])
+        self.assertEqual(result['results'][0]['stdout'], 'one\n')
+        self.assertEqual(result['results'][1]['exit_code'], 1)
+        self.assertTrue(result['results'][2]['success'])
+
+    def test_fail_fast(self):
+        """Test stopping at the first failure"""
+        result = shell.execute_batch(['true', 'sh -c "exit 5"', 'echo never'], mode='fail_fast')
+        self.assertEqual(result['results'][1]['exit_code'], 5)
+        self.assertTrue(result['results'][2]['skipped'])
+        self.assertNotIn('stdout', result['results'][2])
+
+    def test_parallel(self):
+        """Test running commands concurrently with a maximum degree"""
+        start = time.time()
+        result = shell.execute_batch(['sleep 0.4'] * 6 + ['echo "unbalanced'], mode='parallel', max_parallel=3)
+        elapsed = time.time() - start
+        self.assertGreaterEqual(elapsed, 0.8)
+        self.assertLess(elapsed, 2.0)
+        self.assertTrue(all(r['success'] for r in result['results'][:6]))
+        self.assertIn('Invalid command', result['results'][6]['error'])
+
+        with self.assertRaises(ValueError):
+            shell.execute_batch(['true'], mode='random')
+        with self.assertRaises(ValueError):
+            shell.iter_batch(['true', None])
+
+
+class TestBackgroundProcess(unittest.TestCase):
+    """Test case for background processes"""
+
+    def test_status_does_not_block(self):
+        """Test polling a running process for incremental output"""
+        process = BackgroundProcess('echo first; sleep 0.5; echo second; echo oops >&2; sleep 30', shell=True)
+        self.assertTrue(process.start())
+        try:
+            time.sleep(0.2)
+            start = time.time()
+            status = process.get_status()
+            self.assertLess(time.time() - start, 0.5)
+            self.assertTrue(status['running'])
+            self.assertEqual(status['stdout'], 'first\n')
+
+            time.sleep(0.6)
+            status = process.get_status(status['offsets']['stdout'], status['offsets']['stderr'])
+            self.assertEqual(status['stdout'], 'second\n')
+            self.assertEqual(status['stderr'], 'oops\n')
+            self.assertEqual(status['offsets'], {'stdout': 13, 'stderr': 5})
+        finally:
+            self.assertTrue(process.stop())
+            process.close()
+
+        self.assertFalse(process.is_running())
+
+    def test_large_output(self):
+        """Test that a chatty process is drained into a bounded buffer"""
+        process = BackgroundProcess('head -c 5000000 /dev/zero', shell=True)
+        process.stdout.max_bytes = 65536
+        process.stdout.max_spill_bytes = 0
+        self.assertTrue(process.start())
+
+        process.process.wait(timeout=10)
+        process.stop()
+        status = process.get_status()
+        self.assertEqual(status['exit_code'], 0)
+        self.assertTrue(status['truncated']['stdout'])
+        self.assertGreater(len(status['stdout']), 0)
+        self.assertLessEqual(len(status['stdout']), 65536)
+        self.assertEqual(status['offsets']['stdout'], 5000000)
+        process.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
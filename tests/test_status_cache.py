@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the watch-driven Git status cache
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import git
+from git import Repo
+
+from shellama import git_status
+from shellama.status_cache import StatusCache, merge_status
+
+
+class TestStatusCache(unittest.TestCase):
+    """Test case for the Git status cache"""
+
+    def setUp(self):
+        """Set up test environment with a repository holding one commit"""
+        self.test_dir = tempfile.mkdtemp()
+        self.repo = Repo.init(self.test_dir)
+        with self.repo.config_writer() as config:
+            config.set_value('user', 'name', 'Test')
+            config.set_value('user', 'email', 'test@example.com')
+        self.write('src/a.txt', 'a\n')
+        self.write('b.txt', 'b\n')
+        self.repo.git.add(A=True)
+        self.repo.git.commit(m='initial')
+        self.cache = StatusCache()
+
+    def tearDown(self):
+        """Clean up test environment"""
+        self.cache.invalidate()
+        shutil.rmtree(self.test_dir)
+
+    def write(self, name, content):
+        """Write a file in the working tree"""
+        path = os.path.join(self.test_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_merge_status(self):
+        """Test replacing the entries below changed paths"""
+        empty = {'staged': [], 'unstaged': [], 'untracked': [], 'renamed': [], 'conflicted': [],
+                 'modified': [], 'added': [], 'deleted': []}
+        status = dict(empty, branch={}, untracked=['a/x', 'a/y', 'b'], modified=['c'],
+                      unstaged=[{'path': 'c', 'status': 'M'}])
+        update = dict(empty, branch={'head': 'main'}, untracked=['a/z'])
+        merged = merge_status(status, update, ['a', 'c'])
+        self.assertEqual(merged['untracked'], ['a/z', 'b'])
+        self.assertEqual((merged['unstaged'], merged['modified']), ([], []))
+        self.assertEqual(merged['branch'], {'head': 'main'})
+        self.assertEqual(status['untracked'], ['a/x', 'a/y', 'b'])
+
+    def test_cache(self):
+        """Test that unchanged repositories are served from the cache and changes are seen"""
+        first = self.cache.get(self.test_dir)
+        self.assertFalse(first['timing']['cached'])
+        if not first['timing']['watched']:
+            self.skipTest('inotify is not available')
+        second = self.cache.get(self.test_dir)
+        self.assertTrue(second['timing']['cached'])
+        digest = self.cache.digest(self.test_dir)
+
+        # A working tree edit refreshes only the changed path
+        self.write('src/a.txt', 'changed\n')
+        self.write('new/deep/c.txt', 'c\n')
+        status = self.cache.get(self.test_dir)
+        self.assertIsInstance(status['timing']['refreshed_paths'], int)
+        self.assertEqual(status['unstaged'], [{'path': 'src/a.txt', 'status': 'M'}])
+        self.assertEqual(status['untracked'], ['new/deep/c.txt'])
+        self.assertNotEqual(self.cache.digest(self.test_dir), digest)
+
+        # Files created in a directory that appeared after the first scan are seen too
+        self.write('new/deep/d.txt', 'd\n')
+        self.assertEqual(self.cache.get(self.test_dir)['untracked'], ['new/deep/c.txt', 'new/deep/d.txt'])
+
+        # Index changes rescan the whole tree
+        self.repo.git.add('src/a.txt')
+        status = self.cache.get(self.test_dir)
+        self.assertEqual(status['timing']['refreshed_paths'], 'all')
+        self.assertEqual(status['staged'], [{'path': 'src/a.txt', 'status': 'M'}])
+        self.assertEqual(status['unstaged'], [])
+
+        self.repo.git.commit(m='second')
+        status = self.cache.get(self.test_dir)
+        self.assertEqual(status['staged'], [])
+        self.assertEqual(status['branch']['oid'], self.repo.head.commit.hexsha)
+        self.assertTrue(self.cache.get(self.test_dir)['timing']['cached'])
+
+        os.remove(os.path.join(self.test_dir, 'b.txt'))
+        self.assertEqual(self.cache.get(self.test_dir)['deleted'], ['b.txt'])
+
+    def test_untracked_normal(self):
+        """Test that collapsed untracked directories match a full scan after a change"""
+        self.write('a/b/x', 'x\n')
+        status = self.cache.get(self.test_dir, 'normal')
+        if not status['timing']['watched']:
+            self.skipTest('inotify is not available')
+        self.assertEqual(status['untracked'], ['a/'])
+
+        self.write('a/b/y', 'y\n')
+        status = self.cache.get(self.test_dir, 'normal')
+        self.assertEqual(status['untracked'], ['a/'])
+        self.assertEqual(status['untracked'], git_status.get_status(self.test_dir, 'normal')['untracked'])
+
+    def test_concurrent_first_requests(self):
+        """Test that threads asking for a new repository at once share one scan"""
+        self.write('new.txt', 'n\n')
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            statuses = list(executor.map(lambda _: self.cache.get(self.test_dir), range(40)))
+        self.assertTrue(all(status['untracked'] == ['new.txt'] for status in statuses))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_polling_and_errors(self):
+        """Test repositories that cannot be watched and directories that are not repositories"""
+        cache = StatusCache(max_watches=1, poll_interval=0)
+        self.assertFalse(cache.get(self.test_dir)['timing']['watched'])
+        self.write('b.txt', 'changed\n')
+        self.assertEqual(cache.get(self.test_dir)['modified'], ['b.txt'])
+
+        plain = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(git.InvalidGitRepositoryError):
+                self.cache.get(plain)
+            self.assertEqual(self.cache.stats()['repositories'], 0)
+        finally:
+            shutil.rmtree(plain)
+
+    def test_eviction(self):
+        """Test that the least recently used repository is dropped"""
+        other = tempfile.mkdtemp()
+        try:
+            Repo.init(other)
+            cache = StatusCache(max_repos=1)
+            cache.get(self.test_dir)
+            cache.get(other)
+            stats = cache.stats()
+            self.assertEqual((stats['repositories'], stats['evictions']), (1, 1))
+            cache.invalidate()
+            self.assertEqual(cache.stats()['watched_directories'], 0)
+        finally:
+            shutil.rmtree(other)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test pseudo-terminal command execution
+"""
+
+import json
+import time
+import queue
+import unittest
+
+from shellama.terminals import Terminal, TerminalBusy, TerminalManager, bridge
+
+
+class FakeWebSocket:
+    """WebSocket stand-in with the flask-sock interface."""
+
+    def __init__(self):
+        self.incoming = queue.Queue()
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def receive(self, timeout=None):
+        try:
+            message = self.incoming.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if message is ConnectionError:
+            raise ConnectionError('closed')
+        return message
+
+    def close(self, reason=None, message=None):
+        self.incoming.put(ConnectionError)
+
+
+class TestTerminals(unittest.TestCase):
+    """Test case for pseudo-terminals"""
+
+    def read_until(self, terminal, text, timeout=5):
+        """Collect terminal output until it contains a text"""
+        deadline = time.time() + timeout
+        offset, output = 0, b''
+        while text.encode() not in output and time.time() < deadline:
+            data, _start, offset = terminal.read(offset, timeout=0.2)
+            output += data
+        return output.decode()
+
+    def test_interactive(self):
+        """Test that the program sees a terminal and gets its input"""
+        terminal = Terminal('/bin/sh', rows=30, cols=100)
+        try:
+            terminal.write(b'[ -t 1 ] && echo "tty $(stty size)"\n')
+            self.assertIn('tty 30 100', self.read_until(terminal, 'tty 30 100'))
+            # /dev/tty only opens on the controlling terminal
+            terminal.write(b'echo controlling >/dev/tty && echo "$((6 * 7))"\n')
+            self.assertIn('42', self.read_until(terminal, '42'))
+
+            terminal.resize(40, 120)
+            terminal.write(b'stty size\n')
+            self.assertIn('40 120', self.read_until(terminal, '40 120'))
+
+            terminal.write(b'exit 3\n')
+            deadline = time.time() + 5
+            while not terminal.finished and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(terminal.exit_code, 3)
+            with self.assertRaises(OSError):
+                terminal.write(b'echo\n')
+        finally:
+            terminal.close()
+
+    def test_missing_program(self):
+        """Test that a program that does not exist is reported when starting it"""
+        with self.assertRaises(FileNotFoundError):
+            Terminal('shellama-no-such-program')
+
+    def test_flow_control(self):
+        """Test that a client that does not read pauses the program"""
+        terminal = Terminal('yes', flow_window=64 * 1024)
+        try:
+            time.sleep(0.5)
+            paused_at = terminal.output.end
+            time.sleep(0.3)
+            self.assertEqual(terminal.output.end, paused_at)
+            self.assertLess(paused_at, 256 * 1024)
+
+            terminal.read(paused_at)
+            time.sleep(0.3)
+            self.assertGreater(terminal.output.end, paused_at)
+        finally:
+            terminal.close()
+
+    def test_write_not_read(self):
+        """Test that input to a program paused by flow control fails fast without locking the terminal"""
+        terminal = Terminal('yes', flow_window=64 * 1024)
+        try:
+            time.sleep(0.5)
+            start = time.monotonic()
+            with self.assertRaises(TerminalBusy) as context:
+                terminal.write(b'x\n' * (512 * 1024), timeout=0.2)
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertLess(context.exception.written, 1024 * 1024)
+
+            terminal.resize(40, 120)
+            self.assertTrue(terminal.running)
+        finally:
+            terminal.close()
+
+    def test_bridge(self):
+        """Test bridging a terminal to a WebSocket"""
+        terminal = Terminal('/bin/sh')
+        ws = FakeWebSocket()
+        ws.incoming.put(json.dumps({'type': 'resize', 'rows': 50, 'cols': 132}))
+        ws.incoming.put(b'stty size; exit 5\n')
+        try:
+            bridge(terminal, ws)
+        finally:
+            terminal.close()
+
+        output = b''.join(message for message in ws.sent if isinstance(message, bytes))
+        self.assertIn(b'50 132', output)
+        self.assertEqual(json.loads(ws.sent[-1]), {'type': 'exit', 'exit_code': 5})
+        self.assertEqual(terminal.attached, 0)
+
+    def test_manager(self):
+        """Test the terminal limit and closing terminals"""
+        manager = TerminalManager(max_terminals=1)
+        terminal = manager.create('/bin/sh')
+        try:
+            self.assertIs(manager.get(terminal.terminal_id), terminal)
+            with self.assertRaises(RuntimeError):
+                manager.create('/bin/sh')
+        finally:
+            manager.close(terminal.terminal_id)
+        self.assertFalse(terminal.running)
+        with self.assertRaises(KeyError):
+            manager.get(terminal.terminal_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
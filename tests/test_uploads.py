@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test upload sessions module
+"""
+
+import io
+import os
+import hashlib
+import tempfile
+import unittest
+
+from shellama import uploads
+
+
+class TestUploads(unittest.TestCase):
+    """Test case for chunked uploads"""
+
+    def setUp(self):
+        """Set up test environment"""
+        # Create a temporary directory for testing
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_dir = self.temp_dir.name
+        self.file_path = os.path.join(self.test_dir, 'upload.bin')
+
+    def tearDown(self):
+        """Clean up test environment"""
+        self.temp_dir.cleanup()
+
+    def test_chunked_upload(self):
+        """Test uploading a file in chunks"""
+        session = uploads.create_upload(self.file_path, total_size=10)
+
+        self.assertEqual(session.write_chunk(io.BytesIO(b'01234')), 5)
+        self.assertFalse(os.path.exists(self.file_path))
+        self.assertEqual(session.write_chunk(io.BytesIO(b'56789'), offset=5), 10)
+
+        checksum = hashlib.sha256(b'0123456789').hexdigest()
+        uploads.commit_upload(session.upload_id, checksum)
+
+        # Verify the file was moved into place and the session is gone
+        with open(self.file_path, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(os.listdir(self.test_dir), ['upload.bin'])
+        with self.assertRaises(KeyError):
+            uploads.get_upload(session.upload_id)
+
+    def test_resume_upload(self):
+        """Test resuming an upload from an earlier offset"""
+        session = uploads.create_upload(self.file_path)
+        session.write_chunk(io.BytesIO(b'abcdef'))
+
+        # Test rewriting from an acknowledged offset
+        self.assertEqual(session.write_chunk(io.BytesIO(b'DEF'), offset=3), 6)
+
+        # Test a chunk that leaves a gap
+        with self.assertRaises(ValueError):
+            session.write_chunk(io.BytesIO(b'xyz'), offset=10)
+
+        uploads.commit_upload(session.upload_id)
+        with open(self.file_path, 'rb') as f:
+            self.assertEqual(f.read(), b'abcDEF')
+
+    def test_incomplete_upload(self):
+        """Test committing and aborting an incomplete upload"""
+        session = uploads.create_upload(self.file_path, total_size=10)
+        session.write_chunk(io.BytesIO(b'01234'))
+
+        # Test committing before all data was received
+        with self.assertRaises(ValueError):
+            uploads.commit_upload(session.upload_id)
+
+        # Test a chunk larger than the expected size
+        with self.assertRaises(ValueError):
+            session.write_chunk(io.BytesIO(b'56789abc'))
+        self.assertEqual(session.offset, 5)
+
+        # Test aborting the upload
+        uploads.abort_upload(session.upload_id)
+        self.assertEqual(os.listdir(self.test_dir), [])
+        with self.assertRaises(KeyError):
+            uploads.abort_upload(session.upload_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test the multi-repository workspace status
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from git import Repo
+
+from shellama.workspace import WORKSPACE_WORKERS, RepoIndex, iter_workspace_status, repo_index
+
+
+class TestWorkspace(unittest.TestCase):
+    """Test case for the workspace status"""
+
+    def setUp(self):
+        """Set up a workspace with a clean clone, a dirty repository and a plain directory"""
+        self.test_dir = tempfile.mkdtemp()
+        self.origin = self.init_repo('group/origin')
+        self.clone = Repo.clone_from(self.origin.working_dir, os.path.join(self.test_dir, 'group', 'clone'))
+        self.configure(self.clone)
+        self.dirty = self.init_repo('dirty')
+        self.write('dirty/new.txt', 'new\n')
+        self.write('plain/nested/file.txt', 'plain\n')
+        repo_index.invalidate()
+
+    def tearDown(self):
+        """Clean up test environment"""
+        repo_index.invalidate()
+        shutil.rmtree(self.test_dir)
+
+    def write(self, name, content):
+        """Write a file in the workspace"""
+        path = os.path.join(self.test_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def configure(self, repo):
+        """Set the committer identity of a repository"""
+        with repo.config_writer() as config:
+            config.set_value('user', 'name', 'Test')
+            config.set_value('user', 'email', 'test@example.com')
+
+    def init_repo(self, name):
+        """Create a repository with one commit"""
+        repo = Repo.init(os.path.join(self.test_dir, name))
+        self.configure(repo)
+        repo.git.commit('--allow-empty', m='initial')
+        return repo
+
+    def test_index(self):
+        """Test that the index is reused until a searched directory changes"""
+        index = RepoIndex()
+        names = ['dirty', 'group/clone', 'group/origin']
+        repositories, cached = index.find(self.test_dir)
+        self.assertEqual([os.path.relpath(path, self.test_dir) for path in repositories], names)
+        self.assertFalse(cached)
+        self.assertTrue(index.find(self.test_dir)[1])
+
+        # New files inside a repository do not invalidate the index, new repositories do
+        self.write('group/clone/file.txt', 'x\n')
+        self.assertTrue(index.find(self.test_dir)[1])
+        Repo.init(os.path.join(self.test_dir, 'plain', 'nested', 'repo'))
+        repositories, cached = index.find(self.test_dir)
+        self.assertFalse(cached)
+        self.assertEqual(len(repositories), 4)
+        self.assertEqual(len(index.find(self.test_dir, depth=1)[0]), 1)
+
+        with self.assertRaises(FileNotFoundError):
+            index.find(os.path.join(self.test_dir, 'missing'))
+
+    def test_status(self):
+        """Test statuses, ahead/behind counts and the summary"""
+        self.clone.git.commit('--allow-empty', m='ahead')
+        events = list(iter_workspace_status(self.test_dir, workers=2))
+        results = {event['name']: event for event in events if event['event'] == 'repository'}
+        self.assertEqual(set(results), {'dirty', 'group/clone', 'group/origin'})
+        self.assertEqual((results['dirty']['untracked'], results['dirty']['clean']), (1, False))
+        self.assertEqual((results['group/clone']['branch']['ahead'], results['group/clone']['branch']['behind']),
+                         (1, 0))
+        self.assertTrue(results['group/origin']['clean'])
+
+        summary = events[-1]
+        self.assertEqual(summary['event'], 'summary')
+        self.assertEqual((summary['repositories'], summary['dirty'], summary['errors']), (3, 1, 0))
+
+        events = list(iter_workspace_status(self.test_dir, ahead_behind=False, fetch=True))
+        results = {event['name']: event for event in events if event['event'] == 'repository'}
+        self.assertIsNone(results['group/clone']['branch']['ahead'])
+        self.assertTrue(results['group/clone']['fetched'])
+        self.assertTrue(events[-1]['index_cached'])
+
+    def test_worker_limit(self):
+        """Test that clients cannot raise the number of parallel Git processes"""
+        with mock.patch('shellama.workspace.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as executor:
+            events = list(iter_workspace_status(self.test_dir, workers=100000))
+        self.assertEqual(executor.call_args.kwargs['max_workers'], WORKSPACE_WORKERS)
+        self.assertEqual(events[-1]['event'], 'summary')
+
+    def test_errors(self):
+        """Test invalid arguments and repositories removed after indexing"""
+        with self.assertRaises(ValueError):
+            iter_workspace_status(self.test_dir, untracked='some')
+        with self.assertRaises(ValueError):
+            iter_workspace_status(self.test_dir, workers=0)
+
+        list(iter_workspace_status(self.test_dir))
+        shutil.rmtree(os.path.join(self.test_dir, 'dirty', '.git'))
+        events = list(iter_workspace_status(self.test_dir))
+        self.assertEqual(events[-1]['errors'], 1)
+        self.assertFalse(list(iter_workspace_status(self.test_dir))[-1]['index_cached'])
+
+
+if __name__ == '__main__':
+    unittest.main()